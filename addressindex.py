@@ -0,0 +1,377 @@
+"""
+An index of normalized addresses for street, prefix and fuzzy lookups.
+
+Addresses are free text, so they are normalized first: lower case, with
+punctuation removed, spaces collapsed and common abbreviations expanded
+('12 Baker St.' becomes '12 baker street'). The street of an address is what
+is left after its leading house numbers ('baker street').
+
+AddressIndex answers three kinds of lookups without scanning the book:
+
+    addresses = AddressIndex()
+    addresses.on_street('Baker St')        # every listing on the street
+    addresses.prefix('12 baker')           # addresses or streets starting so
+    addresses.fuzzy('12 bakr stret')       # (reference, similarity), best first
+
+Prefix lookups use a sorted run of keys searched with bisect. New keys go
+to a small side run that is merged in once it grows, so a load of millions
+of listings sorts once instead of inserting one key at a time. Fuzzy lookups
+compare character trigrams. Candidate streets come from a trigram index over
+the distinct street names, which is far smaller than the book. Only the
+listings on the best streets are scored.
+
+The index observes ResidentialProperty, so the Address setter, new
+properties and deregister() keep it current.
+"""
+
+from bisect import bisect_left
+import re
+
+from residentialproperty import ResidentialProperty, PropertyObserver
+
+_ABBREVIATIONS = {
+    'st': 'street', 'rd': 'road', 'ave': 'avenue', 'av': 'avenue', 'blvd': 'boulevard',
+    'ln': 'lane', 'dr': 'drive', 'ct': 'court', 'pl': 'place', 'sq': 'square',
+    'cres': 'crescent', 'hwy': 'highway', 'pk': 'park', 'apt': 'apartment',
+}
+
+_WORD = re.compile(r'[^\W_]+')
+
+
+def normalize_address(address):
+    """
+    Normalizes an address for indexing and lookups.
+
+    Args:
+        address (str): The address.
+
+    Returns:
+        str: Lower-case words separated by single spaces, with abbreviations
+        such as 'St' and 'Rd' expanded.
+    """
+    return ' '.join(_ABBREVIATIONS.get(word, word) for word in _WORD.findall(address.lower()))
+
+
+def street_of(normalized):
+    """
+    Finds the street part of a normalized address.
+
+    Args:
+        normalized (str): A normalized address.
+
+    Returns:
+        str: The address without its leading words that contain digits (house
+        and flat numbers), or '' if nothing is left.
+    """
+    words = normalized.split(' ')
+    start = 0
+    while start < len(words) and any(character.isdigit() for character in words[start]):
+        start += 1
+    return ' '.join(words[start:])
+
+
+def trigrams(text):
+    """
+    Splits a text into overlapping three-character pieces, padded so that the
+    start of a word counts more.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        set: The trigrams.
+    """
+    padded = '  ' + text + ' '
+    return {padded[position:position + 3] for position in range(len(padded) - 2)}
+
+
+def similarity(left, right):
+    """
+    Compares two sets of trigrams.
+
+    Args:
+        left (set): The first trigrams.
+        right (set): The second trigrams.
+
+    Returns:
+        float: The Jaccard similarity, from 0 to 1.
+    """
+    if not left or not right:
+        return 0.0
+    shared = len(left & right)
+    return shared / (len(left) + len(right) - shared)
+
+
+class AddressIndex(PropertyObserver):
+    """
+    Maintains street, prefix and trigram indexes over property addresses.
+    """
+
+    def __init__(self, properties=None):
+        """
+        Initializes an AddressIndex and starts observing property changes.
+
+        Args:
+            properties (iterable, optional): The properties to index initially.
+                Defaults to ResidentialProperty.total_properties.
+        """
+        self.__objects = {}  # reference -> property
+        self.__keys = {}  # reference -> (normalized address, street)
+        self.__streets = {}  # street -> set of references
+        self.__grams = {}  # trigram -> set of streets
+        self.__sorted = []  # (key, reference), sorted
+        self.__pending = []  # (key, reference), not yet merged
+        self.__pending_sorted = True
+        self.__stale = 0  # entries of the runs that no longer match their property
+        if properties is None:
+            properties = ResidentialProperty.total_properties
+        for prop in properties:
+            self.property_added(prop)
+        self._merge()
+        ResidentialProperty.add_observer(self)
+
+    def close(self):
+        """
+        Stops observing property changes. The index is no longer updated.
+        """
+        ResidentialProperty.remove_observer(self)
+
+    def __len__(self):
+        return len(self.__objects)
+
+    def get(self, reference):
+        """
+        Returns an indexed property by reference number.
+
+        Args:
+            reference (int): The reference number.
+
+        Returns:
+            ResidentialProperty: The property.
+        """
+        return self.__objects[reference]
+
+    def _insert(self, prop, reference, address):
+        """
+        Adds a property under its address. A property without an address is
+        kept, so that setting one later indexes it, but gets no keys.
+
+        Args:
+            prop: The property.
+            reference (int): Its reference number.
+            address (str): Its address. Other values, e.g. a house number
+                loaded as an int, are indexed as text; None as no address.
+        """
+        if not isinstance(address, str):
+            address = '' if address is None else str(address)
+        normalized = normalize_address(address)
+        street = street_of(normalized)
+        self.__objects[reference] = prop
+        self.__keys[reference] = (normalized, street)
+        if normalized:
+            self.__pending.append((normalized, reference))
+            if street and street != normalized:
+                self.__pending.append((street, reference))
+            self.__pending_sorted = False
+        if street:
+            members = self.__streets.get(street)
+            if members is None:
+                members = self.__streets[street] = set()
+                for gram in trigrams(street):
+                    self.__grams.setdefault(gram, set()).add(street)
+            members.add(reference)
+        if len(self.__pending) > 1024 + len(self.__sorted) // 8:
+            self._merge()
+
+    def _delete(self, reference):
+        """
+        Removes a property. Its sorted-run entries go stale and are dropped at
+        the next merge.
+
+        Args:
+            reference (int): The reference number.
+        """
+        del self.__objects[reference]
+        normalized, street = self.__keys.pop(reference)
+        if normalized:
+            self.__stale += 2 if street and street != normalized else 1
+        if street:
+            members = self.__streets[street]
+            members.discard(reference)
+            if not members:
+                del self.__streets[street]
+                for gram in trigrams(street):
+                    streets = self.__grams[gram]
+                    streets.discard(street)
+                    if not streets:
+                        del self.__grams[gram]
+        if self.__stale > 1024 + len(self.__sorted) // 2:
+            self._merge()
+
+    def _live(self, key, reference):
+        """
+        Checks whether a sorted-run entry still describes its property.
+
+        Args:
+            key (str): The entry key.
+            reference (int): The entry reference number.
+
+        Returns:
+            bool: True if the property still has that address or street.
+        """
+        keys = self.__keys.get(reference)
+        return keys is not None and key in keys
+
+    def _merge(self):
+        """
+        Merges the side run into the sorted run, dropping stale entries.
+        """
+        entries = self.__sorted + self.__pending
+        entries.sort()  # two sorted runs: timsort merges them in linear time
+        if self.__stale:
+            # Drop stale entries, and the duplicates left by an address that
+            # was changed and then changed back.
+            live = self._live
+            entries = [entry for position, entry in enumerate(entries)
+                       if live(*entry) and (not position or entry != entries[position - 1])]
+            self.__stale = 0
+        self.__sorted = entries
+        self.__pending = []
+        self.__pending_sorted = True
+
+    def property_added(self, prop):
+        """
+        Indexes the address of a new property.
+
+        Args:
+            prop (ResidentialProperty): The new property.
+        """
+        reference = prop.getreference_number()
+        if reference not in self.__objects:
+            self._insert(prop, reference, prop.Address)
+
+    def property_removed(self, prop):
+        """
+        Removes a deregistered property from the index.
+
+        Args:
+            prop (ResidentialProperty): The removed property.
+        """
+        reference = prop.getreference_number()
+        if self.__objects.get(reference) is prop:
+            self._delete(reference)
+
+    def property_changed(self, prop, field, old_value, new_value):
+        """
+        Re-indexes a property whose Address changed.
+
+        Args:
+            prop: The property whose field changed.
+            field (str): The property attribute name.
+            old_value: The value before the change.
+            new_value: The value after the change.
+        """
+        if field != 'Address':
+            return
+        reference = prop.getreference_number()
+        if self.__objects.get(reference) is not prop:
+            return
+        self._delete(reference)
+        self._insert(prop, reference, new_value)
+
+    def on_street(self, street):
+        """
+        Finds the properties on a street.
+
+        Args:
+            street (str): The street name, e.g. 'Baker St'. House numbers are
+                ignored.
+
+        Returns:
+            list: The reference numbers, in ascending order.
+        """
+        return sorted(self.__streets.get(street_of(normalize_address(street)), ()))
+
+    def prefix(self, text, limit=None):
+        """
+        Finds the properties whose normalized address, or street, starts with
+        a text.
+
+        Args:
+            text (str): The prefix, e.g. '12 baker' or 'baker st'. It is
+                normalized like the addresses, except that an unfinished last
+                word is not expanded and matches every word it starts.
+            limit (int, optional): The most references returned.
+
+        Returns:
+            list: The reference numbers, ordered by the matching key.
+        """
+        words = _WORD.findall(text.lower())
+        if not words:
+            return []
+        if text[-1:].isalnum():
+            # The last word may be partial ('baker st' matches 'baker stone'
+            # as well as 'baker street'), so it is not expanded.
+            wanted = ' '.join([_ABBREVIATIONS.get(word, word) for word in words[:-1]] + words[-1:])
+        else:
+            wanted = ' '.join(_ABBREVIATIONS.get(word, word) for word in words)
+        if len(self.__pending) > 64:
+            self._merge()
+        elif not self.__pending_sorted:
+            self.__pending.sort()
+            self.__pending_sorted = True
+        matches = []
+        seen = set()
+        live = self._live
+        for run in (self.__sorted, self.__pending):
+            position = bisect_left(run, (wanted,))
+            while position < len(run):
+                key, reference = run[position]
+                if not key.startswith(wanted):
+                    break
+                position += 1
+                if reference not in seen and live(key, reference):
+                    seen.add(reference)
+                    matches.append((key, reference))
+        matches.sort()
+        references = [reference for _, reference in matches]
+        return references if limit is None else references[:limit]
+
+    def fuzzy(self, text, limit=10, min_similarity=0.3, streets=5):
+        """
+        Finds the properties whose address is most like a text, tolerating
+        typos and missing words.
+
+        Args:
+            text (str): The address looked for, e.g. '12 bakr stret'.
+            limit (int, optional): The most results. Defaults to 10.
+            min_similarity (float, optional): The lowest trigram similarity of
+                a candidate street. Defaults to 0.3.
+            streets (int, optional): The number of best matching streets whose
+                listings are scored. Defaults to 5.
+
+        Returns:
+            list: (reference number, similarity) pairs, most similar first.
+        """
+        normalized = normalize_address(text)
+        street = street_of(normalized)
+        wanted = trigrams(street or normalized)
+        counts = {}
+        for gram in wanted:
+            for candidate in self.__grams.get(gram, ()):
+                counts[candidate] = counts.get(candidate, 0) + 1
+        scored = []
+        for candidate, shared in counts.items():
+            score = shared / (len(wanted) + len(trigrams(candidate)) - shared)
+            if score >= min_similarity:
+                scored.append((score, candidate))
+        scored.sort(reverse=True)
+        address_grams = trigrams(normalized)
+        results = []
+        for street_score, candidate in scored[:streets]:
+            for reference in self.__streets[candidate]:
+                score = (street_score + similarity(address_grams,
+                                                   trigrams(self.__keys[reference][0]))) / 2
+                results.append((-score, reference))
+        results.sort()
+        return [(reference, -score) for score, reference in results[:limit]]
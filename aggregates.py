@@ -0,0 +1,395 @@
+"""
+Incrementally maintained aggregates over the registered properties.
+
+A MaterializedAggregates object observes ResidentialProperty. Every
+construction, every setter call and every deregister() sends it a
+notification, and it applies the change to each registered aggregate as an
+O(1) delta: the property's previous contribution is subtracted and its new
+one added. Reading an aggregate is a dictionary lookup, never a scan.
+
+    aggregates = MaterializedAggregates()
+    rent = aggregates.add('rent', SumAggregate('YearlyRent'))
+    price = aggregates.add('price', MeanAggregate('SalePrice', by='Number_of_Bedrooms'))
+    pools = aggregates.add('pools', CountAggregate('Pool_Avail'))
+    rent.value(), price.value(3), pools.value()
+
+verify() recomputes every aggregate from scratch and reports any that
+disagree with the incremental values.
+"""
+
+import math
+
+from residentialproperty import ResidentialProperty, PropertyObserver
+from propertyindex import field_value
+
+# Marks a property that does not contribute to an aggregate.
+_NOTHING = None
+
+
+class IncrementalAggregate:
+    """
+    Base class for aggregates. Each property contributes at most one value to
+    one group; the aggregate keeps a [count, total] pair per group.
+    """
+
+    def __init__(self, field, by=None, of_type=None, depends_on=None):
+        """
+        Initializes an aggregate.
+
+        Args:
+            field (str or callable): The property attribute aggregated, or a
+                function of the property (e.g. lambda prop: prop.TaxValue()).
+                Properties whose value is None do not contribute.
+            by (str or callable, optional): Groups the aggregate by this field.
+            of_type (type or tuple, optional): Only aggregate instances of
+                these classes.
+            depends_on (iterable, optional): The setters that can change the
+                contribution of a property. Defaults to field and by when they
+                are attribute names, and to every setter otherwise.
+        """
+        self.field = field
+        self.by = by
+        self.of_type = of_type
+        if depends_on is None and not callable(field) and not callable(by):
+            depends_on = [name for name in (field, by) if name is not None]
+        self.depends_on = None if depends_on is None else frozenset(depends_on)
+        self.groups = {}
+
+    def _read(self, prop, field):
+        """
+        Reads an attribute or evaluates a function of a property.
+
+        Args:
+            prop: The property.
+            field (str or callable): The attribute name or function.
+
+        Returns:
+            The value, or None.
+        """
+        if callable(field):
+            return field(prop)
+        return field_value(prop, field)
+
+    def _value_of(self, prop):
+        """
+        Computes the value a property contributes.
+
+        Args:
+            prop: The property.
+
+        Returns:
+            The value, or None if the property does not contribute.
+        """
+        return self._read(prop, self.field)
+
+    def contribution(self, prop):
+        """
+        Computes the (group, value) a property contributes.
+
+        Args:
+            prop: The property.
+
+        Returns:
+            tuple: (group key, value), or None if the property does not
+            contribute.
+        """
+        if self.of_type is not None and not isinstance(prop, self.of_type):
+            return _NOTHING
+        value = self._value_of(prop)
+        if value is None:
+            return _NOTHING
+        key = self._read(prop, self.by) if self.by is not None else None
+        return key, value
+
+    def apply(self, contribution, sign):
+        """
+        Adds or subtracts one contribution.
+
+        Args:
+            contribution (tuple): (group key, value), or None.
+            sign (int): 1 to add, -1 to subtract.
+        """
+        if contribution is _NOTHING:
+            return
+        key, value = contribution
+        state = self.groups.get(key)
+        if state is None:
+            state = self.groups[key] = [0, 0]
+        state[0] += sign
+        state[1] += sign * value
+        if not state[0]:
+            del self.groups[key]
+
+    def clear(self):
+        """
+        Forgets every contribution.
+        """
+        self.groups.clear()
+
+    def _result(self, state):
+        """
+        Turns the [count, total] pair of a group into the aggregate value.
+
+        Args:
+            state (list): The pair, or None for an empty group.
+
+        Returns:
+            The aggregate value.
+        """
+        raise NotImplementedError
+
+    def value(self, key=None):
+        """
+        Reads the aggregate of one group in constant time.
+
+        Args:
+            key (optional): The group; omit it for an aggregate without by.
+
+        Returns:
+            The aggregate value.
+        """
+        return self._result(self.groups.get(key))
+
+    def values(self):
+        """
+        Reads the aggregate of every group.
+
+        Returns:
+            dict: Group key -> aggregate value.
+        """
+        return {key: self._result(state) for key, state in self.groups.items()}
+
+
+class SumAggregate(IncrementalAggregate):
+    """
+    The sum of a field, e.g. SumAggregate('YearlyRent').
+    """
+
+    def _result(self, state):
+        return state[1] if state is not None else 0
+
+
+class MeanAggregate(IncrementalAggregate):
+    """
+    The average of a field, e.g. MeanAggregate('SalePrice', by='Number_of_Bedrooms').
+    """
+
+    def _result(self, state):
+        return state[1] / state[0] if state is not None else None
+
+
+class CountAggregate(IncrementalAggregate):
+    """
+    The number of properties whose field is truthy, e.g.
+    CountAggregate('Pool_Avail'), or of all properties when field is None.
+    """
+
+    def __init__(self, field=None, by=None, of_type=None, depends_on=None):
+        """
+        Initializes a CountAggregate. Takes the same arguments as
+        IncrementalAggregate; field defaults to counting every property.
+        """
+        super().__init__(field, by, of_type, depends_on)
+
+    def _value_of(self, prop):
+        if self.field is None:
+            return 1
+        return 1 if self._read(prop, self.field) else None
+
+    def _result(self, state):
+        return state[0] if state is not None else 0
+
+
+def _same(left, right):
+    """
+    Compares an incremental and a recomputed aggregate value, allowing for the
+    rounding of repeated float additions and subtractions.
+
+    Args:
+        left: The incremental value.
+        right: The recomputed value.
+
+    Returns:
+        bool: True if the values agree.
+    """
+    if isinstance(left, float) or isinstance(right, float):
+        return math.isclose(left, right, rel_tol=1e-9, abs_tol=1e-6)
+    return left == right
+
+
+class MaterializedAggregates(PropertyObserver):
+    """
+    A set of aggregates kept up to date from property notifications.
+
+    Properties are tracked from construction until deregister(). A weak or
+    LRU registry drops listings without deregistering them, so those listings
+    keep contributing until they are deregistered explicitly. Slotted variants
+    are virtual subclasses of the concrete classes but not of Sale or Rental,
+    so of_type should name concrete classes.
+    """
+
+    def __init__(self, properties=None):
+        """
+        Initializes a MaterializedAggregates object and starts observing
+        property changes.
+
+        Args:
+            properties (iterable, optional): The properties aggregated
+                initially. Defaults to ResidentialProperty.total_properties.
+        """
+        self.aggregates = {}
+        self.__slots = []
+        self.__members = {}  # reference -> (property, contribution per aggregate)
+        self.__dependants = {}  # setter name -> aggregate slots
+        self.__always = []  # slots of aggregates depending on every setter
+        if properties is None:
+            properties = ResidentialProperty.total_properties
+        for prop in properties:
+            self.property_added(prop)
+        ResidentialProperty.add_observer(self)
+
+    def close(self):
+        """
+        Stops observing property changes. The aggregates are no longer updated.
+        """
+        ResidentialProperty.remove_observer(self)
+
+    def __len__(self):
+        return len(self.__members)
+
+    def __getitem__(self, name):
+        return self.aggregates[name]
+
+    def add(self, name, aggregate):
+        """
+        Registers an aggregate and computes it over the current properties.
+
+        Args:
+            name (str): The aggregate name.
+            aggregate (IncrementalAggregate): The aggregate.
+
+        Returns:
+            IncrementalAggregate: The aggregate, for reading its values.
+        """
+        if name in self.aggregates:
+            raise ValueError('An aggregate named {!r} already exists'.format(name))
+        slot = len(self.__slots)
+        self.__slots.append(aggregate)
+        self.aggregates[name] = aggregate
+        if aggregate.depends_on is None:
+            self.__always.append(slot)
+        else:
+            for field in aggregate.depends_on:
+                self.__dependants.setdefault(field, []).append(slot)
+        aggregate.clear()
+        for prop, contributions in self.__members.values():
+            contribution = aggregate.contribution(prop)
+            contributions.append(contribution)
+            aggregate.apply(contribution, 1)
+        return aggregate
+
+    def property_added(self, prop):
+        """
+        Adds the contributions of a new property.
+
+        Args:
+            prop (ResidentialProperty): The property.
+        """
+        reference = prop.getreference_number()
+        if reference in self.__members:
+            return
+        contributions = []
+        for aggregate in self.__slots:
+            contribution = aggregate.contribution(prop)
+            contributions.append(contribution)
+            aggregate.apply(contribution, 1)
+        self.__members[reference] = (prop, contributions)
+
+    def property_removed(self, prop):
+        """
+        Subtracts the contributions of a deregistered property.
+
+        Args:
+            prop (ResidentialProperty): The property.
+        """
+        reference = prop.getreference_number()
+        member = self.__members.get(reference)
+        if member is None or member[0] is not prop:
+            return
+        del self.__members[reference]
+        for aggregate, contribution in zip(self.__slots, member[1]):
+            aggregate.apply(contribution, -1)
+
+    def property_changed(self, prop, field, old_value, new_value):
+        """
+        Replaces the contributions of a property after a setter call.
+
+        Args:
+            prop: The property whose field changed.
+            field (str): The property attribute name.
+            old_value: The value before the change.
+            new_value: The value after the change.
+        """
+        slots = self.__dependants.get(field)
+        if not slots and not self.__always:
+            return
+        member = self.__members.get(prop.getreference_number())
+        if member is None or member[0] is not prop:
+            return
+        contributions = member[1]
+        for slot in (slots or ()):
+            self._update(slot, prop, contributions)
+        for slot in self.__always:
+            self._update(slot, prop, contributions)
+
+    def _update(self, slot, prop, contributions):
+        """
+        Swaps the stored contribution of a property to one aggregate for its
+        current one.
+
+        Args:
+            slot (int): The aggregate slot.
+            prop: The property.
+            contributions (list): The stored contributions of the property.
+        """
+        aggregate = self.__slots[slot]
+        contribution = aggregate.contribution(prop)
+        if contribution != contributions[slot]:
+            aggregate.apply(contributions[slot], -1)
+            aggregate.apply(contribution, 1)
+            contributions[slot] = contribution
+
+    def recompute(self, name):
+        """
+        Computes an aggregate from scratch over the tracked properties, without
+        changing the incremental values.
+
+        Args:
+            name (str): The aggregate name.
+
+        Returns:
+            dict: Group key -> aggregate value.
+        """
+        incremental = self.aggregates[name]
+        scratch = object.__new__(type(incremental))
+        scratch.__dict__.update(vars(incremental))
+        scratch.groups = {}
+        for prop, _ in self.__members.values():
+            scratch.apply(scratch.contribution(prop), 1)
+        return scratch.values()
+
+    def verify(self):
+        """
+        Checks every aggregate against a full recompute.
+
+        Returns:
+            dict: Name -> (incremental values, recomputed values) for each
+            aggregate that disagrees; empty when all are consistent.
+        """
+        mismatches = {}
+        for name, aggregate in self.aggregates.items():
+            incremental, recomputed = aggregate.values(), self.recompute(name)
+            if (incremental.keys() != recomputed.keys() or
+                    not all(_same(incremental[key], recomputed[key]) for key in incremental)):
+                mismatches[name] = (incremental, recomputed)
+        return mismatches
@@ -0,0 +1,95 @@
+"""
+Cost of incrementally maintained aggregates against recomputing them.
+
+Builds a book, registers three aggregates (total yearly rent, average sale
+price per bedroom count and the number of listings with a pool), then prints
+the time of a full recompute, of an incremental read, and the extra cost each
+setter call pays to keep the aggregates current.
+
+Usage:
+    python benchmarks/bench_aggregates.py [listings] [updates]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from residentialproperty import (ResidentialProperty, RentalApartment,  # noqa: E402
+                                 SaleApartment, SaleHouse)
+from aggregates import (CountAggregate, MaterializedAggregates, MeanAggregate,  # noqa: E402
+                        SumAggregate)
+
+
+def build_book(count):
+    """
+    Creates a book of sale apartments, sale houses and rental apartments.
+
+    Args:
+        count (int): The number of listings.
+
+    Returns:
+        list: The sale listings.
+    """
+    sales = []
+    for number in range(count // 3):
+        sales.append(SaleApartment('Tower {}'.format(number), 900, 1 + number % 4, 2,
+                                   number % 40, 1, 250000.0 + number, 1200.0))
+        sales.append(SaleHouse('Lane {}'.format(number), 1500, 2 + number % 4, 2, 2, 300,
+                               'Villa', 600000.0, 900.0))
+        rental = RentalApartment('Court {}'.format(number), 700, 1 + number % 3, 1, 4, 1)
+        rental.YearlyRent = 24000.0
+    return sales
+
+
+def update_prices(sales, updates):
+    """
+    Changes the sale price of listings in turn.
+
+    Args:
+        sales (list): The sale listings.
+        updates (int): The number of setter calls.
+
+    Returns:
+        float: The elapsed time in seconds.
+    """
+    start = time.perf_counter()
+    for number in range(updates):
+        sales[number % len(sales)].SalePrice = 300000.0 + number
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+    updates = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    ResidentialProperty.total_properties.clear()
+    sales = build_book(count)
+    plain = update_prices(sales, updates)
+
+    aggregates = MaterializedAggregates()
+    aggregates.add('rent', SumAggregate('YearlyRent'))
+    aggregates.add('price', MeanAggregate('SalePrice', by='Number_of_Bedrooms'))
+    aggregates.add('pools', CountAggregate('Pool_Avail'))
+
+    start = time.perf_counter()
+    for name in aggregates.aggregates:
+        aggregates.recompute(name)
+    recompute = time.perf_counter() - start
+    start = time.perf_counter()
+    for name in aggregates.aggregates:
+        aggregates[name].values()
+    read = time.perf_counter() - start
+    maintained = update_prices(sales, updates)
+
+    print('{:,} listings, 3 aggregates'.format(count))
+    print('full recompute      {:>12.3f} ms'.format(recompute * 1e3))
+    print('incremental read    {:>12.3f} ms'.format(read * 1e3))
+    print('setter, unobserved  {:>12.2f} us'.format(plain / updates * 1e6))
+    print('setter, maintained  {:>12.2f} us'.format(maintained / updates * 1e6))
+    print('consistent          {:>12}'.format(str(not aggregates.verify())))
+    aggregates.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Stress test for reference number allocation under concurrent construction.
+
+Constructs SaleApartment objects from a growing number of threads with each
+allocator, checks that no reference number was handed out twice, and reports
+construction throughput. A final run constructs from several processes that
+share a FileLeaseAllocator.
+
+Usage:
+    python benchmarks/bench_allocator.py [objects]
+"""
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from residentialproperty import ResidentialProperty, SaleApartment  # noqa: E402
+from referencenumbers import (CounterAllocator, FileLeaseAllocator,  # noqa: E402
+                              ThreadBlockAllocator)
+
+
+def construct(count):
+    """
+    Constructs count SaleApartment objects.
+
+    Args:
+        count (int): The number of objects.
+
+    Returns:
+        list: Their reference numbers.
+    """
+    return [SaleApartment('Tower', 900, 2, 2, 12, 1, 250000, 1200).getreference_number()
+            for _ in range(count)]
+
+
+def run_threads(allocator, threads, objects):
+    """
+    Constructs objects from a thread pool using one allocator.
+
+    Args:
+        allocator (ReferenceAllocator): The allocator to install.
+        threads (int): The number of worker threads.
+        objects (int): The total number of objects.
+
+    Returns:
+        tuple: (seconds, duplicate count).
+    """
+    ResidentialProperty.reference_allocator = allocator
+    ResidentialProperty.total_properties.clear()
+    per_thread = objects // threads
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        results = list(pool.map(construct, [per_thread] * threads))
+    elapsed = time.perf_counter() - start
+    references = [reference for result in results for reference in result]
+    return elapsed, len(references) - len(set(references))
+
+
+def process_worker(args):
+    """
+    Constructs objects in a worker process using a shared lease file.
+
+    Args:
+        args (tuple): (lease file path, number of objects).
+
+    Returns:
+        list: The reference numbers.
+    """
+    path, count = args
+    ResidentialProperty.reference_allocator = ThreadBlockAllocator(
+        FileLeaseAllocator(path), block_size=256)
+    return construct(count)
+
+
+def main():
+    objects = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    print('{:,} objects per run'.format(objects))
+    print('{:<22} {:>7} {:>10} {:>14} {:>10}'.format(
+        'allocator', 'threads', 'seconds', 'objects/s', 'duplicates'))
+    for name, factory in (('CounterAllocator', CounterAllocator),
+                          ('ThreadBlockAllocator', ThreadBlockAllocator)):
+        for threads in (1, 2, 4, 8):
+            elapsed, duplicates = run_threads(factory(), threads, objects)
+            print('{:<22} {:>7} {:>10.3f} {:>14,.0f} {:>10}'.format(
+                name, threads, elapsed, objects / elapsed, duplicates))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'references.lease')
+        for processes in (1, 2, 4):
+            start = time.perf_counter()
+            with ProcessPoolExecutor(processes) as pool:
+                results = list(pool.map(process_worker,
+                                        [(path, objects // processes)] * processes))
+            elapsed = time.perf_counter() - start
+            references = [reference for result in results for reference in result]
+            print('{:<22} {:>7} {:>10.3f} {:>14,.0f} {:>10}'.format(
+                'FileLeaseAllocator', '{}p'.format(processes), elapsed,
+                objects / elapsed, len(references) - len(set(references))))
+
+
+if __name__ == '__main__':
+    main()
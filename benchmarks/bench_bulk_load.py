@@ -0,0 +1,111 @@
+"""
+Compares bulk_load() with a csv + constructor loop for SaleHouse records.
+
+Exits with status 1 if bulk_load() into objects is not faster than the
+constructor loop. The gap widens with the feed: the loop's garbage collection
+passes rescan every object created so far.
+
+Usage:
+    python benchmarks/bench_bulk_load.py [rows]
+"""
+
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from residentialproperty import ResidentialProperty, SaleHouse  # noqa: E402
+from propertystore import PropertyStore  # noqa: E402
+from bulkload import bulk_load  # noqa: E402
+
+HEADER = ['address', 'built_up_area', 'num_of_bedrooms', 'num_of_bathrooms',
+          'num_of_floors', 'plot_size', 'house_type', 'sale_price',
+          'annual_service_charge', 'num_of_parking_slots', 'pool_avail', 'gym_avail']
+
+
+def write_feed(path, rows):
+    """
+    Writes a random SaleHouse feed.
+
+    Args:
+        path (str): The CSV file to create.
+        rows (int): The number of records.
+    """
+    rng = random.Random(0)
+    with open(path, 'w', newline='') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(HEADER)
+        for number in range(rows):
+            writer.writerow(['{} Main Street'.format(number), rng.randint(500, 5000),
+                             rng.randint(1, 6), rng.randint(1, 4), rng.randint(1, 3),
+                             rng.randint(1000, 20000), rng.choice(['Villa', 'Townhouse']),
+                             rng.randint(100000, 5000000), rng.randint(100, 5000),
+                             rng.randint(0, 3), rng.random() < 0.3, rng.random() < 0.5])
+
+
+def constructor_loop(path):
+    """
+    Loads the feed the traditional way, one SaleHouse(...) call per record.
+
+    Args:
+        path (str): The CSV file.
+
+    Returns:
+        int: The number of properties created.
+    """
+    count = 0
+    with open(path, newline='') as handle:
+        reader = csv.reader(handle)
+        next(reader)
+        for row in reader:
+            SaleHouse(row[0], float(row[1]), int(row[2]), int(row[3]), int(row[4]),
+                      float(row[5]), row[6], float(row[7]), float(row[8]), int(row[9]),
+                      row[10] == 'True', row[11] == 'True')
+            count += 1
+    return count
+
+
+def timed(label, rows, function, repeat=3):
+    """
+    Runs and reports one loading strategy, best of several runs, each
+    starting from an empty registry.
+
+    Args:
+        label (str): The strategy name.
+        rows (int): The number of records in the feed.
+        function (callable): The strategy.
+        repeat (int, optional): The number of runs. Defaults to 3.
+
+    Returns:
+        float: The best time in seconds.
+    """
+    best = None
+    for _ in range(repeat):
+        ResidentialProperty.total_properties.clear()
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print('{:<24} {:>8.3f} s {:>12,.0f} rows/s'.format(label, best, rows / best))
+    return best
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'feed.csv')
+        write_feed(path, rows)
+        print('{:,} SaleHouse records'.format(rows))
+        looped = timed('constructor loop', rows, lambda: constructor_loop(path))
+        loaded = timed('bulk_load -> objects', rows, lambda: bulk_load(path, SaleHouse))
+        timed('bulk_load -> store', rows, lambda: bulk_load(path, SaleHouse, store=PropertyStore()))
+    print('bulk_load -> objects is {:.2f}x the constructor loop'.format(looped / loaded))
+    return 0 if loaded < looped else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Comparable-listing queries with the ComparablesIndex KD-trees against the
+brute-force scan, and the accuracy of PriceEstimator.
+
+Builds a book of sale and rental listings whose prices follow the area with
+some noise. It then times kNN queries in both modes and checks that they
+return the same comparables. It times adding listings one at a time (the
+incremental build) against a full rebuild, and reports the median error of
+the estimated SalePrice and YearlyRent of listings left out of the book.
+
+Usage:
+    python benchmarks/bench_comparables.py [listings] [queries]
+"""
+
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from residentialproperty import (ResidentialProperty, SaleApartment, SaleHouse,  # noqa: E402
+                                 RentalApartment, RentalHouse)
+from comparables import ComparablesIndex, PriceEstimator, SALE_TYPES, np  # noqa: E402
+
+
+def make_listing(generator):
+    """
+    Creates a random listing.
+
+    Args:
+        generator (random.Random): The random source.
+
+    Returns:
+        tuple: (listing, its fair SalePrice or YearlyRent). A sale is priced
+        at a noisy 1000 per unit area and a rental at a noisy 50.
+    """
+    bedrooms = generator.randint(1, 6)
+    area = 400 + 250 * bedrooms + generator.randint(-200, 200)
+    bathrooms = max(1, bedrooms - generator.randint(0, 2))
+    parking, pool, gym = generator.randint(0, 3), generator.random() < 0.3, generator.random() < 0.5
+    kind = generator.randrange(4)
+    if kind == 0:
+        price = area * 1000.0
+        prop = SaleApartment('Flat', area, bedrooms, bathrooms, generator.randint(0, 40), 1,
+                             price * generator.uniform(0.9, 1.1), 1200.0, parking, pool, gym)
+    elif kind == 1:
+        price = area * 1000.0
+        prop = SaleHouse('House', area, bedrooms, bathrooms, generator.randint(1, 3), 600, 'Villa',
+                         price * generator.uniform(0.9, 1.1), 1200.0, parking, pool, gym)
+    else:
+        price = area * 50.0
+        cls = RentalApartment if kind == 2 else RentalHouse
+        if cls is RentalApartment:
+            prop = cls('Flat', area, bedrooms, bathrooms, generator.randint(0, 40), 1,
+                       parking, pool, gym)
+        else:
+            prop = cls('House', area, bedrooms, bathrooms, generator.randint(1, 3), 600, 'Villa',
+                       parking, pool, gym)
+        prop.YearlyRent = price * generator.uniform(0.9, 1.1)
+    return prop, price
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    generator = random.Random(0)
+    ResidentialProperty.total_properties.clear()
+    for _ in range(count):
+        make_listing(generator)
+
+    start = time.perf_counter()
+    index = ComparablesIndex(of_type=SALE_TYPES)
+    print('{:,} sales indexed in {:.2f} s'.format(len(index), time.perf_counter() - start))
+
+    subjects = generator.sample([prop for prop in ResidentialProperty.total_properties
+                                 if prop in index], queries)
+    timings = {}
+    answers = {}
+    for mode in ('tree', 'brute'):
+        start = time.perf_counter()
+        answers[mode] = [index.find_comparables(prop, 10, mode) for prop in subjects]
+        timings[mode] = (time.perf_counter() - start) / queries * 1e3
+    same = [[comparable.reference for comparable in found] for found in answers['tree']] == \
+        [[comparable.reference for comparable in found] for found in answers['brute']]
+    print('k=10 query: tree {:.3f} ms, brute {:.3f} ms ({}), {:.1f}x, {}'.format(
+        timings['tree'], timings['brute'], 'NumPy' if np is not None else 'pure Python',
+        timings['brute'] / timings['tree'], 'same answers' if same else 'MISMATCH'))
+
+    added = max(1, count // 10)
+    start = time.perf_counter()
+    for _ in range(added):
+        make_listing(generator)
+    incremental = time.perf_counter() - start
+    start = time.perf_counter()
+    index.rebuild()
+    rebuild = time.perf_counter() - start
+    print('{:,} listings added one at a time in {:.2f} s (with construction); '
+          'a full rebuild takes {:.2f} s'.format(added, incremental, rebuild))
+    index.close()
+
+    estimator = PriceEstimator()
+    errors = {'SalePrice': [], 'YearlyRent': []}
+    for _ in range(queries):
+        prop, fair = make_listing(generator)
+        prop.deregister()  # priced from the rest of the book
+        estimate = estimator.estimate(prop)
+        errors[estimate.field].append(abs(estimate.value - fair) / fair)
+    for field, values in errors.items():
+        if values:
+            print('{} estimate: median error {:.1%} over {} listings'.format(
+                field, statistics.median(values), len(values)))
+    estimator.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""
+Throughput, recall and precision of DedupEngine on a synthetic feed.
+
+Generates distinct listings spread over many streets, then resubmissions of
+a fraction of them: the same class, rooms and house number, with the street
+abbreviated or expanded, a typo (a dropped, doubled, swapped or replaced
+letter), different case and punctuation, and the area off by up to 1%. Both
+are fed to add_batch() in batches, resubmissions after their originals. It
+reports listings per second, the candidates verified per listing, recall
+(resubmissions merged under their original) and precision (merges that were
+right), and the estimated time of comparing every pair instead. Exits with
+status 1 if recall is under RECALL_TARGET or precision under
+PRECISION_TARGET.
+
+Usage:
+    python benchmarks/bench_dedup.py [listings] [resubmitted fraction] [batch size]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from residentialproperty import (ResidentialProperty, SaleApartment, SaleHouse,  # noqa: E402
+                                 RentalApartment, RentalHouse)
+from addressindex import normalize_address, similarity, street_of, trigrams  # noqa: E402
+from dedup import DedupEngine  # noqa: E402
+
+RECALL_TARGET = 0.95
+PRECISION_TARGET = 0.99
+
+SYLLABLES = ('ka', 'lo', 'mi', 'ra', 'ben', 'tor', 'vel', 'sun', 'ash', 'den',
+             'ho', 'pe', 'qui', 'sa', 'tu', 'wen', 'ya', 'zo', 'fel', 'gar')
+SUFFIXES = ('Street', 'Road', 'Lane', 'Avenue', 'Close', 'Crescent')
+STREET_NAMES = len(SYLLABLES) ** 4 * len(SUFFIXES)
+
+_SHORT = {'Street': 'St', 'Road': 'Rd', 'Avenue': 'Ave', 'Lane': 'Ln', 'Close': 'Close',
+          'Crescent': 'Cres'}
+
+
+def street_name(number):
+    """
+    Makes up a street name; numbers below STREET_NAMES give distinct names.
+
+    Args:
+        number (int): The street number.
+
+    Returns:
+        str: The name, e.g. 'Kalomiben Road'.
+    """
+    count = len(SYLLABLES)
+    first = ''.join(SYLLABLES[(number // count ** digit) % count] for digit in range(4))
+    return '{} {}'.format(first.title(), SUFFIXES[(number // count ** 4) % len(SUFFIXES)])
+
+
+def typo(word, generator):
+    """
+    Makes one typing mistake in a word.
+
+    Args:
+        word (str): The word.
+        generator (random.Random): The random source.
+
+    Returns:
+        str: The word with a letter dropped, doubled, swapped or replaced.
+    """
+    if len(word) < 4:
+        return word
+    position = generator.randrange(1, len(word) - 1)
+    mistake = generator.randrange(4)
+    if mistake == 0:
+        return word[:position] + word[position + 1:]
+    if mistake == 1:
+        return word[:position] + word[position] + word[position:]
+    if mistake == 2:
+        return word[:position - 1] + word[position] + word[position - 1] + word[position + 1:]
+    return word[:position] + generator.choice('abcdefghijklmnopqrstuvwxyz') + word[position + 1:]
+
+
+def resubmitted_address(number, street, generator):
+    """
+    Writes an address the way another feed might.
+
+    Args:
+        number (int): The house number.
+        street (str): The street name, e.g. 'Kalomiben Road'.
+        generator (random.Random): The random source.
+
+    Returns:
+        str: The address with some of its spelling changed.
+    """
+    words = street.split(' ')
+    name, suffix = words[:-1], words[-1]
+    if generator.random() < 0.7:
+        suffix = _SHORT[suffix] + generator.choice(('', '.'))
+    if generator.random() < 0.6:
+        longest = max(range(len(name)), key=lambda index: len(name[index]))
+        name[longest] = typo(name[longest], generator)
+    address = '{}{} {} {}'.format(number, generator.choice(('', ',')), ' '.join(name), suffix)
+    return address.upper() if generator.random() < 0.3 else address
+
+
+FACTORIES = (
+    lambda address, area, bedrooms, bathrooms: SaleApartment(
+        address, area, bedrooms, bathrooms, 3, 1, 250000.0, 1200.0),
+    lambda address, area, bedrooms, bathrooms: SaleHouse(
+        address, area, bedrooms, bathrooms, 2, 300, 'Villa', 600000.0, 900.0),
+    lambda address, area, bedrooms, bathrooms: RentalApartment(
+        address, area, bedrooms, bathrooms, 3, 1),
+    lambda address, area, bedrooms, bathrooms: RentalHouse(
+        address, area, bedrooms, bathrooms, 2, 300, 'Villa'),
+)
+
+
+def make_feed(count, fraction, generator):
+    """
+    Creates the originals and their resubmissions.
+
+    Args:
+        count (int): The number of distinct listings.
+        fraction (float): The share of them submitted a second time.
+        generator (random.Random): The random source.
+
+    Returns:
+        tuple: (originals, resubmissions, {resubmission reference: original
+        reference}).
+    """
+    # Few streets of a sparse sample differ by a single syllable.
+    streets = [street_name(number)
+               for number in generator.sample(range(STREET_NAMES), max(1, count // 50))]
+    originals, specs = [], []
+    for number in range(count):
+        spec = (generator.randrange(len(FACTORIES)), 1 + number % 200,
+                generator.choice(streets),
+                generator.randrange(500, 3000), generator.randint(1, 5), generator.randint(1, 3))
+        kind, house, street, area, bedrooms, bathrooms = spec
+        originals.append(FACTORIES[kind]('{} {}'.format(house, street), area, bedrooms,
+                                          bathrooms))
+        specs.append(spec)
+    resubmissions, truth = [], {}
+    for index in generator.sample(range(count), int(count * fraction)):
+        kind, house, street, area, bedrooms, bathrooms = specs[index]
+        area = round(area * generator.uniform(0.99, 1.01), 1)
+        prop = FACTORIES[kind](resubmitted_address(house, street, generator), area, bedrooms,
+                               bathrooms)
+        resubmissions.append(prop)
+        truth[prop.getreference_number()] = originals[index].getreference_number()
+    return originals, resubmissions, truth
+
+
+def pairwise_seconds(listings, pairs=20000):
+    """
+    Times the exact comparison the blocking and LSH avoid, on random pairs.
+
+    Args:
+        listings (list): The listings.
+        pairs (int, optional): The pairs to time. Defaults to 20000.
+
+    Returns:
+        float: Seconds per pair.
+    """
+    generator = random.Random(11)
+    sample = [(generator.choice(listings), generator.choice(listings)) for _ in range(pairs)]
+    start = time.perf_counter()
+    for left, right in sample:
+        if (left.Number_of_Bedrooms == right.Number_of_Bedrooms
+                and abs(left.Built_Up_Area - right.Built_Up_Area) <= 0.02 * left.Built_Up_Area):
+            similarity(trigrams(street_of(normalize_address(left.Address))),
+                       trigrams(street_of(normalize_address(right.Address))))
+    return (time.perf_counter() - start) / pairs
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    fraction = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 50000
+    ResidentialProperty.total_properties.clear()
+    generator = random.Random(2)
+    originals, resubmissions, truth = make_feed(count, fraction, generator)
+    feed = originals + resubmissions
+
+    engine = DedupEngine()
+    found, candidates, seconds = {}, 0, 0.0
+    for start in range(0, len(feed), batch_size):
+        report = engine.add_batch(feed[start:start + batch_size])
+        found.update(report.duplicates)
+        candidates += report.candidates
+        seconds += report.seconds
+    correct = sum(1 for reference, canonical in found.items() if truth.get(reference) == canonical)
+    recall = correct / len(truth) if truth else 1.0
+    precision = correct / len(found) if found else 1.0
+    print('{:,} listings ({:,} resubmitted) in batches of {:,}: {:.1f} s, {:,.0f} listings/s'
+          .format(len(feed), len(truth), batch_size, seconds, len(feed) / seconds))
+    print('candidates verified per listing: {:.2f}; registry after merging: {:,}'.format(
+        candidates / len(feed), len(ResidentialProperty.total_properties)))
+    print('recall {:.2%} (target {:.0%}), precision {:.2%} (target {:.0%})'.format(
+        recall, RECALL_TARGET, precision, PRECISION_TARGET))
+    per_pair = pairwise_seconds(originals)
+    print('comparing every pair instead: {:.1f} us per pair, about {:,.0f} hours'.format(
+        per_pair * 1e6, per_pair * len(feed) * (len(feed) - 1) / 2 / 3600))
+    return 0 if recall >= RECALL_TARGET and precision >= PRECISION_TARGET else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
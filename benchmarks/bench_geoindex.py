@@ -0,0 +1,185 @@
+"""
+Proximity and address lookups with GeoIndex and AddressIndex against a
+linear scan of the registry.
+
+Builds a book of listings spread over a 4 x 6 degree region, about fifty to a
+street, then times radius, bounding-box, street, prefix and fuzzy lookups
+both ways. It also times building the indexes and moving listings through
+the Location and Address setters. The default is the 5M-listing book the
+indexes are sized for; pass a smaller count on machines with less than about
+16 GB of memory. Finally it indexes listings whose address is None or an
+int, and exits with status 1 if they break the AddressIndex or are not found.
+
+Usage:
+    python benchmarks/bench_geoindex.py [listings] [queries]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from residentialproperty import ResidentialProperty, SaleApartment  # noqa: E402
+from geoindex import GeoIndex, haversine_km  # noqa: E402
+from addressindex import AddressIndex, normalize_address, street_of  # noqa: E402
+
+SUFFIXES = ('Street', 'Road', 'Lane', 'Avenue', 'Close', 'Crescent')
+
+
+def street_name(number):
+    """
+    Makes up a street name.
+
+    Args:
+        number (int): The street number.
+
+    Returns:
+        str: The name, e.g. 'Kimo Mira Road'.
+    """
+    syllables = ('ka', 'lo', 'mi', 'ra', 'ben', 'tor', 'vel', 'sun', 'ash', 'den')
+    first = ''.join(syllables[(number // 10 ** digit) % 10] for digit in range(3)).title()
+    return '{} {}'.format(first, SUFFIXES[number % len(SUFFIXES)])
+
+
+def build_book(count, generator):
+    """
+    Creates located listings.
+
+    Args:
+        count (int): The number of listings.
+        generator (random.Random): The random source.
+    """
+    streets = max(1, count // 50)
+    for number in range(count):
+        prop = SaleApartment('{} {}'.format(1 + number % 200, street_name(number % streets)),
+                             900, 2, 2, 3, 1, 250000.0, 1200.0)
+        prop.Location = (generator.uniform(50.0, 54.0), generator.uniform(-4.0, 2.0))
+
+
+def timed(function, repeat):
+    """
+    Times a function.
+
+    Args:
+        function (callable): Called with the repetition number.
+        repeat (int): The number of calls.
+
+    Returns:
+        tuple: (milliseconds per call, the last result).
+    """
+    start = time.perf_counter()
+    for number in range(repeat):
+        result = function(number)
+    return (time.perf_counter() - start) / repeat * 1e3, result
+
+
+def odd_addresses():
+    """
+    Indexes listings whose address is not a string, then gives one without
+    an address a real one and takes it away again.
+
+    Returns:
+        bool: True if every lookup found what it should.
+    """
+    missing = SaleApartment(None, 900, 2, 2, 3, 1, 250000.0, 1200.0)
+    numbered = SaleApartment(221, 900, 2, 2, 3, 1, 250000.0, 1200.0)
+    addresses = AddressIndex([missing, numbered])
+    found = addresses.prefix('221') == [numbered.getreference_number()]
+    missing.Address = '5 Odd Lane'
+    found = found and addresses.on_street('Odd Ln') == [missing.getreference_number()]
+    missing.Address = None
+    found = found and addresses.on_street('Odd Lane') == [] and len(addresses) == 2
+    addresses.close()
+    for prop in (missing, numbered):
+        prop.deregister()
+    print('None and int addresses indexed: {}'.format('ok' if found else 'NOT FOUND'))
+    return found
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    generator = random.Random(0)
+    ResidentialProperty.total_properties.clear()
+    start = time.perf_counter()
+    build_book(count, generator)
+    print('{:,} listings built in {:.1f} s'.format(count, time.perf_counter() - start))
+    book = ResidentialProperty.total_properties
+
+    start = time.perf_counter()
+    geo = GeoIndex(cell_degrees=0.02)
+    print('GeoIndex built in {:.1f} s'.format(time.perf_counter() - start))
+    start = time.perf_counter()
+    addresses = AddressIndex()
+    print('AddressIndex built in {:.1f} s'.format(time.perf_counter() - start))
+
+    centres = [(generator.uniform(50.5, 53.5), generator.uniform(-3.5, 1.5)) for _ in range(queries)]
+    streets = [street_name(generator.randrange(max(1, count // 50))) for _ in range(queries)]
+    prefixes = [street.lower()[:6] for street in streets]  # e.g. 'kalomi'
+
+    def scan_radius(number):
+        latitude, longitude = centres[number]
+        return sorted(prop.getreference_number() for prop in book
+                      if haversine_km(latitude, longitude, *prop.Location) <= 2.0)
+
+    def scan_box(number):
+        latitude, longitude = centres[number]
+        return sorted(prop.getreference_number() for prop in book
+                      if latitude <= prop.Location[0] <= latitude + 0.05
+                      and longitude <= prop.Location[1] <= longitude + 0.05)
+
+    def scan_street(number):
+        wanted = street_of(normalize_address(streets[number]))
+        return sorted(prop.getreference_number() for prop in book
+                      if street_of(normalize_address(prop.Address)) == wanted)
+
+    def scan_prefix(number):
+        found = []
+        for prop in book:
+            normalized = normalize_address(prop.Address)
+            if (normalized.startswith(prefixes[number])
+                    or street_of(normalized).startswith(prefixes[number])):
+                found.append(prop.getreference_number())
+        return found
+
+    scans = max(1, queries // 10)  # scans are slow; run fewer of them
+    rows = (
+        ('radius 2 km', scan_radius,
+         lambda n: sorted(geo.within_radius(*centres[n], 2.0))),
+        ('box 0.05 deg', scan_box,
+         lambda n: geo.within_box(centres[n][0], centres[n][1], centres[n][0] + 0.05,
+                                  centres[n][1] + 0.05)),
+        ('street', scan_street, lambda n: addresses.on_street(streets[n])),
+        ('prefix', scan_prefix, lambda n: addresses.prefix(prefixes[n])),
+    )
+    print('{:<14} {:>12} {:>12} {:>9} {:>8}'.format('lookup', 'scan ms', 'index ms', 'speedup',
+                                                    'results'))
+    for label, scan, lookup in rows:
+        scan_time, expected = timed(scan, scans)
+        index_time, _ = timed(lookup, queries)
+        _, found = timed(lookup, scans)
+        check = '' if sorted(found) == sorted(expected) else '  MISMATCH'
+        print('{:<14} {:>12.2f} {:>12.3f} {:>8.0f}x {:>8,}{}'.format(
+            label, scan_time, index_time, scan_time / index_time, len(found), check))
+
+    misspelt = [name.replace('a', 'e', 1) for name in streets]
+    fuzzy_time, found = timed(lambda n: addresses.fuzzy('7 ' + misspelt[n], limit=5), queries)
+    print('fuzzy          {:>12} {:>12.3f} {:>9} {:>8,}'.format('-', fuzzy_time, '', len(found)))
+
+    props = list(book)[:10000]
+    start = time.perf_counter()
+    for prop in props:
+        location = prop.Location
+        prop.Location = (location[0] + 0.01, location[1])
+        prop.Address = prop.Address + ' North'
+    print('setter updates {:>12.2f} us per listing (Location and Address)'.format(
+        (time.perf_counter() - start) / len(props) * 1e6))
+    geo.close()
+    addresses.close()
+    return 0 if odd_addresses() else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
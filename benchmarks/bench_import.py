@@ -0,0 +1,88 @@
+"""
+Startup cost of `import residentialproperty`.
+
+Runs fresh interpreters with -X importtime and reads the cumulative import
+time of residentialproperty, keeping the median. It also lists the modules
+the import loads and checks that no accelerator module (PropertyStore,
+snapshots, the service, ...) or heavy dependency is among them, then times
+the first access to a few lazily imported names. Exits with status 1 if the
+median is over IMPORT_TIME_BUDGET_US or a heavy module was loaded.
+
+Usage:
+    python benchmarks/bench_import.py [runs]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT)
+
+from residentialproperty import ACCELERATORS  # noqa: E402
+
+# Cumulative microseconds allowed for `import residentialproperty`, as
+# reported by -X importtime.
+IMPORT_TIME_BUDGET_US = 25000
+
+HEAVY = frozenset(ACCELERATORS) | {'numpy', 'pyarrow', 'asyncio', 'mmap', 'sqlite3',
+                                    'multiprocessing', 'concurrent.futures', 'pickle'}
+
+
+def python(code, *options):
+    """
+    Runs code in a fresh interpreter from the repository root.
+
+    Args:
+        code (str): The code.
+        *options (str): Interpreter options, e.g. '-X', 'importtime'.
+
+    Returns:
+        subprocess.CompletedProcess: The finished process.
+    """
+    environment = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.run([sys.executable, *options, '-c', code], cwd=ROOT, env=environment,
+                          check=True, capture_output=True, text=True)
+
+
+def import_time_us():
+    """
+    Measures one import of residentialproperty.
+
+    Returns:
+        int: The cumulative import time in microseconds.
+    """
+    for line in python('import residentialproperty', '-X', 'importtime').stderr.splitlines():
+        fields = [field.strip() for field in line.split('|')]
+        if len(fields) == 3 and fields[2] == 'residentialproperty':
+            return int(fields[1])
+    raise RuntimeError('residentialproperty missing from the -X importtime output')
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+    python('import residentialproperty')  # write the bytecode caches first
+    times = [import_time_us() for _ in range(runs)]
+    median = statistics.median(times)
+    print('import residentialproperty: median {:,.0f} us, min {:,} us over {} runs; '
+          'budget {:,} us: {}'.format(median, min(times), runs, IMPORT_TIME_BUDGET_US,
+                                      'ok' if median <= IMPORT_TIME_BUDGET_US else 'OVER'))
+
+    loaded = python('import sys; before = set(sys.modules); import residentialproperty; '
+                    'print(" ".join(sorted(set(sys.modules) - before)))').stdout.split()
+    heavy = sorted(name for name in loaded if name in HEAVY or name.split('.')[0] in HEAVY)
+    print('modules loaded: {}'.format(' '.join(loaded)))
+    print('heavy modules loaded: {}'.format(' '.join(heavy) if heavy else 'none'))
+
+    for name in ('PropertyIndex', 'PropertyStore', 'open_snapshot', 'PropertyService'):
+        output = python('import time, residentialproperty; start = time.perf_counter(); '
+                        'residentialproperty.{}; print(time.perf_counter() - start)'.format(name))
+        print('first access to residentialproperty.{}: {:.1f} ms'.format(
+            name, float(output.stdout) * 1e3))
+    return 0 if median <= IMPORT_TIME_BUDGET_US and not heavy else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""
+Build and update cost of PropertyIndex, and its answers after a churn.
+
+Builds an index over an existing book and times it, then times setter calls
+on an indexed field and a create/deregister churn. Rentals get their
+YearlyRent through the setter only after the index is built, and one more is
+then built from a record with its rent already set. After the churn every
+query below is checked against a scan of the live listings, and the bitmaps
+must span no more slots than the peak number of listings indexed at once.
+Exits with status 1 if a query gives a different answer or the bitmaps kept
+growing.
+
+Usage:
+    python benchmarks/bench_index.py [listings] [churn cycles]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from residentialproperty import (ResidentialProperty, RentalApartment,  # noqa: E402
+                                 SaleApartment, SaleHouse)
+from propertyindex import OPERATORS, TYPE_FIELD, PropertyIndex  # noqa: E402
+import validation  # noqa: E402
+
+QUERIES = (
+    (SaleApartment, (('Number_of_Bedrooms', '>=', 3), ('FloorNumber', '<', 10))),
+    (SaleHouse, (('SalePrice', 'between', (600100.0, 600900.0)),)),
+    (SaleApartment, (('Built_Up_Area', '==', 925), ('Number_of_Bedrooms', '==', 2))),
+    (SaleHouse, (('Number_of_Bedrooms', '<=', 2),)),
+    (RentalApartment, (('YearlyRent', '>=', 21000.0),)),
+)
+
+
+def listing(number):
+    """
+    Creates listing number n, alternating sale apartments and sale houses.
+    """
+    if number % 2:
+        return SaleApartment('Tower {}'.format(number), 900 + number % 50, 1 + number % 4, 2,
+                             number % 40, 1, 250000.0 + number, 1200.0)
+    return SaleHouse('Lane {}'.format(number), 1500, 1 + number % 5, 2, 2, 300, 'Villa',
+                     600000.0 + number % 1000, 900.0)
+
+
+def scan(cls, conditions):
+    """
+    Answers a query by checking every live listing.
+
+    Returns:
+        list: The matching reference numbers, in ascending order.
+    """
+    return sorted(prop.getreference_number() for prop in ResidentialProperty.total_properties
+                  if isinstance(prop, cls) and all(
+                      getattr(prop, field, None) is not None
+                      and OPERATORS[op](getattr(prop, field), value)
+                      for field, op, value in conditions))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    cycles = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    ResidentialProperty.total_properties.clear()
+    book = [listing(number) for number in range(count)]
+    # Their rent is set only once the index exists, through the setter, so
+    # the YearlyRent index starts out empty.
+    rentals = [RentalApartment('Court {}'.format(number), 700, 2, 1, 4, 1)
+               for number in range(count // 10)]
+
+    start = time.perf_counter()
+    index = PropertyIndex()
+    built = time.perf_counter() - start
+    print('{:,} listings: building the index {:.2f} s'.format(count, built))
+
+    apartments = [prop for prop in book if isinstance(prop, SaleApartment)]
+    start = time.perf_counter()
+    for number, prop in enumerate(apartments):
+        prop.FloorNumber = (number * 7) % 40
+    updated = time.perf_counter() - start
+    print('    FloorNumber setter with the index {:.2f} us per call'.format(
+        updated / len(apartments) * 1e6))
+    for number, rental in enumerate(rentals):
+        rental.YearlyRent = 20000.0 + number % 20000
+    # Built without the constructor, as bulk loads do, so this is the first
+    # entry of the YearlyRent index not made by a setter.
+    rentals.extend(validation.build(RentalApartment, [{
+        'Address': 'Court Loaded', 'Built_Up_Area': 700.0, 'Number_of_Bedrooms': 2,
+        'Number_of_Bathrooms': 1, 'FloorNumber': 4, 'NumberOfBalconies': 1,
+        'YearlyRent': 50000.0}]))
+
+    start = time.perf_counter()
+    for number in range(count, count + cycles):
+        withdrawn = book[number % count]
+        withdrawn.deregister()
+        book[number % count] = listing(number)
+    churned = time.perf_counter() - start
+    print('    create/deregister churn {:.2f} us per cycle'.format(churned / cycles * 1e6))
+
+    slots = index.bitmap_indexes[TYPE_FIELD].mask('in', index.known_types()).bit_length()
+    bounded = slots <= len(index)
+    print('    bitmaps span {:,} slots for {:,} live listings: {}'.format(
+        slots, len(index), 'ok' if bounded else 'GROWING'))
+
+    agree = True
+    for cls, conditions in QUERIES:
+        query = index.query().of_type(cls)
+        for field, op, value in conditions:
+            query.where(field, op, value)
+        found, expected = query.references(), scan(cls, conditions)
+        agree = agree and found == expected
+        print('    {} {}: {:,} matches, same as a scan: {}'.format(
+            cls.__name__, conditions, len(found), 'yes' if found == expected else 'NO'))
+    index.close()
+    return 0 if bounded and agree else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
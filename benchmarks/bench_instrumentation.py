@@ -0,0 +1,74 @@
+"""
+Cost of the opt-in instrumentation, disabled and enabled.
+
+Times construction, AgentCommissionValue(), TaxValue() and a setter call
+without instrumentation, with it enabled, and after enabling and disabling
+it. It also checks that disable() leaves every class exactly as it found it.
+Then it instruments a small pricing batch and prints part of the Prometheus
+output. Exits with status 1 if disable() leaves anything behind, or if so
+many paired runs are over DISABLED_OVERHEAD_BUDGET that noise cannot
+explain it (see measure_overhead()).
+
+Usage:
+    python benchmarks/bench_instrumentation.py [calls] [listings]
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from residentialproperty import ResidentialProperty, SaleHouse, RentalApartment  # noqa: E402
+from instrumentation import Instrumentation, measure_overhead  # noqa: E402
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    ResidentialProperty.total_properties.clear()
+
+    instrumentation = Instrumentation()
+    before = {cls: dict(vars(cls)) for cls in instrumentation.classes}
+    instrumentation.enable()
+    instrumentation.disable()
+    restored = all(dict(vars(cls)) == namespace for cls, namespace in before.items())
+    print('classes restored by disable(): {}'.format('yes' if restored else 'NO'))
+
+    result = measure_overhead(calls)
+    print('ns per operation: none {:.1f}, disabled {:.1f}, enabled {:.1f}'.format(
+        result.baseline * 1e9, result.disabled * 1e9, result.enabled * 1e9))
+    print('disabled overhead {:+.2%} (median of paired runs), budget {:.0%}, '
+          '{} of {} pairs over it: {}'.format(result.overhead, result.budget, result.pairs_over,
+                                              result.pairs,
+                                              'ok' if result.within_budget else 'OVER'))
+
+    with instrumentation:
+        with instrumentation.section('pricing batch'):
+            book = []
+            for number in range(count):
+                house = SaleHouse('Lane {}'.format(number), 1500, 3, 2, 2, 300, 'Villa',
+                                  600000.0, 900.0)
+                flat = RentalApartment('Tower {}'.format(number), 900, 2, 2, number % 40, 1)
+                flat.YearlyRent = 60000.0
+                book += [house, flat]
+            for prop in book:
+                prop.AgentCommissionValue()
+                if isinstance(prop, SaleHouse):
+                    prop.TaxValue()
+    text = instrumentation.to_prometheus()
+    print('\n'.join(line for line in text.splitlines()
+                    if '"+Inf"' in line or '_sum' in line
+                    or line.startswith(('residential_setter', 'residential_registry'))))
+    handle, path = tempfile.mkstemp(suffix='.json')
+    os.close(handle)
+    try:
+        instrumentation.dump_json(path)
+        print('JSON dump: {:,} bytes'.format(os.path.getsize(path)))
+    finally:
+        os.remove(path)
+    return 0 if restored and result.within_budget else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Setter overhead of the mutation journal, and compaction and replay costs.
+
+Prints, for several batch sizes, the time per setter call without and with an
+open MutationJournal against journal.SETTER_OVERHEAD_BUDGET. Then journals a
+burst of price changes over a book, compacts the journal and times replaying
+it before and after compaction. Finally it checks that a compacted journal,
+whose sequence numbers have gaps, is read and replayed incrementally from
+every sequence number, and that reopening it continues the numbering. Exits
+with status 1 if any batch size is over the budget or the check fails.
+
+Usage:
+    python benchmarks/bench_journal.py [setter calls] [listings]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from residentialproperty import ResidentialProperty, SaleApartment  # noqa: E402
+from journal import (MutationJournal, compact_journal, measure_overhead,  # noqa: E402
+                     read_journal, replay)
+
+
+def states(replica):
+    return {reference: prop.__getstate__() for reference, prop in replica.items()}
+
+
+def check_compaction(path):
+    """
+    Journals two bursts of changes, replays the first into a replica, then
+    compacts the journal into frames with gaps in their sequence numbers and
+    reads, replays and reopens it.
+
+    Args:
+        path (str): A journal file path that does not exist yet.
+
+    Returns:
+        bool: True if reads from every sequence number and the replica's
+        incremental replay matched a full replay, and the reopened journal
+        numbered after the last record.
+    """
+    generator = random.Random(7)
+    book = []
+    with MutationJournal(path):
+        book.extend(SaleApartment('Gap {}'.format(number), 900, 2, 2, 1, 1, 250000.0, 1200.0)
+                    for number in range(5))
+        for _ in range(30):
+            generator.choice(book).SalePrice = generator.randrange(200000, 300000)
+    replica, applied = replay(path)
+    with MutationJournal(path):
+        for _ in range(20):
+            generator.choice(book[1:]).SalePrice = generator.randrange(200000, 300000)
+        book[0].deregister()
+    compact_journal(path, batch_size=2)
+    records = list(read_journal(path))
+    ok = all(list(read_journal(path, since)) == [record for record in records
+                                                 if record.sequence > since]
+             for since in range(records[-1].sequence + 1))
+    replica, _ = replay(path, replica, applied)
+    ok = ok and states(replica) == states(replay(path)[0])
+    with MutationJournal(path) as journal:
+        ok = ok and journal.last_sequence == records[-1].sequence
+        book[1].SalePrice = 1.0
+    ok = ok and list(read_journal(path))[-1].sequence == records[-1].sequence + 1
+    print('compacted journal, sequences {}: incremental reads, replay and reopening {}'.format(
+        [record.sequence for record in records], 'agree' if ok else 'DISAGREE'))
+    for prop in book[1:]:
+        prop.deregister()
+    return ok
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    ResidentialProperty.total_properties.clear()
+
+    print('{:>10} {:>12} {:>12} {:>12} {:>8}'.format(
+        'batch', 'plain us', 'journal us', 'overhead us', 'budget'))
+    within = True
+    for batch_size in (64, 1024, 4096, 16384):
+        result = measure_overhead(calls, batch_size)
+        within = within and result.within_budget
+        print('{:>10} {:>12.3f} {:>12.3f} {:>12.3f} {:>8}'.format(
+            batch_size, result.baseline * 1e6, result.journaled * 1e6, result.overhead * 1e6,
+            'ok' if result.within_budget else 'OVER'))
+
+    handle, path = tempfile.mkstemp(suffix='.journal')
+    os.close(handle)
+    os.remove(path)
+    try:
+        with MutationJournal(path):
+            book = [SaleApartment('Tower {}'.format(number), 900, 2, 2, number % 40, 1,
+                                  250000.0, 1200.0) for number in range(count)]
+            for round_number in range(10):
+                for prop in book:
+                    prop.SalePrice = 250000.0 + round_number
+        size = os.path.getsize(path)
+        start = time.perf_counter()
+        replica, last = replay(path)
+        full = time.perf_counter() - start
+        start = time.perf_counter()
+        before, after = compact_journal(path)
+        compaction = time.perf_counter() - start
+        start = time.perf_counter()
+        compacted, _ = replay(path)
+        short = time.perf_counter() - start
+        print('{:,} records, {:,} bytes -> {:,} records, {:,} bytes, compacted in {:.3f} s'.format(
+            before, size, after, os.path.getsize(path), compaction))
+        print('replay {:.3f} s before compaction, {:.3f} s after; {:,} listings, last sequence {:,}'
+              .format(full, short, len(compacted), last))
+    finally:
+        os.remove(path)
+    try:
+        within = check_compaction(path) and within
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    return 0 if within else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
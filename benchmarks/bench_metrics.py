@@ -0,0 +1,73 @@
+"""
+Derived-metric reads with and without the DerivedMetrics cache.
+
+Simulates a pricing screen. Each render reads every metric of a page of
+listings, and a few prices change between renders. The script prints the
+time per render when each metric is computed directly and when it is read
+through the cache, then prints the cache counters.
+
+Usage:
+    python benchmarks/bench_metrics.py [listings] [renders]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from residentialproperty import ResidentialProperty, SaleHouse  # noqa: E402
+from metrics import METRICS, DerivedMetrics  # noqa: E402
+
+
+def render(page, read, names, updates, offset):
+    """
+    Reads every metric of a page, after changing the price of a few listings.
+
+    Args:
+        page (list): The listings.
+        read (callable): Reads a metric: read(prop, name).
+        names (list): The metric names.
+        updates (int): The listings whose price changes before the render.
+        offset (int): Picks the listings that change.
+    """
+    for number in range(updates):
+        page[(offset + number) % len(page)].SalePrice = 600000.0 + offset
+    for prop in page:
+        for name in names:
+            read(prop, name)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    renders = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    ResidentialProperty.total_properties.clear()
+    page = [SaleHouse('Lane {}'.format(number), 1500, 3, 2, 2, 300 + number % 50, 'Villa',
+                      600000.0, 900.0) for number in range(count)]
+    names = list(METRICS)
+    updates = max(1, count // 100)
+
+    def direct(prop, name):
+        return METRICS[name].function(prop)
+
+    start = time.perf_counter()
+    for offset in range(renders):
+        render(page, direct, names, updates, offset)
+    uncached = (time.perf_counter() - start) / renders
+
+    metrics = DerivedMetrics(maxsize=count)
+    start = time.perf_counter()
+    for offset in range(renders):
+        render(page, metrics.get, names, updates, offset)
+    cached = (time.perf_counter() - start) / renders
+
+    print('{:,} listings x {} metrics, {} price changes per render'.format(
+        count, len(names), updates))
+    print('computed every read {:>10.3f} ms per render'.format(uncached * 1e3))
+    print('DerivedMetrics      {:>10.3f} ms per render'.format(cached * 1e3))
+    print(metrics.stats())
+    metrics.close()
+
+
+if __name__ == '__main__':
+    main()
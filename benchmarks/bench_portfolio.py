@@ -0,0 +1,125 @@
+"""
+Scaling of PortfolioEvaluator from 1 to N worker processes.
+
+Builds a mixed book, prints the time to cut it into shards and then, for
+every pool size, the evaluation time, the speedup over one worker and the
+scaling efficiency (speedup / workers). Finally evaluates a version 1
+snapshot, where -1 marks a missing bedroom count, and exits with status 1
+if that listing is not bucketed under None.
+
+Usage:
+    python benchmarks/bench_portfolio.py [listings] [max workers]
+"""
+
+import os
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from residentialproperty import (ResidentialProperty, RentalApartment, RentalHouse,  # noqa: E402
+                                 SaleApartment, SaleHouse)
+from portfolio import PortfolioEvaluator  # noqa: E402
+from propertystore import MISSING_INT, PropertyStore  # noqa: E402
+from snapshot import open_snapshot, save_snapshot  # noqa: E402
+
+# The snapshot layout: a '<8sIIQIIQQQ' header (magic, version, flags, rows,
+# column count, ...), then one '<32sc7xQ' entry (name, typecode, offset) per
+# column.
+HEADER, ENTRY = struct.Struct('<8sIIQIIQQQ'), struct.Struct('<32sc7xQ')
+
+
+def build_book(count):
+    """
+    Creates a book with the four concrete classes in equal parts.
+
+    Args:
+        count (int): The number of listings.
+    """
+    for number in range(count // 4):
+        SaleApartment('Tower {}'.format(number), 900, 1 + number % 4, 2, number % 40, 1,
+                      250000.0 + number, 1200.0)
+        SaleHouse('Lane {}'.format(number), 1500, 2 + number % 4, 2, 2, 300,
+                  ('Villa', 'Townhouse', 'Bungalow')[number % 3], 600000.0, 900.0)
+        rental = RentalApartment('Court {}'.format(number), 700, 1 + number % 3, 1, 4, 1)
+        rental.YearlyRent = 24000.0
+        house = RentalHouse('Road {}'.format(number), 1400, 3, 2, 2, 250, 'Villa')
+        house.YearlyRent = 36000.0
+
+
+def write_version_1(path, store):
+    """
+    Writes a store as a version 1 snapshot, which marked missing integers
+    with -1.
+
+    Args:
+        path (str): The snapshot file.
+        store (PropertyStore): The properties.
+    """
+    save_snapshot(path, store)
+    with open(path, 'r+b') as handle:
+        data = bytearray(handle.read())
+        header = list(HEADER.unpack_from(data))
+        header[1] = 1
+        HEADER.pack_into(data, 0, *header)
+        offsets = dict(ENTRY.unpack_from(data, HEADER.size + ENTRY.size * number)[::2]
+                       for number in range(header[4]))
+        offset = offsets[b'bedrooms'.ljust(32, b'\0')]
+        column = store.column('bedrooms')
+        for row, value in enumerate(column):
+            if value == MISSING_INT:
+                struct.pack_into('<' + column.typecode, data, offset + row * column.itemsize, -1)
+        handle.seek(0)
+        handle.write(data)
+
+
+def check_version_1():
+    """
+    Evaluates a version 1 snapshot holding a listing without a bedroom count.
+
+    Returns:
+        bool: True if the listing is bucketed under None, not -1.
+    """
+    store = PropertyStore()
+    store.append(SaleApartment, Address='Tower', Built_Up_Area=900.0, Number_of_Bathrooms=2,
+                 FloorNumber=3, NumberOfBalconies=1, SalePrice=250000.0,
+                 AnnualServiceCharge=1200.0)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'v1.snapshot')
+        write_version_1(path, store)
+        snapshot = open_snapshot(path)
+        try:
+            keys = list(PortfolioEvaluator(snapshot, workers=1).evaluate().cells)
+        finally:
+            snapshot.close()
+    missing = keys == [(SaleApartment, None, None)]
+    print('version 1 snapshot, listing without bedrooms bucketed under {}: {}'.format(
+        [bedrooms for _, _, bedrooms in keys], 'ok' if missing else 'WRONG'))
+    return missing
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1
+    ResidentialProperty.total_properties.clear()
+    build_book(count)
+    evaluator = PortfolioEvaluator(workers=max_workers)
+
+    start = time.perf_counter()
+    shards, _ = evaluator.shards(max_workers * evaluator.shards_per_worker)
+    print('{:,} listings, {} shards built in {:.3f} s'.format(
+        count, len(shards), time.perf_counter() - start))
+    print('{:>8} {:>10} {:>9} {:>11}'.format('workers', 'seconds', 'speedup', 'efficiency'))
+    for result in evaluator.scaling(max_workers):
+        print('{:>8} {:>10.3f} {:>9.2f} {:>10.0%}'.format(*result))
+    totals = evaluator.evaluate()
+    for cls, sums in sorted(totals.by_class().items(), key=lambda item: item[0].__name__):
+        print('{:<16} {:>9,} listings  commission {:>16,.2f}  tax {:>16,.2f}'.format(
+            cls.__name__, sums['count'], sums['commission'], sums['tax']))
+    return 0 if check_version_1() else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
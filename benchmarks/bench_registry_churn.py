@@ -0,0 +1,84 @@
+"""
+Memory benchmark for the property registries under a create/withdraw churn.
+
+Each cycle constructs a RentalApartment and withdraws it again (deregister()
+for the strong registry, dropping the last reference otherwise). Resident set
+size is sampled at regular checkpoints; with a bounded registry it should stay
+flat for the whole run. The original behaviour, a strong registry whose
+listings are never withdrawn, is run for comparison.
+
+Usage:
+    python benchmarks/bench_registry_churn.py [cycles]
+"""
+
+import gc
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from residentialproperty import ResidentialProperty, RentalApartment  # noqa: E402
+
+
+def rss_mb():
+    """
+    Returns the current resident set size.
+
+    Returns:
+        float: The RSS in MiB. Falls back to the peak RSS where /proc is not
+        available.
+    """
+    try:
+        with open('/proc/self/statm') as handle:
+            pages = int(handle.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def churn(label, cycles, withdraw, checkpoints=5):
+    """
+    Runs the churn workload and prints RSS at each checkpoint.
+
+    Args:
+        label (str): The scenario name.
+        cycles (int): The number of create/withdraw cycles.
+        withdraw (callable): Withdraws a listing, or None to keep it.
+        checkpoints (int, optional): The number of RSS samples. Defaults to 5.
+    """
+    gc.collect()
+    step = max(cycles // checkpoints, 1)
+    samples = []
+    start = time.perf_counter()
+    for cycle in range(1, cycles + 1):
+        listing = RentalApartment('Churn Street', 700, 2, 1, 4, 1)
+        listing.YearlyRent = 24000
+        if withdraw is not None:
+            withdraw(listing)
+        del listing
+        if cycle % step == 0:
+            samples.append(rss_mb())
+    elapsed = time.perf_counter() - start
+    print('{:<26} {:>8.1f} s  RSS MiB: {}'.format(
+        label, elapsed, ' '.join('{:7.1f}'.format(sample) for sample in samples)))
+
+
+def main():
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    print('{:,} create/withdraw cycles per scenario'.format(cycles))
+    ResidentialProperty.use_registry('strong')
+    churn('strong + deregister()', cycles, RentalApartment.deregister)
+    ResidentialProperty.use_registry('weak')
+    churn('weak', cycles, None)
+    ResidentialProperty.use_registry('lru', maxsize=10000)
+    churn('lru(10000)', cycles, None)
+    ResidentialProperty.use_registry('disabled')
+    churn('disabled', cycles, None)
+    ResidentialProperty.use_registry('strong')
+    churn('strong, never withdrawn', min(cycles, 1000000), None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Scenario sweeps with ScenarioEngine against mutating the live objects.
+
+Builds a mixed book and times copying its columns, then a grid of commission
+percents, tax percents and price and rent multipliers (several hundred
+scenarios) evaluated from the per-class sums. A slice of the grid is also
+evaluated in direct mode, recomputing every listing, and compared with the
+sums; and a few scenarios are run the way they are answered without the
+engine: setting AgentCommissionPercent and FixedTaxPercent on every object and
+summing the methods. Finally it checks that the live objects were left as
+they were. Exits with status 1 if the results disagree or the book changed.
+
+Usage:
+    python benchmarks/bench_scenarios.py [listings] [direct scenarios]
+"""
+
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from residentialproperty import ResidentialProperty, Sale  # noqa: E402
+from scenarios import ScenarioEngine, scenario_grid  # noqa: E402
+from suite import FACTORIES  # noqa: E402
+
+TOLERANCE = 1e-9
+
+
+def mutate_and_sum(book, scenario):
+    """
+    Answers one scenario by changing every object and calling its methods,
+    then puts the percents back.
+
+    Args:
+        book (list): The listings.
+        scenario (Scenario): A scenario without multipliers.
+
+    Returns:
+        tuple: (total commission, total tax).
+    """
+    saved = [(prop.AgentCommissionPercent, getattr(prop, 'FixedTaxPercent', None))
+             for prop in book]
+    commission = tax = 0.0
+    for prop in book:
+        if scenario.commission_percent is not None:
+            prop.AgentCommissionPercent = scenario.commission_percent
+        if isinstance(prop, Sale) and scenario.tax_percent is not None:
+            prop.FixedTaxPercent = scenario.tax_percent
+        value = prop.AgentCommissionValue()
+        commission += value if value is not None else 0.0
+        if isinstance(prop, Sale):
+            tax += prop.TaxValue()
+    for prop, (percent, tax_percent) in zip(book, saved):
+        prop.AgentCommissionPercent = percent
+        if isinstance(prop, Sale):
+            prop.FixedTaxPercent = tax_percent
+    return commission, tax
+
+
+def close(left, right):
+    return math.isclose(left, right, rel_tol=TOLERANCE, abs_tol=TOLERANCE)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    direct = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    ResidentialProperty.total_properties.clear()
+    factories = list(FACTORIES.values())
+    book = [factories[number % len(factories)](number) for number in range(count)]
+    before = [prop.__getstate__() for prop in book[::97]]
+
+    start = time.perf_counter()
+    engine = ScenarioEngine(book)
+    print('columns copied and reduced: {:,} listings in {:.2f} s'.format(
+        count, time.perf_counter() - start))
+
+    grid = scenario_grid(commission_percent=(None, 0.01, 0.015, 0.02, 0.025, 0.03),
+                         tax_percent=(None, 0.03, 0.04, 0.05, 0.06),
+                         price_multiplier=(0.8, 0.9, 1.0, 1.1, 1.2),
+                         rent_multiplier=(0.9, 1.0, 1.1))
+    start = time.perf_counter()
+    cube = engine.evaluate(grid)
+    seconds = time.perf_counter() - start
+    print('{} scenarios x {} classes x {} metrics from the sums: {:.2f} ms'.format(
+        len(grid), len(cube.classes), len(cube.metrics), seconds * 1e3))
+
+    sample = grid[::max(1, len(grid) // direct)][:direct]
+    start = time.perf_counter()
+    baseline = engine.evaluate(sample, mode='direct')
+    seconds = time.perf_counter() - start
+    expected = cube.totals('commission'), cube.totals('tax')
+    agree = all(close(cube.value(scenario, cls, metric), baseline.value(position, cls, metric))
+                for position, scenario in enumerate(sample) for cls in cube.classes
+                for metric in cube.metrics)
+    print('direct mode, {} scenarios: {:.2f} s ({:.2f} s per scenario); matches the sums: {}'
+          .format(len(sample), seconds, seconds / len(sample), 'yes' if agree else 'NO'))
+
+    plain = [scenario for scenario in grid
+             if scenario.price_multiplier == 1.0 and scenario.rent_multiplier == 1.0]
+    plain = plain[::max(1, len(plain) // 3)][:3]
+    start = time.perf_counter()
+    for scenario in plain:
+        commission, tax = mutate_and_sum(book, scenario)
+        position = grid.index(scenario)
+        agree = agree and close(commission, expected[0][position]) \
+            and close(tax, expected[1][position])
+    seconds = time.perf_counter() - start
+    per_scenario = seconds / len(plain)
+    print('mutating the objects, {} scenarios: {:.2f} s per scenario, '
+          'about {:.0f} s for the grid'.format(len(plain), per_scenario, per_scenario * len(grid)))
+
+    unchanged = before == [prop.__getstate__() for prop in book[::97]]
+    print('results agree: {}; live objects unchanged: {}'.format(
+        'yes' if agree else 'NO', 'yes' if unchanged else 'NO'))
+    return 0 if agree and unchanged else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
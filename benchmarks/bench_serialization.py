@@ -0,0 +1,228 @@
+"""
+Compares the compact property records with stock pickle for each of the four
+concrete classes: bytes per property, and encode/decode time for a batch
+(to_bytes()/from_bytes() against pickling a list) and for single objects
+(pickle of the compact states against pickle of the instance __dict__).
+Then round-trips a batch mixing regular objects, their slotted variants and
+PropertyStore views of the same classes through to_bytes()/from_bytes(), and
+exits with status 1 if any property is lost, reordered or changed, or a
+regular object comes back with other attributes than it had. Subclasses of
+the concrete classes and objects with extra attributes must survive pickle
+and copy.deepcopy with everything they hold.
+
+Usage:
+    python benchmarks/bench_serialization.py [properties]
+"""
+
+from contextlib import contextmanager
+import copy
+import os
+import pickle
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from residentialproperty import (ResidentialProperty, RentalApartment, RentalHouse,  # noqa: E402
+                                 SaleApartment, SaleHouse)
+from propertystore import PropertyStore  # noqa: E402
+from serialization import SLOTTED, from_bytes, restore_property, to_bytes  # noqa: E402
+from slotted import SlottedSaleHouse  # noqa: E402
+
+
+def _rental(prop):
+    prop.YearlyRent = 24000.0
+    prop.DepositAmount = 2000.0
+    return prop
+
+
+FACTORIES = {
+    'SaleApartment': lambda n: SaleApartment('Tower {}'.format(n), 900.0, 2, 2, n % 40, 1,
+                                             250000.0, 1200.0),
+    'SaleHouse': lambda n: SaleHouse('Lane {}'.format(n), 1500.0, 3, 2, 2, 300.0, 'Villa',
+                                     600000.0, 900.0),
+    'RentalApartment': lambda n: _rental(RentalApartment('Court {}'.format(n), 700.0, 2, 1,
+                                                         n % 30, 1)),
+    'RentalHouse': lambda n: _rental(RentalHouse('Road {}'.format(n), 1400.0, 3, 2, 2, 250.0,
+                                                 'Townhouse')),
+}
+
+
+class NotedHouse(SaleHouse):
+    """A user subclass with an attribute of its own."""
+
+    def __init__(self, *args, note=None):
+        super().__init__(*args)
+        self.note = note
+
+
+class TaggedSlottedHouse(SlottedSaleHouse):
+    """A user subclass of a slotted class with slots of its own."""
+
+    __slots__ = ('tag', '__secret')
+
+
+@contextmanager
+def stock_pickle():
+    """
+    Temporarily removes the pickling methods of ResidentialProperty, so
+    pickle falls back to storing the class and the instance __dict__.
+    """
+    saved = {name: vars(ResidentialProperty)[name]
+             for name in ('__reduce__', '__getstate__', '__setstate__')}
+    for name in saved:
+        delattr(ResidentialProperty, name)
+    try:
+        yield
+    finally:
+        for name, method in saved.items():
+            setattr(ResidentialProperty, name, method)
+
+
+def stock_dumps(obj):
+    """
+    Pickles an object as pickle would without the compact states.
+
+    Args:
+        obj: The object.
+
+    Returns:
+        bytes: The pickle.
+    """
+    with stock_pickle():
+        return pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+
+def stock_loads(data):
+    """
+    Unpickles data made by stock_dumps().
+
+    Args:
+        data (bytes): The pickle.
+
+    Returns:
+        The object.
+    """
+    with stock_pickle():
+        return pickle.loads(data)
+
+
+def best_of(function, repeat=3):
+    """
+    Runs a function several times.
+
+    Args:
+        function (callable): The function.
+        repeat (int, optional): The number of runs. Defaults to 3.
+
+    Returns:
+        tuple: (fastest time in seconds, the last result).
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def check_mixed_batch(count=1000):
+    """
+    Round-trips regular objects, slotted objects and store views of every
+    class, interleaved, in one batch.
+
+    Args:
+        count (int, optional): Objects per class and variety. Defaults to 1000.
+
+    Returns:
+        bool: True if every property came back, in order, with its state.
+    """
+    store = PropertyStore()
+    batch = []
+    for factory in FACTORIES.values():
+        for number in range(count):
+            prop = factory(number)
+            version, code, values = prop.__getstate__()
+            slotted = restore_property(version, code | SLOTTED, values)
+            batch.extend((prop, store.view(store.add(prop)), slotted))
+    batch = batch[::2] + batch[1::2]  # interleave the classes and varieties
+    restored = from_bytes(to_bytes(batch))
+    expected = [prop.__getstate__()[2] for prop in batch]
+    ok = len(restored) == len(batch) and [prop.__getstate__()[2] for prop in restored] == expected
+    # Regular objects come back with the same attributes, without the unset
+    # Rental fields stored as None. Set fields come back in schema order, not
+    # in the order their setters were called.
+    same = all(set(vars(prop)) == set(vars(copy)) for prop, copy in zip(batch, restored)
+               if type(prop) is type(copy) and hasattr(prop, '__dict__'))
+    print('mixed batch of objects, slotted objects and store views: {:,} packed, {:,} restored, '
+          'states {}, attributes {}'.format(len(batch), len(restored), 'match' if ok else 'DIFFER',
+                                            'match' if same else 'DIFFER'))
+    return ok and same
+
+
+def check_fallback():
+    """
+    Pickles and deep-copies objects the compact states cannot hold: user
+    subclasses and an object with an extra attribute.
+
+    Returns:
+        bool: True if every copy has the class and attributes of its original.
+    """
+    noted = NotedHouse('Lane 1', 1500.0, 3, 2, 2, 300.0, 'Villa', 600000.0, 900.0, note='corner')
+    tagged = TaggedSlottedHouse('Lane 2', 1500.0, 3, 2, 2, 300.0, 'Villa', 600000.0, 900.0)
+    tagged.tag = 'new'
+    tagged._TaggedSlottedHouse__secret = 7
+    extra = FACTORIES['SaleHouse'](3)
+    extra.custom = {'viewed': 2}
+
+    def attributes(prop):
+        names = [name for cls in type(prop).__mro__ for name in getattr(cls, '__slots__', ())]
+        names = [name if not name.startswith('__') or name.endswith('__')
+                 else '_{}{}'.format(type(prop).__name__, name) for name in names]
+        state = {name: getattr(prop, name, None) for name in names
+                 if name not in ('__dict__', '__weakref__')}
+        state.update(getattr(prop, '__dict__', {}))
+        return state
+
+    ok = True
+    for prop in (noted, tagged, extra):
+        for copied in (pickle.loads(pickle.dumps(prop, pickle.HIGHEST_PROTOCOL)),
+                       copy.deepcopy(prop)):
+            ok = ok and type(copied) is type(prop) and attributes(copied) == attributes(prop)
+    print('subclasses and extra attributes through pickle and deepcopy: {}'.format(
+        'kept' if ok else 'LOST'))
+    return ok
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    ResidentialProperty.use_registry('disabled')
+    print('{:,} properties per class, times in microseconds per property'.format(count))
+    print('{:<16} {:<18} {:>8} {:>8} {:>8}'.format('class', 'method', 'bytes', 'encode', 'decode'))
+    for name, factory in FACTORIES.items():
+        properties = [factory(n) for n in range(count)]
+        protocol = pickle.HIGHEST_PROTOCOL
+        sample = properties[0]
+        methods = (
+            ('stock pickle list', lambda: stock_dumps(properties), stock_loads),
+            ('state pickle', lambda: pickle.dumps(properties, protocol), pickle.loads),
+            ('to_bytes', lambda: to_bytes(properties), from_bytes),
+        )
+        for label, encode, decode in methods:
+            encode_time, data = best_of(encode)
+            decode_time, _ = best_of(lambda: decode(data))
+            print('{:<16} {:<18} {:>8.1f} {:>8.2f} {:>8.2f}'.format(
+                name, label, len(data) / count, encode_time / count * 1e6,
+                decode_time / count * 1e6))
+        # A single object, as sent to a worker process.
+        print('{:<16} {:<18} {:>8} {:>8}'.format(
+            '', 'one object', len(stock_dumps(sample)), len(pickle.dumps(sample, protocol))))
+    ok = check_mixed_batch()
+    ok = check_fallback() and ok
+    ResidentialProperty.use_registry('strong')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""
+Load test of PropertyService with a local stub client.
+
+Sends a mix of lookups, commission quotes and searches with 10,000 requests
+in flight, and prints the throughput and the p50/p99 latency for several
+batch sizes. max_batch=1 serves every request on its own, as the service did
+before micro-batching.
+
+Usage:
+    python benchmarks/bench_service.py [listings] [requests] [concurrency]
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from residentialproperty import (ResidentialProperty, RentalApartment,  # noqa: E402
+                                 SaleApartment, SaleHouse)
+from propertyindex import PropertyIndex  # noqa: E402
+from service import PropertyService, load_test  # noqa: E402
+
+
+def build_book(count):
+    """
+    Creates a book of sale apartments, sale houses and rental apartments.
+
+    Args:
+        count (int): The number of listings.
+    """
+    for number in range(count // 3):
+        SaleApartment('Tower {}'.format(number), 900, 1 + number % 4, 2, number % 40, 1,
+                      250000.0 + number, 1200.0)
+        SaleHouse('Lane {}'.format(number), 1500, 2 + number % 4, 2, 2, 300,
+                  'Villa', 600000.0, 900.0)
+        rental = RentalApartment('Court {}'.format(number), 700, 1 + number % 3, 1, 4, 1)
+        rental.YearlyRent = 24000.0
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 30000
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 10000
+    ResidentialProperty.total_properties.clear()
+    build_book(count)
+    index = PropertyIndex()
+    print('{:,} listings, {:,} requests, {:,} in flight'.format(count, requests, concurrency))
+    print('{:>10} {:>12} {:>10} {:>10} {:>9} {:>11}'.format(
+        'max_batch', 'requests/s', 'p50 ms', 'p99 ms', 'batches', 'mean batch'))
+    for max_batch in (1, 64, 1024, 4096):
+        service = PropertyService(index, max_batch=max_batch)
+        result = load_test(service, requests, concurrency)
+        print('{:>10} {:>12,.0f} {:>10.2f} {:>10.2f} {:>9,} {:>11.1f}'.format(
+            max_batch, result.throughput, result.p50 * 1e3, result.p99 * 1e3,
+            result.batches, result.mean_batch))
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Compares the regular and the slotted SaleApartment/RentalHouse classes:
+memory per instance and getter/setter latency. Rental houses are measured
+both as constructed and with their rent and deposit set, which is what
+turns the dict of a regular instance into a full one.
+
+Usage:
+    python benchmarks/bench_slotted.py [instances]
+"""
+
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from residentialproperty import ResidentialProperty, RentalHouse, SaleApartment  # noqa: E402
+from slotted import SlottedRentalHouse, SlottedSaleApartment  # noqa: E402
+
+
+def _rented(prop):
+    prop.YearlyRent = 24000.0
+    prop.DepositAmount = 2000.0
+    return prop
+
+
+FACTORIES = {
+    'SaleApartment': lambda cls: cls('Tower', 900, 2, 2, 12, 1, 250000, 1200),
+    'RentalHouse': lambda cls: cls('Lane', 1500, 3, 2, 2, 3000, 'Villa'),
+    'RentalHouse, rented': lambda cls: _rented(cls('Lane', 1500, 3, 2, 2, 3000, 'Villa')),
+}
+CLASSES = {
+    'SaleApartment': (SaleApartment, SlottedSaleApartment),
+    'RentalHouse': (RentalHouse, SlottedRentalHouse),
+    'RentalHouse, rented': (RentalHouse, SlottedRentalHouse),
+}
+
+
+def measure_memory(cls, factory, count):
+    """
+    Measures the bytes allocated per instance.
+
+    Args:
+        cls (type): The class to instantiate.
+        factory (callable): Creates one instance of cls.
+        count (int): The number of instances.
+
+    Returns:
+        tuple: (bytes per instance, the instances).
+    """
+    ResidentialProperty.use_registry('disabled')
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    instances = [factory(cls) for _ in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # The list holding the instances is not part of their cost.
+    return (after - before - sys.getsizeof(instances)) / count, instances
+
+
+def measure_access(instances):
+    """
+    Times a getter and a setter over every instance.
+
+    Args:
+        instances (list): The instances.
+
+    Returns:
+        tuple: (ns per get, ns per set).
+    """
+    start = time.perf_counter()
+    for prop in instances:
+        prop.Built_Up_Area
+    get_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for prop in instances:
+        prop.Built_Up_Area = 1000
+    set_time = time.perf_counter() - start
+    return get_time / len(instances) * 1e9, set_time / len(instances) * 1e9
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    print('{:,} instances per class'.format(count))
+    print('{:<22} {:<8} {:>14} {:>10} {:>10}'.format(
+        'class', '', 'bytes/instance', 'get ns', 'set ns'))
+    for name, factory in FACTORIES.items():
+        for cls in CLASSES[name]:
+            size, instances = measure_memory(cls, factory, count)
+            get_ns, set_ns = measure_access(instances)
+            print('{:<22} {:<8} {:>14.1f} {:>10.1f} {:>10.1f}'.format(
+                cls.__name__, 'rented' if name.endswith('rented') else '', size, get_ns, set_ns))
+            del instances
+    ResidentialProperty.use_registry('strong')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+Compares service startup by reconstructing every listing through the
+constructors with opening a memory-mapped snapshot of the same book, then
+reads a sample of listings from several worker processes sharing the mapping.
+
+It first checks that a basement apartment (FloorNumber -1) and the unset
+fields of a rental read back as -1 and None from a store and from a
+snapshot, that a block added with extend() without a commission percent
+gets the 0.02 default, that setters called on store views are reported to
+observers, and that a save failing halfway leaves no temporary file behind.
+Exits with status 1 if any check fails.
+
+Usage:
+    python benchmarks/bench_snapshot.py [listings]
+"""
+
+from array import array
+import errno
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from residentialproperty import (PropertyObserver, ResidentialProperty,  # noqa: E402
+                                 RentalHouse, SaleApartment)
+from propertystore import PropertyStore  # noqa: E402
+from snapshot import open_snapshot, save_snapshot  # noqa: E402
+
+
+def construct(count):
+    """
+    Builds a book of listings through the constructors.
+
+    Args:
+        count (int): The number of listings.
+    """
+    for number in range(count // 2):
+        SaleApartment('Tower {}'.format(number), 900, 2, 2, number % 40, 1, 250000, 1200)
+        RentalHouse('Lane {}'.format(number), 1500, 3, 2, 2, 3000, 'Villa')
+
+
+def sum_areas(snapshot, rows):
+    """
+    Reads the built-up area of a range of rows, as a worker would.
+
+    Args:
+        snapshot (Snapshot): The shared snapshot.
+        rows (range): The rows to read.
+
+    Returns:
+        float: The sum of the areas.
+    """
+    total = 0.0
+    for row in rows:
+        total += snapshot.view(row).Built_Up_Area
+    return total
+
+
+def check_missing_values(directory):
+    """
+    Stores a basement apartment and a rental whose rental fields were never
+    set, and reads them back from a store and from a snapshot.
+
+    Args:
+        directory (str): Where to write the snapshot.
+
+    Returns:
+        bool: True if -1 and the unset fields read back unchanged.
+    """
+    basement = SaleApartment('1 Low Road', 700, 1, 1, -1, 0, 150000, 800)
+    rental = RentalHouse('2 Low Road', 1500, 3, 2, 2, 3000, 'Villa')
+    store = PropertyStore.from_properties([basement, rental])
+    path = os.path.join(directory, 'missing.snapshot')
+    save_snapshot(path, store)
+    snapshot = open_snapshot(path)
+    expected = (-1, 0, None, None, None)
+    try:
+        found = [(source.view(0).FloorNumber, source.view(0).NumberOfBalconies,
+                  source.view(1).YearlyRent, source.view(1).DepositAmount,
+                  source.view(1).Furnished) for source in (store, snapshot)]
+    finally:
+        snapshot.close()
+        os.remove(path)
+    kept = all(values == expected for values in found)
+    print('FloorNumber -1 and unset fields read back from a store and a snapshot: {}'.format(
+        'yes' if kept else 'NO {}'.format(found)))
+    return kept
+
+
+def check_extend_commission():
+    """
+    Adds a block whose commission percents are missing, zero or given.
+
+    Returns:
+        bool: True if the missing and zero percents read back as 0.02.
+    """
+    store = PropertyStore()
+    rows = store.extend(SaleApartment, 1, {
+        'Address': ['1 Block Road', '2 Block Road', '3 Block Road'],
+        'Built_Up_Area': [700.0] * 3, 'Number_of_Bedrooms': [1] * 3,
+        'Number_of_Bathrooms': [1] * 3, 'FloorNumber': [2] * 3, 'NumberOfBalconies': [0] * 3,
+        'SalePrice': [150000.0] * 3, 'AnnualServiceCharge': [800.0] * 3,
+        'AgentCommissionPercent': [None, 0.0, 0.03]})
+    found = [store.view(row).AgentCommissionPercent for row in rows]
+    defaulted = found == [0.02, 0.02, 0.03]
+    print('commission percents after extend(): {}'.format(
+        'defaulted' if defaulted else 'WRONG {}'.format(found)))
+    return defaulted
+
+
+class Recorder(PropertyObserver):
+    """
+    Records the setter calls reported to observers.
+    """
+
+    def __init__(self):
+        self.changes = []
+
+    def property_changed(self, prop, field, old_value, new_value):
+        self.changes.append((prop.getreference_number(), field, old_value, new_value))
+
+
+def check_view_setters():
+    """
+    Calls a column setter and a flag setter on a store view.
+
+    Returns:
+        bool: True if observers saw both changes with their old values.
+    """
+    apartment = SaleApartment('4 Low Road', 700, 1, 1, 3, 0, 150000, 800)
+    view = PropertyStore.from_properties([apartment]).view(0)
+    recorder = Recorder()
+    ResidentialProperty.add_observer(recorder)
+    try:
+        view.SalePrice = 160000.0
+        view.Pool_Avail = True
+    finally:
+        ResidentialProperty.remove_observer(recorder)
+    reference = apartment.getreference_number()
+    expected = [(reference, 'SalePrice', 150000.0, 160000.0),
+                (reference, 'Pool_Avail', False, True)]
+    notified = recorder.changes == expected
+    print('setters on store views reported to observers: {}'.format(
+        'yes' if notified else 'NO {}'.format(recorder.changes)))
+    return notified
+
+
+class FullDisk(array):
+    """
+    A column whose tofile() fails as on a full disk.
+    """
+
+    def tofile(self, handle):
+        raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+
+
+def check_failed_save(directory):
+    """
+    Saves a snapshot whose write fails halfway.
+
+    Args:
+        directory (str): Where to write the snapshot.
+
+    Returns:
+        bool: True if the error reached the caller and no file was left.
+    """
+    store = PropertyStore.from_properties(
+        [SaleApartment('1 Low Road', 700, 1, 1, 2, 0, 150000, 800)])
+    store.sale_price = FullDisk('d', store.sale_price)
+    path = os.path.join(directory, 'failed.snapshot')
+    try:
+        save_snapshot(path, store)
+        raised = False
+    except OSError:
+        raised = True
+    clean = raised and not os.listdir(directory)
+    print('a failed save raised and left no file behind: {}'.format(
+        'yes' if clean else 'NO {}'.format(os.listdir(directory))))
+    return clean
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    print('{:,} listings'.format(count))
+    ResidentialProperty.total_properties.clear()
+    directory = tempfile.mkdtemp()
+    kept = all([check_failed_save(directory), check_missing_values(directory),
+                check_extend_commission(), check_view_setters()])
+    ResidentialProperty.total_properties.clear()
+    ResidentialProperty.reference_number = 0
+
+    start = time.perf_counter()
+    construct(count)
+    print('{:<28} {:>8.3f} s'.format('constructors', time.perf_counter() - start))
+
+    path = os.path.join(directory, 'book.snapshot')
+    start = time.perf_counter()
+    save_snapshot(path)
+    print('{:<28} {:>8.3f} s  ({:.1f} MiB)'.format(
+        'save_snapshot()', time.perf_counter() - start, os.path.getsize(path) / 2 ** 20))
+    ResidentialProperty.total_properties.clear()
+
+    start = time.perf_counter()
+    snapshot = open_snapshot(path)
+    print('{:<28} {:>8.3f} s'.format('open_snapshot()', time.perf_counter() - start))
+
+    workers = 4
+    step = len(snapshot) // workers + 1
+    chunks = [(snapshot, range(first, min(first + step, len(snapshot))))
+              for first in range(0, len(snapshot), step)]
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        total = sum(pool.starmap(sum_areas, chunks))
+    print('{:<28} {:>8.3f} s  (sum {:,.0f})'.format(
+        '{} workers, full scan'.format(workers), time.perf_counter() - start, total))
+    snapshot.close()
+    os.remove(path)
+    return 0 if kept else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
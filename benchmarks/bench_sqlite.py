@@ -0,0 +1,155 @@
+"""
+Insert and query throughput of SQLiteRepository.
+
+Saves a mixed book of sale and rental houses and apartments in chunks,
+timing only the save() calls, and compares that with committing one row at a
+time on a small sample. Then it times point lookups (lazy, then hydrated),
+indexed range queries and counts, and runs the same point lookups from 1 to
+several threads sharing the reader pool. The default is a 2M-listing
+database; the file goes to a temporary directory and is removed afterwards.
+
+Usage:
+    python benchmarks/bench_sqlite.py [listings] [threads]
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from residentialproperty import (ResidentialProperty, SaleApartment, SaleHouse,  # noqa: E402
+                                 RentalApartment, RentalHouse)
+from sqlitestore import SQLiteRepository  # noqa: E402
+
+CHUNK = 50000
+
+
+def make_listing(number):
+    """
+    Creates listing number n of the book.
+
+    Args:
+        number (int): The listing number.
+
+    Returns:
+        ResidentialProperty: A sale or rental house or apartment.
+    """
+    bedrooms = 1 + number % 5
+    area = 500 + (number * 37) % 2500
+    kind = number % 4
+    if kind == 0:
+        return SaleApartment('Tower {}'.format(number), area, bedrooms, 2, number % 40, 1,
+                             200 * area, 1200.0)
+    if kind == 1:
+        return SaleHouse('Lane {}'.format(number), area, bedrooms, 2, 2, 300, 'Villa',
+                         300 * area, 900.0)
+    prop = (RentalApartment('Tower {}'.format(number), area, bedrooms, 2, number % 40, 1)
+            if kind == 2 else RentalHouse('Lane {}'.format(number), area, bedrooms, 2, 2, 300,
+                                          'Villa'))
+    prop.YearlyRent = 30.0 * area
+    return prop
+
+
+def insert(repository, count):
+    """
+    Saves the book chunk by chunk.
+
+    Args:
+        repository (SQLiteRepository): The repository.
+        count (int): The number of listings.
+
+    Returns:
+        float: The seconds spent in save().
+    """
+    elapsed = 0.0
+    for start in range(0, count, CHUNK):
+        chunk = [make_listing(number) for number in range(start, min(count, start + CHUNK))]
+        begin = time.perf_counter()
+        repository.save(chunk)
+        elapsed += time.perf_counter() - begin
+    return elapsed
+
+
+def rate(operations, seconds):
+    return '{:,.0f}/s'.format(operations / seconds)
+
+
+def point_reads(repository, references, hydrate):
+    for reference in references:
+        prop = repository.get(reference)
+        if hydrate:
+            prop.Built_Up_Area
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    directory = tempfile.mkdtemp()
+    registry = ResidentialProperty.total_properties
+    ResidentialProperty.use_registry('disabled')
+    try:
+        path = os.path.join(directory, 'book.db')
+        repository = SQLiteRepository(path, readers=threads)
+        seconds = insert(repository, count)
+        print('save(): {:,} rows in {:.2f} s, {} in batches of {:,}'.format(
+            count, seconds, rate(count, seconds), repository.batch_size))
+
+        sample = [make_listing(number) for number in range(2000)]
+        single = SQLiteRepository(os.path.join(directory, 'single.db'))
+        begin = time.perf_counter()
+        for prop in sample:
+            single.add(prop)
+        seconds = time.perf_counter() - begin
+        single.close()
+        print('add(), one transaction per row: {}'.format(rate(len(sample), seconds)))
+        print('database file: {:,.1f} MB'.format(os.path.getsize(path) / 1e6))
+
+        generator = random.Random(7)
+        references = [generator.randrange(1, count + 1) for _ in range(20000)]
+        for hydrate in (False, True):
+            begin = time.perf_counter()
+            point_reads(repository, references, hydrate)
+            seconds = time.perf_counter() - begin
+            print('get(){}: {}'.format(' + first field access' if hydrate else ', lazy',
+                                       rate(len(references), seconds)))
+
+        queries = [(('Number_of_Bedrooms', '==', 1 + number % 5),
+                    ('Built_Up_Area', 'between', (1000 + number, 1010 + number)))
+                   for number in range(500)]
+        begin = time.perf_counter()
+        found = sum(len(repository.find(*query, of_type=SaleHouse, lazy=False))
+                    for query in queries)
+        seconds = time.perf_counter() - begin
+        print('find() indexed range, rows read: {} ({:,} listings found)'.format(
+            rate(len(queries), seconds), found))
+        begin = time.perf_counter()
+        for number in range(50):
+            repository.count(('SalePrice', '>=', 400000.0 + 1000 * number))
+        seconds = time.perf_counter() - begin
+        print('count() indexed range: {}'.format(rate(50, seconds)))
+
+        for workers in sorted({1, threads}):
+            share = [references[start::workers] for start in range(workers)]
+            pool = [threading.Thread(target=point_reads, args=(repository, part, True))
+                    for part in share]
+            begin = time.perf_counter()
+            for thread in pool:
+                thread.start()
+            for thread in pool:
+                thread.join()
+            seconds = time.perf_counter() - begin
+            print('get() + field access from {} thread(s): {}'.format(
+                workers, rate(len(references), seconds)))
+        repository.close()
+    finally:
+        ResidentialProperty.use_registry(registry)
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
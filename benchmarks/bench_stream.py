@@ -0,0 +1,137 @@
+"""
+Peak memory of a report written with list comprehensions over the registry
+against the same report written as a stream. Then streams a CSV file of the
+same listings. Exits with status 1 if the stream over the registry
+allocates a pointer per listing (a copy of the registry), or if the objects
+read from the file were registered or announced to observers.
+
+Usage:
+    python benchmarks/bench_stream.py [listings]
+"""
+
+import csv
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from residentialproperty import PropertyObserver, ResidentialProperty, SaleApartment  # noqa: E402
+from stream import stream  # noqa: E402
+
+HEADER = ['address', 'built_up_area', 'num_of_bedrooms', 'num_of_bathrooms', 'floor_num',
+          'num_of_balconies', 'sale_price', 'annual_service_charge']
+
+
+class Counter(PropertyObserver):
+    """Counts the properties announced to observers."""
+
+    def __init__(self):
+        self.added = 0
+
+    def property_added(self, prop):
+        self.added += 1
+
+
+def with_lists():
+    """
+    The report as written today: every stage materialises a list.
+
+    Returns:
+        float: The average price of the larger apartments.
+    """
+    apartments = [prop for prop in ResidentialProperty.total_properties
+                  if isinstance(prop, SaleApartment)]
+    large = [prop for prop in apartments if prop.Number_of_Bedrooms >= 2]
+    prices = [(prop.getreference_number(), prop.SalePrice) for prop in large]
+    return sum(price for _, price in prices) / len(prices)
+
+
+def with_stream():
+    """
+    The same report as a stream.
+
+    Returns:
+        float: The average price of the larger apartments.
+    """
+    return stream().of_type(SaleApartment).where('Number_of_Bedrooms', '>=', 2) \
+        .map(lambda prop: prop.SalePrice).aggregate(lambda price: price).mean
+
+
+def measure(report):
+    """
+    Runs a report under tracemalloc.
+
+    Args:
+        report (callable): The report.
+
+    Returns:
+        tuple: (result, seconds, peak MiB allocated during the run).
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = report()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak / 2 ** 20
+
+
+def check_file(count):
+    """
+    Runs the stream report over a CSV file of the listings.
+
+    Args:
+        count (int): The number of listings.
+
+    Returns:
+        bool: True if no object read from the file was registered or
+        announced to observers.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'apartments.csv')
+        with open(path, 'w', newline='') as handle:
+            writer = csv.writer(handle)
+            writer.writerow(HEADER)
+            for number in range(count):
+                writer.writerow(['Tower {}'.format(number), 900, number % 4, 2, number % 40, 1,
+                                 250000.0 + number, 1200.0])
+        registered = len(ResidentialProperty.total_properties)
+        counter = Counter()
+        ResidentialProperty.add_observer(counter)
+        try:
+            result, seconds, peak = measure(
+                lambda: stream(path, 'SaleApartment', chunk_size=10000)
+                .where('Number_of_Bedrooms', '>=', 2)
+                .map(lambda prop: prop.SalePrice).aggregate(lambda price: price).mean)
+        finally:
+            ResidentialProperty.remove_observer(counter)
+    unregistered = len(ResidentialProperty.total_properties) == registered and not counter.added
+    print('{:<20} {:>8.3f} s  peak {:>8.1f} MiB  (mean price {:,.2f}), {}'.format(
+        'stream from a file', seconds, peak, result,
+        'unregistered' if unregistered else 'REGISTERED'))
+    return unregistered
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    ResidentialProperty.total_properties.clear()
+    for number in range(count):
+        SaleApartment('Tower {}'.format(number), 900, number % 4, 2, number % 40, 1,
+                      250000.0 + number, 1200.0)
+    print('{:,} listings'.format(count))
+    for label, report in (('list comprehensions', with_lists), ('stream', with_stream)):
+        result, seconds, peak = measure(report)
+        print('{:<20} {:>8.3f} s  peak {:>8.1f} MiB  (mean price {:,.2f})'.format(
+            label, seconds, peak, result))
+    # Iterating the registry must not copy it.
+    lazy = peak * 2 ** 20 < count * 8
+    if not lazy:
+        print('the stream over the registry COPIED it')
+    return 0 if check_file(count) and lazy else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+Validation overhead per object of the compiled schemas in validation.py.
+
+For SaleApartment and RentalHouse it times, per object:
+
+- the plain constructor, create() and the constructor after enable(), so the
+  difference is what checking the arguments costs;
+- validate_batch() on records, against a loop that interprets the same
+  schema for every record (what the generated code avoids);
+- build() with and without trusted=True;
+- a setter call with and without enable().
+
+It also feeds a batch with one bad value in every BAD_EVERY records and
+checks that validate_batch() reports each of them and nothing else, and
+that enable() and an Instrumentation refuse to wrap the same constructors,
+in either order, and leave them as they were. While enabled, setting an
+attribute that is not a field, e.g. FloorNumber on a house, must raise.
+Exits with status 1 if any of this fails, or if checking the constructor
+arguments of an object takes more than OVERHEAD_BUDGET_US. The constructor
+timings are noisier than the checks themselves, so they are only reported.
+
+Usage:
+    python benchmarks/bench_validation.py [objects]
+"""
+
+import gc
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from residentialproperty import (ResidentialProperty, RentalHouse,  # noqa: E402
+                                 SaleApartment, SaleHouse)
+from instrumentation import Instrumentation  # noqa: E402
+import validation  # noqa: E402
+
+# Microseconds the argument checks of one object may take.
+OVERHEAD_BUDGET_US = 1.0
+BAD_EVERY = 97
+
+ARGUMENTS = {
+    SaleApartment: lambda number: ('{} Tower'.format(number), 900.0 + number % 50, 2, 2,
+                                   number % 40, 1, 250000.0 + number, 1200.0),
+    RentalHouse: lambda number: ('{} Lane'.format(number), 1500.0, 3, 2, 2,
+                                 3000.0 + number % 7, 'Villa'),
+}
+
+# Record fields in constructor argument order.
+RECORD_FIELDS = {
+    SaleApartment: ('Address', 'Built_Up_Area', 'Number_of_Bedrooms', 'Number_of_Bathrooms',
+                    'FloorNumber', 'NumberOfBalconies', 'SalePrice', 'AnnualServiceCharge'),
+    RentalHouse: ('Address', 'Built_Up_Area', 'Number_of_Bedrooms', 'Number_of_Bathrooms',
+                  'Number_of_Floors', 'Plot_Size', 'House_Type'),
+}
+
+_KIND_TYPES = {'integer': int, 'number': (int, float), 'boolean': bool, 'text': str}
+
+
+def interpret(fields, record):
+    """
+    Checks a record by reading the schema, as a validator without generated
+    code would.
+
+    Args:
+        fields (tuple): The Field tuples.
+        record (dict): The record.
+
+    Returns:
+        list: (field, message) per bad value.
+    """
+    errors = []
+    for field in fields:
+        value = record.get(field.name, validation.REQUIRED)
+        if value is validation.REQUIRED:
+            if field.default is validation.REQUIRED:
+                errors.append((field.name, 'is required'))
+            continue
+        if value is None and field.nullable:
+            continue
+        expected = _KIND_TYPES.get(field.kind)
+        if expected is not None and (not isinstance(value, expected) or (
+                field.kind != 'boolean' and isinstance(value, bool))):
+            errors.append((field.name, 'has the wrong type'))
+            continue
+        for bound, fails in (('above', lambda value, bound: not value > bound),
+                             ('at_least', lambda value, bound: not value >= bound),
+                             ('below', lambda value, bound: not value < bound)):
+            limit = getattr(field, bound)
+            if limit is not None and fails(value, limit):
+                errors.append((field.name, 'is out of range'))
+                break
+    return errors
+
+
+def per_object(function, count, repeat=3):
+    """
+    Times a function that handles count objects, best of a few runs with the
+    cyclic garbage collector paused.
+
+    Returns:
+        float: Microseconds per object.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            function()
+            best = min(best, time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return best / count * 1e6
+
+
+def corrupt(records):
+    """
+    Puts a bad value into every BAD_EVERY-th record.
+
+    Returns:
+        set: (row, field) of each bad value.
+    """
+    bad = set()
+    mistakes = (('Built_Up_Area', -1.0), ('Number_of_Bedrooms', '3'), ('Address', ''))
+    for row in range(0, len(records), BAD_EVERY):
+        field, value = mistakes[(row // BAD_EVERY) % len(mistakes)]
+        records[row][field] = value
+        bad.add((row, field))
+    return bad
+
+
+def check_enabled():
+    """
+    Checks that enable() rejects attributes outside the schema, and that it
+    does not stack with an Instrumentation in either order.
+
+    Returns:
+        bool: True if every check passes.
+    """
+    house = SaleHouse('1 Lane', 1500, 3, 2, 2, 300, 'Villa', 600000.0, 900.0)
+    original = SaleHouse.__init__
+    with validation.validating():
+        try:
+            house.FloorNumber = 3
+            rejected = False
+        except validation.ValidationError:
+            rejected = True
+        house.SalePrice = 650000.0
+    house.FloorNumber = 3  # plain classes again
+    print('FloorNumber on a house rejected while enabled: {}'.format(
+        'yes' if rejected else 'NO'))
+
+    refused = 0
+    instrumentation = Instrumentation()
+    instrumentation.enable()
+    try:
+        validation.enable()
+    except RuntimeError:
+        refused += 1
+    instrumentation.disable()
+    validation.disable()
+    with validation.validating():
+        try:
+            instrumentation.enable()
+        except RuntimeError:
+            refused += 1
+        instrumentation.disable()
+    restored = SaleHouse.__init__ is original and not instrumentation.enabled
+    print('validation and instrumentation refused to stack: {}, constructors restored: {}'
+          .format('yes' if refused == 2 else 'NO', 'yes' if restored else 'NO'))
+    return rejected and refused == 2 and restored
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    ResidentialProperty.use_registry('disabled')
+    within_budget, reported = True, check_enabled()
+    for cls, make in ARGUMENTS.items():
+        arguments = [make(number) for number in range(count)]
+        records = [dict(zip(RECORD_FIELDS[cls], values)) for values in arguments]
+        compiled = validation.compile_schema(cls)
+        check_args = compiled.check_args
+
+        plain = per_object(lambda: [cls(*values) for values in arguments], count)
+        created = per_object(lambda: [validation.create(cls, *values) for values in arguments],
+                             count)
+        checks = per_object(lambda: [check_args(*values) for values in arguments], count)
+        with validation.validating([cls]):
+            wrapped = per_object(lambda: [cls(*values) for values in arguments], count)
+        print('{}: constructor {:.2f} us, create() {:.2f} us ({:+.2f}), after enable() '
+              '{:.2f} us ({:+.2f}); the argument checks alone {:.2f} us'.format(
+                  cls.__name__, plain, created, created - plain, wrapped, wrapped - plain,
+                  checks))
+        within_budget = within_budget and checks <= OVERHEAD_BUDGET_US
+
+        batch = per_object(lambda: validation.validate_batch(cls, records), count)
+        interpreted = per_object(lambda: [interpret(compiled.fields, record)
+                                          for record in records], count)
+        trusted = per_object(lambda: validation.build(cls, records, trusted=True), count)
+        checked = per_object(lambda: validation.build(cls, records), count)
+        print('    validate_batch() {:.2f} us per record, interpreting the schema {:.2f} us; '
+              'build() {:.2f} us, trusted {:.2f} us'.format(batch, interpreted, checked,
+                                                              trusted))
+
+        objects = [cls(*values) for values in arguments]
+        field = RECORD_FIELDS[cls][1]
+        setter = per_object(lambda: [setattr(prop, field, 1000.0) for prop in objects], count)
+        with validation.validating([cls]):
+            validated = per_object(lambda: [setattr(prop, field, 1000.0) for prop in objects],
+                                   count)
+        print('    {} setter {:.3f} us, validated {:.3f} us'.format(field, setter, validated))
+
+        bad = corrupt(records)
+        errors = validation.validate_batch(cls, records)
+        found = {(error.row, error.field) for error in errors}
+        reported = reported and found == bad and len(errors) == len(bad)
+        print('    {:,} bad values in {:,} records: {:,} reported, all of them and nothing '
+              'else: {}'.format(len(bad), count, len(errors), 'yes' if found == bad else 'NO'))
+    ResidentialProperty.use_registry('strong')
+    return 0 if within_budget and reported else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
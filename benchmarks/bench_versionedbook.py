@@ -0,0 +1,146 @@
+"""
+Snapshot cost, memory per change and consistency of VersionedBook.
+
+Builds a book of sale listings and a VersionedBook over it, then:
+
+- times snapshot() against copying the state of every listing;
+- changes a growing number of prices after a snapshot and reports, with
+  tracemalloc, the memory freed by dropping the snapshot, i.e. what the old
+  version kept per change, and what remains once it is gone;
+- runs a writer thread moving money between listings in batch() blocks while
+  a reader thread takes snapshots and checks that the total never changes.
+
+Exits with status 1 if a torn read is seen or the memory an old version
+keeps per change is over BYTES_PER_CHANGE_BUDGET.
+
+Usage:
+    python benchmarks/bench_versionedbook.py [listings] [seconds]
+"""
+
+import gc
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from residentialproperty import ResidentialProperty, SaleApartment  # noqa: E402
+from versionedbook import VersionedBook  # noqa: E402
+
+# Memory an old version may keep per changed listing: its share of the trie
+# nodes on the path plus the old state.
+BYTES_PER_CHANGE_BUDGET = 4096
+# Listings the writer moves money between.
+ACCOUNTS = 1000
+
+
+def traced_bytes():
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def change_prices(book, count, generator):
+    for prop in generator.sample(book, count):
+        prop.SalePrice = prop.SalePrice + 1.0
+
+
+def consistency(book, versioned, seconds):
+    """
+    Moves money between listings on one thread and audits snapshots on
+    another.
+
+    Args:
+        book (list): The listings.
+        versioned (VersionedBook): The versioned book.
+        seconds (float): How long to run.
+
+    Returns:
+        tuple: (transfers, audits, torn reads).
+    """
+    accounts = book[:ACCOUNTS]
+    references = [prop.getreference_number() for prop in accounts]
+    expected = sum(prop.SalePrice for prop in accounts)
+    stop = time.perf_counter() + seconds
+    counts = {'transfers': 0, 'audits': 0, 'torn': 0}
+
+    def writer():
+        generator = random.Random(3)
+        while time.perf_counter() < stop:
+            source, target = generator.sample(accounts, 2)
+            with versioned.batch():
+                source.SalePrice = source.SalePrice - 100.0
+                target.SalePrice = target.SalePrice + 100.0
+            counts['transfers'] += 1
+
+    def reader():
+        while time.perf_counter() < stop:
+            snapshot = versioned.snapshot()
+            total = sum(snapshot.get(reference).SalePrice for reference in references)
+            if abs(total - expected) > 1e-6:
+                counts['torn'] += 1
+            counts['audits'] += 1
+
+    threads = [threading.Thread(target=writer), threading.Thread(target=reader)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts['transfers'], counts['audits'], counts['torn']
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3.0
+    ResidentialProperty.total_properties.clear()
+    book = [SaleApartment('Tower {}'.format(number), 900, 2, 2, number % 40, 1,
+                          250000.0, 1200.0) for number in range(count)]
+    start = time.perf_counter()
+    versioned = VersionedBook()
+    print('VersionedBook over {:,} listings built in {:.2f} s'.format(
+        count, time.perf_counter() - start))
+
+    timings = []
+    for _ in range(1000):
+        start = time.perf_counter()
+        versioned.snapshot()
+        timings.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    [prop.__getstate__() for prop in book]
+    copy_seconds = time.perf_counter() - start
+    print('snapshot(): median {:.2f} us; copying every state: {:.0f} ms'.format(
+        statistics.median(timings) * 1e6, copy_seconds * 1e3))
+
+    # Rebuild the versioned book under tracemalloc, so that freeing its
+    # nodes and states is seen.
+    versioned.close()
+    tracemalloc.start()
+    versioned = VersionedBook()
+    generator = random.Random(5)
+    within_budget = True
+    for changes in (count // 1000, count // 100, count // 10):
+        snapshot = versioned.snapshot()
+        before = traced_bytes()
+        change_prices(book, changes, generator)
+        with_snapshot = traced_bytes()
+        del snapshot
+        after = traced_bytes()
+        per_change = (with_snapshot - after) / changes
+        within_budget = within_budget and per_change <= BYTES_PER_CHANGE_BUDGET
+        print('{:>9,} changes after a snapshot: the old version kept {:,.0f} bytes per change; '
+              '{:,.0f} per change remain once it is dropped'.format(
+                  changes, per_change, (after - before) / changes))
+    tracemalloc.stop()
+
+    transfers, audits, torn = consistency(book, versioned, seconds)
+    print('{:,} batched transfers and {:,} snapshot audits of {} listings: {} torn reads'
+          .format(transfers, audits, ACCOUNTS, torn))
+    versioned.close()
+    return 0 if not torn and within_budget else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+Runs the benchmark suite in benchmarks/suite.py and stores the results, or
+compares two stored runs.
+
+Every benchmark runs at each size (and each value of its other parameters).
+A time_* benchmark is repeated and its fastest run kept. The results are
+printed with the cost per listing and written to
+benchmarks/results/<commit>.json, named after the checked-out commit (with
+'-dirty' if the tree has uncommitted changes), together with the Python
+version and the machine. Comparing two stored runs prints the ratio of every
+benchmark they share and exits with status 1 if any got slower or bigger by
+more than the threshold.
+
+Usage:
+    python benchmarks/run_suite.py [sizes] [pattern]
+    python benchmarks/run_suite.py compare BASE [HEAD] [threshold]
+
+sizes is a comma-separated list (default 1000,100000,1000000). pattern keeps
+only the benchmarks whose name contains it, e.g. 'Access.' or 'time_tax'.
+BASE and HEAD are commits or results files; HEAD defaults to the newest
+stored run and threshold to 1.10.
+"""
+
+import datetime
+import glob
+import inspect
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+RESULTS = os.path.join(BENCHMARKS, 'results')
+
+sys.path.insert(0, BENCHMARKS)
+
+import suite  # noqa: E402
+
+
+def current_commit():
+    """
+    Names the checked-out commit.
+
+    Returns:
+        str: The short commit hash, with '-dirty' if tracked files have
+        uncommitted changes, or 'unknown' outside a git checkout.
+    """
+    root = os.path.dirname(BENCHMARKS)
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, check=True,
+                                capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                               cwd=root, check=True, capture_output=True, text=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('-dirty' if dirty.strip() else '')
+
+
+def benchmarks(pattern=''):
+    """
+    Finds the benchmarks of the suite.
+
+    Args:
+        pattern (str, optional): Keep only names containing this text.
+
+    Yields:
+        tuple: (name 'Class.method', class, method name).
+    """
+    for class_name, cls in inspect.getmembers(suite, inspect.isclass):
+        if cls.__module__ != suite.__name__:
+            continue
+        for method in sorted(vars(cls)):
+            if method.startswith(('time_', 'track_')):
+                name = '{}.{}'.format(class_name, method)
+                if pattern in name:
+                    yield name, cls, method
+
+
+def run_one(cls, method, params):
+    """
+    Runs one benchmark with one set of parameters.
+
+    Args:
+        cls (type): The benchmark class.
+        method (str): The time_* or track_* method name.
+        params (tuple): The parameter values.
+
+    Returns:
+        float: The fastest time in seconds, or the tracked value; None if the
+        benchmark does not apply to these parameters.
+    """
+    best = None
+    for _ in range(getattr(cls, 'repeat', 1) if method.startswith('time_') else 1):
+        instance = cls()
+        try:
+            instance.setup(*params)
+        except NotImplementedError:
+            return None
+        try:
+            if method.startswith('track_'):
+                return getattr(instance, method)(*params)
+            start = time.perf_counter()
+            getattr(instance, method)(*params)
+            elapsed = time.perf_counter() - start
+        except NotImplementedError:
+            return None
+        finally:
+            instance.teardown(*params)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(sizes, pattern=''):
+    """
+    Runs the suite, prints the results and stores them.
+
+    Args:
+        sizes (tuple): The listing counts.
+        pattern (str, optional): Keep only benchmark names containing this.
+
+    Returns:
+        str: The path of the stored results.
+    """
+    results = {}
+    print('{:<70} {:>12} {:>14}'.format('benchmark', 'value', 'per listing'))
+    for name, cls, method in benchmarks(pattern):
+        other_params = cls.params[1:]
+        unit = getattr(getattr(cls, method), 'unit', 'seconds')
+        for params in itertools.product(sizes, *other_params):
+            value = run_one(cls, method, params)
+            if value is None:
+                continue
+            key = '{}({})'.format(name, ', '.join(
+                '{}={}'.format(param, setting) for param, setting in zip(cls.param_names, params)))
+            entry = {'value': value, 'unit': unit}
+            if unit == 'seconds':
+                entry['per_listing_ns'] = value / params[0] * 1e9
+                shown = '{:>11.4g}s {:>11.1f} ns'.format(value, entry['per_listing_ns'])
+            else:
+                shown = '{:>12.1f} {:>14}'.format(value, unit)
+            results[key] = entry
+            print('{:<70} {}'.format(key, shown), flush=True)
+    commit = current_commit()
+    os.makedirs(RESULTS, exist_ok=True)
+    path = os.path.join(RESULTS, commit + '.json')
+    stored = {}
+    if os.path.exists(path):  # a partial run adds to the earlier runs of the commit
+        with open(path) as handle:
+            stored = json.load(handle)['results']
+    stored.update(results)
+    with open(path, 'w') as handle:
+        json.dump({'commit': commit,
+                   'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                   'python': platform.python_version(),
+                   'machine': platform.platform(),
+                   'processor': platform.processor() or platform.machine(),
+                   'results': stored}, handle, indent=1, sort_keys=True)
+    print('stored in', path)
+    return path
+
+
+def load(run_name):
+    """
+    Loads stored results.
+
+    Args:
+        run_name (str): A results file, or the commit it is named after.
+
+    Returns:
+        dict: The stored run.
+    """
+    path = run_name if os.path.exists(run_name) else os.path.join(RESULTS, run_name + '.json')
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def compare(base, head=None, threshold=1.10):
+    """
+    Compares two stored runs.
+
+    Args:
+        base (str): The earlier run, a results file or commit.
+        head (str, optional): The later run. Defaults to the newest stored.
+        threshold (float, optional): The head / base ratio above which a
+            benchmark counts as a regression. Defaults to 1.10.
+
+    Returns:
+        int: The number of regressions.
+    """
+    if head is None:
+        head = max(glob.glob(os.path.join(RESULTS, '*.json')), key=os.path.getmtime)
+    before, after = load(base), load(head)
+    print('{} -> {}'.format(before['commit'], after['commit']))
+    if (before['python'], before['machine']) != (after['python'], after['machine']):
+        print('warning: the runs come from different machines or Python versions')
+    regressions = 0
+    print('{:<70} {:>12} {:>12} {:>8}'.format('benchmark', 'base', 'head', 'ratio'))
+    for key in sorted(set(before['results']) & set(after['results'])):
+        old, new = before['results'][key]['value'], after['results'][key]['value']
+        ratio = new / old if old else float('inf')
+        flag = ''
+        if ratio > threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        elif ratio < 1 / threshold:
+            flag = '  improved'
+        print('{:<70} {:>12.4g} {:>12.4g} {:>7.2f}x{}'.format(key, old, new, ratio, flag))
+    print('{} regression(s) above {:.2f}x'.format(regressions, threshold))
+    return regressions
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'compare':
+        if len(sys.argv) < 3:
+            sys.exit(__doc__)
+        head = sys.argv[3] if len(sys.argv) > 3 else None
+        threshold = float(sys.argv[4]) if len(sys.argv) > 4 else 1.10
+        sys.exit(1 if compare(sys.argv[2], head, threshold) else 0)
+    sizes = tuple(int(size) for size in sys.argv[1].split(',')) if len(sys.argv) > 1 \
+        else suite.SIZES
+    run(sizes, sys.argv[2] if len(sys.argv) > 2 else '')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+The benchmark suite of the ResidentialProperty hierarchy's hot paths.
+
+Benchmarks follow the asv conventions, so the classes can also be run by
+airspeed velocity: each class has params and param_names, setup() and
+teardown() run around every repeat, time_* methods are timed and track_*
+methods return the value recorded (with its unit). The first parameter is
+always the number of listings, which run_suite.py uses to report the cost per
+listing. Run and store the suite with
+
+    python benchmarks/run_suite.py [sizes] [pattern]
+
+and compare two stored runs with
+
+    python benchmarks/run_suite.py compare BASE [HEAD]
+"""
+
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from residentialproperty import (ResidentialProperty, SaleApartment, SaleHouse,  # noqa: E402
+                                 RentalApartment, RentalHouse)
+
+SIZES = (1000, 100000, 1000000)
+
+
+def _rental(prop):
+    prop.YearlyRent = 60000.0
+    return prop
+
+
+# Class name -> factory creating listing number n.
+FACTORIES = {
+    'SaleApartment': lambda number: SaleApartment(
+        'Tower {}'.format(number), 900, 2, 2, number % 40, 1, 250000.0, 1200.0),
+    'SaleHouse': lambda number: SaleHouse(
+        'Lane {}'.format(number), 1500, 3, 2, 2, 300, 'Villa', 600000.0, 900.0),
+    'RentalApartment': lambda number: _rental(RentalApartment(
+        'Tower {}'.format(number), 900, 2, 2, number % 40, 1)),
+    'RentalHouse': lambda number: _rental(RentalHouse(
+        'Lane {}'.format(number), 1500, 3, 2, 2, 300, 'Villa')),
+}
+
+KINDS = tuple(FACTORIES)
+
+
+def _build(kind, size):
+    """
+    Creates listings of one class in an empty registry.
+
+    Args:
+        kind (str): A key of FACTORIES.
+        size (int): The number of listings.
+
+    Returns:
+        list: The listings.
+    """
+    ResidentialProperty.total_properties.clear()
+    factory = FACTORIES[kind]
+    return [factory(number) for number in range(size)]
+
+
+def _clear():
+    ResidentialProperty.total_properties.clear()
+    gc.collect()
+
+
+class Construction:
+    """
+    Construction throughput of the four concrete classes, registration
+    included.
+    """
+
+    params = (SIZES, KINDS)
+    param_names = ('size', 'kind')
+    number = 1
+    repeat = 3
+
+    def setup(self, size, kind):
+        _clear()
+
+    def teardown(self, size, kind):
+        _clear()
+
+    def time_construct(self, size, kind):
+        factory = FACTORIES[kind]
+        for number in range(size):
+            factory(number)
+
+
+class Access:
+    """
+    Getter and setter latency through the name-mangled properties, one field
+    from each level of the hierarchy.
+    """
+
+    params = (SIZES, ('Built_Up_Area', 'FloorNumber', 'SalePrice'))
+    param_names = ('size', 'field')
+    number = 1
+    repeat = 3
+
+    def setup(self, size, field):
+        self.listings = _build('SaleApartment', size)
+
+    def teardown(self, size, field):
+        self.listings = None
+        _clear()
+
+    def time_get(self, size, field):
+        for prop in self.listings:
+            getattr(prop, field)
+
+    def time_set(self, size, field):
+        for prop in self.listings:
+            setattr(prop, field, 5)
+
+
+class Valuation:
+    """
+    AgentCommissionValue() throughput of every class, and TaxValue() of the
+    sale classes.
+    """
+
+    params = (SIZES, KINDS)
+    param_names = ('size', 'kind')
+    number = 1
+    repeat = 3
+
+    def setup(self, size, kind):
+        self.listings = _build(kind, size)
+
+    def teardown(self, size, kind):
+        self.listings = None
+        _clear()
+
+    def time_commission(self, size, kind):
+        for prop in self.listings:
+            prop.AgentCommissionValue()
+
+    def time_tax(self, size, kind):
+        if not kind.startswith('Sale'):
+            raise NotImplementedError('only sales are taxed')
+        for prop in self.listings:
+            prop.TaxValue()
+
+
+class RegistryScan:
+    """
+    Full scans of ResidentialProperty.total_properties over a mixed book.
+    """
+
+    params = (SIZES,)
+    param_names = ('size',)
+    number = 1
+    repeat = 3
+
+    def setup(self, size):
+        _clear()
+        factories = [FACTORIES[kind] for kind in KINDS]
+        for number in range(size):
+            factories[number % len(factories)](number)
+
+    def teardown(self, size):
+        _clear()
+
+    def time_iterate(self, size):
+        for _ in ResidentialProperty.total_properties:
+            pass
+
+    def time_filter(self, size):
+        [prop for prop in ResidentialProperty.total_properties
+         if prop.Number_of_Bedrooms >= 3 and prop.Built_Up_Area > 1000]
+
+
+class PrintAttributes:
+    """
+    print_attributes() cost, written to os.devnull.
+    """
+
+    params = (SIZES, KINDS)
+    param_names = ('size', 'kind')
+    number = 1
+    repeat = 1
+
+    def setup(self, size, kind):
+        self.listings = _build(kind, size)
+        self.sink = open(os.devnull, 'w')
+
+    def teardown(self, size, kind):
+        self.sink.close()
+        self.listings = None
+        _clear()
+
+    def time_print_attributes(self, size, kind):
+        stdout, sys.stdout = sys.stdout, self.sink
+        try:
+            for prop in self.listings:
+                prop.print_attributes()
+        finally:
+            sys.stdout = stdout
+
+
+class Memory:
+    """
+    Memory per instance, measured with tracemalloc. Instances are created
+    with the registry disabled, so only the object itself is counted.
+    """
+
+    params = (SIZES, KINDS)
+    param_names = ('size', 'kind')
+
+    def setup(self, size, kind):
+        _clear()
+
+    def teardown(self, size, kind):
+        _clear()
+
+    def track_bytes_per_instance(self, size, kind):
+        registry = ResidentialProperty.total_properties
+        ResidentialProperty.use_registry('disabled')
+        try:
+            factory = FACTORIES[kind]
+            gc.collect()
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            instances = [factory(number) for number in range(size)]
+            after = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+        finally:
+            ResidentialProperty.use_registry(registry)
+        # The list holding the instances is not part of their cost.
+        return (after - before - sys.getsizeof(instances)) / len(instances)
+
+    track_bytes_per_instance.unit = 'bytes'
@@ -0,0 +1,532 @@
+"""
+Bulk loading of listings from CSV or Parquet files.
+
+bulk_load() streams a file in chunks, validates each column, reserves one
+contiguous block of reference numbers per chunk and then fills either plain
+property objects (without running the constructor chain) or the columns of a
+PropertyStore directly.
+
+File columns are named after the constructor arguments of the loaded class,
+e.g. ``address``, ``built_up_area``, ``num_of_floors``, ``sale_price``.
+Rental classes also accept ``deposit_amount``, ``yearly_rent``, ``furnished``
+and ``maid_room``; any class accepts ``agent_commission_percent`` and sale
+classes ``fixed_tax_percent``.
+"""
+
+from collections import namedtuple
+from contextlib import contextmanager
+import csv
+import gc
+from itertools import chain, islice, repeat
+import os
+
+from residentialproperty import (ResidentialProperty, RentalApartment, RentalHouse,
+                                 SaleApartment, SaleHouse)
+from propertystore import KIND_ATTRIBUTES
+
+
+_BOOLEANS = {True: True, False: False, 'True': True, 'False': False}
+_BOOLEANS.update(dict.fromkeys(('true', 'yes', 'y', 't', '1'), True))
+_BOOLEANS.update(dict.fromkeys(('false', 'no', 'n', 'f', '0'), False))
+
+
+def _parse_bool(value):
+    """
+    Converts a file value to bool.
+
+    Args:
+        value: A bool, 0/1, or one of true/false, yes/no, y/n, t/f, 1/0.
+
+    Returns:
+        bool: The parsed value.
+
+    Raises:
+        ValueError: If the value is not recognised.
+    """
+    try:
+        return _BOOLEANS[value]
+    except (KeyError, TypeError):
+        pass
+    try:
+        return _BOOLEANS[str(value).strip().lower()]
+    except KeyError:
+        raise ValueError('not a boolean: {!r}'.format(value)) from None
+
+
+def _parse_int(value):
+    """
+    Converts a file value to int, accepting integral floats from Parquet.
+
+    Args:
+        value: The raw value.
+
+    Returns:
+        int: The parsed value.
+    """
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError('not an integer: {!r}'.format(value))
+        return int(value)
+    return int(value)
+
+
+def _parse_str(value):
+    """
+    Converts a file value to str.
+
+    Args:
+        value: The raw value.
+
+    Returns:
+        str: The value as a string.
+    """
+    if value is None or value == '':
+        raise ValueError('missing value')
+    return str(value)
+
+
+# Converters that can be swapped for a builtin when a column holds only text.
+_TEXT_PARSERS = {_parse_int: int, _parse_str: str, _parse_bool: _BOOLEANS.__getitem__}
+
+# A file column: its name, the property it fills, the converter, whether it
+# must be present and the default used when it is absent or empty.
+Column = namedtuple('Column', 'name field parse required default')
+
+_NO_DEFAULT = object()
+
+_BASE_COLUMNS = (
+    Column('address', 'Address', _parse_str, True, _NO_DEFAULT),
+    Column('built_up_area', 'Built_Up_Area', float, True, _NO_DEFAULT),
+    Column('num_of_bedrooms', 'Number_of_Bedrooms', _parse_int, True, _NO_DEFAULT),
+    Column('num_of_bathrooms', 'Number_of_Bathrooms', _parse_int, True, _NO_DEFAULT),
+    Column('num_of_parking_slots', 'Number_of_Parking_Slots', _parse_int, False, 1),
+    Column('pool_avail', 'Pool_Avail', _parse_bool, False, False),
+    Column('gym_avail', 'Gym_Avail', _parse_bool, False, False),
+    Column('agent_commission_percent', 'AgentCommissionPercent', float, False, 0.02),
+)
+_HOUSE_COLUMNS = (
+    Column('num_of_floors', 'Number_of_Floors', _parse_int, True, _NO_DEFAULT),
+    Column('plot_size', 'Plot_Size', float, True, _NO_DEFAULT),
+    Column('house_type', 'House_Type', _parse_str, True, _NO_DEFAULT),
+)
+_APARTMENT_COLUMNS = (
+    Column('floor_num', 'FloorNumber', _parse_int, True, _NO_DEFAULT),
+    Column('num_of_balconies', 'NumberOfBalconies', _parse_int, True, _NO_DEFAULT),
+)
+_SALE_COLUMNS = (
+    Column('sale_price', 'SalePrice', float, True, _NO_DEFAULT),
+    Column('annual_service_charge', 'AnnualServiceCharge', float, True, _NO_DEFAULT),
+    Column('fixed_tax_percent', 'FixedTaxPercent', float, False, 0.04),
+)
+_RENTAL_COLUMNS = (
+    Column('deposit_amount', 'DepositAmount', float, False, None),
+    Column('yearly_rent', 'YearlyRent', float, False, None),
+    Column('furnished', 'Furnished', _parse_bool, False, None),
+    Column('maid_room', 'MaidRoom', _parse_bool, False, None),
+)
+
+# Loadable class -> the file columns it reads.
+KIND_COLUMNS = {
+    RentalApartment: _BASE_COLUMNS + _APARTMENT_COLUMNS + _RENTAL_COLUMNS,
+    RentalHouse: _BASE_COLUMNS + _HOUSE_COLUMNS + _RENTAL_COLUMNS,
+    SaleApartment: _BASE_COLUMNS + _APARTMENT_COLUMNS + _SALE_COLUMNS,
+    SaleHouse: _BASE_COLUMNS + _HOUSE_COLUMNS + _SALE_COLUMNS,
+}
+
+# A rejected value: the 1-based record number in the file (header excluded),
+# the file column, the raw value and the reason.
+LoadError = namedtuple('LoadError', 'row column value message')
+
+
+class LoadReport:
+    """
+    The outcome of a bulk_load() call.
+    """
+
+    def __init__(self, kind):
+        """
+        Initializes an empty LoadReport.
+
+        Args:
+            kind (type): The class that was loaded.
+        """
+        self.kind = kind
+        self.count = 0
+        self.errors = []
+        self.references = []
+        self.properties = []
+        self.rows = []
+
+    def errors_by_column(self):
+        """
+        Groups the rejected values by file column.
+
+        Returns:
+            dict: Column name -> list of LoadError.
+        """
+        grouped = {}
+        for error in self.errors:
+            grouped.setdefault(error.column, []).append(error)
+        return grouped
+
+    def __repr__(self):
+        return 'LoadReport(kind={}, count={}, errors={})'.format(
+            self.kind.__name__, self.count, len(self.errors))
+
+
+def reserve_references(count):
+    """
+    Reserves a contiguous block of reference numbers in one step.
+
+    Args:
+        count (int): The number of reference numbers needed.
+
+    Returns:
+        range: The reserved reference numbers.
+    """
+    return ResidentialProperty.reference_allocator.allocate_block(count)
+
+
+@contextmanager
+def gc_paused():
+    """
+    Pauses the cyclic garbage collector while objects are built, e.g. a
+    chunk or a whole file. Creating tens of thousands of containers otherwise
+    triggers repeated collections that scan the whole, growing, registry.
+    Nested pauses leave the collector off until the outermost one ends.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def resolve_kind(kind):
+    """
+    Accepts a loadable class or its name.
+
+    Args:
+        kind (type or str): E.g. SaleHouse or 'SaleHouse'.
+
+    Returns:
+        type: The class.
+    """
+    for cls in KIND_COLUMNS:
+        if kind is cls or kind == cls.__name__:
+            return cls
+    raise ValueError('Cannot bulk load {!r}; expected one of {}'.format(
+        kind, ', '.join(cls.__name__ for cls in KIND_COLUMNS)))
+
+
+def read_csv_chunks(path, chunk_size):
+    """
+    Reads a CSV file with a header row in column-oriented chunks.
+
+    A chunk without quotes whose lines all have one value per column is
+    split with a few str calls over the whole chunk instead of record by
+    record. Other chunks, e.g. with blank or short lines, go through the csv
+    module, and so does the rest of the file from the first quote on, since
+    a quoted value may span lines.
+
+    Args:
+        path (str): The file path.
+        chunk_size (int): The maximum number of records per chunk.
+
+    Yields:
+        dict: Column name -> list of raw string values.
+    """
+    with open(path, newline='') as handle:
+        reader = csv.reader(handle)
+        header = [name.strip() for name in next(reader, [])]
+        width = len(header)
+        while width > 1:
+            lines = list(islice(handle, chunk_size))
+            if not lines:
+                return
+            text = ''.join(lines).replace('\r\n', '\n')
+            if '"' in text:
+                reader = csv.reader(chain(lines, handle))
+                break
+            records = text[:-1].split('\n') if text.endswith('\n') else text.split('\n')
+            if '\r' in text or set(map(str.count, records, repeat(','))) != {width - 1}:
+                yield from _csv_chunks(header, csv.reader(lines), chunk_size)
+                continue
+            values = ','.join(records).split(',')
+            yield {name: values[position::width] for position, name in enumerate(header)}
+        yield from _csv_chunks(header, reader, chunk_size)
+
+
+def _csv_chunks(header, reader, chunk_size):
+    """
+    Turns the records of a csv reader into column-oriented chunks. Blank
+    records are skipped and short records are padded with empty values.
+
+    Args:
+        header (list): The column names.
+        reader (iterator): The csv reader, past the header.
+        chunk_size (int): The maximum number of records per chunk.
+
+    Yields:
+        dict: Column name -> list of raw string values.
+    """
+    width = len(header)
+    while True:
+        rows = list(islice(reader, chunk_size))
+        if not rows:
+            return
+        if set(map(len, rows)) != {width}:
+            rows = [row if len(row) == width else (row + [''] * width)[:width]
+                    for row in rows if row]
+            if not rows:
+                continue
+        yield dict(zip(header, map(list, zip(*rows))))
+
+
+def read_parquet_chunks(path, chunk_size):
+    """
+    Reads a Parquet file in column-oriented chunks. Requires pyarrow.
+
+    Args:
+        path (str): The file path.
+        chunk_size (int): The maximum number of records per chunk.
+
+    Yields:
+        dict: Column name -> list of values.
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError('pyarrow is required to load Parquet files') from None
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+        yield batch.to_pydict()
+
+
+def _validate_chunk(columns, specs, first_row, errors):
+    """
+    Converts the raw columns of a chunk and drops records with bad values.
+
+    Args:
+        columns (dict): Column name -> raw values.
+        specs (tuple): The Column specs of the loaded class.
+        first_row (int): The record number of the first record in the chunk.
+        errors (list): Receives a LoadError per rejected value.
+
+    Returns:
+        dict: Property name -> list of converted values for the valid records.
+    """
+    size = len(next(iter(columns.values()))) if columns else 0
+    converted = {}
+    bad_rows = set()
+    for spec in specs:
+        raw = columns.get(spec.name)
+        if raw is None:
+            converted[spec.field] = [spec.default] * size
+            continue
+        parse = spec.parse
+        if raw and raw[0].__class__ is str and parse in _TEXT_PARSERS:
+            # CSV columns are all text, so the builtin converters can be used
+            # directly; they raise on missing values, which then go through
+            # the checked loop below. A text column is already converted.
+            if parse is not _parse_str:
+                parse = _TEXT_PARSERS[parse]
+            elif '' in raw or None in raw:
+                parse = None
+            else:
+                converted[spec.field] = raw
+                continue
+        if parse is not None:
+            try:
+                # Fast path: a clean column converts in a single map() call.
+                converted[spec.field] = list(map(parse, raw))
+                continue
+            except (TypeError, ValueError, KeyError):
+                pass
+        parse, values = spec.parse, []
+        for position, value in enumerate(raw):
+            if value is None or value == '':
+                if spec.required:
+                    errors.append(LoadError(first_row + position, spec.name, value,
+                                            'missing value'))
+                    bad_rows.add(position)
+                values.append(spec.default)
+                continue
+            try:
+                values.append(parse(value))
+            except (TypeError, ValueError) as exc:
+                errors.append(LoadError(first_row + position, spec.name, value, str(exc)))
+                bad_rows.add(position)
+                values.append(None)
+        converted[spec.field] = values
+    if bad_rows:
+        keep = [position for position in range(size) if position not in bad_rows]
+        converted = {field: [values[position] for position in keep]
+                     for field, values in converted.items()}
+    if converted.get('AgentCommissionPercent'):
+        # A falsy percent is ignored by the setter, leaving the 0.02 default.
+        converted['AgentCommissionPercent'] = [percent if percent else 0.02 for percent
+                                               in converted['AgentCommissionPercent']]
+    return converted
+
+
+def build_objects(kind, references, fields):
+    """
+    Creates property objects for a validated chunk without calling __init__.
+
+    Args:
+        kind (type): The class to create.
+        references (range): The reference numbers of the records.
+        fields (dict): Property name -> converted values.
+
+    Returns:
+        list: The new objects.
+    """
+    attributes, columns = ['_ResidentialProperty__reference_number'], [references]
+    for attribute, field in KIND_ATTRIBUTES[kind]:
+        if field is None:
+            continue
+        if attribute.startswith('_Rental__') and all(v is None for v in fields[field]):
+            # Left to the Rental class default, as for a constructed object.
+            continue
+        attributes.append(attribute)
+        columns.append(fields[field])
+    return attribute_builder(kind, tuple(attributes))(object.__new__, kind, *columns)
+
+
+_BUILDERS = {}
+
+
+def attribute_builder(kind, attributes):
+    """
+    Returns a generated function that creates objects of a class from one
+    column per attribute.
+
+    The attributes are assigned with plain attribute stores, like __init__
+    does, so the objects keep CPython's compact shared-key instance dicts.
+    Functions are generated once per class and attribute list.
+
+    Args:
+        kind (type): The class to create.
+        attributes (tuple): The (name-mangled) attribute names to assign.
+
+    Returns:
+        function: build(new, kind, *columns) -> list of objects.
+    """
+    key = (kind, attributes)
+    build = _BUILDERS.get(key)
+    if build is None:
+        names = ['column{}'.format(number) for number in range(len(attributes))]
+        values = ['value{}'.format(number) for number in range(len(attributes))]
+        lines = ['def build(new, kind, {}):'.format(', '.join(names)),
+                 '    properties = []',
+                 '    append = properties.append',
+                 '    for {} in zip({}):'.format(', '.join(values), ', '.join(names)),
+                 '        prop = new(kind)']
+        lines.extend('        prop.{} = {}'.format(attribute, value)
+                     for attribute, value in zip(attributes, values))
+        lines.extend(['        append(prop)', '    return properties'])
+        namespace = {}
+        exec('\n'.join(lines), namespace)
+        build = _BUILDERS[key] = namespace['build']
+    return build
+
+
+def iter_load(path, kind, store=None, chunk_size=50000, file_format=None, register=True):
+    """
+    Loads a file chunk by chunk.
+
+    Args:
+        path (str): The CSV or Parquet file.
+        kind (type or str): The class of every record, e.g. SaleHouse.
+        store (PropertyStore, optional): Load into this store instead of
+            creating objects.
+        chunk_size (int, optional): Records per chunk. Defaults to 50000.
+        file_format (str, optional): 'csv' or 'parquet'. Defaults to the
+            file extension.
+        register (bool, optional): Add the objects to the property
+            registries and notify observers. With False they are only
+            referenced by the caller, and each chunk can be freed once it is
+            consumed. Defaults to True.
+
+    Yields:
+        tuple: (references, loaded, errors) per chunk, where loaded is a list
+        of objects, or the range of store rows when loading into a store.
+    """
+    kind = resolve_kind(kind)
+    specs = KIND_COLUMNS[kind]
+    if file_format is None:
+        file_format = 'parquet' if os.path.splitext(path)[1].lower() in ('.parquet', '.pq') else 'csv'
+    if file_format == 'csv':
+        chunks = read_csv_chunks(path, chunk_size)
+    elif file_format == 'parquet':
+        chunks = read_parquet_chunks(path, chunk_size)
+    else:
+        raise ValueError('Unsupported file format: {!r}'.format(file_format))
+    first_row = 1
+    while True:
+        with gc_paused():
+            columns = next(chunks, None)
+            if columns is None:
+                return
+            missing = [spec.name for spec in specs
+                       if spec.required and spec.name not in columns]
+            if missing:
+                raise ValueError('{} is missing required columns: {}'.format(
+                    path, ', '.join(missing)))
+            errors = []
+            fields = _validate_chunk(columns, specs, first_row, errors)
+            first_row += len(next(iter(columns.values())))
+            count = len(fields['Address'])
+            references = reserve_references(count)
+            if store is not None:
+                loaded = store.extend(kind, references.start, fields)
+            else:
+                loaded = build_objects(kind, references, fields)
+                if register:
+                    for registry in ResidentialProperty.registries_for(kind):
+                        registry.extend(loaded)
+                    for observer in ResidentialProperty.observers:
+                        for prop in loaded:
+                            observer.property_added(prop)
+        yield references, loaded, errors
+
+
+def bulk_load(path, kind, store=None, chunk_size=50000, file_format=None):
+    """
+    Loads every record of a file.
+
+    Records with invalid values are skipped and reported; all other records
+    are loaded. Objects are added to the property registries and
+    observers are notified, exactly as if they had been constructed.
+
+    Args:
+        path (str): The CSV or Parquet file.
+        kind (type or str): The class of every record, e.g. SaleHouse.
+        store (PropertyStore, optional): Load into this store instead of
+            creating objects.
+        chunk_size (int, optional): Records per chunk. Defaults to 50000.
+        file_format (str, optional): 'csv' or 'parquet'. Defaults to the
+            file extension.
+
+    Returns:
+        LoadReport: The loaded objects or store rows, reference ranges and
+        errors.
+    """
+    report = LoadReport(resolve_kind(kind))
+    # Paused for the whole file rather than per chunk: with the collector
+    # running between chunks, full collections rescan everything loaded so
+    # far as the file goes on.
+    with gc_paused():
+        for references, loaded, errors in iter_load(path, kind, store, chunk_size, file_format):
+            report.errors.extend(sorted(errors))
+            if not references:
+                continue
+            report.count += len(references)
+            report.references.append(references)
+            if store is not None:
+                report.rows.append(loaded)
+            else:
+                report.properties.extend(loaded)
+    return report
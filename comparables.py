@@ -0,0 +1,643 @@
+"""
+Comparable listings by k-nearest-neighbour search, and price estimates from
+them.
+
+A listing is described by a feature vector read from its getters: bedrooms,
+bathrooms, Built_Up_Area, FloorNumber (apartments) or Number_of_Floors
+(houses), parking slots, pool, gym and whether it is a house. Counts and
+areas are divided by their standard deviation over the indexed listings, so
+100 units of area weigh about as much as one bedroom would in a book where
+those are the typical spreads. Flags are left as 0 or 1. Every feature is
+then multiplied by its weight. The comparables of a listing are the listings
+nearest to it in that space.
+
+    comparables = ComparablesIndex(of_type=(SaleApartment, SaleHouse))
+    comparables.find_comparables(prop, k=10)        # Comparable tuples, nearest first
+    comparables.find_comparables(prop, 10, mode='brute')
+
+    estimator = PriceEstimator()
+    estimator.estimate(prop)                        # Estimate of SalePrice or YearlyRent
+
+Queries go to a forest of static KD-trees. New listings are buffered and,
+once the buffer fills, merged with the small trees into one larger tree, the
+way a binary counter carries (the logarithmic method). Loading n listings one
+by one therefore rebuilds each listing O(log n) times instead of rebuilding
+the whole index per listing. The 'brute' mode scans every vector, with NumPy
+when it is installed, and serves as the correctness baseline for the trees.
+
+The index observes ResidentialProperty, so new properties, setter calls on
+the features and deregister() keep it current. The scales are fixed when the
+first tree is built; rebuild() derives them again from the current listings.
+"""
+
+from collections import namedtuple
+import heapq
+import math
+from math import dist
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from residentialproperty import (ResidentialProperty, PropertyObserver, House,
+                                 SaleApartment, SaleHouse, RentalApartment, RentalHouse)
+
+# Feature name -> True if it is a 0/1 flag rather than a count or area.
+FEATURES = (
+    ('Number_of_Bedrooms', False),
+    ('Number_of_Bathrooms', False),
+    ('Built_Up_Area', False),
+    ('FloorNumber', False),
+    ('Number_of_Floors', False),
+    ('Number_of_Parking_Slots', False),
+    ('Pool_Avail', True),
+    ('Gym_Avail', True),
+    ('is_house', True),
+)
+
+# An apartment and a house with the same rooms are poor comparables.
+DEFAULT_WEIGHTS = {'is_house': 2.0}
+
+SALE_TYPES = (SaleApartment, SaleHouse)
+RENTAL_TYPES = (RentalApartment, RentalHouse)
+
+Comparable = namedtuple('Comparable', 'reference distance property')
+Estimate = namedtuple('Estimate', 'field value spread comparables')
+
+_FIELDS = frozenset(name for name, _ in FEATURES if name != 'is_house')
+_LEAF_SIZE = 16
+_BUFFER_SIZE = 64
+
+
+def feature_values(prop):
+    """
+    Reads the raw features of a property.
+
+    Args:
+        prop: The property.
+
+    Returns:
+        tuple: One float per entry of FEATURES. A field the property does not
+        have, such as FloorNumber for a house, or an unset one reads as 0.
+    """
+    values = []
+    for name, _ in FEATURES:
+        if name == 'is_house':
+            values.append(1.0 if isinstance(prop, House) else 0.0)
+        else:
+            values.append(float(getattr(prop, name, None) or 0))
+    return tuple(values)
+
+
+def market_of(prop):
+    """
+    Finds the classes whose listings are comparable with a property.
+
+    Args:
+        prop: The property.
+
+    Returns:
+        tuple: SALE_TYPES or RENTAL_TYPES, or None for any other property.
+    """
+    if isinstance(prop, SALE_TYPES):
+        return SALE_TYPES
+    if isinstance(prop, RENTAL_TYPES):
+        return RENTAL_TYPES
+    return None
+
+
+class _KDTree:
+    """
+    A static KD-tree over (vector, reference) points.
+
+    Internal nodes are (dimension, split value, left, right) tuples and leaves
+    are lists of points. Each node splits at the median of its widest
+    dimension.
+    """
+
+    def __init__(self, points):
+        """
+        Builds a _KDTree.
+
+        Args:
+            points (list): (vector, reference) pairs. The list is reordered.
+        """
+        self.points = points
+        self.root = self._build(points)
+
+    def _build(self, points):
+        if len(points) <= _LEAF_SIZE:
+            return points
+        dimensions = len(points[0][0])
+        best, widest = 0, -1.0
+        for dimension in range(dimensions):
+            column = [vector[dimension] for vector, _ in points]
+            spread = max(column) - min(column)
+            if spread > widest:
+                best, widest = dimension, spread
+        if widest <= 0:
+            return points  # every point is the same; nothing to split
+        points.sort(key=lambda point: point[0][best])
+        middle = len(points) // 2
+        split = points[middle][0][best]
+        return (best, split, self._build(points[:middle]), self._build(points[middle:]))
+
+
+def _nearest(root, query, heap, k, live):
+    """
+    Adds the nearest live points under a KD-tree node to a heap of the best
+    found so far.
+
+    Args:
+        root: The node, a _KDTree root or a plain list of points.
+        query (tuple): The query vector.
+        heap (list): (-distance, -reference) pairs, at most k, with
+            the worst match on top. Updated in place.
+        k (int): The number of neighbours wanted.
+        live (callable): live(vector, reference) is False for points that were
+            removed or changed since they were placed.
+    """
+    # Each entry carries the squared distance from the query to the node's
+    # region, and the per-dimension offsets that distance is made of.
+    stack = [(root, 0.0, None)]
+    while stack:
+        node, bound, offsets = stack.pop()
+        if len(heap) == k and bound > heap[0][0] * heap[0][0]:
+            continue
+        if type(node) is list:
+            for vector, reference in node:
+                item = (-dist(query, vector), -reference)
+                if len(heap) < k:
+                    if live(vector, reference):
+                        heapq.heappush(heap, item)
+                elif item > heap[0] and live(vector, reference):
+                    heapq.heapreplace(heap, item)
+            continue
+        dimension, split, left, right = node
+        offset = query[dimension] - split
+        near, far = (left, right) if offset < 0 else (right, left)
+        # The far region is offset away along this dimension, replacing the
+        # offset already counted for it.
+        far_offsets = [0.0] * len(query) if offsets is None else offsets[:]
+        previous = far_offsets[dimension]
+        far_offsets[dimension] = offset
+        stack.append((far, bound - previous * previous + offset * offset, far_offsets))
+        stack.append((near, bound, offsets))
+
+
+class ComparablesIndex(PropertyObserver):
+    """
+    A nearest-neighbour index of listings over their feature vectors.
+    """
+
+    def __init__(self, properties=None, of_type=None, require=None, weights=None):
+        """
+        Initializes a ComparablesIndex and starts observing property changes.
+
+        Args:
+            properties (iterable, optional): The properties to index initially.
+                Defaults to ResidentialProperty.total_properties.
+            of_type (type or tuple, optional): Only index instances of these
+                classes, e.g. SALE_TYPES.
+            require (str, optional): Only index properties whose attribute of
+                this name is set, e.g. 'YearlyRent'.
+            weights (dict, optional): Feature name -> weight, overriding
+                DEFAULT_WEIGHTS. A weight of 0 ignores the feature.
+        """
+        if of_type is not None and not isinstance(of_type, tuple):
+            of_type = (of_type,)
+        self.of_type = of_type
+        self.require = require
+        merged = dict(DEFAULT_WEIGHTS)
+        merged.update(weights or {})
+        unknown = set(merged) - {name for name, _ in FEATURES}
+        if unknown:
+            raise ValueError('unknown features: {}'.format(', '.join(sorted(unknown))))
+        self.weights = tuple(merged.get(name, 1.0) for name, _ in FEATURES)
+        self.__entries = {}  # reference -> (property, raw features)
+        self.__vectors = {}  # reference -> scaled vector held by a tree or the buffer
+        self.__buffer = []  # (vector, reference) not yet in a tree
+        self.__trees = []  # _KDTree or None; slot i holds about _BUFFER_SIZE * 2**i points
+        self.__stale = 0  # tree and buffer points that no longer match their property
+        self.__scales = None
+        self.__matrix = None  # NumPy (references, vectors) for the brute mode
+        if properties is None:
+            properties = ResidentialProperty.total_properties
+        self.__loading = True
+        for prop in properties:
+            self.property_added(prop)
+        self.__loading = False
+        self.rebuild()
+        ResidentialProperty.add_observer(self)
+
+    def close(self):
+        """
+        Stops observing property changes. The index is no longer updated.
+        """
+        ResidentialProperty.remove_observer(self)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, prop):
+        entry = self.__entries.get(prop.getreference_number())
+        return entry is not None and entry[0] is prop
+
+    def get(self, reference):
+        """
+        Returns an indexed property by reference number.
+
+        Args:
+            reference (int): The reference number.
+
+        Returns:
+            ResidentialProperty: The property.
+        """
+        return self.__entries[reference][0]
+
+    @property
+    def scales(self):
+        """
+        Gets the factors that turn raw features into vector coordinates.
+
+        Returns:
+            tuple: One factor per entry of FEATURES (weight / spread), or None
+            before the first tree is built.
+        """
+        return self.__scales
+
+    def vector(self, prop):
+        """
+        Computes the feature vector of any property, indexed or not.
+
+        Args:
+            prop: The property.
+
+        Returns:
+            tuple: The scaled features. While the index is empty only the
+            weights are applied.
+        """
+        if self.__scales is None and self.__entries:
+            self.rebuild()
+        return self._scale(feature_values(prop))
+
+    def _scale(self, values):
+        return tuple(value * scale for value, scale in
+                     zip(values, self.__scales or self.weights))
+
+    def _derive_scales(self):
+        """
+        Derives the scales from the standard deviations of the raw features.
+
+        Returns:
+            tuple: weight / standard deviation per count or area feature, the
+            weight alone per flag.
+        """
+        rows = [values for _, values in self.__entries.values()]
+        scales = []
+        for position, ((_, flag), weight) in enumerate(zip(FEATURES, self.weights)):
+            spread = 1.0
+            if not flag and len(rows) > 1:
+                column = [row[position] for row in rows]
+                mean = math.fsum(column) / len(column)
+                spread = math.sqrt(math.fsum((value - mean) ** 2 for value in column) /
+                                   len(column)) or 1.0
+            scales.append(weight / spread)
+        return tuple(scales)
+
+    def _accepts(self, prop):
+        if self.of_type is not None and not isinstance(prop, self.of_type):
+            return False
+        return self.require is None or getattr(prop, self.require, None) is not None
+
+    def _live(self, vector, reference):
+        return self.__vectors.get(reference) is vector
+
+    def _insert(self, prop, reference):
+        """
+        Indexes a property. Its vector waits in the buffer until the buffer
+        fills and is carried into the trees.
+
+        Args:
+            prop: The property.
+            reference (int): Its reference number.
+        """
+        values = feature_values(prop)
+        self.__entries[reference] = (prop, values)
+        self.__matrix = None
+        if self.__scales is None:
+            # Still loading, or too few listings to derive scales from: the
+            # first rebuild() places every entry.
+            if not self.__loading and len(self.__entries) >= _BUFFER_SIZE:
+                self.rebuild()
+            return
+        vector = self._scale(values)
+        self.__vectors[reference] = vector
+        self.__buffer.append((vector, reference))
+        if len(self.__buffer) >= _BUFFER_SIZE:
+            self._carry()
+
+    def _delete(self, reference):
+        """
+        Removes a property. Its tree point goes stale and is dropped when its
+        tree is merged or rebuilt.
+
+        Args:
+            reference (int): The reference number.
+        """
+        del self.__entries[reference]
+        self.__matrix = None
+        if self.__vectors.pop(reference, None) is not None:
+            self.__stale += 1
+            if self.__stale > _BUFFER_SIZE + len(self.__vectors):
+                self._restructure()
+
+    def _carry(self):
+        """
+        Merges the buffer and the smallest trees into one tree, like the carry
+        of a binary counter.
+        """
+        live = self._live
+        points = [point for point in self.__buffer if live(*point)]
+        self.__buffer = []
+        trees = self.__trees
+        slot = 0
+        while slot < len(trees) and trees[slot] is not None:
+            points.extend(point for point in trees[slot].points if live(*point))
+            trees[slot] = None
+            slot += 1
+        if slot == len(trees):
+            trees.append(None)
+        self.__stale = sum(len(tree.points) for tree in trees if tree is not None) + \
+            len(points) - len(self.__vectors)
+        if points:
+            trees[slot] = _KDTree(points)
+
+    def _restructure(self):
+        """
+        Rebuilds the trees from the live vectors, keeping the scales.
+        """
+        points = [(vector, reference) for reference, vector in self.__vectors.items()]
+        self.__buffer = []
+        self.__stale = 0
+        slot = 0
+        while _BUFFER_SIZE << slot < len(points):
+            slot += 1
+        self.__trees = [None] * (slot + 1)
+        if points:
+            self.__trees[slot] = _KDTree(points)
+
+    def rebuild(self):
+        """
+        Derives the scales again from the indexed listings and rebuilds every
+        tree, e.g. after the book has grown or shifted a lot since the index
+        was created.
+        """
+        self.__scales = None
+        if not self.__entries:
+            self.__vectors = {}
+            self.__buffer = []
+            self.__trees = []
+            return
+        self.__scales = self._derive_scales()
+        scale = self._scale
+        self.__vectors = {reference: scale(values)
+                          for reference, (_, values) in self.__entries.items()}
+        self.__matrix = None
+        self._restructure()
+
+    def property_added(self, prop):
+        """
+        Indexes a new property if it is of an indexed type.
+
+        Args:
+            prop (ResidentialProperty): The new property.
+        """
+        reference = prop.getreference_number()
+        if reference not in self.__entries and self._accepts(prop):
+            self._insert(prop, reference)
+
+    def property_removed(self, prop):
+        """
+        Removes a deregistered property from the index.
+
+        Args:
+            prop (ResidentialProperty): The removed property.
+        """
+        reference = prop.getreference_number()
+        entry = self.__entries.get(reference)
+        if entry is not None and entry[0] is prop:
+            self._delete(reference)
+
+    def property_changed(self, prop, field, old_value, new_value):
+        """
+        Moves a property whose features changed, and adds or removes one whose
+        required field was set or cleared.
+
+        Args:
+            prop: The property whose field changed.
+            field (str): The property attribute name.
+            old_value: The value before the change.
+            new_value: The value after the change.
+        """
+        if field not in _FIELDS and field != self.require:
+            return
+        reference = prop.getreference_number()
+        entry = self.__entries.get(reference)
+        if entry is not None:
+            if entry[0] is not prop:
+                return
+            self._delete(reference)
+        if self._accepts(prop):
+            self._insert(prop, reference)
+
+    def find_comparables(self, prop, k=10, mode='tree'):
+        """
+        Finds the listings most like a property.
+
+        Args:
+            prop: The property. It does not need to be indexed; if it is, it
+                is not its own comparable.
+            k (int, optional): The number of comparables. Defaults to 10.
+            mode (str, optional): 'tree' searches the KD-trees; 'brute' scans
+                every vector (with NumPy if installed) and returns the same
+                answer. Defaults to 'tree'.
+
+        Returns:
+            list: Comparable(reference, distance, property) tuples, nearest
+            first. Ties are ordered by reference number.
+
+        Raises:
+            ValueError: If mode is unknown.
+        """
+        if mode not in ('tree', 'brute'):
+            raise ValueError("mode must be 'tree' or 'brute'")
+        query = self.vector(prop)
+        if k < 1 or self.__scales is None:
+            return []
+        own = prop.getreference_number()
+        entry = self.__entries.get(own)
+        exclude = own if entry is not None and entry[0] is prop else None
+        wanted = k + (exclude is not None)
+        if mode == 'brute':
+            found = self._brute(query, wanted)
+        else:
+            found = self._search(query, wanted)
+        entries = self.__entries
+        return [Comparable(reference, distance, entries[reference][0])
+                for distance, reference in found if reference != exclude][:k]
+
+    def _search(self, query, k):
+        """
+        Runs a kNN query over the buffer and every tree.
+
+        Args:
+            query (tuple): The query vector.
+            k (int): The number of neighbours.
+
+        Returns:
+            list: (distance, reference) pairs, nearest first.
+        """
+        heap = []
+        live = self._live
+        _nearest(self.__buffer, query, heap, k, live)
+        for tree in reversed(self.__trees):  # the large trees tighten the bound first
+            if tree is not None:
+                _nearest(tree.root, query, heap, k, live)
+        return sorted((-distance, -reference) for distance, reference in heap)
+
+    def _brute(self, query, k):
+        """
+        Runs a kNN query by computing the distance to every vector.
+
+        Args:
+            query (tuple): The query vector.
+            k (int): The number of neighbours.
+
+        Returns:
+            list: (distance, reference) pairs, nearest first.
+        """
+        if np is None:
+            return heapq.nsmallest(k, ((dist(query, vector), reference)
+                                       for reference, vector in self.__vectors.items()))
+        if self.__matrix is None:
+            self.__matrix = (np.fromiter(self.__vectors, dtype=np.int64, count=len(self.__vectors)),
+                             np.array(list(self.__vectors.values()), dtype=float))
+        references, vectors = self.__matrix
+        if not len(references):
+            return []
+        distances = np.sqrt(((vectors - np.asarray(query, dtype=float)) ** 2).sum(axis=1))
+        if k < len(distances):
+            # Keep everything tied with the k-th distance so that ties are
+            # broken by reference number, as in the tree mode.
+            kth = np.partition(distances, k - 1)[k - 1]
+            chosen = np.nonzero(distances <= kth)[0]
+        else:
+            chosen = np.arange(len(distances))
+        return sorted(zip(distances[chosen].tolist(), references[chosen].tolist()))[:k]
+
+
+def find_comparables(prop, k=10, properties=None, mode='tree'):
+    """
+    Finds the comparables of one property with a temporary index over the
+    listings of its market (sales for a sale, rentals with a YearlyRent for a
+    rental). Keep a ComparablesIndex instead when asking more than once.
+
+    Args:
+        prop: The property.
+        k (int, optional): The number of comparables. Defaults to 10.
+        properties (iterable, optional): The candidate listings. Defaults to
+            ResidentialProperty.total_properties.
+        mode (str, optional): 'tree' or 'brute'. Defaults to 'tree'.
+
+    Returns:
+        list: Comparable(reference, distance, property) tuples, nearest first.
+    """
+    market = market_of(prop)
+    index = ComparablesIndex(properties, of_type=market,
+                             require='YearlyRent' if market is RENTAL_TYPES else None)
+    try:
+        return index.find_comparables(prop, k, mode)
+    finally:
+        index.close()
+
+
+class PriceEstimator:
+    """
+    Suggests a SalePrice or YearlyRent for a listing from its comparables.
+
+    Each comparable's price is scaled to the listing's Built_Up_Area (its
+    price per unit area times the listing's area) and the estimate is the
+    mean of those, weighted by the inverse of the comparable's distance.
+    """
+
+    def __init__(self, properties=None, k=10, weights=None):
+        """
+        Initializes a PriceEstimator with one index of priced sales and one
+        of priced rentals, both following property changes.
+
+        Args:
+            properties (iterable, optional): The listings to learn from.
+                Defaults to ResidentialProperty.total_properties.
+            k (int, optional): The comparables per estimate. Defaults to 10.
+            weights (dict, optional): Feature weights, as for ComparablesIndex.
+        """
+        if properties is not None:
+            properties = list(properties)
+        self.k = k
+        self.indexes = {
+            'SalePrice': ComparablesIndex(properties, SALE_TYPES, 'SalePrice', weights),
+            'YearlyRent': ComparablesIndex(properties, RENTAL_TYPES, 'YearlyRent', weights),
+        }
+
+    def close(self):
+        """
+        Stops both indexes observing property changes.
+        """
+        for index in self.indexes.values():
+            index.close()
+
+    def estimate(self, prop, field=None, k=None):
+        """
+        Estimates the price of a listing.
+
+        Args:
+            prop: The listing. It may be unpriced or not registered at all.
+            field (str, optional): 'SalePrice' or 'YearlyRent'. Defaults to
+                the price field of the listing's class.
+            k (int, optional): The number of comparables. Defaults to the
+                estimator's k.
+
+        Returns:
+            Estimate: The field, the estimated value, the weighted standard
+            deviation of the comparables' scaled prices, and the comparables.
+            The value and spread are NaN if there are no comparables.
+
+        Raises:
+            ValueError: If field is not given and the listing is neither a
+                sale nor a rental.
+        """
+        if field is None:
+            market = market_of(prop)
+            if market is None:
+                raise ValueError('field is required for a listing that is neither '
+                                 'a sale nor a rental')
+            field = 'SalePrice' if market is SALE_TYPES else 'YearlyRent'
+        comparables = self.indexes[field].find_comparables(prop, self.k if k is None else k)
+        area = getattr(prop, 'Built_Up_Area', None)
+        total = weighted = weighted_squares = 0.0
+        for comparable in comparables:
+            price = getattr(comparable.property, field)
+            their_area = comparable.property.Built_Up_Area
+            if area and their_area:
+                price = price * area / their_area
+            weight = 1.0 / (comparable.distance + 1e-3)
+            total += weight
+            weighted += weight * price
+            weighted_squares += weight * price * price
+        if not total:
+            return Estimate(field, math.nan, math.nan, comparables)
+        value = weighted / total
+        spread = math.sqrt(max(0.0, weighted_squares / total - value * value))
+        return Estimate(field, value, spread, comparables)
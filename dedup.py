@@ -0,0 +1,320 @@
+"""
+Duplicate detection for incoming listings, by blocking keys and
+locality-sensitive hashing of addresses.
+
+Feeds often submit a property again with a slightly different Address
+('12 Baker St.', '12 Bakr Street'), and every submission gets a new reference
+number. DedupEngine finds such resubmissions without comparing every pair of
+listings:
+
+1. Blocking. Two listings can only match if they have the same class,
+   bedrooms, bathrooms and house or flat numbers in the address, and
+   Built_Up_Area within area_tolerance of each other. Areas are bucketed on a
+   logarithmic scale so that close areas share a bucket or sit in
+   neighbouring ones.
+2. LSH. Within a block, the trigrams of the normalized street name (see
+   addressindex.py) are MinHashed into bands of rows; listings sharing any
+   band are candidates. Two streets with trigram similarity s become
+   candidates with probability 1 - (1 - s ** rows) ** bands.
+3. Verification. Each candidate is compared exactly: areas within the
+   tolerance and trigram similarity of at least min_similarity. The most
+   similar candidate wins.
+
+    engine = DedupEngine(ResidentialProperty.total_properties)
+    report = engine.add_batch(new_listings)
+    report.duplicates                  # [(reference, canonical reference), ...]
+    engine.canonical(reference)
+
+add_batch() handles each batch incrementally: listings are matched against
+everything indexed so far, including the earlier members of the same batch,
+and then indexed themselves. A duplicate is merged under the canonical
+reference number, the one its cluster was first indexed with: with
+merge=True it is also deregistered, so it leaves the registries and every
+index that observes them.
+"""
+
+from collections import namedtuple
+import math
+import random
+import re
+import time
+
+from addressindex import normalize_address, similarity, street_of, trigrams
+from propertystore import kind_code
+
+DedupReport = namedtuple('DedupReport', 'added duplicates candidates seconds')
+DedupReport.__doc__ = """
+The outcome of one add_batch() call: the number of listings added, the
+(reference, canonical reference) pairs found, the candidate pairs verified
+and the seconds taken.
+"""
+
+_Record = namedtuple('_Record', 'prop block area street')
+
+_NUMBER = re.compile(r'\S*\d\S*')
+
+
+def _numbers(normalized):
+    """
+    Finds the words of an address that contain digits, e.g. house and flat
+    numbers.
+
+    Args:
+        normalized (str): A normalized address.
+
+    Returns:
+        tuple: The words, in order.
+    """
+    return tuple(_NUMBER.findall(normalized))
+
+
+class DedupEngine:
+    """
+    Finds and merges resubmitted listings, batch by batch.
+    """
+
+    def __init__(self, properties=(), area_tolerance=0.02, min_similarity=0.5,
+                 bands=6, rows=1, seed=0):
+        """
+        Initializes a DedupEngine.
+
+        Args:
+            properties (iterable, optional): Listings already in the book.
+                They are indexed as canonical listings without being compared.
+                Defaults to none.
+            area_tolerance (float, optional): The largest relative difference
+                of Built_Up_Area between duplicates. Defaults to 0.02.
+            min_similarity (float, optional): The smallest trigram similarity
+                of the street names of duplicates. Defaults to 0.5.
+            bands (int, optional): MinHash bands. More bands find more
+                duplicates and cost more memory. Defaults to 6.
+            rows (int, optional): MinHash values per band. More rows make
+                candidates rarer and more similar. The blocks are narrow
+                enough for one row to verify few candidates. Defaults to 1.
+            seed (int, optional): Seeds the MinHash functions. Defaults to 0.
+        """
+        if not 0 <= area_tolerance < 1:
+            raise ValueError('area_tolerance must be in [0, 1)')
+        self.area_tolerance = area_tolerance
+        self.min_similarity = min_similarity
+        self.bands = bands
+        self.rows = rows
+        generator = random.Random(seed)
+        self.__masks = [generator.getrandbits(63) for _ in range(bands * rows)]
+        self.__bucket_width = math.log1p(area_tolerance) if area_tolerance else None
+        self.__records = {}  # reference -> _Record of canonical listings
+        self.__buckets = {}  # (block, area bucket, band, signature) -> reference or list
+        self.__parents = {}  # merged reference -> canonical reference
+        self.__merged = {}  # canonical reference -> merged references
+        for prop in properties:
+            self._index(prop.getreference_number(), self._record(prop))
+
+    def __len__(self):
+        return len(self.__records)
+
+    def _record(self, prop):
+        """
+        Extracts the matching fields of a listing.
+
+        Args:
+            prop (ResidentialProperty): The listing.
+
+        Returns:
+            _Record: Its record.
+        """
+        normalized = normalize_address(prop.Address or '')
+        block = (kind_code(type(prop)), prop.Number_of_Bedrooms, prop.Number_of_Bathrooms,
+                 _numbers(normalized))
+        return _Record(prop, block, prop.Built_Up_Area, street_of(normalized))
+
+    def _area_bucket(self, area):
+        if not area or area <= 0:
+            return None
+        if self.__bucket_width is None:
+            return area
+        return int(math.log(area) // self.__bucket_width)
+
+    def _bands(self, street):
+        """
+        Computes the MinHash band signatures of a street name.
+
+        Args:
+            street (str): The street name.
+
+        Returns:
+            list: One tuple of rows values per band.
+        """
+        hashes = [hash(gram) for gram in trigrams(street)]
+        minimums = [min(map(mask.__xor__, hashes)) for mask in self.__masks]
+        rows = self.rows
+        return [tuple(minimums[start:start + rows]) for start in range(0, len(minimums), rows)]
+
+    def _index(self, reference, record, signatures=None):
+        """
+        Adds a canonical listing to the buckets.
+
+        Args:
+            reference (int): Its reference number.
+            record (_Record): Its record.
+            signatures (list, optional): Its band signatures, if already
+                computed.
+        """
+        self.__records[reference] = record
+        if signatures is None:
+            signatures = self._bands(record.street)
+        buckets = self.__buckets
+        area_bucket = self._area_bucket(record.area)
+        for band, signature in enumerate(signatures):
+            key = (record.block, area_bucket, band, signature)
+            members = buckets.get(key)
+            if members is None:
+                buckets[key] = reference  # most buckets hold one listing
+            elif isinstance(members, list):
+                members.append(reference)
+            else:
+                buckets[key] = [members, reference]
+
+    def _candidates(self, record, signatures):
+        """
+        Collects the canonical listings sharing a block, a neighbouring area
+        bucket and a band with a record.
+
+        Args:
+            record (_Record): The record.
+            signatures (list): Its band signatures.
+
+        Returns:
+            set: Their reference numbers.
+        """
+        found = set()
+        bucket = self._area_bucket(record.area)
+        if bucket is None or self.__bucket_width is None:
+            neighbours = (bucket,)
+        else:
+            neighbours = (bucket - 1, bucket, bucket + 1)
+        buckets = self.__buckets
+        for area_bucket in neighbours:
+            for band, signature in enumerate(signatures):
+                members = buckets.get((record.block, area_bucket, band, signature))
+                if members is None:
+                    continue
+                if isinstance(members, list):
+                    found.update(members)
+                else:
+                    found.add(members)
+        return found
+
+    def _areas_match(self, left, right):
+        if left == right:
+            return True
+        if not left or not right:
+            return False
+        return abs(left - right) <= self.area_tolerance * max(abs(left), abs(right))
+
+    def match(self, prop):
+        """
+        Finds the canonical listing a listing duplicates, without indexing it.
+
+        Args:
+            prop (ResidentialProperty): The listing.
+
+        Returns:
+            tuple: (canonical reference number or None, candidates verified).
+        """
+        record = self._record(prop)
+        return self._match(record, prop.getreference_number(), self._bands(record.street))
+
+    def _match(self, record, reference, signatures):
+        """
+        Verifies the candidates of a record.
+
+        Args:
+            record (_Record): The record.
+            reference (int): Its reference number, never matched with itself.
+            signatures (list): Its band signatures.
+
+        Returns:
+            tuple: (best canonical reference number or None, candidates).
+        """
+        candidates = self._candidates(record, signatures)
+        candidates.discard(reference)
+        best, best_similarity = None, self.min_similarity
+        grams = trigrams(record.street)
+        for candidate in sorted(candidates):
+            other = self.__records[candidate]
+            if not self._areas_match(record.area, other.area):
+                continue
+            score = similarity(grams, trigrams(other.street))
+            if score > best_similarity or (best is None and score == best_similarity):
+                best, best_similarity = candidate, score
+        return best, len(candidates)
+
+    def add_batch(self, properties, merge=True):
+        """
+        Matches a batch of new listings and indexes the ones that are not
+        duplicates.
+
+        Args:
+            properties (iterable): The new listings.
+            merge (bool, optional): Whether to deregister the duplicates, so
+                only their canonical listing stays in the book. Defaults to
+                True.
+
+        Returns:
+            DedupReport: What was found.
+        """
+        start = time.perf_counter()
+        added, compared, duplicates = 0, 0, []
+        for prop in properties:
+            added += 1
+            reference = prop.getreference_number()
+            record = self._record(prop)
+            signatures = self._bands(record.street)
+            canonical, candidates = self._match(record, reference, signatures)
+            compared += candidates
+            if canonical is None:
+                self._index(reference, record, signatures)
+                continue
+            self.__parents[reference] = canonical
+            self.__merged.setdefault(canonical, []).append(reference)
+            duplicates.append((reference, canonical))
+            if merge:
+                prop.deregister()
+        return DedupReport(added, duplicates, compared, time.perf_counter() - start)
+
+    def canonical(self, reference):
+        """
+        Returns the canonical reference number of a listing.
+
+        Args:
+            reference (int): A reference number seen by the engine.
+
+        Returns:
+            int: The reference number the listing was merged under, or its
+            own if it is not a duplicate.
+        """
+        return self.__parents.get(reference, reference)
+
+    def duplicates_of(self, reference):
+        """
+        Lists the listings merged under a canonical listing.
+
+        Args:
+            reference (int): The canonical reference number.
+
+        Returns:
+            list: Their reference numbers, ascending.
+        """
+        return sorted(self.__merged.get(reference, ()))
+
+    def get(self, reference):
+        """
+        Returns a canonical listing.
+
+        Args:
+            reference (int): Its reference number.
+
+        Returns:
+            ResidentialProperty: The listing.
+        """
+        return self.__records[reference].prop
@@ -0,0 +1,311 @@
+"""
+A grid index over property coordinates for radius and bounding-box queries.
+
+Coordinates are the optional ResidentialProperty.Location, a (latitude,
+longitude) pair in degrees. GeoIndex buckets located properties into a fixed
+grid of cell_degrees x cell_degrees cells (the same idea as a geohash at one
+precision). A query only visits the cells overlapping the search area and
+checks the exact distance or bounds for the properties in them.
+
+    geo = GeoIndex()
+    prop.Location = (51.5072, -0.1276)
+    geo.within_radius(51.5, -0.12, 2.0)          # references, nearest first
+    geo.within_box(51.4, -0.3, 51.6, 0.1)        # references, ascending
+
+The index observes ResidentialProperty, so the Location setter, new
+properties and deregister() keep it current. Properties without a location
+are not indexed.
+"""
+
+import math
+
+from residentialproperty import ResidentialProperty, PropertyObserver
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(latitude1, longitude1, latitude2, longitude2):
+    """
+    Computes the great-circle distance between two points.
+
+    Args:
+        latitude1 (float): Latitude of the first point, in degrees.
+        longitude1 (float): Longitude of the first point, in degrees.
+        latitude2 (float): Latitude of the second point, in degrees.
+        longitude2 (float): Longitude of the second point, in degrees.
+
+    Returns:
+        float: The distance in kilometres.
+    """
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    half_dphi = (phi2 - phi1) / 2
+    half_dlambda = math.radians(longitude2 - longitude1) / 2
+    a = math.sin(half_dphi) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(half_dlambda) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GeoIndex(PropertyObserver):
+    """
+    A fixed-grid spatial index of the properties that have a Location.
+    """
+
+    def __init__(self, properties=None, cell_degrees=0.05):
+        """
+        Initializes a GeoIndex and starts observing property changes.
+
+        Args:
+            properties (iterable, optional): The properties to index initially.
+                Defaults to ResidentialProperty.total_properties.
+            cell_degrees (float, optional): The cell size in degrees. Defaults
+                to 0.05, about 5.5 km of latitude. Pick it near the usual
+                query radius.
+        """
+        if not 0 < cell_degrees <= 90:
+            raise ValueError('cell_degrees must be in (0, 90]')
+        self.cell_degrees = cell_degrees
+        self.__rows = math.ceil(180 / cell_degrees)
+        self.__columns = math.ceil(360 / cell_degrees)
+        self.__cells = {}  # (row, column) -> {reference: (latitude, longitude)}
+        self.__located = {}  # reference -> (property, cell)
+        if properties is None:
+            properties = ResidentialProperty.total_properties
+        for prop in properties:
+            self.property_added(prop)
+        ResidentialProperty.add_observer(self)
+
+    def close(self):
+        """
+        Stops observing property changes. The index is no longer updated.
+        """
+        ResidentialProperty.remove_observer(self)
+
+    def __len__(self):
+        return len(self.__located)
+
+    def get(self, reference):
+        """
+        Returns an indexed property by reference number.
+
+        Args:
+            reference (int): The reference number.
+
+        Returns:
+            ResidentialProperty: The property.
+        """
+        return self.__located[reference][0]
+
+    def _row(self, latitude):
+        return min(self.__rows - 1, int((latitude + 90.0) // self.cell_degrees))
+
+    def _column(self, longitude):
+        return int((longitude + 180.0) // self.cell_degrees) % self.__columns
+
+    def _insert(self, prop, reference, location):
+        """
+        Adds a located property to its cell.
+
+        Args:
+            prop: The property.
+            reference (int): Its reference number.
+            location (tuple): Its (latitude, longitude).
+        """
+        cell = (self._row(location[0]), self._column(location[1]))
+        self.__cells.setdefault(cell, {})[reference] = location
+        self.__located[reference] = (prop, cell)
+
+    def _delete(self, reference):
+        """
+        Removes a property from its cell.
+
+        Args:
+            reference (int): The reference number.
+        """
+        _, cell = self.__located.pop(reference)
+        members = self.__cells[cell]
+        del members[reference]
+        if not members:
+            del self.__cells[cell]
+
+    def property_added(self, prop):
+        """
+        Indexes a new property if it has a location.
+
+        Args:
+            prop (ResidentialProperty): The new property.
+        """
+        location = getattr(prop, 'Location', None)
+        if location is not None:
+            self._insert(prop, prop.getreference_number(), location)
+
+    def property_removed(self, prop):
+        """
+        Removes a deregistered property from the index.
+
+        Args:
+            prop (ResidentialProperty): The removed property.
+        """
+        reference = prop.getreference_number()
+        entry = self.__located.get(reference)
+        if entry is not None and entry[0] is prop:
+            self._delete(reference)
+
+    def property_changed(self, prop, field, old_value, new_value):
+        """
+        Moves a property whose Location changed.
+
+        Args:
+            prop: The property whose field changed.
+            field (str): The property attribute name.
+            old_value: The value before the change.
+            new_value: The value after the change.
+        """
+        if field != 'Location':
+            return
+        reference = prop.getreference_number()
+        entry = self.__located.get(reference)
+        if entry is not None:
+            if entry[0] is not prop:
+                return
+            self._delete(reference)
+        if new_value is not None:
+            self._insert(prop, reference, new_value)
+
+    def _cells_in(self, first_row, last_row, columns):
+        """
+        Yields the populated cells in a range of rows and columns, visiting
+        whichever is smaller: the range or the populated cells.
+
+        Args:
+            first_row (int): The first row.
+            last_row (int): The last row, inclusive.
+            columns (list): The columns.
+
+        Yields:
+            dict: Reference -> (latitude, longitude) for each populated cell.
+        """
+        cells = self.__cells
+        if (last_row - first_row + 1) * len(columns) <= len(cells):
+            for row in range(first_row, last_row + 1):
+                for column in columns:
+                    members = cells.get((row, column))
+                    if members is not None:
+                        yield members
+        else:
+            wanted = set(columns)
+            for (row, column), members in cells.items():
+                if first_row <= row <= last_row and column in wanted:
+                    yield members
+
+    def _column_range(self, west, east):
+        """
+        Lists the columns between two longitudes, going east and wrapping
+        across the antimeridian if west > east.
+
+        Args:
+            west (float): The western longitude.
+            east (float): The eastern longitude.
+
+        Returns:
+            list: The columns.
+        """
+        first, last = self._column(west), self._column(east)
+        if last >= first and west <= east:
+            return list(range(first, last + 1))
+        return list(range(first, self.__columns)) + list(range(0, last + 1))
+
+    def within_radius(self, latitude, longitude, radius_km):
+        """
+        Finds the properties within a distance of a point.
+
+        Args:
+            latitude (float): The latitude of the centre, in degrees.
+            longitude (float): The longitude of the centre, in degrees.
+            radius_km (float): The radius in kilometres.
+
+        Returns:
+            list: The reference numbers, nearest first.
+        """
+        return [reference for _, reference in self.within_radius_distances(
+            latitude, longitude, radius_km)]
+
+    def within_radius_distances(self, latitude, longitude, radius_km):
+        """
+        Finds the properties within a distance of a point, with their
+        distances.
+
+        Args:
+            latitude (float): The latitude of the centre, in degrees.
+            longitude (float): The longitude of the centre, in degrees.
+            radius_km (float): The radius in kilometres.
+
+        Returns:
+            list: (distance in kilometres, reference number) pairs, nearest
+            first.
+        """
+        angle = radius_km / EARTH_RADIUS_KM
+        delta_latitude = math.degrees(angle)
+        south, north = latitude - delta_latitude, latitude + delta_latitude
+        if south <= -90.0 or north >= 90.0 or math.sin(angle) >= math.cos(math.radians(latitude)):
+            columns = list(range(self.__columns))  # the circle reaches a pole
+        else:
+            delta_longitude = math.degrees(math.asin(math.sin(angle) /
+                                                     math.cos(math.radians(latitude))))
+            columns = self._column_range(_wrap(longitude - delta_longitude),
+                                         _wrap(longitude + delta_longitude))
+        phi = math.radians(latitude)
+        cos_phi = math.cos(phi)
+        # Compare the haversine term directly, without the asin per point.
+        limit = math.sin(min(angle, math.pi) / 2) ** 2
+        found = []
+        for members in self._cells_in(self._row(max(south, -90.0)), self._row(min(north, 90.0)),
+                                      columns):
+            for reference, (point_latitude, point_longitude) in members.items():
+                point_phi = math.radians(point_latitude)
+                a = (math.sin((point_phi - phi) / 2) ** 2 + cos_phi * math.cos(point_phi) *
+                     math.sin(math.radians(point_longitude - longitude) / 2) ** 2)
+                if a <= limit:
+                    found.append((2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a))),
+                                  reference))
+        found.sort()
+        return found
+
+    def within_box(self, south, west, north, east):
+        """
+        Finds the properties inside a latitude/longitude rectangle. A box with
+        west > east crosses the antimeridian.
+
+        Args:
+            south (float): The southern latitude, in degrees.
+            west (float): The western longitude, in degrees.
+            north (float): The northern latitude, in degrees.
+            east (float): The eastern longitude, in degrees.
+
+        Returns:
+            list: The reference numbers, in ascending order.
+        """
+        if south > north:
+            raise ValueError('south must not be greater than north')
+        wraps = west > east
+        found = []
+        for members in self._cells_in(self._row(max(south, -90.0)), self._row(min(north, 90.0)),
+                                      self._column_range(west, east)):
+            for reference, (point_latitude, point_longitude) in members.items():
+                if south <= point_latitude <= north and (
+                        (west <= point_longitude or point_longitude <= east) if wraps
+                        else west <= point_longitude <= east):
+                    found.append(reference)
+        found.sort()
+        return found
+
+
+def _wrap(longitude):
+    """
+    Wraps a longitude into [-180, 180).
+
+    Args:
+        longitude (float): The longitude, in degrees.
+
+    Returns:
+        float: The wrapped longitude.
+    """
+    return (longitude + 180.0) % 360.0 - 180.0
@@ -0,0 +1,496 @@
+"""
+Opt-in instrumentation of the property classes' hot paths.
+
+    instrumentation = Instrumentation()
+    with instrumentation:                    # enable() ... disable()
+        with instrumentation.section('pricing batch'):
+            run_pricing_batch()
+    print(instrumentation.to_prometheus())   # or dump_json(path)
+
+While enabled, an Instrumentation records:
+
+- a timing histogram of the constructor of every concrete class;
+- a timing histogram of every AgentCommissionValue() and TaxValue() call,
+  by class and method;
+- the number of setter calls per field;
+- the number of properties created and deregistered, and the registry size;
+- a timing histogram of each named section() of the caller's code.
+
+enable() wraps the constructors and valuation methods of the instrumented
+classes and registers the instrumentation as a PropertyObserver for the
+setter and registry counts. disable() puts the original functions back and
+unregisters it, so a disabled instrumentation costs nothing at all: the hot
+paths run exactly the code they run without this module. measure_overhead()
+and benchmarks/bench_instrumentation.py check that against a budget.
+
+batchcompute.compute_commissions() and compute_taxes() compute per class in
+one pass without calling the methods, so they are not counted.
+"""
+
+from bisect import bisect_left
+from collections import namedtuple
+from contextlib import contextmanager
+import functools
+import gc
+import json
+import math
+import statistics
+import time
+
+from patching import patch, restore
+from residentialproperty import (ResidentialProperty, PropertyObserver, SaleApartment, SaleHouse,
+                                 RentalApartment, RentalHouse)
+
+# Upper bounds of the histogram buckets, in seconds.
+DEFAULT_BUCKETS = (1e-7, 2.5e-7, 5e-7, 1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 1e-4, 1e-3, 1e-2, 1e-1)
+
+VALUATION_METHODS = ('AgentCommissionValue', 'TaxValue')
+
+# The fraction a disabled instrumentation may add to the time of the
+# instrumented operations. It restores the original functions, so any
+# measured difference is noise.
+DISABLED_OVERHEAD_BUDGET = 0.03
+
+# measure_overhead() only reports the budget as exceeded when the chance of
+# that many pairs exceeding it by noise alone is below this.
+OVERHEAD_SIGNIFICANCE = 0.001
+
+Overhead = namedtuple('Overhead', 'baseline disabled enabled overhead budget within_budget '
+                                  'pairs_over pairs')
+
+_active = None  # the enabled Instrumentation; only one can wrap the classes at a time
+
+
+class Histogram:
+    """
+    A Prometheus-style histogram: a count per bucket, plus the sum and count
+    of all observations.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Initializes an empty Histogram.
+
+        Args:
+            buckets (iterable, optional): The bucket upper bounds. Defaults to
+                DEFAULT_BUCKETS. An implicit +Inf bucket holds the rest.
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """
+        Records an observation.
+
+        Args:
+            value (float): The observed value, e.g. seconds.
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """
+        Lists the cumulative bucket counts, as Prometheus exposes them.
+
+        Returns:
+            list: (upper bound, observations <= bound) pairs, ending with
+            (inf, count).
+        """
+        pairs = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def to_dict(self):
+        return {'buckets': list(self.buckets), 'counts': list(self.counts), 'count': self.count,
+                'sum': self.sum}
+
+
+class Instrumentation(PropertyObserver):
+    """
+    Counters and timing histograms for constructors, setters, valuation
+    methods and the registry.
+    """
+
+    def __init__(self, classes=None, buckets=DEFAULT_BUCKETS):
+        """
+        Initializes a disabled Instrumentation.
+
+        Args:
+            classes (iterable, optional): The classes whose constructors and
+                valuation methods are timed. Defaults to SaleApartment,
+                SaleHouse, RentalApartment and RentalHouse. Slotted classes
+                can be added.
+            buckets (iterable, optional): Histogram bucket bounds in seconds.
+                Defaults to DEFAULT_BUCKETS.
+        """
+        self.classes = tuple(classes) if classes is not None else (
+            SaleApartment, SaleHouse, RentalApartment, RentalHouse)
+        self.buckets = tuple(buckets)
+        self.__patches = []  # patching.patch() records
+        self.reset()
+
+    def reset(self):
+        """
+        Zeroes every counter and histogram.
+        """
+        self.constructors = {}  # class name -> Histogram
+        self.valuations = {}  # (class name, method) -> Histogram
+        self.sections = {}  # section name -> Histogram
+        self.setter_calls = {}  # field -> calls
+        self.added = 0
+        self.removed = 0
+
+    @property
+    def enabled(self):
+        return _active is self
+
+    def enable(self):
+        """
+        Starts recording by wrapping the instrumented methods.
+
+        Raises:
+            RuntimeError: If another Instrumentation is enabled, or a method
+                is already wrapped, e.g. by validation.enable().
+        """
+        global _active
+        if _active is self:
+            return
+        if _active is not None:
+            raise RuntimeError('another Instrumentation is enabled')
+        try:
+            for cls in self.classes:
+                self._wrap(cls, '__init__', self._timed_constructor)
+                for name in VALUATION_METHODS:
+                    if hasattr(cls, name):
+                        self._wrap(cls, name, self._timed_valuation)
+        except Exception:
+            self._unwrap()
+            raise
+        _active = self
+        ResidentialProperty.add_observer(self)
+
+    def disable(self):
+        """
+        Stops recording and restores the original methods. The recorded
+        values are kept.
+        """
+        global _active
+        if _active is not self:
+            return
+        ResidentialProperty.remove_observer(self)
+        self._unwrap()
+        _active = None
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.disable()
+
+    def _wrap(self, cls, name, make_wrapper):
+        """
+        Replaces a method of a class with a timing wrapper.
+
+        Args:
+            cls (type): The class.
+            name (str): The method name.
+            make_wrapper (callable): make_wrapper(cls, name, function) returns
+                the wrapper.
+        """
+        patch('an Instrumentation', self.__patches, cls, name,
+              make_wrapper(cls, name, getattr(cls, name)))
+
+    def _unwrap(self):
+        """
+        Restores every wrapped method, newest first.
+        """
+        restore(self.__patches)
+
+    def _timed_constructor(self, cls, name, function):
+        histogram = self.constructors.get(cls.__name__)
+        if histogram is None:
+            histogram = self.constructors[cls.__name__] = Histogram(self.buckets)
+        observe, clock = histogram.observe, time.perf_counter
+
+        @functools.wraps(function)
+        def wrapper(prop, *args, **kwargs):
+            start = clock()
+            function(prop, *args, **kwargs)
+            observe(clock() - start)
+        return wrapper
+
+    def _timed_valuation(self, cls, name, function):
+        key = (cls.__name__, name)
+        histogram = self.valuations.get(key)
+        if histogram is None:
+            histogram = self.valuations[key] = Histogram(self.buckets)
+        observe, clock = histogram.observe, time.perf_counter
+
+        @functools.wraps(function)
+        def wrapper(prop):
+            start = clock()
+            value = function(prop)
+            observe(clock() - start)
+            return value
+        return wrapper
+
+    @contextmanager
+    def section(self, name):
+        """
+        Times a block of the caller's code, e.g. one pricing batch. Sections
+        are recorded whether or not the instrumentation is enabled.
+
+        Args:
+            name (str): The section name.
+
+        Yields:
+            None
+        """
+        histogram = self.sections.get(name)
+        if histogram is None:
+            histogram = self.sections[name] = Histogram(self.buckets)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    def property_added(self, prop):
+        """
+        Counts a new property.
+
+        Args:
+            prop (ResidentialProperty): The new property.
+        """
+        self.added += 1
+
+    def property_removed(self, prop):
+        """
+        Counts a deregistered property.
+
+        Args:
+            prop (ResidentialProperty): The removed property.
+        """
+        self.removed += 1
+
+    def property_changed(self, prop, field, old_value, new_value):
+        """
+        Counts a setter call.
+
+        Args:
+            prop: The property whose field changed.
+            field (str): The property attribute name.
+            old_value: The value before the change.
+            new_value: The value after the change.
+        """
+        calls = self.setter_calls
+        calls[field] = calls.get(field, 0) + 1
+
+    def snapshot(self):
+        """
+        Collects every recorded value.
+
+        Returns:
+            dict: JSON-serializable counters and histograms, with the current
+            registry size.
+        """
+        return {
+            'constructors': {name: histogram.to_dict()
+                             for name, histogram in sorted(self.constructors.items())},
+            'valuations': {'{}.{}'.format(*key): histogram.to_dict()
+                           for key, histogram in sorted(self.valuations.items())},
+            'sections': {name: histogram.to_dict()
+                         for name, histogram in sorted(self.sections.items())},
+            'setter_calls': dict(sorted(self.setter_calls.items())),
+            'properties_added': self.added,
+            'properties_removed': self.removed,
+            'registry_size': len(ResidentialProperty.total_properties),
+        }
+
+    def dump_json(self, path):
+        """
+        Writes snapshot() to a JSON file.
+
+        Args:
+            path (str): The file path.
+        """
+        with open(path, 'w') as handle:
+            json.dump(self.snapshot(), handle, indent=1)
+
+    def to_prometheus(self):
+        """
+        Renders the recorded values in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics, ending with a newline.
+        """
+        lines = []
+        _histogram_lines(lines, 'residential_constructor_seconds',
+                         'Time spent in property constructors.',
+                         {(('class', name),): histogram
+                          for name, histogram in self.constructors.items()})
+        _histogram_lines(lines, 'residential_valuation_seconds',
+                         'Time spent in AgentCommissionValue() and TaxValue().',
+                         {(('class', cls), ('method', method)): histogram
+                          for (cls, method), histogram in self.valuations.items()})
+        _histogram_lines(lines, 'residential_section_seconds',
+                         'Time spent in instrumented sections.',
+                         {(('section', name),): histogram
+                          for name, histogram in self.sections.items()})
+        lines.append('# HELP residential_setter_calls_total Property setter calls.')
+        lines.append('# TYPE residential_setter_calls_total counter')
+        for field, calls in sorted(self.setter_calls.items()):
+            lines.append('residential_setter_calls_total{}{}'.format(
+                _labels((('field', field),)), ' {}'.format(calls)))
+        for name, help_text, kind, value in (
+                ('residential_properties_added_total', 'Properties created.', 'counter',
+                 self.added),
+                ('residential_properties_removed_total', 'Properties deregistered.', 'counter',
+                 self.removed),
+                ('residential_registry_size', 'Properties in total_properties.', 'gauge',
+                 len(ResidentialProperty.total_properties))):
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            lines.append('{} {}'.format(name, value))
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(pairs):
+    """
+    Formats Prometheus labels.
+
+    Args:
+        pairs (tuple): (name, value) pairs.
+
+    Returns:
+        str: e.g. '{class="SaleHouse",method="TaxValue"}'.
+    """
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                                           .replace('"', '\\"').replace('\n', '\\n'))
+                          for name, value in pairs) + '}'
+
+
+def _histogram_lines(lines, name, help_text, histograms):
+    """
+    Appends the exposition of a labelled histogram.
+
+    Args:
+        lines (list): The output lines.
+        name (str): The metric name.
+        help_text (str): The HELP text.
+        histograms (dict): Label pairs -> Histogram.
+    """
+    lines.append('# HELP {} {}'.format(name, help_text))
+    lines.append('# TYPE {} histogram'.format(name))
+    for labels, histogram in sorted(histograms.items()):
+        for bound, count in histogram.cumulative():
+            lines.append('{}_bucket{} {}'.format(
+                name, _labels(labels + (('le', '+Inf' if bound == float('inf') else repr(bound)),)),
+                count))
+        lines.append('{}_sum{} {!r}'.format(name, _labels(labels), histogram.sum))
+        lines.append('{}_count{} {}'.format(name, _labels(labels), histogram.count))
+
+
+def _time_operations(calls):
+    """
+    Times construction, both valuation methods and a setter call, with the
+    garbage collector paused.
+
+    Args:
+        calls (int): Iterations of the four operations.
+
+    Returns:
+        float: Seconds per operation.
+    """
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for number in range(calls):
+            prop = SaleApartment('Instrumented', 900, 2, 2, 1, 1, 250000.0, 1200.0)
+            prop.AgentCommissionValue()
+            prop.TaxValue()
+            prop.SalePrice = 250000.0 + number
+        return (time.perf_counter() - start) / (calls * 4)
+    finally:
+        if collecting:
+            gc.enable()
+
+
+def measure_overhead(calls=20000, repeat=31, budget=DISABLED_OVERHEAD_BUDGET):
+    """
+    Measures what an enabled-then-disabled Instrumentation adds to the hot
+    paths, against a budget.
+
+    Each repeat enables an Instrumentation, times the operations while it
+    is enabled, disables it and times them again. That run is paired with a
+    reference run made just before enabling or just after the disabled run,
+    in alternating order so that drift in the machine's speed cancels out.
+    The overhead is the median relative difference of the pairs. The
+    registry is disabled while measuring, and no other observer should be
+    registered.
+
+    A single pair on a busy machine can be several percent off either way,
+    so the budget is judged with a sign test rather than on the median: it
+    only counts as exceeded if so many pairs exceed it that an overhead
+    within the budget would produce that with a chance below
+    OVERHEAD_SIGNIFICANCE (25 of the default 31 pairs).
+
+    Args:
+        calls (int, optional): Iterations timed per run. Defaults to 20000.
+        repeat (int, optional): Pairs of runs. Defaults to 31.
+        budget (float, optional): The allowed overhead, as a fraction of the
+            time per operation. Defaults to DISABLED_OVERHEAD_BUDGET.
+
+    Returns:
+        Overhead: (the fastest seconds per operation of the reference runs
+        (one made before any instrumentation), of the runs after disable()
+        and of the enabled runs, the median overhead as a fraction, the
+        budget, whether the overhead is within it, the number of pairs over
+        the budget, the number of pairs).
+    """
+    registry = ResidentialProperty.total_properties
+    ResidentialProperty.use_registry('disabled')
+    baseline, disabled, enabled, differences = [], [], [], []
+    try:
+        _time_operations(calls)  # warm up
+        baseline.append(_time_operations(calls))
+        for number in range(repeat):
+            before = _time_operations(calls) if number % 2 else None
+            with Instrumentation():
+                enabled.append(_time_operations(calls))
+            after = _time_operations(calls)
+            if before is None:
+                before = _time_operations(calls)
+            baseline.append(before)
+            disabled.append(after)
+            differences.append((after - before) / before)
+    finally:
+        ResidentialProperty.use_registry(registry)
+    overhead = statistics.median(differences)
+    over = sum(difference > budget for difference in differences)
+    return Overhead(min(baseline), min(disabled), min(enabled), overhead, budget,
+                    _sign_test(over, repeat) >= OVERHEAD_SIGNIFICANCE, over, repeat)
+
+
+def _sign_test(over, pairs):
+    """
+    Computes the chance of at least `over` of `pairs` runs exceeding the
+    budget if each does so with probability 1/2, the most an overhead within
+    the budget allows.
+
+    Args:
+        over (int): The pairs over the budget.
+        pairs (int): The number of pairs.
+
+    Returns:
+        float: The one-sided p-value.
+    """
+    return sum(math.comb(pairs, count) for count in range(over, pairs + 1)) / 2 ** pairs
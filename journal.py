@@ -0,0 +1,468 @@
+"""
+An append-only journal of property mutations, for change-data capture.
+
+A MutationJournal is an opt-in PropertyObserver. While it is open it records
+every property construction, setter call and deregister() as a record with a
+sequence number, the reference number, the field, the old value and the new
+value. Records are buffered in memory and appended to the journal file a batch
+at a time, so a setter call only pays for building a tuple:
+
+    with MutationJournal('book.journal') as journal:
+        prop.SalePrice = 260000.0
+    replica, last = replay('book.journal')                  # a full copy
+    replica, last = replay('book.journal', replica, last)   # only new deltas
+
+File layout: an 8-byte magic and a version, then one frame per flushed batch.
+A frame is a header (payload size, CRC-32 of the payload, first and last
+sequence number) followed by the batch pickled as a list of tuples. Sequence
+numbers within a frame need not be contiguous: compaction leaves gaps.
+Version 1 frames stored a record count instead of the last sequence number;
+they are still read, and appended to in their own format. A
+frame that was only partly written, e.g. by a crash, ends the journal; it is
+cut off the next time the journal is opened for writing.
+
+compact_journal() rewrites a journal with one record per changed field, one
+record per listing created (with its changes folded into it) and one tombstone
+per listing removed. Replaying the compacted journal from any sequence number
+gives the same result as replaying the original.
+"""
+
+from collections import namedtuple
+import itertools
+import os
+import pickle
+import struct
+import tempfile
+import time
+import zlib
+
+from residentialproperty import ResidentialProperty, PropertyObserver, SaleApartment
+from propertystore import KIND_ATTRIBUTES
+from serialization import property_state, restore_property, kind_schema, ADDED_IN_2
+
+MAGIC = b'RPJRNL01'
+VERSION = 2
+
+# magic, version
+_FILE_HEAD = struct.Struct('<8sI')
+# Journal version -> frame header: payload size, payload CRC-32, first
+# sequence number, then the record count (1) or last sequence number (2).
+_FRAME_HEADS = {1: struct.Struct('<IIQI'), 2: struct.Struct('<IIQQ')}
+
+# Record operations.
+ADDED, CHANGED, REMOVED = 0, 1, 2
+
+# Setter overhead, in seconds per call, that an open journal may add.
+SETTER_OVERHEAD_BUDGET = 2e-6
+
+JournalRecord = namedtuple('JournalRecord',
+                           'sequence operation reference field old_value new_value')
+
+Overhead = namedtuple('Overhead', 'baseline journaled overhead budget within_budget')
+
+# Class -> {field: attribute name}, for the regular classes.
+_FIELD_ATTRIBUTES = {cls: {name: attribute for attribute, name in attributes + ADDED_IN_2 if name}
+                     for cls, attributes in KIND_ATTRIBUTES.items()}
+
+
+def _attribute(cls, field):
+    """
+    Finds the attribute a setter stores a field in.
+
+    Args:
+        cls (type): The class of the property, regular or slotted.
+        field (str): The property attribute name, e.g. 'SalePrice'.
+
+    Returns:
+        str: The mangled attribute name.
+    """
+    return _FIELD_ATTRIBUTES[getattr(cls, 'variant_of', cls)][field]
+
+
+def _frames(handle, version):
+    """
+    Reads the frames of a journal file positioned after its header.
+
+    Args:
+        handle (file): The journal file, opened in binary mode.
+        version (int): The journal version, from _check_header().
+
+    Yields:
+        tuple: (end position, first sequence number, last sequence number,
+        payload) for every complete frame, stopping at the first torn one.
+    """
+    frame_head = _FRAME_HEADS[version]
+    while True:
+        head = handle.read(frame_head.size)
+        if len(head) < frame_head.size:
+            return
+        size, checksum, first, last = frame_head.unpack(head)
+        payload = handle.read(size)
+        if len(payload) < size or zlib.crc32(payload) != checksum:
+            return
+        if version == 1:
+            # The header has a count, which is wrong for compacted frames.
+            records = pickle.loads(payload)
+            last = records[-1][0] if records else first - 1
+        yield handle.tell(), first, last, payload
+
+
+def _check_header(handle, path):
+    """
+    Reads and checks the header of a journal file.
+
+    Args:
+        handle (file): The journal file, opened in binary mode.
+        path (str): The file path, for error messages.
+
+    Returns:
+        int: The journal version.
+
+    Raises:
+        ValueError: If the file is not a journal of a supported version.
+    """
+    magic, version = _FILE_HEAD.unpack(handle.read(_FILE_HEAD.size).ljust(_FILE_HEAD.size, b'\0'))
+    if magic != MAGIC:
+        raise ValueError('{} is not a mutation journal'.format(path))
+    if version not in _FRAME_HEADS:
+        raise ValueError('unsupported journal version {}'.format(version))
+    return version
+
+
+def read_journal(path, since=0):
+    """
+    Reads the records of a journal.
+
+    Args:
+        path (str): The journal file.
+        since (int, optional): Only records with a higher sequence number are
+            returned, e.g. the last sequence number a replica has applied.
+            Defaults to 0, all records.
+
+    Yields:
+        JournalRecord: The records, in sequence order.
+    """
+    with open(path, 'rb') as handle:
+        version = _check_header(handle, path)
+        for _, first, last, payload in _frames(handle, version):
+            if last <= since:
+                continue  # the whole batch was seen already
+            for record in pickle.loads(payload):
+                if record[0] > since:
+                    yield JournalRecord._make(record)
+
+
+def replay(path, replica=None, since=0):
+    """
+    Applies the records of a journal to a replica of the book.
+
+    Created listings are restored as unregistered objects (see
+    serialization.restore_property()), and changes are stored straight into
+    their attributes, so replaying never notifies observers or writes to an
+    open journal.
+
+    Args:
+        path (str): The journal file.
+        replica (dict, optional): Reference number -> property, as left by an
+            earlier replay. Defaults to a new, empty replica.
+        since (int, optional): The last sequence number already applied to the
+            replica. Defaults to 0.
+
+    Returns:
+        tuple: (the replica, the last sequence number applied).
+    """
+    if replica is None:
+        replica = {}
+    last = since
+    for sequence, operation, reference, field, _, new_value in read_journal(path, since):
+        if operation == CHANGED:
+            prop = replica.get(reference)
+            if prop is not None:
+                setattr(prop, _attribute(type(prop), field), new_value)
+        elif operation == ADDED:
+            replica[reference] = restore_property(*new_value)
+        else:
+            replica.pop(reference, None)
+        last = sequence
+    return replica, last
+
+
+def _write_frames(handle, records, batch_size, version=VERSION):
+    """
+    Appends records to a journal file as frames of up to batch_size records.
+
+    Args:
+        handle (file): The journal file, opened for binary appending.
+        records (list): The record tuples.
+        batch_size (int): The most records per frame.
+        version (int, optional): The journal version of the file. Defaults
+            to VERSION.
+    """
+    frame_head = _FRAME_HEADS[version]
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        payload = pickle.dumps(batch, pickle.HIGHEST_PROTOCOL)
+        last = batch[-1][0] if version > 1 else len(batch)
+        handle.write(frame_head.pack(len(payload), zlib.crc32(payload), batch[0][0], last))
+        handle.write(payload)
+
+
+def compact_journal(path, batch_size=4096):
+    """
+    Rewrites a journal with the fewest records that replay to the same book.
+
+    For every listing the compacted journal holds either its creation record,
+    carrying the state it had after its last change, or the latest change of
+    every field with the oldest old value, or a tombstone if it was removed.
+    Each record keeps the highest sequence number folded into it, so replicas
+    can keep replaying from the last sequence number they applied.
+
+    Args:
+        path (str): The journal file. It must not be open for writing.
+        batch_size (int, optional): Records per frame. Defaults to 4096.
+
+    Returns:
+        tuple: (records before, records after).
+    """
+    entries = {}  # reference -> creation record, tombstone or {field: change}
+    before = 0
+    for record in read_journal(path):
+        before += 1
+        sequence, operation, reference, field, old_value, new_value = record
+        entry = entries.get(reference)
+        if operation == ADDED or operation == REMOVED:
+            entries[reference] = list(record)
+        elif isinstance(entry, dict):
+            change = entry.get(field)
+            if change is None:
+                entry[field] = list(record)
+            else:
+                change[0], change[5] = sequence, new_value
+        elif entry is not None and entry[1] == ADDED:
+            # Fold the change into the state of the creation record.
+            version, code, values = entry[5]
+            cls, attributes = kind_schema(version, code)
+            values = list(values)
+            values[attributes.index(_attribute(cls, field))] = new_value
+            entry[0], entry[5] = sequence, (version, code, tuple(values))
+        elif entry is None:
+            entries[reference] = {field: list(record)}
+        # A change after a tombstone cannot happen; it is dropped.
+    records = []
+    for entry in entries.values():
+        records.extend(entry.values() if isinstance(entry, dict) else (entry,))
+    records = sorted(map(tuple, records), key=lambda record: record[0])
+    temporary = path + '.tmp'
+    try:
+        with open(temporary, 'wb') as handle:
+            handle.write(_FILE_HEAD.pack(MAGIC, VERSION))
+            _write_frames(handle, records, batch_size)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        try:
+            os.remove(temporary)  # the journal itself is left as it was
+        except OSError:
+            pass
+        raise
+    return before, len(records)
+
+
+class MutationJournal(PropertyObserver):
+    """
+    Records property mutations to an append-only journal file while open.
+    """
+
+    def __init__(self, path, batch_size=4096, durable=False):
+        """
+        Opens a journal for appending and starts observing property changes.
+        An existing journal is continued: sequence numbers carry on from its
+        last record, and a torn final frame is cut off.
+
+        Args:
+            path (str): The journal file.
+            batch_size (int, optional): Records buffered before they are
+                written as one frame. Defaults to 4096.
+            durable (bool, optional): Calls fsync after every frame, so a
+                flushed batch survives a power loss. Defaults to False.
+
+        Raises:
+            ValueError: If the file exists but is not a journal.
+        """
+        if batch_size < 1:
+            raise ValueError('batch size must be at least 1')
+        self.path = path
+        self.batch_size = batch_size
+        self.durable = durable
+        self.__buffer = []
+        self.__handle = None
+        self.__open()
+        ResidentialProperty.add_observer(self)
+
+    def __open(self):
+        """
+        Opens the journal file, continuing an existing journal.
+        """
+        path, last, self.__version = self.path, 0, VERSION
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, 'r+b') as handle:
+                self.__version = _check_header(handle, path)
+                end = _FILE_HEAD.size
+                for end, _, frame_last, _ in _frames(handle, self.__version):
+                    last = max(last, frame_last)
+                handle.truncate(end)
+            self.__handle = open(path, 'ab')
+        else:
+            self.__handle = open(path, 'wb')
+            self.__handle.write(_FILE_HEAD.pack(MAGIC, VERSION))
+            self.__handle.flush()
+        self.__sequence = itertools.count(last + 1)
+        self.last_sequence = last
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        """
+        Returns the number of records buffered but not yet written.
+        """
+        return len(self.__buffer)
+
+    def property_added(self, prop):
+        """
+        Records the creation of a property with its full state.
+
+        Args:
+            prop (ResidentialProperty): The new property.
+        """
+        self.__buffer.append((next(self.__sequence), ADDED, prop.getreference_number(),
+                              None, None, property_state(prop)))
+        if len(self.__buffer) >= self.batch_size:
+            self.flush()
+
+    def property_changed(self, prop, field, old_value, new_value):
+        """
+        Records a setter call.
+
+        Args:
+            prop: The property whose field changed.
+            field (str): The property attribute name.
+            old_value: The value before the change.
+            new_value: The value after the change.
+        """
+        buffer = self.__buffer
+        buffer.append((next(self.__sequence), CHANGED, prop.getreference_number(),
+                       field, old_value, new_value))
+        if len(buffer) >= self.batch_size:
+            self.flush()
+
+    def property_removed(self, prop):
+        """
+        Records the removal of a property.
+
+        Args:
+            prop (ResidentialProperty): The removed property.
+        """
+        self.__buffer.append((next(self.__sequence), REMOVED, prop.getreference_number(),
+                              None, None, None))
+        if len(self.__buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered records to the journal file as one frame.
+
+        Returns:
+            int: The sequence number of the last record written.
+        """
+        buffer = self.__buffer
+        if buffer:
+            _write_frames(self.__handle, buffer, len(buffer), self.__version)
+            self.__handle.flush()
+            if self.durable:
+                os.fsync(self.__handle.fileno())
+            self.last_sequence = buffer[-1][0]
+            buffer.clear()
+        return self.last_sequence
+
+    def compact(self):
+        """
+        Flushes the buffer and compacts the journal file (see
+        compact_journal()). Recording continues afterwards.
+
+        Returns:
+            tuple: (records before, records after).
+        """
+        self.flush()
+        self.__handle.close()
+        try:
+            counts = compact_journal(self.path, self.batch_size)
+            self.__version = VERSION  # compaction writes the current format
+            return counts
+        finally:
+            self.__handle = open(self.path, 'ab')
+
+    def close(self):
+        """
+        Stops observing property changes, then flushes and closes the file.
+        """
+        ResidentialProperty.remove_observer(self)
+        if self.__handle is not None:
+            self.flush()
+            self.__handle.close()
+            self.__handle = None
+
+
+def _time_setter(prop, calls):
+    """
+    Times setter calls on one property.
+
+    Args:
+        prop (SaleApartment): The property.
+        calls (int): The number of calls.
+
+    Returns:
+        float: Seconds per call.
+    """
+    start = time.perf_counter()
+    for number in range(calls):
+        prop.SalePrice = 250000.0 + number
+    return (time.perf_counter() - start) / calls
+
+
+def measure_overhead(calls=200000, batch_size=4096, budget=SETTER_OVERHEAD_BUDGET):
+    """
+    Measures the time an open journal adds to each setter call, including
+    the amortized cost of writing the frames, against a budget. The journal
+    is written to a temporary file, and no other observer should be
+    registered while measuring.
+
+    Args:
+        calls (int, optional): Setter calls timed. Defaults to 200000.
+        batch_size (int, optional): The journal batch size. Defaults to 4096.
+        budget (float, optional): The allowed overhead in seconds per call.
+            Defaults to SETTER_OVERHEAD_BUDGET.
+
+    Returns:
+        Overhead: (seconds per call without and with the journal, the
+        difference, the budget, whether the difference is within it).
+    """
+    prop = SaleApartment('Journal benchmark', 900, 2, 2, 1, 1, 250000.0, 1200.0)
+    prop.deregister()
+    baseline = _time_setter(prop, calls)
+    handle, path = tempfile.mkstemp(suffix='.journal')
+    os.close(handle)
+    try:
+        with MutationJournal(path, batch_size) as journal:
+            start = time.perf_counter()
+            _time_setter(prop, calls)
+            journal.flush()
+            journaled = (time.perf_counter() - start) / calls
+    finally:
+        os.remove(path)
+    overhead = journaled - baseline
+    return Overhead(baseline, journaled, overhead, budget, overhead <= budget)
@@ -0,0 +1,315 @@
+"""
+Memoized derived metrics, invalidated by the setters they depend on.
+
+A derived metric is a value computed from the fields of a property, such as
+AgentCommissionValue() or the sale price per unit of Built_Up_Area. A
+DerivedMetrics cache computes each metric of a property once and serves
+later reads from memory. It observes ResidentialProperty. A setter call drops
+only the cached metrics whose declared depends_on includes the changed field:
+changing SalePrice clears 'tax' and 'price_per_area' but leaves
+'plot_ratio' in place.
+
+Metrics are declared with the derived_metric() decorator (added to every
+cache created afterwards) or DerivedMetrics.register() (one cache only):
+
+    @derived_metric('bedrooms_per_bathroom',
+                    depends_on=('Number_of_Bedrooms', 'Number_of_Bathrooms'))
+    def bedrooms_per_bathroom(prop):
+        return prop.Number_of_Bedrooms / prop.Number_of_Bathrooms
+
+    metrics = DerivedMetrics(maxsize=50000)
+    metrics.get(prop, 'commission'), metrics.stats()
+
+The cache holds the metrics of at most maxsize properties and evicts the least
+recently read one beyond that, so its memory is bounded by maxsize times the
+number of metrics.
+"""
+
+from collections import OrderedDict, namedtuple
+
+from residentialproperty import ResidentialProperty, PropertyObserver
+from propertystore import PropertyView
+
+_UNSET = object()
+
+CacheStats = namedtuple('CacheStats', 'hits misses invalidations evictions size')
+
+
+class DerivedMetric:
+    """
+    The definition of a derived metric.
+    """
+
+    def __init__(self, name, function, depends_on=None):
+        """
+        Initializes a DerivedMetric.
+
+        Args:
+            name (str): The metric name.
+            function (callable): Computes the metric from a property.
+            depends_on (iterable, optional): The property attribute names whose
+                setters change the metric. Defaults to every field, i.e. any
+                setter call invalidates it.
+        """
+        self.name = name
+        self.function = function
+        self.depends_on = None if depends_on is None else frozenset(depends_on)
+
+    def __repr__(self):
+        return 'DerivedMetric({!r}, depends_on={!r})'.format(
+            self.name, None if self.depends_on is None else sorted(self.depends_on))
+
+
+# Metric name -> DerivedMetric, the definitions every new cache starts with.
+METRICS = {}
+
+
+def derived_metric(name, depends_on=None):
+    """
+    Decorator declaring a derived metric for every DerivedMetrics cache
+    created afterwards.
+
+    Args:
+        name (str): The metric name.
+        depends_on (iterable, optional): The fields the metric is computed
+            from. Defaults to every field.
+
+    Returns:
+        callable: The decorator, which returns the function unchanged.
+    """
+    def declare(function):
+        METRICS[name] = DerivedMetric(name, function, depends_on)
+        return function
+    return declare
+
+
+def _ratio(prop, numerator, denominator):
+    """
+    Divides two fields of a property.
+
+    Args:
+        prop: The property.
+        numerator (str): The property attribute name of the numerator.
+        denominator (str): The property attribute name of the denominator.
+
+    Returns:
+        float: The ratio, or None if the property lacks either field, either
+        is unset, or the denominator is zero.
+    """
+    try:
+        top, bottom = getattr(prop, numerator), getattr(prop, denominator)
+    except AttributeError:  # other kinds of property, or Rental fields never set
+        return None
+    if top is None or not bottom:
+        return None
+    return top / bottom
+
+
+@derived_metric('commission', depends_on=('AgentCommissionPercent', 'SalePrice', 'YearlyRent'))
+def _commission(prop):
+    return prop.AgentCommissionValue()
+
+
+@derived_metric('tax', depends_on=('SalePrice', 'FixedTaxPercent'))
+def _tax(prop):
+    return prop.TaxValue() if hasattr(prop, 'TaxValue') else None
+
+
+@derived_metric('price_per_area', depends_on=('SalePrice', 'Built_Up_Area'))
+def _price_per_area(prop):
+    return _ratio(prop, 'SalePrice', 'Built_Up_Area')
+
+
+@derived_metric('rent_per_area', depends_on=('YearlyRent', 'Built_Up_Area'))
+def _rent_per_area(prop):
+    return _ratio(prop, 'YearlyRent', 'Built_Up_Area')
+
+
+@derived_metric('plot_ratio', depends_on=('Built_Up_Area', 'Plot_Size'))
+def _plot_ratio(prop):
+    return _ratio(prop, 'Built_Up_Area', 'Plot_Size')
+
+
+# Only defined for listings carrying both a rent and a sale price; the
+# classes in this package have one or the other, so it is None for them.
+@derived_metric('rent_yield', depends_on=('YearlyRent', 'SalePrice'))
+def _rent_yield(prop):
+    return _ratio(prop, 'YearlyRent', 'SalePrice')
+
+
+class DerivedMetrics(PropertyObserver):
+    """
+    A bounded per-property cache of derived metrics.
+    """
+
+    def __init__(self, maxsize=100000, metrics=None):
+        """
+        Initializes a DerivedMetrics cache and starts observing property
+        changes.
+
+        Args:
+            maxsize (int, optional): The most properties whose metrics are
+                cached. Defaults to 100000.
+            metrics (iterable, optional): DerivedMetric definitions. Defaults to
+                the ones declared with derived_metric().
+        """
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+        self.maxsize = maxsize
+        self.metrics = {}
+        self.__cache = OrderedDict()  # property -> {metric: value}
+        self.__dependants = {}  # field -> names of the metrics computed from it
+        self.__always = set()  # names of the metrics without depends_on
+        self.hits = self.misses = self.invalidations = self.evictions = 0
+        for metric in (METRICS.values() if metrics is None else metrics):
+            self.add(metric)
+        ResidentialProperty.add_observer(self)
+
+    def close(self):
+        """
+        Stops observing property changes and empties the cache.
+        """
+        ResidentialProperty.remove_observer(self)
+        self.__cache.clear()
+
+    def __len__(self):
+        return len(self.__cache)
+
+    def add(self, metric):
+        """
+        Adds or replaces a metric definition.
+
+        Args:
+            metric (DerivedMetric): The definition.
+        """
+        if metric.name in self.metrics:
+            self.discard(metric.name)
+        self.metrics[metric.name] = metric
+        if metric.depends_on is None:
+            self.__always.add(metric.name)
+        else:
+            for field in metric.depends_on:
+                self.__dependants.setdefault(field, set()).add(metric.name)
+
+    def discard(self, name):
+        """
+        Removes a metric definition and its cached values.
+
+        Args:
+            name (str): The metric name.
+        """
+        self.metrics.pop(name, None)
+        self.__always.discard(name)
+        for names in self.__dependants.values():
+            names.discard(name)
+        for values in self.__cache.values():
+            values.pop(name, None)
+
+    def register(self, name, depends_on=None):
+        """
+        Decorator adding a metric to this cache only.
+
+        Args:
+            name (str): The metric name.
+            depends_on (iterable, optional): The fields the metric is computed
+                from. Defaults to every field.
+
+        Returns:
+            callable: The decorator, which returns the function unchanged.
+        """
+        def declare(function):
+            self.add(DerivedMetric(name, function, depends_on))
+            return function
+        return declare
+
+    def get(self, prop, name):
+        """
+        Reads a metric of a property, computing it on the first read.
+
+        PropertyStore views are always computed: their setters write to the
+        store without notifying observers, so a cached value could go stale.
+
+        Args:
+            prop: The property.
+            name (str): The metric name.
+
+        Returns:
+            The metric value.
+
+        Raises:
+            KeyError: If no metric has that name.
+        """
+        cache = self.__cache
+        values = cache.get(prop)
+        if values is not None:
+            value = values.get(name, _UNSET)
+            if value is not _UNSET:
+                cache.move_to_end(prop)
+                self.hits += 1
+                return value
+        function = self.metrics[name].function
+        self.misses += 1
+        if isinstance(prop, PropertyView):
+            return function(prop)
+        if values is None:
+            values = cache[prop] = {}
+            if len(cache) > self.maxsize:
+                cache.popitem(last=False)
+                self.evictions += 1
+        else:
+            cache.move_to_end(prop)
+        value = values[name] = function(prop)
+        return value
+
+    def invalidate(self, prop=None):
+        """
+        Drops cached metrics, e.g. after fields were changed without a setter.
+
+        Args:
+            prop (optional): The property whose metrics are dropped. Defaults
+                to every property.
+        """
+        if prop is None:
+            self.__cache.clear()
+        else:
+            self.__cache.pop(prop, None)
+
+    def stats(self):
+        """
+        Reports the cache counters.
+
+        Returns:
+            CacheStats: Hits, misses, metrics invalidated by setter calls,
+            properties evicted, and properties cached.
+        """
+        return CacheStats(self.hits, self.misses, self.invalidations, self.evictions,
+                          len(self.__cache))
+
+    def property_changed(self, prop, field, old_value, new_value):
+        """
+        Drops the cached metrics that depend on the changed field.
+
+        Args:
+            prop: The property whose field changed.
+            field (str): The property attribute name.
+            old_value: The value before the change.
+            new_value: The value after the change.
+        """
+        values = self.__cache.get(prop)
+        if not values:
+            return
+        for name in self.__dependants.get(field, ()):
+            if values.pop(name, values) is not values:
+                self.invalidations += 1
+        for name in self.__always:
+            if values.pop(name, values) is not values:
+                self.invalidations += 1
+
+    def property_removed(self, prop):
+        """
+        Drops the cached metrics of a deregistered property.
+
+        Args:
+            prop (ResidentialProperty): The removed property.
+        """
+        self.__cache.pop(prop, None)
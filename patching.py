@@ -0,0 +1,57 @@
+"""
+Replacing and restoring class attributes for the opt-in wrappers of
+instrumentation.py and validation.py.
+
+Both modules wrap the same constructors, so they go through patch() and
+restore() here. patch() refuses an attribute that is already replaced:
+whichever wrapper was restored first would otherwise drop the other one, or
+leave its own wrapper installed for good. restore() only puts an attribute
+back while it still holds the replacement, so a value set since is kept.
+"""
+
+_owners = {}  # (class, name) -> description of whoever replaced it
+
+
+def patch(owner, patches, cls, name, replacement):
+    """
+    Replaces a class attribute and records how to restore it.
+
+    Args:
+        owner (str): Who replaces the attribute, for error messages, e.g.
+            'validation'.
+        patches (list): The caller's records, (class, name, original in the
+            class __dict__ or None, replacement) per replaced attribute.
+        cls (type): The class.
+        name (str): The attribute name.
+        replacement: The new value.
+
+    Raises:
+        RuntimeError: If the attribute is already replaced.
+    """
+    holder = _owners.get((cls, name))
+    if holder is not None:
+        raise RuntimeError('{}.{} is already replaced by {}; disable it first'.format(
+            cls.__name__, name, holder))
+    patches.append((cls, name, cls.__dict__.get(name), replacement))
+    _owners[(cls, name)] = owner
+    setattr(cls, name, replacement)
+
+
+def restore(patches):
+    """
+    Restores the attributes replaced by patch(), newest first, and empties
+    the records. An attribute that no longer holds its replacement is left
+    as it is.
+
+    Args:
+        patches (list): The records filled by patch().
+    """
+    while patches:
+        cls, name, own, replacement = patches.pop()
+        _owners.pop((cls, name), None)
+        if cls.__dict__.get(name) is not replacement:
+            continue
+        if own is None:
+            delattr(cls, name)  # it was inherited
+        else:
+            setattr(cls, name, own)
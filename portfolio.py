@@ -0,0 +1,427 @@
+"""
+Portfolio-wide valuation on several processes.
+
+PortfolioEvaluator splits a book of properties into shards of consecutive
+reference numbers and evaluates them on a ProcessPoolExecutor. A shard is a
+handful of typed arrays (kind, bedrooms, house type id, sale price, rent,
+percentages and service charge), so workers receive compact columnar chunks
+rather than pickled objects.
+
+Each worker computes AgentCommissionValue() and TaxValue() with the same
+formulas as the property classes and sums them, together with
+AnnualServiceCharge and YearlyRent, per (class, house type, bedrooms) cell.
+The parent merges the partial PortfolioTotals, which can then be rolled up
+per class, per House_Type or per bedroom count. Unset values (e.g. the
+YearlyRent of a rental that was never let) are left out of the sums, as NaN
+results are by batchcompute.
+"""
+
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import math
+from operator import attrgetter, methodcaller
+import os
+import time
+
+from residentialproperty import ResidentialProperty
+from propertystore import (PropertyStore, StringTable, COLUMNS, KINDS, MISSING_INT,
+                           RENTAL_CODES, SALE_CODES, kind_code)
+
+try:
+    import numpy as np
+except ImportError:  # Workers fall back to a plain Python loop
+    np = None
+
+
+MEASURES = ('count', 'commission', 'tax', 'service_charge', 'yearly_rent')
+
+# Shard column -> property read from objects (None for the reference/kind).
+SHARD_FIELDS = {
+    'reference': None,
+    'kind': None,
+    'bedrooms': 'Number_of_Bedrooms',
+    'house_type': 'House_Type',
+    'sale_price': 'SalePrice',
+    'yearly_rent': 'YearlyRent',
+    'commission_percent': 'AgentCommissionPercent',
+    'fixed_tax_percent': 'FixedTaxPercent',
+    'annual_service_charge': 'AnnualServiceCharge',
+}
+
+Shard = namedtuple('Shard', 'first_reference last_reference columns')
+Shard.__doc__ = """
+One chunk of the book: the reference number range it covers and its
+SHARD_FIELDS columns as arrays.
+"""
+
+ScalingResult = namedtuple('ScalingResult', 'workers seconds speedup efficiency')
+
+
+class PortfolioTotals:
+    """
+    Sums of the MEASURES per (class, house type, bedrooms) cell. Totals from
+    different shards are combined with merge().
+    """
+
+    def __init__(self, cells=None):
+        """
+        Initializes a PortfolioTotals object.
+
+        Args:
+            cells (dict, optional): (class, house type, bedrooms) -> list of
+                the MEASURES. Defaults to no cells.
+        """
+        self.cells = cells if cells is not None else {}
+
+    def merge(self, other):
+        """
+        Adds the cells of another PortfolioTotals to this one.
+
+        Args:
+            other (PortfolioTotals): The totals to add.
+
+        Returns:
+            PortfolioTotals: This object.
+        """
+        for key, sums in other.cells.items():
+            mine = self.cells.get(key)
+            if mine is None:
+                self.cells[key] = list(sums)
+            else:
+                for position, value in enumerate(sums):
+                    mine[position] += value
+        return self
+
+    def _roll_up(self, position):
+        """
+        Sums the cells over every key part but one.
+
+        Args:
+            position (int): The key part to keep: 0 class, 1 house type,
+                2 bedrooms.
+
+        Returns:
+            dict: Key -> {measure: total}.
+        """
+        groups = {}
+        for key, sums in self.cells.items():
+            group = groups.get(key[position])
+            if group is None:
+                group = groups[key[position]] = [0] * len(MEASURES)
+            for index, value in enumerate(sums):
+                group[index] += value
+        return {key: dict(zip(MEASURES, sums)) for key, sums in groups.items()}
+
+    def by_class(self):
+        """
+        Gets the totals per property class.
+
+        Returns:
+            dict: Class -> {measure: total}.
+        """
+        return self._roll_up(0)
+
+    def by_house_type(self):
+        """
+        Gets the totals per House_Type. Apartments are listed under None.
+
+        Returns:
+            dict: House type -> {measure: total}.
+        """
+        return self._roll_up(1)
+
+    def by_bedrooms(self):
+        """
+        Gets the totals per bedroom count.
+
+        Returns:
+            dict: Number of bedrooms -> {measure: total}.
+        """
+        return self._roll_up(2)
+
+    def total(self):
+        """
+        Gets the totals of the whole portfolio.
+
+        Returns:
+            dict: Measure -> total.
+        """
+        sums = [0] * len(MEASURES)
+        for cell in self.cells.values():
+            for index, value in enumerate(cell):
+                sums[index] += value
+        return dict(zip(MEASURES, sums))
+
+
+def _nan_to_zero(values):
+    """
+    Replaces NaN by 0 in a NumPy array, so unset values drop out of sums.
+
+    Args:
+        values (numpy.ndarray): The values.
+
+    Returns:
+        numpy.ndarray: The values with NaN replaced.
+    """
+    return np.where(np.isnan(values), 0.0, values)
+
+
+def _evaluate_numpy(columns):
+    """
+    Computes the cell sums of a shard with NumPy.
+
+    Args:
+        columns (dict): The shard columns.
+
+    Returns:
+        dict: Raw (kind code, house type id, bedrooms) -> list of MEASURES.
+    """
+    def column(name):
+        return np.frombuffer(columns[name], dtype=COLUMNS[name])
+
+    kind = column('kind')
+    is_sale = np.isin(kind, list(SALE_CODES))
+    is_rental = np.isin(kind, list(RENTAL_CODES))
+    sale_price, percent = column('sale_price'), column('commission_percent')
+    commission = np.where(is_sale, sale_price * percent,
+                          np.where(is_rental, column('yearly_rent') * percent, np.nan))
+    tax = np.where(is_sale, sale_price * column('fixed_tax_percent'), np.nan)
+    keys = np.stack([kind.astype(np.int64), column('house_type').astype(np.int64),
+                     column('bedrooms').astype(np.int64)], axis=1)
+    cells, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    sums = [np.bincount(inverse, minlength=len(cells))]
+    for values in (commission, tax, column('annual_service_charge'), column('yearly_rent')):
+        sums.append(np.bincount(inverse, weights=_nan_to_zero(values), minlength=len(cells)))
+    return {tuple(int(part) for part in cell): [int(sums[0][index])] +
+            [float(measure[index]) for measure in sums[1:]]
+            for index, cell in enumerate(cells)}
+
+
+def _evaluate_python(columns):
+    """
+    Computes the cell sums of a shard with a plain Python loop.
+
+    Args:
+        columns (dict): The shard columns.
+
+    Returns:
+        dict: Raw (kind code, house type id, bedrooms) -> list of MEASURES.
+    """
+    cells = {}
+    nan = math.nan
+    for code, house_type, bedrooms, price, rent, percent, tax_percent, charge in zip(
+            columns['kind'], columns['house_type'], columns['bedrooms'],
+            columns['sale_price'], columns['yearly_rent'], columns['commission_percent'],
+            columns['fixed_tax_percent'], columns['annual_service_charge']):
+        if code in SALE_CODES:
+            commission, tax = price * percent, price * tax_percent
+        elif code in RENTAL_CODES:
+            commission, tax = rent * percent, nan
+        else:
+            commission = tax = nan
+        key = (code, house_type, bedrooms)
+        sums = cells.get(key)
+        if sums is None:
+            sums = cells[key] = [0, 0.0, 0.0, 0.0, 0.0]
+        sums[0] += 1
+        # x == x is False for NaN, i.e. for unset values.
+        if commission == commission:
+            sums[1] += commission
+        if tax == tax:
+            sums[2] += tax
+        if charge == charge:
+            sums[3] += charge
+        if rent == rent:
+            sums[4] += rent
+    return cells
+
+
+def evaluate_shard(shard):
+    """
+    Worker entry point: computes the cell sums of one shard.
+
+    Args:
+        shard (Shard): The shard.
+
+    Returns:
+        dict: Raw (kind code, house type id, bedrooms) -> list of MEASURES.
+    """
+    if not len(shard.columns['kind']):
+        return {}
+    if np is not None:
+        return _evaluate_numpy(shard.columns)
+    return _evaluate_python(shard.columns)
+
+
+def object_shard(properties, strings):
+    """
+    Gathers the shard columns of property objects, one class at a time.
+
+    Args:
+        properties (list): The properties, in reference number order.
+        strings (StringTable): Interns the house types.
+
+    Returns:
+        Shard: The shard.
+    """
+    columns = {name: array(COLUMNS[name]) for name in SHARD_FIELDS}
+    groups = {}
+    for prop in properties:
+        groups.setdefault(type(prop), []).append(prop)
+    for cls, members in groups.items():
+        columns['reference'].extend(map(methodcaller('getreference_number'), members))
+        columns['kind'].extend([kind_code(cls)] * len(members))
+        for name, field in SHARD_FIELDS.items():
+            if field is None:
+                continue
+            missing = math.nan if COLUMNS[name] == 'd' else MISSING_INT
+            if not hasattr(cls, field):
+                columns[name].extend([missing] * len(members))
+                continue
+            values = map(attrgetter(field), members)
+            if name == 'house_type':
+                columns[name].extend(map(strings.intern, values))
+            else:
+                columns[name].extend(missing if value is None else value for value in values)
+    return Shard(properties[0].getreference_number(), properties[-1].getreference_number(),
+                 columns)
+
+
+def store_shard(store, rows):
+    """
+    Copies the shard columns of a range of store rows.
+
+    Args:
+        store (PropertyStore): The store.
+        rows (range or list): The rows, in reference number order.
+
+    Returns:
+        Shard: The shard.
+    """
+    columns = {}
+    for name in SHARD_FIELDS:
+        column = store.column(name)
+        values = array(COLUMNS[name])
+        if isinstance(rows, range):
+            values.frombytes(memoryview(column)[rows.start:rows.stop].cast('B'))
+        else:
+            values.extend(map(column.__getitem__, rows))
+        columns[name] = values
+    return Shard(store.reference[rows[0]], store.reference[rows[-1]], columns)
+
+
+class PortfolioEvaluator:
+    """
+    Evaluates commission, tax, service charge and rent totals of a whole book
+    on a pool of worker processes.
+    """
+
+    def __init__(self, source=None, workers=None, shards_per_worker=4):
+        """
+        Initializes a PortfolioEvaluator.
+
+        Args:
+            source (iterable or PropertyStore, optional): The properties, or a
+                store or snapshot. Defaults to ResidentialProperty.total_properties,
+                read when shards are built.
+            workers (int, optional): The number of worker processes. Defaults
+                to the number of CPUs.
+            shards_per_worker (int, optional): Shards per worker, so that a slow
+                shard does not leave the other workers idle. Defaults to 4.
+        """
+        self.source = source
+        self.workers = workers or os.cpu_count() or 1
+        self.shards_per_worker = shards_per_worker
+
+    def shards(self, count):
+        """
+        Splits the book into shards of consecutive reference numbers.
+
+        Args:
+            count (int): The number of shards wanted.
+
+        Returns:
+            tuple: (list of Shard, house type lookup function).
+        """
+        source = self.source
+        if source is None:
+            source = ResidentialProperty.total_properties
+        if isinstance(source, PropertyStore):
+            rows = range(len(source))
+            if not source.ordered:
+                rows = sorted(rows, key=source.reference.__getitem__)
+            make, lookup = (lambda part: store_shard(source, part)), source.strings.lookup
+        else:
+            rows = sorted(source, key=methodcaller('getreference_number'))
+            strings = StringTable()
+            make, lookup = (lambda part: object_shard(part, strings)), strings.lookup
+        size = max(-(-len(rows) // max(count, 1)), 1)
+        return [make(rows[start:start + size]) for start in range(0, len(rows), size)], lookup
+
+    def evaluate(self, workers=None):
+        """
+        Evaluates the whole book.
+
+        Args:
+            workers (int, optional): The number of worker processes. Defaults
+                to self.workers.
+
+        Returns:
+            PortfolioTotals: The totals, keyed by class, house type and
+            bedroom count.
+        """
+        workers = workers or self.workers
+        shards, lookup = self.shards(workers * self.shards_per_worker)
+        return self._evaluate_shards(shards, lookup, workers)
+
+    def _evaluate_shards(self, shards, lookup, workers):
+        """
+        Farms prepared shards out to a process pool and merges the results.
+
+        Args:
+            shards (list): The shards.
+            lookup (callable): Maps house type ids to house types.
+            workers (int): The number of worker processes.
+
+        Returns:
+            PortfolioTotals: The merged totals.
+        """
+        raw = PortfolioTotals()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for cells in pool.map(evaluate_shard, shards):
+                raw.merge(PortfolioTotals(cells))
+        # Store shards keep the store's own sentinel (-1 in version 1
+        # snapshots); object shards use MISSING_INT.
+        missing = self.source.missing_int if isinstance(self.source, PropertyStore) \
+            else MISSING_INT
+        totals = PortfolioTotals()
+        for (code, house_type, bedrooms), sums in raw.cells.items():
+            key = (KINDS[code], lookup(house_type), None if bedrooms == missing else bedrooms)
+            totals.merge(PortfolioTotals({key: sums}))
+        return totals
+
+    def scaling(self, max_workers=None):
+        """
+        Measures how evaluation time scales from 1 to max_workers processes.
+        Shards are built once, so only the parallel part is timed.
+
+        Args:
+            max_workers (int, optional): The largest pool. Defaults to
+                self.workers.
+
+        Returns:
+            list: One ScalingResult per pool size; efficiency is the speedup
+            over one worker divided by the number of workers.
+        """
+        max_workers = max_workers or self.workers
+        shards, lookup = self.shards(max_workers * self.shards_per_worker)
+        results = []
+        for workers in range(1, max_workers + 1):
+            start = time.perf_counter()
+            self._evaluate_shards(shards, lookup, workers)
+            seconds = time.perf_counter() - start
+            speedup = results[0].seconds / seconds if results else 1.0
+            results.append(ScalingResult(workers, seconds, speedup, speedup / workers))
+        return results
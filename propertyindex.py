@@ -0,0 +1,899 @@
+"""
+Secondary indexes and a query engine over the property registry.
+
+A PropertyIndex registers itself as a PropertyObserver, so every new property
+and every setter call keeps its indexes up to date. Queries are built with
+PropertyIndex.query() and planned against the most selective index:
+
+    index = PropertyIndex()
+    matches = (index.query()
+               .of_type(Apartment)
+               .where('Number_of_Bedrooms', '>=', 3)
+               .where('FloorNumber', '>', 10)
+               .where('Gym_Avail', '==', True)
+               .all())
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from heapq import heappop, heappush
+import operator
+
+from residentialproperty import PropertyObserver, ResidentialProperty
+
+
+# Fields kept in sorted indexes, answering equality and range predicates.
+SORTED_FIELDS = ('Number_of_Bedrooms', 'Built_Up_Area', 'FloorNumber',
+                 'Plot_Size', 'SalePrice', 'YearlyRent')
+# Fields kept in bitmap indexes, answering equality on a few distinct values.
+BITMAP_FIELDS = ('Pool_Avail', 'Gym_Avail')
+# Fields kept in hash indexes, answering equality on many distinct values.
+HASH_FIELDS = ('House_Type',)
+# Pseudo-field holding the concrete class of each property.
+TYPE_FIELD = 'type'
+
+OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'between': lambda value, bounds: bounds[0] <= value <= bounds[1],
+    'in': lambda value, values: value in values,
+}
+
+# Entries per block of a SortedIndex. A block is split in two once it holds
+# twice as many.
+BLOCK_SIZE = 1000
+
+_LOWEST = float('-inf')
+_HIGHEST = float('inf')
+
+
+def field_value(prop, field):
+    """
+    Reads a field from a property, treating fields the class lacks as None.
+
+    Args:
+        prop (ResidentialProperty): The property.
+        field (str): The property attribute name, or TYPE_FIELD.
+
+    Returns:
+        The field value, or None.
+    """
+    if field == TYPE_FIELD:
+        return type(prop)
+    return getattr(prop, field, None)
+
+
+class SortedIndex:
+    """
+    An index of (value, reference number) pairs kept in sorted order, used for
+    equality and range lookups on numeric fields.
+
+    The pairs are held in sorted blocks of up to 2 * BLOCK_SIZE entries along
+    with the last entry of each block, so adding or removing a pair bisects
+    the block maxima and shifts a single block instead of the whole index.
+    """
+
+    def __init__(self, field):
+        """
+        Initializes an empty SortedIndex.
+
+        Args:
+            field (str): The indexed property attribute.
+        """
+        self.field = field
+        self.__blocks = []
+        self.__maxes = []
+        self.__offsets = None
+        self.__size = 0
+
+    def load(self, pairs):
+        """
+        Adds many properties at once, sorting the entries once instead of
+        inserting them one by one. None values are not indexed.
+
+        Args:
+            pairs (iterable): The (reference, value) pairs.
+        """
+        added = [(value, reference) for reference, value in pairs if value is not None]
+        entries = [entry for block in self.__blocks for entry in block] + added
+        try:
+            entries.sort()
+        except TypeError:  # leave the values that do not compare to add()
+            for value, reference in added:
+                self.add(reference, value)
+            return
+        self.__blocks = [entries[start:start + BLOCK_SIZE]
+                         for start in range(0, len(entries), BLOCK_SIZE)]
+        self.__maxes = [block[-1] for block in self.__blocks]
+        self.__offsets = None
+        self.__size = len(entries)
+
+    def add(self, reference, value):
+        """
+        Adds a property to the index. None values are not indexed.
+
+        Args:
+            reference (int): The property reference number.
+            value: The field value.
+        """
+        if value is None:
+            return
+        entry = (value, reference)
+        blocks, maxes = self.__blocks, self.__maxes
+        if not blocks:
+            blocks.append([entry])
+            maxes.append(entry)
+        else:
+            try:
+                number = bisect_left(maxes, entry)
+                if number == len(maxes):
+                    number -= 1
+                    blocks[number].append(entry)
+                    maxes[number] = entry
+                else:
+                    insort(blocks[number], entry)
+            except TypeError:  # values that do not compare with the rest stay unindexed
+                return
+            block = blocks[number]
+            if len(block) > 2 * BLOCK_SIZE:
+                blocks[number:number + 1] = [block[:BLOCK_SIZE], block[BLOCK_SIZE:]]
+                maxes.insert(number, block[BLOCK_SIZE - 1])
+        self.__size += 1
+        self.__offsets = None
+
+    def remove(self, reference, value):
+        """
+        Removes a property from the index.
+
+        Args:
+            reference (int): The property reference number.
+            value: The field value the property was indexed under.
+        """
+        if value is None:
+            return
+        entry = (value, reference)
+        blocks, maxes = self.__blocks, self.__maxes
+        try:
+            number = bisect_left(maxes, entry)
+            if number == len(maxes):
+                return
+            block = blocks[number]
+            position = bisect_left(block, entry)
+        except TypeError:
+            return
+        if block[position] != entry:
+            return
+        del block[position]
+        if block:
+            maxes[number] = block[-1]
+        else:
+            del blocks[number]
+            del maxes[number]
+        self.__size -= 1
+        self.__offsets = None
+
+    def _offsets(self):
+        """
+        Returns the position of the first entry of every block, computed
+        again after the blocks change.
+
+        Returns:
+            list: The block start positions.
+        """
+        if self.__offsets is None:
+            offsets, total = [], 0
+            for block in self.__blocks:
+                offsets.append(total)
+                total += len(block)
+            self.__offsets = offsets
+        return self.__offsets
+
+    def _position(self, key, after):
+        """
+        Finds where a key would be inserted among all entries.
+
+        Args:
+            key (tuple): A (value, reference) key.
+            after (bool): Whether to go after entries equal to the key.
+
+        Returns:
+            int: The position.
+        """
+        search = bisect_right if after else bisect_left
+        number = search(self.__maxes, key)
+        if number == len(self.__maxes):
+            return self.__size
+        return self._offsets()[number] + search(self.__blocks[number], key)
+
+    def _bounds(self, op, value):
+        """
+        Finds the slice of entries matching a predicate.
+
+        Args:
+            op (str): The comparison operator.
+            value: The value compared against.
+
+        Returns:
+            tuple: The (start, stop) positions, or None if the operator cannot
+            be answered with a range.
+        """
+        position = self._position
+        if op == '==':
+            return position((value, _LOWEST), False), position((value, _HIGHEST), True)
+        if op == '<':
+            return 0, position((value, _LOWEST), False)
+        if op == '<=':
+            return 0, position((value, _HIGHEST), True)
+        if op == '>':
+            return position((value, _HIGHEST), True), self.__size
+        if op == '>=':
+            return position((value, _LOWEST), False), self.__size
+        if op == 'between':
+            low, high = value
+            return position((low, _LOWEST), False), position((high, _HIGHEST), True)
+        return None
+
+    def supports(self, op):
+        """
+        Checks whether the index can answer an operator.
+
+        Args:
+            op (str): The comparison operator.
+
+        Returns:
+            bool: True if the operator is supported.
+        """
+        return op in ('==', '<', '<=', '>', '>=', 'between')
+
+    def estimate(self, op, value):
+        """
+        Counts the entries matching a predicate, in O(log n).
+
+        Args:
+            op (str): The comparison operator.
+            value: The value compared against.
+
+        Returns:
+            int: The number of matching entries.
+        """
+        start, stop = self._bounds(op, value)
+        return max(stop - start, 0)
+
+    def lookup(self, op, value):
+        """
+        Returns the reference numbers matching a predicate.
+
+        Args:
+            op (str): The comparison operator.
+            value: The value compared against.
+
+        Returns:
+            list: The matching reference numbers.
+        """
+        start, stop = self._bounds(op, value)
+        if start >= stop:
+            return []
+        blocks, offsets = self.__blocks, self._offsets()
+        number = bisect_right(offsets, start) - 1
+        references = []
+        while start < stop:
+            first = offsets[number]
+            block = blocks[number]
+            references.extend(reference for _, reference
+                              in block[start - first:stop - first])
+            start = first + len(block)
+            number += 1
+        return references
+
+    def __len__(self):
+        return self.__size
+
+
+class BitmapIndex:
+    """
+    An index keeping one bitmap per distinct value, used for booleans and the
+    concrete property class. Bit positions are slots handed out by the owning
+    PropertyIndex.
+    """
+
+    def __init__(self, field, slots):
+        """
+        Initializes an empty BitmapIndex.
+
+        Args:
+            field (str): The indexed property attribute.
+            slots (list): The owning index's slot -> reference number list.
+        """
+        self.field = field
+        self.__slots = slots
+        self.__bitmaps = {}
+        self.__counts = {}
+
+    def add(self, slot, value):
+        """
+        Sets the bit for a slot in the bitmap of a value.
+
+        Args:
+            slot (int): The property slot.
+            value: The field value.
+        """
+        bitmap = self.__bitmaps.get(value)
+        if bitmap is None:
+            bitmap = self.__bitmaps[value] = bytearray()
+            self.__counts[value] = 0
+        byte = slot >> 3
+        if byte >= len(bitmap):
+            bitmap.extend(bytes(byte + 1 - len(bitmap)))
+        bit = 1 << (slot & 7)
+        if not bitmap[byte] & bit:
+            bitmap[byte] |= bit
+            self.__counts[value] += 1
+
+    def remove(self, slot, value):
+        """
+        Clears the bit for a slot in the bitmap of a value.
+
+        Args:
+            slot (int): The property slot.
+            value: The field value the slot was indexed under.
+        """
+        bitmap = self.__bitmaps.get(value)
+        byte = slot >> 3
+        if bitmap is None or byte >= len(bitmap):
+            return
+        bit = 1 << (slot & 7)
+        if bitmap[byte] & bit:
+            bitmap[byte] &= ~bit
+            self.__counts[value] -= 1
+            if not self.__counts[value]:
+                del self.__bitmaps[value]
+                del self.__counts[value]
+            elif byte == len(bitmap) - 1:
+                while not bitmap[-1]:
+                    bitmap.pop()
+
+    def supports(self, op):
+        """
+        Checks whether the index can answer an operator.
+
+        Args:
+            op (str): The comparison operator.
+
+        Returns:
+            bool: True if the operator is supported.
+        """
+        return op in ('==', 'in')
+
+    def values(self):
+        """
+        Returns the distinct values that have a bitmap.
+
+        Returns:
+            list: The indexed values.
+        """
+        return list(self.__bitmaps)
+
+    def _values(self, op, value):
+        """
+        Normalizes the value of an '==' or 'in' predicate to a list.
+        """
+        return [value] if op == '==' else list(value)
+
+    def estimate(self, op, value):
+        """
+        Counts the slots matching a predicate, using cached bitmap counts.
+
+        Args:
+            op (str): '==' or 'in'.
+            value: The value, or collection of values for 'in'.
+
+        Returns:
+            int: The number of matching slots.
+        """
+        return sum(self.__counts.get(v, 0) for v in self._values(op, value))
+
+    def mask(self, op, value):
+        """
+        Returns the combined bitmap for a predicate as an integer.
+
+        Args:
+            op (str): '==' or 'in'.
+            value: The value, or collection of values for 'in'.
+
+        Returns:
+            int: A bitmask with one bit set per matching slot.
+        """
+        mask = 0
+        for v in self._values(op, value):
+            bitmap = self.__bitmaps.get(v)
+            if bitmap:
+                mask |= int.from_bytes(bitmap, 'little')
+        return mask
+
+    def lookup(self, op, value):
+        """
+        Returns the reference numbers matching a predicate.
+
+        Args:
+            op (str): '==' or 'in'.
+            value: The value, or collection of values for 'in'.
+
+        Returns:
+            list: The matching reference numbers.
+        """
+        return slots_to_references(self.mask(op, value), self.__slots)
+
+
+def slots_to_references(mask, slots):
+    """
+    Converts a slot bitmask into reference numbers.
+
+    Args:
+        mask (int): A bitmask with one bit set per slot.
+        slots (list): The slot -> reference number list.
+
+    Returns:
+        list: The reference numbers, in slot order.
+    """
+    references = []
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+    for byte_number, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            references.append(slots[(byte_number << 3) + low.bit_length() - 1])
+            byte ^= low
+    return references
+
+
+class HashIndex:
+    """
+    An index mapping each distinct value to the set of reference numbers
+    holding it, used for equality lookups on string fields.
+    """
+
+    def __init__(self, field):
+        """
+        Initializes an empty HashIndex.
+
+        Args:
+            field (str): The indexed property attribute.
+        """
+        self.field = field
+        self.__buckets = {}
+
+    def add(self, reference, value):
+        """
+        Adds a property to the index. None values are not indexed.
+
+        Args:
+            reference (int): The property reference number.
+            value: The field value.
+        """
+        if value is not None:
+            self.__buckets.setdefault(value, set()).add(reference)
+
+    def remove(self, reference, value):
+        """
+        Removes a property from the index.
+
+        Args:
+            reference (int): The property reference number.
+            value: The field value the property was indexed under.
+        """
+        bucket = self.__buckets.get(value)
+        if bucket is not None:
+            bucket.discard(reference)
+            if not bucket:
+                del self.__buckets[value]
+
+    def supports(self, op):
+        """
+        Checks whether the index can answer an operator.
+
+        Args:
+            op (str): The comparison operator.
+
+        Returns:
+            bool: True if the operator is supported.
+        """
+        return op in ('==', 'in')
+
+    def _values(self, op, value):
+        """
+        Normalizes the value of an '==' or 'in' predicate to a list.
+        """
+        return [value] if op == '==' else list(value)
+
+    def estimate(self, op, value):
+        """
+        Counts the references matching a predicate.
+
+        Args:
+            op (str): '==' or 'in'.
+            value: The value, or collection of values for 'in'.
+
+        Returns:
+            int: The number of matching references.
+        """
+        return sum(len(self.__buckets.get(v, ())) for v in self._values(op, value))
+
+    def lookup(self, op, value):
+        """
+        Returns the reference numbers matching a predicate.
+
+        Args:
+            op (str): '==' or 'in'.
+            value: The value, or collection of values for 'in'.
+
+        Returns:
+            list: The matching reference numbers.
+        """
+        references = []
+        for v in self._values(op, value):
+            references.extend(self.__buckets.get(v, ()))
+        return references
+
+
+class Predicate:
+    """
+    A single condition of a query, e.g. ``Number_of_Bedrooms >= 3``.
+    """
+
+    def __init__(self, field, op, value):
+        """
+        Initializes a Predicate.
+
+        Args:
+            field (str): The property attribute name, or TYPE_FIELD.
+            op (str): One of the keys of OPERATORS.
+            value: The value compared against. For 'between' a (low, high)
+                tuple, for 'in' a collection.
+        """
+        if op not in OPERATORS:
+            raise ValueError('Unsupported operator: {!r}'.format(op))
+        self.field = field
+        self.op = op
+        self.value = value
+
+    def matches(self, prop):
+        """
+        Evaluates the predicate against a property object.
+
+        Args:
+            prop (ResidentialProperty): The property.
+
+        Returns:
+            bool: True if the property satisfies the predicate.
+        """
+        value = field_value(prop, self.field)
+        if value is None:
+            return False
+        try:
+            return OPERATORS[self.op](value, self.value)
+        except TypeError:
+            return False
+
+    def __repr__(self):
+        return 'Predicate({!r}, {!r}, {!r})'.format(self.field, self.op, self.value)
+
+
+class Query:
+    """
+    A conjunction of predicates run against a PropertyIndex.
+    """
+
+    def __init__(self, index):
+        """
+        Initializes an empty Query.
+
+        Args:
+            index (PropertyIndex): The index the query runs against.
+        """
+        self.__index = index
+        self.predicates = []
+
+    def where(self, field, op, value):
+        """
+        Adds a predicate to the query.
+
+        Args:
+            field (str): The property attribute name.
+            op (str): The comparison operator.
+            value: The value compared against.
+
+        Returns:
+            Query: This query, for chaining.
+        """
+        self.predicates.append(Predicate(field, op, value))
+        return self
+
+    def of_type(self, *classes):
+        """
+        Restricts the query to instances of the given classes, including
+        their subclasses.
+
+        Args:
+            *classes (type): The property classes, e.g. Apartment or SaleHouse.
+
+        Returns:
+            Query: This query, for chaining.
+        """
+        concrete = {cls for cls in self.__index.known_types()
+                    if issubclass(cls, classes)}
+        self.predicates.append(Predicate(TYPE_FIELD, 'in', concrete))
+        return self
+
+    def explain(self):
+        """
+        Describes the plan chosen for this query.
+
+        Returns:
+            dict: The index used ('scan' for a full scan), the estimated
+            number of candidates and the predicates checked on each candidate.
+        """
+        return self.__index.plan(self.predicates)
+
+    def references(self):
+        """
+        Runs the query.
+
+        Returns:
+            list: The matching reference numbers, in ascending order.
+        """
+        return self.__index.execute(self.predicates)
+
+    def all(self):
+        """
+        Runs the query.
+
+        Returns:
+            list: The matching properties, in reference number order.
+        """
+        return [self.__index.get(reference) for reference in self.references()]
+
+    def count(self):
+        """
+        Runs the query.
+
+        Returns:
+            int: The number of matching properties.
+        """
+        return len(self.references())
+
+
+class PropertyIndex(PropertyObserver):
+    """
+    Maintains sorted, bitmap and hash indexes over properties and answers
+    queries against them. The index observes ResidentialProperty, so new
+    properties and every setter call update it immediately.
+    """
+
+    def __init__(self, properties=None):
+        """
+        Initializes a PropertyIndex and starts observing property changes.
+
+        Args:
+            properties (iterable, optional): The properties to index initially.
+                Defaults to ResidentialProperty.total_properties.
+        """
+        self.__objects = {}
+        self.__slot_of = {}
+        self.__slots = []
+        self.__free_slots = []
+        self.sorted_indexes = {field: SortedIndex(field) for field in SORTED_FIELDS}
+        self.bitmap_indexes = {field: BitmapIndex(field, self.__slots)
+                               for field in BITMAP_FIELDS + (TYPE_FIELD,)}
+        self.hash_indexes = {field: HashIndex(field) for field in HASH_FIELDS}
+        if properties is None:
+            properties = ResidentialProperty.total_properties
+        loading = {field: [] for field in self.sorted_indexes}
+        for prop in properties:
+            reference = self.__track(prop)
+            if reference is not None:
+                for field, pairs in loading.items():
+                    pairs.append((reference, field_value(prop, field)))
+        for field, pairs in loading.items():
+            self.sorted_indexes[field].load(pairs)
+        ResidentialProperty.add_observer(self)
+
+    def close(self):
+        """
+        Stops observing property changes. The index is no longer updated.
+        """
+        ResidentialProperty.remove_observer(self)
+
+    def __len__(self):
+        return len(self.__objects)
+
+    def get(self, reference):
+        """
+        Returns an indexed property by reference number.
+
+        Args:
+            reference (int): The reference number.
+
+        Returns:
+            ResidentialProperty: The property.
+        """
+        return self.__objects[reference]
+
+    def known_types(self):
+        """
+        Returns the concrete classes of the indexed properties.
+
+        Returns:
+            list: The property classes.
+        """
+        return self.bitmap_indexes[TYPE_FIELD].values()
+
+    def _index_for(self, field):
+        """
+        Finds the index maintained for a field.
+
+        Args:
+            field (str): The property attribute name.
+
+        Returns:
+            The index, or None if the field is not indexed.
+        """
+        # Not chained with `or`: an empty SortedIndex is falsy.
+        for indexes in (self.sorted_indexes, self.bitmap_indexes, self.hash_indexes):
+            index = indexes.get(field)
+            if index is not None:
+                return index
+        return None
+
+    def __track(self, prop):
+        """
+        Gives a property a slot, reusing the lowest one a removed property
+        freed, and adds it to the bitmap and hash indexes.
+
+        Args:
+            prop (ResidentialProperty): The property.
+
+        Returns:
+            int: The reference number, or None if the property is already
+            indexed.
+        """
+        reference = prop.getreference_number()
+        if reference in self.__objects:
+            return None
+        if self.__free_slots:
+            slot = heappop(self.__free_slots)
+            self.__slots[slot] = reference
+        else:
+            slot = len(self.__slots)
+            self.__slots.append(reference)
+        self.__slot_of[reference] = slot
+        self.__objects[reference] = prop
+        for field, index in self.bitmap_indexes.items():
+            index.add(slot, field_value(prop, field))
+        for field, index in self.hash_indexes.items():
+            index.add(reference, field_value(prop, field))
+        return reference
+
+    def property_added(self, prop):
+        """
+        Indexes a newly created property.
+
+        Args:
+            prop (ResidentialProperty): The property.
+        """
+        reference = self.__track(prop)
+        if reference is not None:
+            for field, index in self.sorted_indexes.items():
+                index.add(reference, field_value(prop, field))
+
+    def property_removed(self, prop):
+        """
+        Drops a deregistered property from every index.
+
+        Args:
+            prop (ResidentialProperty): The property.
+        """
+        reference = prop.getreference_number()
+        if self.__objects.get(reference) is not prop:
+            return
+        slot = self.__slot_of.pop(reference)
+        del self.__objects[reference]
+        for field, index in self.sorted_indexes.items():
+            index.remove(reference, field_value(prop, field))
+        for field, index in self.bitmap_indexes.items():
+            index.remove(slot, field_value(prop, field))
+        for field, index in self.hash_indexes.items():
+            index.remove(reference, field_value(prop, field))
+        self.__slots[slot] = None
+        heappush(self.__free_slots, slot)
+
+    def property_changed(self, prop, field, old_value, new_value):
+        """
+        Moves a property between index entries after a setter call.
+
+        Args:
+            prop: The property whose field changed.
+            field (str): The property attribute name.
+            old_value: The value before the change.
+            new_value: The value after the change.
+        """
+        index = self._index_for(field)
+        if index is None or not isinstance(prop, ResidentialProperty):
+            return
+        reference = prop.getreference_number()
+        if self.__objects.get(reference) is not prop:
+            return
+        key = self.__slot_of[reference] if isinstance(index, BitmapIndex) else reference
+        index.remove(key, old_value)
+        index.add(key, new_value)
+
+    def query(self):
+        """
+        Starts a new query.
+
+        Returns:
+            Query: An empty query over this index.
+        """
+        return Query(self)
+
+    def plan(self, predicates):
+        """
+        Picks the most selective index for a list of predicates.
+
+        Args:
+            predicates (list): The Predicate objects of a query.
+
+        Returns:
+            dict: 'index' (the field whose index is used, or 'scan'),
+            'estimate' (the number of candidates) and 'residual' (the
+            predicates checked on each candidate).
+        """
+        best, best_estimate = None, len(self.__objects)
+        for predicate in predicates:
+            index = self._index_for(predicate.field)
+            if index is None or not index.supports(predicate.op):
+                continue
+            estimate = index.estimate(predicate.op, predicate.value)
+            if best is None or estimate < best_estimate:
+                best, best_estimate = predicate, estimate
+        return {
+            'index': best.field if best is not None else 'scan',
+            'predicate': best,
+            'estimate': best_estimate,
+            'residual': [p for p in predicates if p is not best],
+        }
+
+    def execute(self, predicates):
+        """
+        Runs a list of predicates.
+
+        Args:
+            predicates (list): The Predicate objects of a query.
+
+        Returns:
+            list: The matching reference numbers, in ascending order.
+        """
+        plan = self.plan(predicates)
+        chosen = plan['predicate']
+        residual = plan['residual']
+        if chosen is None:
+            candidates = self.__objects.keys()
+        elif isinstance(self._index_for(chosen.field), BitmapIndex):
+            # Bitmap predicates combine with a single AND before any object
+            # is touched.
+            mask = self.bitmap_indexes[chosen.field].mask(chosen.op, chosen.value)
+            remaining = []
+            for predicate in residual:
+                index = self.bitmap_indexes.get(predicate.field)
+                if index is not None and index.supports(predicate.op):
+                    mask &= index.mask(predicate.op, predicate.value)
+                else:
+                    remaining.append(predicate)
+            residual = remaining
+            candidates = slots_to_references(mask, self.__slots)
+        else:
+            candidates = self._index_for(chosen.field).lookup(chosen.op, chosen.value)
+        objects = self.__objects
+        return sorted(reference for reference in candidates
+                      if all(p.matches(objects[reference]) for p in residual))
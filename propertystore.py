@@ -0,0 +1,796 @@
+"""
+Columnar, array-backed storage for residential properties.
+
+A PropertyStore keeps every listing as one row spread over typed, contiguous
+``array`` columns instead of one Python object per listing. Rows are exposed
+through thin view classes that subclass the concrete property classes, so a
+stored row answers to the same getters, setters and methods as a regular
+SaleHouse, RentalApartment, etc.
+"""
+
+from array import array
+from bisect import bisect_left
+import math
+
+from residentialproperty import (ResidentialProperty, House, Apartment,
+                                 Sale, RentalApartment, RentalHouse,
+                                 SaleApartment, SaleHouse, notify_changed)
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; columns stay usable as plain arrays
+    np = None
+
+
+# Kind codes stored in the ``kind`` column. The position in this tuple is the
+# code, so new classes must only ever be appended.
+KINDS = (ResidentialProperty, House, Apartment, RentalApartment,
+         RentalHouse, SaleApartment, SaleHouse)
+KIND_CODES = {cls: code for code, cls in enumerate(KINDS)}
+SALE_CODES = frozenset(KIND_CODES[cls] for cls in (SaleApartment, SaleHouse))
+RENTAL_CODES = frozenset(KIND_CODES[cls] for cls in (RentalApartment, RentalHouse))
+
+# Bit flags stored in the ``flags`` column.
+POOL = 1
+GYM = 2
+
+# Values marking a missing field. Integer fields can be negative, e.g. a
+# FloorNumber of -1 for a basement, so their sentinel is the lowest 32-bit
+# value; boolean columns only ever hold 0 or 1.
+MISSING_INT = -2 ** 31
+MISSING_BOOL = -1
+MISSING_FLOAT = math.nan
+
+# Column name -> array typecode.
+COLUMNS = {
+    'reference': 'q',
+    'kind': 'B',
+    'address': 'i',
+    'built_up_area': 'd',
+    'bedrooms': 'i',
+    'bathrooms': 'i',
+    'parking_slots': 'i',
+    'flags': 'B',
+    'commission_percent': 'd',
+    'num_of_floors': 'i',
+    'plot_size': 'd',
+    'house_type': 'i',
+    'floor_num': 'i',
+    'num_of_balconies': 'i',
+    'sale_price': 'd',
+    'annual_service_charge': 'd',
+    'fixed_tax_percent': 'd',
+    'deposit_amount': 'd',
+    'yearly_rent': 'd',
+    'furnished': 'b',
+    'maid_room': 'b',
+}
+
+# Columns holding string table ids rather than numbers.
+STRING_COLUMNS = ('address', 'house_type')
+
+# Property name -> column, for plain numeric/string fields.
+FIELD_COLUMNS = {
+    'Address': 'address',
+    'Built_Up_Area': 'built_up_area',
+    'Number_of_Bedrooms': 'bedrooms',
+    'Number_of_Bathrooms': 'bathrooms',
+    'Number_of_Parking_Slots': 'parking_slots',
+    'AgentCommissionPercent': 'commission_percent',
+    'Number_of_Floors': 'num_of_floors',
+    'Plot_Size': 'plot_size',
+    'House_Type': 'house_type',
+    'FloorNumber': 'floor_num',
+    'NumberOfBalconies': 'num_of_balconies',
+    'SalePrice': 'sale_price',
+    'AnnualServiceCharge': 'annual_service_charge',
+    'FixedTaxPercent': 'fixed_tax_percent',
+    'DepositAmount': 'deposit_amount',
+    'YearlyRent': 'yearly_rent',
+    'Furnished': 'furnished',
+    'MaidRoom': 'maid_room',
+}
+
+# Property name -> bit in the ``flags`` column.
+FLAG_FIELDS = {
+    'Pool_Avail': POOL,
+    'Gym_Avail': GYM,
+}
+
+# Name-mangled attribute -> property name, in the order a regular instance
+# stores them. Used to reproduce print_attributes() output for a view.
+_BASE_ATTRIBUTES = (
+    ('_ResidentialProperty__reference_number', None),
+    ('_ResidentialProperty__address', 'Address'),
+    ('_ResidentialProperty__built_up_area', 'Built_Up_Area'),
+    ('_ResidentialProperty__num_of_bedrooms', 'Number_of_Bedrooms'),
+    ('_ResidentialProperty__num_of_bathrooms', 'Number_of_Bathrooms'),
+    ('_ResidentialProperty__num_of_parking_slots', 'Number_of_Parking_Slots'),
+    ('_ResidentialProperty__pool_avail', 'Pool_Avail'),
+    ('_ResidentialProperty__gym_avail', 'Gym_Avail'),
+    ('_ResidentialProperty__agent_commission_percent', 'AgentCommissionPercent'),
+)
+_HOUSE_ATTRIBUTES = (
+    ('_House__num_of_floors', 'Number_of_Floors'),
+    ('_House__plot_size', 'Plot_Size'),
+    ('_House__house_type', 'House_Type'),
+)
+_APARTMENT_ATTRIBUTES = (
+    ('_Apartment__floor_num', 'FloorNumber'),
+    ('_Apartment__num_of_balconies', 'NumberOfBalconies'),
+)
+_SALE_ATTRIBUTES = (
+    ('_Sale__sale_price', 'SalePrice'),
+    ('_Sale__annual_service_charge', 'AnnualServiceCharge'),
+    ('_Sale__fixed_tax_percent', 'FixedTaxPercent'),
+)
+_RENTAL_ATTRIBUTES = (
+    ('_Rental__deposit_amount', 'DepositAmount'),
+    ('_Rental__yearly_rent', 'YearlyRent'),
+    ('_Rental__furnished', 'Furnished'),
+    ('_Rental__maid_room', 'MaidRoom'),
+)
+KIND_ATTRIBUTES = {
+    ResidentialProperty: _BASE_ATTRIBUTES,
+    House: _BASE_ATTRIBUTES + _HOUSE_ATTRIBUTES,
+    Apartment: _BASE_ATTRIBUTES + _APARTMENT_ATTRIBUTES,
+    RentalApartment: _BASE_ATTRIBUTES + _APARTMENT_ATTRIBUTES + _RENTAL_ATTRIBUTES,
+    RentalHouse: _BASE_ATTRIBUTES + _HOUSE_ATTRIBUTES + _RENTAL_ATTRIBUTES,
+    SaleApartment: _BASE_ATTRIBUTES + _APARTMENT_ATTRIBUTES + _SALE_ATTRIBUTES,
+    SaleHouse: _BASE_ATTRIBUTES + _HOUSE_ATTRIBUTES + _SALE_ATTRIBUTES,
+}
+
+
+def _missing(typecode):
+    """
+    Returns the missing-value sentinel of a column type.
+
+    Args:
+        typecode (str): The array typecode of the column.
+
+    Returns:
+        The sentinel.
+    """
+    if typecode == 'd':
+        return MISSING_FLOAT
+    return MISSING_BOOL if typecode == 'b' else MISSING_INT
+
+
+def _is_missing(column, value, missing_int=MISSING_INT):
+    """
+    Checks whether a raw column value is the missing-value sentinel.
+
+    Args:
+        column (str): The column name.
+        value: The raw value read from the column.
+        missing_int (int, optional): The sentinel of integer columns.
+            Defaults to MISSING_INT.
+
+    Returns:
+        bool: True if the value marks a missing field.
+    """
+    typecode = COLUMNS[column]
+    if typecode == 'd':
+        return value != value
+    return value == (MISSING_BOOL if typecode == 'b' else missing_int)
+
+
+class StringTable:
+    """
+    Interns strings so that each distinct value is stored only once.
+    Columns keep the integer id returned by intern().
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty StringTable.
+        """
+        self.__strings = []
+        self.__ids = {}
+
+    def intern(self, value):
+        """
+        Returns the id for a string, adding it to the table if needed.
+
+        Args:
+            value (str): The string to intern. None maps to MISSING_INT.
+
+        Returns:
+            int: The string id.
+        """
+        if value is None:
+            return MISSING_INT
+        string_id = self.__ids.get(value)
+        if string_id is None:
+            string_id = len(self.__strings)
+            self.__strings.append(value)
+            self.__ids[value] = string_id
+        return string_id
+
+    def lookup(self, string_id):
+        """
+        Returns the string stored under an id.
+
+        Args:
+            string_id (int): The string id.
+
+        Returns:
+            str: The string, or None for a negative id (MISSING_INT).
+        """
+        if string_id < 0:
+            return None
+        return self.__strings[string_id]
+
+    def find(self, value):
+        """
+        Returns the id of a string without interning it.
+
+        Args:
+            value (str): The string to look up.
+
+        Returns:
+            int: The string id, or MISSING_INT if the string is unknown.
+        """
+        return self.__ids.get(value, MISSING_INT)
+
+    @property
+    def strings(self):
+        """
+        Gets the interned strings in id order.
+
+        Returns:
+            tuple: The interned strings.
+        """
+        return tuple(self.__strings)
+
+    def __len__(self):
+        return len(self.__strings)
+
+
+def _field_property(name, column):
+    """
+    Builds a property that reads and writes one column of a view's row.
+
+    Args:
+        name (str): The property name being overridden.
+        column (str): The column backing the property.
+
+    Returns:
+        property: The column-backed property.
+    """
+    def getter(self):
+        return self._store.get_value(self._row, column)
+
+    def setter(self, value):
+        if name == 'AgentCommissionPercent' and not value:
+            # Matches ResidentialProperty: a falsy percent is ignored.
+            return
+        if not ResidentialProperty.observers:
+            self._store.set_value(self._row, column, value)
+            return
+        old_value = self._store.get_value(self._row, column)
+        self._store.set_value(self._row, column, value)
+        notify_changed(self, name, old_value, value)
+
+    return property(getter, setter)
+
+
+def _flag_property(name, bit):
+    """
+    Builds a property that reads and writes one bit of the ``flags`` column.
+
+    Args:
+        name (str): The property name being overridden.
+        bit (int): The flag bit.
+
+    Returns:
+        property: The flag-backed property.
+    """
+    def getter(self):
+        return bool(self._store.flags[self._row] & bit)
+
+    def setter(self, value):
+        flags = self._store.flags
+        old_value = bool(flags[self._row] & bit)
+        if value:
+            flags[self._row] |= bit
+        else:
+            flags[self._row] &= ~bit
+        if ResidentialProperty.observers:
+            notify_changed(self, name, old_value, value)
+
+    return property(getter, setter)
+
+
+class PropertyView:
+    """
+    Mixin for the classes returned by PropertyStore.view(). Each view is a thin
+    handle on one row of a store; no field values live on the view itself.
+    """
+
+    def getreference_number(self):
+        """
+        Returns the reference number of the property.
+
+        Returns:
+            int: The reference number.
+        """
+        return self._store.reference[self._row]
+
+    @property
+    def Row(self):
+        """
+        Gets the store row this view points at.
+
+        Returns:
+            int: The row index.
+        """
+        return self._row
+
+    def print_attributes(self):
+        """
+        Prints all the attributes of the property, in the same form as the
+        regular (non-stored) class.
+        """
+        print("Attributes:")
+        for attr, name in KIND_ATTRIBUTES[self._kind]:
+            if name is None:
+                value = self.getreference_number()
+            else:
+                value = getattr(self, name)
+                if value is None and attr.startswith('_Rental__'):
+                    continue
+            print(attr, ":", value)
+
+    def __repr__(self):
+        return '{}(reference={})'.format(type(self).__name__,
+                                         self.getreference_number())
+
+
+def _make_view_class(cls):
+    """
+    Creates the view class for one concrete property class.
+
+    Args:
+        cls (type): The property class to mirror.
+
+    Returns:
+        type: A subclass of cls whose properties are backed by store columns.
+    """
+    namespace = {'_kind': cls, '__doc__': 'Store-backed view of a {}.'.format(cls.__name__)}
+    for name, column in FIELD_COLUMNS.items():
+        if hasattr(cls, name):
+            namespace[name] = _field_property(name, column)
+    for name, bit in FLAG_FIELDS.items():
+        namespace[name] = _flag_property(name, bit)
+    return type('Stored' + cls.__name__, (PropertyView, cls), namespace)
+
+
+VIEW_CLASSES = {cls: _make_view_class(cls) for cls in KINDS}
+
+
+def kind_code(cls):
+    """
+    Finds the kind code of a property class, view class or slotted class.
+
+    Args:
+        cls (type): The class.
+
+    Returns:
+        int: The kind code.
+
+    Raises:
+        TypeError: If the class is not one of the property classes.
+    """
+    kind = cls._kind if issubclass(cls, PropertyView) else getattr(cls, 'variant_of', cls)
+    try:
+        return KIND_CODES[kind]
+    except KeyError:
+        raise TypeError('{} is not one of the property classes'.format(cls.__name__)) from None
+
+
+class PropertyStore:
+    """
+    A columnar store of residential properties.
+
+    Every field lives in a typed ``array`` column, addresses and house types are
+    interned in a shared StringTable, and pool/gym availability are packed into
+    a single bit-flag byte. Full-inventory scans can read a column directly
+    (or as a zero-copy NumPy array via numpy_column()) instead of walking
+    Python objects.
+    """
+
+    # The sentinel of missing values in integer columns; older snapshot
+    # files used -1.
+    _missing_int = MISSING_INT
+
+    def __init__(self):
+        """
+        Initializes an empty PropertyStore.
+        """
+        self.strings = StringTable()
+        for column, typecode in COLUMNS.items():
+            setattr(self, column, array(typecode))
+        self._reset_lookup(True)
+
+    def _reset_lookup(self, ordered):
+        """
+        Forgets the reference number -> row lookup.
+
+        Args:
+            ordered (bool): Whether the reference column is strictly increasing,
+                which allows binary search instead of a lookup dict.
+        """
+        self.__rows_by_reference = None
+        self.__ordered = ordered
+
+    @property
+    def missing_int(self):
+        """
+        Gets the value marking a missing field in the integer columns.
+
+        Returns:
+            int: MISSING_INT, or -1 for a version 1 snapshot.
+        """
+        return self._missing_int
+
+    @property
+    def ordered(self):
+        """
+        Checks whether rows are in increasing reference number order.
+
+        Returns:
+            bool: True if the reference column is strictly increasing.
+        """
+        return self.__ordered
+
+    @classmethod
+    def from_properties(cls, properties=None):
+        """
+        Builds a store holding a copy of existing property objects.
+
+        Args:
+            properties (iterable, optional): The properties to copy.
+                Defaults to ResidentialProperty.total_properties.
+
+        Returns:
+            PropertyStore: The new store.
+        """
+        store = cls()
+        if properties is None:
+            properties = ResidentialProperty.total_properties
+        for prop in properties:
+            store.add(prop)
+        return store
+
+    def __len__(self):
+        return len(self.reference)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self.view(row)
+
+    def add(self, prop):
+        """
+        Copies a property object into a new row.
+
+        Args:
+            prop (ResidentialProperty): The property to copy.
+
+        Returns:
+            int: The row index.
+        """
+        kind = type(prop)
+        if isinstance(prop, PropertyView):
+            kind = prop._kind
+        kind = getattr(kind, 'variant_of', kind)
+        fields = {}
+        for name in FIELD_COLUMNS:
+            if hasattr(kind, name):
+                try:
+                    fields[name] = getattr(prop, name)
+                except AttributeError:  # Rental fields that were never set
+                    pass
+        for name in FLAG_FIELDS:
+            fields[name] = getattr(prop, name)
+        return self._append_row(kind, prop.getreference_number(), fields)
+
+    def append(self, kind, **fields):
+        """
+        Adds a new listing directly as a row, without constructing an object.
+        A fresh reference number is taken from
+        ResidentialProperty.reference_allocator so it never
+        collides with regular objects.
+
+        Args:
+            kind (type): The concrete property class, e.g. SaleHouse.
+            **fields: Field values keyed by property name, e.g. Address=...,
+                SalePrice=...
+
+        Returns:
+            int: The row index.
+        """
+        if kind not in KIND_CODES:
+            raise TypeError('Unsupported property class: {!r}'.format(kind))
+        reference = ResidentialProperty.reference_allocator.allocate()
+        return self._append_row(kind, reference, fields)
+
+    def _append_row(self, kind, reference, fields):
+        """
+        Appends one row to every column.
+
+        Args:
+            kind (type): The concrete property class.
+            reference (int): The reference number.
+            fields (dict): Field values keyed by property name.
+
+        Returns:
+            int: The row index.
+        """
+        unknown = set(fields) - set(FIELD_COLUMNS) - set(FLAG_FIELDS)
+        if unknown:
+            raise TypeError('Unknown fields: {}'.format(', '.join(sorted(unknown))))
+        row = len(self)
+        if row and reference <= self.reference[-1]:
+            self.__ordered = False
+        values = {'reference': reference, 'kind': KIND_CODES[kind], 'flags': 0,
+                  'commission_percent': 0.02}
+        if issubclass(kind, Sale):
+            values['fixed_tax_percent'] = 0.04
+        for name, column in FIELD_COLUMNS.items():
+            if name in fields:
+                if name == 'AgentCommissionPercent' and not fields[name]:
+                    continue
+                values[column] = self._encode(column, fields[name])
+        for name, bit in FLAG_FIELDS.items():
+            if fields.get(name):
+                values['flags'] |= bit
+        for column, typecode in COLUMNS.items():
+            getattr(self, column).append(values.get(column, _missing(typecode)))
+        if self.__rows_by_reference is not None:
+            self.__rows_by_reference[reference] = row
+        return row
+
+    def extend(self, kind, first_reference, fields):
+        """
+        Appends a block of rows of one class, a whole column at a time.
+
+        Args:
+            kind (type): The concrete property class of every row.
+            first_reference (int): The reference number of the first row; the
+                block uses consecutive reference numbers from there.
+            fields (dict): Equally long lists of field values keyed by
+                property name.
+
+        Returns:
+            range: The row indexes of the new rows.
+        """
+        unknown = set(fields) - set(FIELD_COLUMNS) - set(FLAG_FIELDS)
+        if unknown:
+            raise TypeError('Unknown fields: {}'.format(', '.join(sorted(unknown))))
+        start = len(self)
+        count = len(next(iter(fields.values()))) if fields else 0
+        if not count:
+            return range(start, start)
+        if start and first_reference <= self.reference[-1]:
+            self.__ordered = False
+        filled = {'reference': range(first_reference, first_reference + count),
+                  'kind': [KIND_CODES[kind]] * count}
+        flags = [0] * count
+        for name, bit in FLAG_FIELDS.items():
+            for row, value in enumerate(fields.get(name, ())):
+                if value:
+                    flags[row] |= bit
+        filled['flags'] = flags
+        for name, column in FIELD_COLUMNS.items():
+            if name not in fields:
+                continue
+            values = fields[name]
+            if name == 'AgentCommissionPercent':
+                # A falsy or missing percent keeps the default, as in
+                # _append_row(); None must not reach the NaN encoding.
+                values = [percent if percent else 0.02 for percent in values]
+            if column in STRING_COLUMNS:
+                filled[column] = list(map(self.strings.intern, values))
+            elif None in values:
+                filled[column] = [self._encode(column, value) for value in values]
+            else:
+                filled[column] = values
+        if 'commission_percent' not in filled:
+            filled['commission_percent'] = [0.02] * count
+        if issubclass(kind, Sale) and 'fixed_tax_percent' not in filled:
+            filled['fixed_tax_percent'] = [0.04] * count
+        # Convert every column before touching the store, so a bad value
+        # cannot leave the columns with different lengths.
+        blocks = {}
+        for column, typecode in COLUMNS.items():
+            values = filled.get(column)
+            if values is None:
+                blocks[column] = array(typecode, [_missing(typecode)]) * count
+            else:
+                blocks[column] = array(typecode, values)
+        for column, block in blocks.items():
+            getattr(self, column).extend(block)
+        if self.__rows_by_reference is not None:
+            self.__rows_by_reference.update(
+                zip(filled['reference'], range(start, start + count)))
+        return range(start, start + count)
+
+    def _encode(self, column, value):
+        """
+        Converts a field value to its raw column representation.
+
+        Args:
+            column (str): The column name.
+            value: The field value.
+
+        Returns:
+            The raw value to store.
+        """
+        if column in STRING_COLUMNS:
+            return self.strings.intern(value)
+        if value is None:
+            return _missing(COLUMNS[column])
+        if COLUMNS[column] == 'b':
+            return 1 if value else 0
+        return value
+
+    def get_value(self, row, column):
+        """
+        Reads one field of a row, decoding strings and missing values.
+
+        Args:
+            row (int): The row index.
+            column (str): The column name.
+
+        Returns:
+            The field value, or None if it is missing.
+        """
+        value = getattr(self, column)[row]
+        if column in STRING_COLUMNS:
+            return self.strings.lookup(value)
+        if _is_missing(column, value, self._missing_int):
+            return None
+        if COLUMNS[column] == 'b':
+            return bool(value)
+        return value
+
+    def set_value(self, row, column, value):
+        """
+        Writes one field of a row.
+
+        Args:
+            row (int): The row index.
+            column (str): The column name.
+            value: The new field value.
+        """
+        getattr(self, column)[row] = self._encode(column, value)
+
+    def kind_of(self, row):
+        """
+        Returns the concrete property class stored in a row.
+
+        Args:
+            row (int): The row index.
+
+        Returns:
+            type: The property class.
+        """
+        return KINDS[self.kind[row]]
+
+    def view(self, row):
+        """
+        Returns a thin view over a row.
+
+        Args:
+            row (int): The row index.
+
+        Returns:
+            PropertyView: A view that behaves like the row's property class.
+        """
+        if not 0 <= row < len(self):
+            raise IndexError('row out of range')
+        view = object.__new__(VIEW_CLASSES[KINDS[self.kind[row]]])
+        view._store = self
+        view._row = row
+        return view
+
+    def row_of(self, reference):
+        """
+        Finds the row holding a reference number.
+
+        Args:
+            reference (int): The reference number.
+
+        Returns:
+            int: The row index.
+
+        Raises:
+            KeyError: If no row holds the reference number.
+        """
+        if self.__ordered:
+            row = bisect_left(self.reference, reference)
+            if row < len(self) and self.reference[row] == reference:
+                return row
+            raise KeyError(reference)
+        if self.__rows_by_reference is None:
+            self.__rows_by_reference = {ref: row for row, ref in enumerate(self.reference)}
+        return self.__rows_by_reference[reference]
+
+    def get(self, reference):
+        """
+        Returns a view of the listing with a given reference number.
+
+        Args:
+            reference (int): The reference number.
+
+        Returns:
+            PropertyView: The view.
+        """
+        return self.view(self.row_of(reference))
+
+    def rows_of_kind(self, *kinds):
+        """
+        Returns the rows whose concrete class is one of the given classes or
+        one of their subclasses.
+
+        Args:
+            *kinds (type): Property classes, e.g. House or SaleApartment.
+
+        Returns:
+            list: The matching row indexes.
+        """
+        codes = {code for code, cls in enumerate(KINDS)
+                 if any(issubclass(cls, kind) for kind in kinds)}
+        if np is not None:
+            mask = np.isin(self.numpy_column('kind'), list(codes))
+            return np.flatnonzero(mask).tolist()
+        return [row for row, code in enumerate(self.kind) if code in codes]
+
+    def column(self, column):
+        """
+        Returns the raw array backing a column.
+
+        Args:
+            column (str): The column name.
+
+        Returns:
+            array.array: The column.
+        """
+        if column not in COLUMNS:
+            raise KeyError(column)
+        return getattr(self, column)
+
+    def numpy_column(self, column):
+        """
+        Returns a zero-copy NumPy view of a column.
+
+        The view shares memory with the store, so it must not be kept across
+        appends, which may reallocate the column.
+
+        Args:
+            column (str): The column name.
+
+        Returns:
+            numpy.ndarray: The column as a NumPy array.
+
+        Raises:
+            ImportError: If NumPy is not installed.
+        """
+        if np is None:
+            raise ImportError('numpy is required for numpy_column()')
+        values = self.column(column)
+        if not len(values):
+            return np.empty(0, dtype=COLUMNS[column])
+        return np.frombuffer(values, dtype=COLUMNS[column])
+
+    def memory_usage(self):
+        """
+        Estimates the bytes held by the columns and the string table.
+
+        Returns:
+            int: The estimated size in bytes.
+        """
+        size = sum(len(values) * values.itemsize
+                   for values in (getattr(self, column) for column in COLUMNS))
+        return size + sum(len(value) for value in self.strings.strings)
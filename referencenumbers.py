@@ -0,0 +1,347 @@
+"""
+Reference number allocators.
+
+ResidentialProperty takes the reference number of every new property from
+ResidentialProperty.reference_allocator. The default CounterAllocator hands
+out 1, 2, 3, ... exactly as before, but safely from several threads. For
+heavily threaded ingestion, ThreadBlockAllocator gives each thread its own
+block of numbers, and FileLeaseAllocator leases blocks through a locked file so
+that several processes never hand out the same number.
+"""
+
+from _thread import allocate_lock  # the lock of threading.Lock, without importing threading
+import os
+import weakref
+
+
+def _at_fork(method):
+    """
+    Calls a bound method in forked children for as long as its object lives.
+
+    Args:
+        method: The bound method to call after a fork, in the child.
+    """
+    if not hasattr(os, 'register_at_fork'):
+        return
+    reference = weakref.WeakMethod(method)
+
+    def hook():
+        callback = reference()
+        if callback is not None:
+            callback()
+
+    os.register_at_fork(after_in_child=hook)
+
+
+class ReferenceAllocator:
+    """
+    Base class for reference number allocators.
+    """
+
+    def allocate(self):
+        """
+        Returns a reference number that has never been handed out before.
+
+        Returns:
+            int: The reference number.
+        """
+        return self.allocate_block(1).start
+
+    def allocate_block(self, count):
+        """
+        Reserves a contiguous block of reference numbers.
+
+        Args:
+            count (int): The number of reference numbers needed.
+
+        Returns:
+            range: The reserved reference numbers.
+        """
+        raise NotImplementedError
+
+    @property
+    def highest(self):
+        """
+        Gets the highest reference number handed out or reserved so far.
+
+        Returns:
+            int: The highest reference number, 0 if none.
+        """
+        raise NotImplementedError
+
+    def reset(self, highest=0):
+        """
+        Makes the allocator continue after a given reference number.
+
+        Args:
+            highest (int, optional): The last number considered used. Defaults to 0.
+        """
+        raise NotImplementedError
+
+
+class CounterAllocator(ReferenceAllocator):
+    """
+    An in-process counter handing out consecutive reference numbers. The
+    read-and-increment is done under a lock, so concurrent constructors never
+    receive the same number.
+    """
+
+    def __init__(self, highest=0):
+        """
+        Initializes a CounterAllocator.
+
+        Args:
+            highest (int, optional): The last number considered used. Defaults to 0.
+        """
+        self.__lock = allocate_lock()
+        self.__highest = highest
+
+    def allocate(self):
+        """
+        Returns the next reference number.
+
+        Returns:
+            int: The reference number.
+        """
+        with self.__lock:
+            self.__highest += 1
+            return self.__highest
+
+    def allocate_block(self, count):
+        """
+        Reserves the next count reference numbers.
+
+        Args:
+            count (int): The number of reference numbers needed.
+
+        Returns:
+            range: The reserved reference numbers.
+        """
+        with self.__lock:
+            first = self.__highest + 1
+            self.__highest += count
+        return range(first, first + count)
+
+    @property
+    def highest(self):
+        """
+        Gets the highest reference number handed out so far.
+
+        Returns:
+            int: The highest reference number.
+        """
+        return self.__highest
+
+    def reset(self, highest=0):
+        """
+        Makes the counter continue after a given reference number.
+
+        Args:
+            highest (int, optional): The last number considered used. Defaults to 0.
+        """
+        with self.__lock:
+            self.__highest = highest
+
+
+class ThreadBlockAllocator(ReferenceAllocator):
+    """
+    Hands every thread its own block of reference numbers taken from a shared
+    source allocator. Allocating from a thread's block needs no lock; the
+    source is only consulted once per block.
+
+    Numbers are unique but not in creation order across threads, and numbers
+    left in a thread's block when it exits are never used.
+    """
+
+    def __init__(self, source=None, block_size=1024):
+        """
+        Initializes a ThreadBlockAllocator.
+
+        Args:
+            source (ReferenceAllocator, optional): Where blocks come from.
+                Defaults to a new CounterAllocator.
+            block_size (int, optional): Numbers per thread block. Defaults to 1024.
+        """
+        self.source = source if source is not None else CounterAllocator()
+        self.block_size = block_size
+        import threading  # only this allocator needs thread-local storage
+        self.__local = threading.local()
+        self.__generation = 0
+        _at_fork(self._forget_blocks)
+
+    def _forget_blocks(self):
+        """
+        Drops every thread's block, e.g. in a forked child that must not reuse
+        numbers reserved by its parent.
+        """
+        self.__generation += 1
+
+    def _refill(self):
+        """
+        Fetches a new block for the current thread.
+
+        Returns:
+            iterator: The reference numbers of the new block.
+        """
+        block = self.source.allocate_block(self.block_size)
+        numbers = iter(block)
+        self.__local.numbers = numbers
+        self.__local.generation = self.__generation
+        return numbers
+
+    def allocate(self):
+        """
+        Returns the next reference number of the current thread's block.
+
+        Returns:
+            int: The reference number.
+        """
+        local = self.__local
+        numbers = getattr(local, 'numbers', None)
+        if numbers is None or local.generation != self.__generation:
+            numbers = self._refill()
+        for number in numbers:
+            return number
+        return next(self._refill())
+
+    def allocate_block(self, count):
+        """
+        Reserves a contiguous block straight from the source allocator.
+
+        Args:
+            count (int): The number of reference numbers needed.
+
+        Returns:
+            range: The reserved reference numbers.
+        """
+        return self.source.allocate_block(count)
+
+    @property
+    def highest(self):
+        """
+        Gets the highest reference number reserved from the source.
+
+        Returns:
+            int: The highest reference number.
+        """
+        return self.source.highest
+
+    def reset(self, highest=0):
+        """
+        Resets the source and drops every thread's block.
+
+        Args:
+            highest (int, optional): The last number considered used. Defaults to 0.
+        """
+        self.source.reset(highest)
+        self._forget_blocks()
+
+
+class FileLeaseAllocator(ReferenceAllocator):
+    """
+    Leases blocks of reference numbers through a counter file shared by
+    several processes on one machine. Each lease takes an exclusive lock on
+    the file, reads the highest leased number, writes it back advanced by the
+    block size and releases the lock. Requires POSIX file locking (fcntl).
+    """
+
+    def __init__(self, path, block_size=4096):
+        """
+        Initializes a FileLeaseAllocator.
+
+        Args:
+            path (str): The counter file. It is created if it does not exist.
+            block_size (int, optional): Numbers leased at a time by allocate().
+                Defaults to 4096.
+        """
+        import fcntl  # POSIX only; imported here so the module loads everywhere
+        self.__fcntl = fcntl
+        self.path = path
+        self.block_size = block_size
+        self.__lock = allocate_lock()
+        self.__numbers = iter(())
+        self.__highest = 0
+        _at_fork(self._forget_lease)
+
+    def _forget_lease(self):
+        """
+        Drops the locally leased block, e.g. in a forked child.
+        """
+        self.__lock = allocate_lock()
+        self.__numbers = iter(())
+
+    def _locked_update(self, update):
+        """
+        Reads, updates and writes the counter file under an exclusive lock.
+
+        Args:
+            update (callable): Maps the stored highest number to the new one.
+
+        Returns:
+            tuple: The (old, new) highest numbers.
+        """
+        fcntl = self.__fcntl
+        with open(self.path, 'a+b') as handle:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            try:
+                handle.seek(0)
+                text = handle.read().strip()
+                old = int(text) if text else 0
+                new = update(old)
+                handle.seek(0)
+                handle.truncate()
+                handle.write(str(new).encode('ascii'))
+                handle.flush()
+            finally:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+        self.__highest = max(self.__highest, new)
+        return old, new
+
+    def allocate_block(self, count):
+        """
+        Leases a contiguous block from the counter file.
+
+        Args:
+            count (int): The number of reference numbers needed.
+
+        Returns:
+            range: The reserved reference numbers.
+        """
+        old, new = self._locked_update(lambda highest: highest + count)
+        return range(old + 1, new + 1)
+
+    def allocate(self):
+        """
+        Returns the next number of the locally leased block, leasing a new
+        block when it runs out.
+
+        Returns:
+            int: The reference number.
+        """
+        with self.__lock:
+            for number in self.__numbers:
+                return number
+            self.__numbers = iter(self.allocate_block(self.block_size))
+            return next(self.__numbers)
+
+    @property
+    def highest(self):
+        """
+        Gets the highest reference number leased by this process.
+
+        Returns:
+            int: The highest reference number.
+        """
+        return self.__highest
+
+    def reset(self, highest=0):
+        """
+        Rewrites the counter file. Only safe while no other process allocates.
+
+        Args:
+            highest (int, optional): The last number considered used. Defaults to 0.
+        """
+        with self.__lock:
+            self._locked_update(lambda _: highest)
+            self.__highest = highest
+            self.__numbers = iter(())
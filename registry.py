@@ -0,0 +1,481 @@
+"""
+Property registries.
+
+Every constructed property is added to ResidentialProperty.total_properties,
+and to the registry of any subclass that has one of its own (see
+ResidentialProperty.use_registry()). The registry type decides how long
+properties are kept alive:
+
+- StrongRegistry keeps every property until it is deregistered (the original
+  behaviour).
+- WeakRegistry only holds weak references, so a property disappears once the
+  rest of the program drops it.
+- LRURegistry keeps the most recently registered or looked-up properties, up
+  to a fixed size.
+- NullRegistry keeps nothing.
+
+All registries are keyed by reference number. Iterating a registry walks
+its live contents without copying them, so, as with a dict, registering or
+deregistering a property inside the loop raises RuntimeError; loop over
+list(registry) to do that. Registries still accept the list operations of
+the original registry: append(), extend() and positional indexing
+(registry[0], registry[-1], registry[10:20]), which walks the registry and
+takes time proportional to the distance from the nearer end.
+"""
+
+from itertools import islice
+import weakref
+
+
+class PropertyRegistry:
+    """
+    Base class for property registries.
+    """
+
+    def add(self, prop):
+        """
+        Registers a property.
+
+        Args:
+            prop (ResidentialProperty): The property.
+        """
+        raise NotImplementedError
+
+    def discard(self, reference):
+        """
+        Removes a property if it is registered.
+
+        Args:
+            reference (int): The property reference number.
+
+        Returns:
+            ResidentialProperty: The removed property, or None.
+        """
+        raise NotImplementedError
+
+    def get(self, reference, default=None):
+        """
+        Looks up a property by reference number.
+
+        Args:
+            reference (int): The property reference number.
+            default (optional): Returned when the property is not registered.
+
+        Returns:
+            ResidentialProperty: The property, or default.
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        """
+        Removes every property.
+        """
+        raise NotImplementedError
+
+    def append(self, prop):
+        """
+        Registers a property. Kept so code written against the original
+        list registry keeps working.
+
+        Args:
+            prop (ResidentialProperty): The property.
+        """
+        self.add(prop)
+
+    def extend(self, properties):
+        """
+        Registers several properties.
+
+        Args:
+            properties (iterable): The properties.
+        """
+        for prop in properties:
+            self.add(prop)
+
+    def remove(self, prop):
+        """
+        Removes a registered property.
+
+        Args:
+            prop (ResidentialProperty): The property.
+
+        Raises:
+            ValueError: If the property is not registered.
+        """
+        if self.discard(prop.getreference_number()) is None:
+            raise ValueError('property is not registered')
+
+    def references(self):
+        """
+        Returns the registered reference numbers.
+
+        Returns:
+            list: The reference numbers, in registration order.
+        """
+        return [prop.getreference_number() for prop in self]
+
+    def __getitem__(self, index):
+        """
+        Gets a property by its position in registration order. Kept so code
+        written against the original list registry keeps working; use get()
+        to look a property up by reference number.
+
+        Args:
+            index (int or slice): The position, negative counting from the
+                most recent property, or a slice of positions.
+
+        Returns:
+            ResidentialProperty or list: The property, or a list of the
+            properties in the slice.
+
+        Raises:
+            IndexError: If the position is out of range.
+        """
+        if isinstance(index, slice):
+            return list(self)[index]
+        length = len(self)
+        if not -length <= index < length:
+            raise IndexError('registry index out of range')
+        if index < 0:
+            return next(islice(reversed(self), -index - 1, None))
+        return next(islice(self, index, None))
+
+    def __reversed__(self):
+        return reversed(list(self))
+
+    def __contains__(self, prop):
+        return self.get(prop.getreference_number()) is prop
+
+    def __repr__(self):
+        return '{}({} properties)'.format(type(self).__name__, len(self))
+
+
+class StrongRegistry(PropertyRegistry):
+    """
+    Keeps every registered property alive until it is deregistered.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty StrongRegistry.
+        """
+        self.__properties = {}
+
+    def add(self, prop):
+        """
+        Registers a property, replacing any with the same reference number.
+
+        Args:
+            prop (ResidentialProperty): The property.
+        """
+        self.__properties[prop.getreference_number()] = prop
+
+    def extend(self, properties):
+        """
+        Registers several properties in one dict update.
+
+        Args:
+            properties (iterable): The properties.
+        """
+        self.__properties.update((prop.getreference_number(), prop) for prop in properties)
+
+    def discard(self, reference):
+        """
+        Removes a property if it is registered.
+
+        Args:
+            reference (int): The property reference number.
+
+        Returns:
+            ResidentialProperty: The removed property, or None.
+        """
+        return self.__properties.pop(reference, None)
+
+    def get(self, reference, default=None):
+        """
+        Looks up a property by reference number.
+
+        Args:
+            reference (int): The property reference number.
+            default (optional): Returned when the property is not registered.
+
+        Returns:
+            ResidentialProperty: The property, or default.
+        """
+        return self.__properties.get(reference, default)
+
+    def clear(self):
+        """
+        Removes every property.
+        """
+        self.__properties.clear()
+
+    def references(self):
+        """
+        Returns the registered reference numbers.
+
+        Returns:
+            list: The reference numbers, in registration order.
+        """
+        return list(self.__properties)
+
+    def __iter__(self):
+        return iter(self.__properties.values())
+
+    def __reversed__(self):
+        return reversed(self.__properties.values())
+
+    def __len__(self):
+        return len(self.__properties)
+
+
+class WeakRegistry(PropertyRegistry):
+    """
+    Holds weak references only, so registering a property never keeps it
+    alive.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty WeakRegistry.
+        """
+        self.__properties = weakref.WeakValueDictionary()
+
+    def add(self, prop):
+        """
+        Registers a property without keeping it alive.
+
+        Args:
+            prop (ResidentialProperty): The property.
+        """
+        self.__properties[prop.getreference_number()] = prop
+
+    def discard(self, reference):
+        """
+        Removes a property if it is registered and still alive.
+
+        Args:
+            reference (int): The property reference number.
+
+        Returns:
+            ResidentialProperty: The removed property, or None.
+        """
+        return self.__properties.pop(reference, None)
+
+    def get(self, reference, default=None):
+        """
+        Looks up a property by reference number.
+
+        Args:
+            reference (int): The property reference number.
+            default (optional): Returned when the property is not registered
+                or has been garbage collected.
+
+        Returns:
+            ResidentialProperty: The property, or default.
+        """
+        return self.__properties.get(reference, default)
+
+    def clear(self):
+        """
+        Removes every property.
+        """
+        self.__properties.clear()
+
+    def references(self):
+        """
+        Returns the reference numbers of the live registered properties.
+
+        Returns:
+            list: The reference numbers, in registration order.
+        """
+        return list(self.__properties.keys())
+
+    def __iter__(self):
+        # The WeakValueDictionary iterator holds one property at a time, and
+        # properties collected during the loop are removed after it.
+        return self.__properties.values()
+
+    def __len__(self):
+        return len(self.__properties)
+
+
+class LRURegistry(PropertyRegistry):
+    """
+    Keeps at most maxsize properties, evicting the least recently registered
+    or looked-up property when full.
+    """
+
+    def __init__(self, maxsize=100000, on_evict=None):
+        """
+        Initializes an empty LRURegistry.
+
+        Args:
+            maxsize (int, optional): The maximum number of properties kept.
+                Defaults to 100000.
+            on_evict (callable, optional): Called with each evicted property,
+                e.g. to archive it.
+        """
+        from collections import OrderedDict  # not needed by `import residentialproperty`
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self.__properties = OrderedDict()
+
+    def add(self, prop):
+        """
+        Registers a property as the most recent one, evicting the least
+        recent ones beyond maxsize.
+
+        Args:
+            prop (ResidentialProperty): The property.
+        """
+        properties = self.__properties
+        reference = prop.getreference_number()
+        properties[reference] = prop
+        properties.move_to_end(reference)
+        while len(properties) > self.maxsize:
+            _, evicted = properties.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(evicted)
+
+    def discard(self, reference):
+        """
+        Removes a property if it is registered.
+
+        Args:
+            reference (int): The property reference number.
+
+        Returns:
+            ResidentialProperty: The removed property, or None.
+        """
+        return self.__properties.pop(reference, None)
+
+    def get(self, reference, default=None):
+        """
+        Looks up a property by reference number and marks it as the most
+        recent one. That reorders the registry, so it also raises
+        RuntimeError inside a loop over the registry.
+
+        Args:
+            reference (int): The property reference number.
+            default (optional): Returned when the property is not registered.
+
+        Returns:
+            ResidentialProperty: The property, or default.
+        """
+        prop = self.__properties.get(reference)
+        if prop is None:
+            return default
+        self.__properties.move_to_end(reference)
+        return prop
+
+    def clear(self):
+        """
+        Removes every property.
+        """
+        self.__properties.clear()
+
+    def references(self):
+        """
+        Returns the registered reference numbers.
+
+        Returns:
+            list: The reference numbers, least recently used first.
+        """
+        return list(self.__properties)
+
+    def __contains__(self, prop):
+        return self.__properties.get(prop.getreference_number()) is prop
+
+    def __iter__(self):
+        return iter(self.__properties.values())
+
+    def __reversed__(self):
+        return reversed(self.__properties.values())
+
+    def __len__(self):
+        return len(self.__properties)
+
+
+class NullRegistry(PropertyRegistry):
+    """
+    A disabled registry: nothing is ever kept.
+    """
+
+    def add(self, prop):
+        """
+        Ignores a property.
+
+        Args:
+            prop (ResidentialProperty): The property.
+        """
+
+    def extend(self, properties):
+        """
+        Ignores several properties without iterating them.
+
+        Args:
+            properties (iterable): The properties.
+        """
+
+    def discard(self, reference):
+        """
+        Removes nothing.
+
+        Args:
+            reference (int): The property reference number.
+
+        Returns:
+            None: Nothing is ever registered.
+        """
+        return None
+
+    def get(self, reference, default=None):
+        """
+        Looks up nothing.
+
+        Args:
+            reference (int): The property reference number.
+            default (optional): Always returned.
+
+        Returns:
+            The default.
+        """
+        return default
+
+    def clear(self):
+        """
+        Does nothing; the registry is always empty.
+        """
+
+    def __iter__(self):
+        return iter(())
+
+    def __len__(self):
+        return 0
+
+
+REGISTRY_TYPES = {
+    'strong': StrongRegistry,
+    'weak': WeakRegistry,
+    'lru': LRURegistry,
+    'disabled': NullRegistry,
+}
+
+
+def make_registry(kind='strong', **options):
+    """
+    Creates a registry by name.
+
+    Args:
+        kind (str, optional): 'strong', 'weak', 'lru' or 'disabled'.
+            Defaults to 'strong'.
+        **options: Passed to the registry class, e.g. maxsize for 'lru'.
+
+    Returns:
+        PropertyRegistry: The new registry.
+    """
+    try:
+        return REGISTRY_TYPES[kind](**options)
+    except KeyError:
+        raise ValueError('Unknown registry kind: {!r}'.format(kind)) from None
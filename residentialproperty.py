@@ -1,13 +1,146 @@
-from abc import ABC, abstractmethod
+from abc import ABC, ABCMeta, abstractmethod
 
+from referencenumbers import CounterAllocator
+from registry import PropertyRegistry, StrongRegistry, make_registry
 
-class ResidentialProperty:
+
+class PropertyObserver:
+    """
+    Base class for objects that want to be told about property changes.
+    Register an instance with ResidentialProperty.add_observer(); subclasses
+    override only the notifications they need.
+    """
+
+    def property_added(self, prop):
+        """
+        Called once a property has been fully constructed.
+
+        Args:
+            prop (ResidentialProperty): The new property.
+        """
+
+    def property_changed(self, prop, field, old_value, new_value):
+        """
+        Called after a property setter has stored a new value.
+
+        Args:
+            prop: The property whose field changed.
+            field (str): The name of the property attribute, e.g. 'SalePrice'.
+            old_value: The value before the change.
+            new_value: The value after the change.
+        """
+
+    def property_removed(self, prop):
+        """
+        Called after a property has been deregistered or archived.
+
+        Args:
+            prop (ResidentialProperty): The removed property.
+        """
+
+
+def notify_changed(prop, field, old_value, new_value):
+    """
+    Tells every registered observer that a field has changed.
+
+    Args:
+        prop: The property whose field changed.
+        field (str): The name of the property attribute.
+        old_value: The value before the change.
+        new_value: The value after the change.
+    """
+    for observer in ResidentialProperty.observers:
+        observer.property_changed(prop, field, old_value, new_value)
+
+
+def as_location(location):
+    """
+    Checks a value given to the Location setter.
+
+    Args:
+        location (tuple or None): A (latitude, longitude) pair in degrees, or
+            None to clear the location.
+
+    Returns:
+        tuple: (latitude, longitude) as floats, or None.
+
+    Raises:
+        ValueError: If the pair is malformed or out of range.
+    """
+    if location is None:
+        return None
+    try:
+        latitude, longitude = map(float, location)
+    except (TypeError, ValueError):
+        raise ValueError('Location must be a (latitude, longitude) pair') from None
+    if not (-90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0):
+        raise ValueError('Location {!r} is out of range'.format(location))
+    return latitude, longitude
+
+
+_serialization_module = None
+
+
+def _serialization():
+    """
+    Imports serialization.py on first use; it builds on this module.
+
+    Returns:
+        module: The serialization module.
+    """
+    global _serialization_module
+    if _serialization_module is None:
+        import serialization
+        _serialization_module = serialization
+    return _serialization_module
+
+
+class PropertyMeta(ABCMeta):
+    """
+    Metaclass of ResidentialProperty. Notifies observers once the whole
+    constructor chain (e.g. House.__init__ and Sale.__init__) has finished.
+    Being an ABCMeta, it also lets alternative implementations (such as the
+    slotted classes) register as virtual subclasses.
+    """
+
+    def __call__(cls, *args, **kwargs):
+        prop = super().__call__(*args, **kwargs)
+        for observer in ResidentialProperty.observers:
+            observer.property_added(prop)
+        return prop
+
+    @property
+    def reference_number(cls):
+        """
+        Gets the highest reference number handed out so far.
+
+        Returns:
+            int: The highest reference number.
+        """
+        return ResidentialProperty.reference_allocator.highest
+
+    @reference_number.setter
+    def reference_number(cls, reference_number):
+        """
+        Makes new properties continue numbering after a given reference number.
+
+        Args:
+            reference_number (int): The last reference number considered used.
+        """
+        ResidentialProperty.reference_allocator.reset(reference_number)
+
+
+class ResidentialProperty(metaclass=PropertyMeta):
     """
     A class representing a residential property.
     """
 
-    total_properties = []  # List to store all residential properties
-    reference_number = 0  # Counter to assign reference numbers to properties
+    total_properties = StrongRegistry()  # Registry of all residential properties
+    reference_allocator = CounterAllocator()  # Assigns reference numbers to properties
+    observers = []  # PropertyObserver objects notified of new and changed properties
+
+    # Coordinates are optional and only set through the Location setter.
+    __location = None
 
     def __init__(self, address: str, built_up_area: float, num_of_bedrooms: int,
                  num_of_bathrooms: int, num_of_parking_slots=1,
@@ -25,7 +158,7 @@ class ResidentialProperty:
             gym_avail (bool, optional): Indicates if a gym is available. Defaults to False.
         """
         
-        self.__reference_number = ResidentialProperty.reference_number + 1
+        self.__reference_number = ResidentialProperty.reference_allocator.allocate()
         self.__address = address
         self.__built_up_area = built_up_area
         self.__num_of_bedrooms = num_of_bedrooms
@@ -34,8 +167,141 @@ class ResidentialProperty:
         self.__pool_avail = pool_avail
         self.__gym_avail = gym_avail
         self.__agent_commission_percent = 0.02
-        ResidentialProperty.reference_number += 1
-        ResidentialProperty.total_properties.append(self)
+        for registry in ResidentialProperty.registries_for(type(self)):
+            registry.add(self)
+
+    @staticmethod
+    def add_observer(observer):
+        """
+        Registers an observer for property creation and setter calls.
+
+        Args:
+            observer (PropertyObserver): The observer to register.
+        """
+        if observer not in ResidentialProperty.observers:
+            ResidentialProperty.observers.append(observer)
+
+    @staticmethod
+    def remove_observer(observer):
+        """
+        Unregisters an observer. Unknown observers are ignored.
+
+        Args:
+            observer (PropertyObserver): The observer to remove.
+        """
+        if observer in ResidentialProperty.observers:
+            ResidentialProperty.observers.remove(observer)
+
+    @classmethod
+    def use_registry(cls, registry='strong', **options):
+        """
+        Sets the registry that new instances of this class are added to.
+        Called on ResidentialProperty it replaces total_properties for every
+        property; called on a subclass such as House it gives that subclass a
+        registry of its own, kept in addition to the global one.
+
+        Args:
+            registry (PropertyRegistry or str, optional): The registry, or one
+                of 'strong', 'weak', 'lru' and 'disabled'. Defaults to 'strong'.
+            **options: Options for a registry given by name, e.g. maxsize=1000
+                for 'lru'.
+
+        Returns:
+            PropertyRegistry: The registry now in use.
+        """
+        if not isinstance(registry, PropertyRegistry):
+            registry = make_registry(registry, **options)
+        if cls is ResidentialProperty:
+            registry.extend(ResidentialProperty.total_properties)
+        else:
+            registry.extend(prop for prop in ResidentialProperty.total_properties
+                            if isinstance(prop, cls))
+        cls.total_properties = registry
+        ResidentialProperty._registry_cache.clear()
+        return registry
+
+    _registry_cache = {}  # Class -> registries its instances are added to
+
+    @staticmethod
+    def registries_for(cls):
+        """
+        Returns the registries that new instances of a class are added to.
+
+        Args:
+            cls (type): A ResidentialProperty subclass.
+
+        Returns:
+            list: The global registry and any registries of its base classes.
+        """
+        registries = ResidentialProperty._registry_cache.get(cls)
+        if registries is None:
+            # Alternative implementations register like the class they mirror.
+            mro = getattr(cls, 'variant_of', cls).__mro__
+            registries = [klass.__dict__['total_properties'] for klass in mro
+                          if 'total_properties' in klass.__dict__]
+            ResidentialProperty._registry_cache[cls] = registries
+        return registries
+
+    def deregister(self):
+        """
+        Removes the property from every registry it was added to, e.g. when a
+        listing is withdrawn, and notifies observers.
+        """
+        reference = self.__reference_number
+        for registry in ResidentialProperty.registries_for(type(self)):
+            if registry.get(reference) is self:
+                registry.discard(reference)
+        for observer in ResidentialProperty.observers:
+            observer.property_removed(self)
+
+    def archive(self, store):
+        """
+        Copies the property into an archive, such as a PropertyStore, and then
+        deregisters it.
+
+        Args:
+            store: An object with an add(prop) method.
+
+        Returns:
+            The value returned by store.add(), e.g. the archive row.
+        """
+        row = store.add(self)
+        self.deregister()
+        return row
+
+    def __getstate__(self):
+        """
+        Returns the compact, schema-versioned state of the property (see
+        serialization.py).
+
+        Returns:
+            tuple: (schema version, kind code, field values).
+        """
+        return _serialization().property_state(self)
+
+    def __setstate__(self, state):
+        """
+        Restores the fields of the property.
+
+        Args:
+            state (tuple or dict): A state from __getstate__(), the instance
+                __dict__ stored by pickles made before states were versioned,
+                or the (__dict__, slot values) pair of the stock protocol.
+        """
+        if isinstance(state, dict):
+            self.__dict__.update(state)
+            return
+        if len(state) == 2:
+            attributes, slots = state
+            if attributes:
+                self.__dict__.update(attributes)
+            for name, value in slots.items():
+                setattr(self, name, value)
+            return
+        _serialization().restore_state(self, state)
+
+    def __reduce__(self):
+        return _serialization().reduce_property(self)
 
     def getreference_number(self):
         """
@@ -64,7 +330,10 @@ class ResidentialProperty:
         Args:
             address (str): The new address.
         """
+        old_value = self.__address
         self.__address = address
+        if ResidentialProperty.observers:
+            notify_changed(self, 'Address', old_value, address)
 
     @property
     def Built_Up_Area(self):
@@ -84,7 +353,10 @@ class ResidentialProperty:
         Args:
             built_up_area (float): The new built-up area in square units.
         """
+        old_value = self.__built_up_area
         self.__built_up_area = built_up_area
+        if ResidentialProperty.observers:
+            notify_changed(self, 'Built_Up_Area', old_value, built_up_area)
 
     @property
     def Number_of_Bedrooms(self):
@@ -104,7 +376,10 @@ class ResidentialProperty:
         Args:
             num_of_bedrooms (int): The new number of bedrooms.
         """
+        old_value = self.__num_of_bedrooms
         self.__num_of_bedrooms = num_of_bedrooms
+        if ResidentialProperty.observers:
+            notify_changed(self, 'Number_of_Bedrooms', old_value, num_of_bedrooms)
 
     @property
     def Number_of_Bathrooms(self):
@@ -124,7 +399,10 @@ class ResidentialProperty:
         Args:
             num_of_bathrooms (int): The new number of bathrooms.
         """
+        old_value = self.__num_of_bathrooms
         self.__num_of_bathrooms = num_of_bathrooms
+        if ResidentialProperty.observers:
+            notify_changed(self, 'Number_of_Bathrooms', old_value, num_of_bathrooms)
 
     @property
     def Number_of_Parking_Slots(self):
@@ -144,7 +422,10 @@ class ResidentialProperty:
         Args:
             num_of_parking_slots (int): The new number of parking slots.
         """
+        old_value = self.__num_of_parking_slots
         self.__num_of_parking_slots = num_of_parking_slots
+        if ResidentialProperty.observers:
+            notify_changed(self, 'Number_of_Parking_Slots', old_value, num_of_parking_slots)
 
     @property
     def Gym_Avail(self):
@@ -164,7 +445,10 @@ class ResidentialProperty:
         Args:
             gym_avail (bool): True if a gym is available, False otherwise.
         """
+        old_value = self.__gym_avail
         self.__gym_avail = gym_avail
+        if ResidentialProperty.observers:
+            notify_changed(self, 'Gym_Avail', old_value, gym_avail)
 
     @property
     def Pool_Avail(self):
@@ -184,7 +468,10 @@ class ResidentialProperty:
         Args:
             pool_avail (bool): True if a pool is available, False otherwise.
         """
+        old_value = self.__pool_avail
         self.__pool_avail = pool_avail
+        if ResidentialProperty.observers:
+            notify_changed(self, 'Pool_Avail', old_value, pool_avail)
 
     @property
     def AgentCommissionPercent(self):
@@ -205,7 +492,37 @@ class ResidentialProperty:
             commission_percent (float, optional): The new agent commission percentage. Defaults to None.
         """
         if commission_percent:
+            old_value = self.__agent_commission_percent
             self.__agent_commission_percent = commission_percent
+            if ResidentialProperty.observers:
+                notify_changed(self, 'AgentCommissionPercent', old_value, commission_percent)
+
+    @property
+    def Location(self):
+        """
+        Gets the coordinates of the property.
+
+        Returns:
+            tuple: (latitude, longitude) in degrees, or None if unknown.
+        """
+        return self.__location
+
+    @Location.setter
+    def Location(self, location):
+        """
+        Sets the coordinates of the property.
+
+        Args:
+            location (tuple): A (latitude, longitude) pair in degrees, or None.
+
+        Raises:
+            ValueError: If the pair is malformed or out of range.
+        """
+        location = as_location(location)
+        old_value = self.__location
+        self.__location = location
+        if ResidentialProperty.observers:
+            notify_changed(self, 'Location', old_value, location)
 
     def print_attributes(self):
         """
@@ -267,7 +584,10 @@ class House(ResidentialProperty):
         Args:
             num_of_floors (int): The new number of floors.
         """
+        old_value = self.__num_of_floors
         self.__num_of_floors = num_of_floors
+        if ResidentialProperty.observers:
+            notify_changed(self, 'Number_of_Floors', old_value, num_of_floors)
 
     @property
     def Plot_Size(self):
@@ -287,7 +607,10 @@ class House(ResidentialProperty):
         Args:
             plot_size (float): The new plot size in square units.
         """
+        old_value = self.__plot_size
         self.__plot_size = plot_size
+        if ResidentialProperty.observers:
+            notify_changed(self, 'Plot_Size', old_value, plot_size)
 
     @property
     def House_Type(self):
@@ -307,7 +630,10 @@ class House(ResidentialProperty):
         Args:
             house_type (str): The new house type.
         """
+        old_value = self.__house_type
         self.__house_type = house_type
+        if ResidentialProperty.observers:
+            notify_changed(self, 'House_Type', old_value, house_type)
 
 class Apartment(ResidentialProperty):
     """
@@ -356,7 +682,10 @@ class Apartment(ResidentialProperty):
         Args:
             floor_num (int): The new floor number.
         """
+        old_value = self.__floor_num
         self.__floor_num = floor_num
+        if ResidentialProperty.observers:
+            notify_changed(self, 'FloorNumber', old_value, floor_num)
 
     @property
     def NumberOfBalconies(self):
@@ -376,14 +705,25 @@ class Apartment(ResidentialProperty):
         Args:
             num_of_balconies (int): The new number of balconies.
         """
+        old_value = self.__num_of_balconies
         self.__num_of_balconies = num_of_balconies
+        if ResidentialProperty.observers:
+            notify_changed(self, 'NumberOfBalconies', old_value, num_of_balconies)
 
         
-class Rental:
+class Rental(metaclass=ABCMeta):
     """
-    A class representing a rental property.
+    A class representing a rental property. Like ResidentialProperty, it
+    accepts virtual subclasses (the slotted Rental mixin registers itself).
     """
 
+    # Rental fields are only set through the setters, so default them to None
+    # until a value is given.
+    __deposit_amount = None
+    __yearly_rent = None
+    __furnished = None
+    __maid_room = None
+
     @property
     def DepositAmount(self):
         """
@@ -402,7 +742,10 @@ class Rental:
         Args:
             deposit_amount (float): The deposit amount.
         """
+        old_value = self.__deposit_amount
         self.__deposit_amount = deposit_amount
+        if ResidentialProperty.observers:
+            notify_changed(self, 'DepositAmount', old_value, deposit_amount)
 
     @property
     def YearlyRent(self):
@@ -422,7 +765,10 @@ class Rental:
         Args:
             yearly_rent (float): The yearly rent.
         """
+        old_value = self.__yearly_rent
         self.__yearly_rent = yearly_rent
+        if ResidentialProperty.observers:
+            notify_changed(self, 'YearlyRent', old_value, yearly_rent)
 
     @property
     def Furnished(self):
@@ -442,7 +788,10 @@ class Rental:
         Args:
             furnished (bool): The furnished status.
         """
+        old_value = self.__furnished
         self.__furnished = furnished
+        if ResidentialProperty.observers:
+            notify_changed(self, 'Furnished', old_value, furnished)
 
     @property
     def MaidRoom(self):
@@ -462,7 +811,10 @@ class Rental:
         Args:
             maid_room (bool): The maid room status.
         """
+        old_value = self.__maid_room
         self.__maid_room = maid_room
+        if ResidentialProperty.observers:
+            notify_changed(self, 'MaidRoom', old_value, maid_room)
 
     @abstractmethod
     def AgentCommissionValue(self):
@@ -474,9 +826,10 @@ class Rental:
 
     
     
-class Sale:
+class Sale(metaclass=ABCMeta):
     """
-    A class representing a sale property.
+    A class representing a sale property. Like ResidentialProperty, it
+    accepts virtual subclasses (the slotted Sale mixin registers itself).
     """
 
     def __init__(self, sale_price, annual_service_charge):
@@ -509,7 +862,10 @@ class Sale:
         Args:
             sale_price (float): The sale price.
         """
+        old_value = self.__sale_price
         self.__sale_price = sale_price
+        if ResidentialProperty.observers:
+            notify_changed(self, 'SalePrice', old_value, sale_price)
 
     @property
     def AnnualServiceCharge(self):
@@ -529,7 +885,10 @@ class Sale:
         Args:
             annual_service_charge (float): The annual service charge.
         """
+        old_value = self.__annual_service_charge
         self.__annual_service_charge = annual_service_charge
+        if ResidentialProperty.observers:
+            notify_changed(self, 'AnnualServiceCharge', old_value, annual_service_charge)
 
     @property
     def FixedTaxPercent(self):
@@ -549,7 +908,10 @@ class Sale:
         Args:
             fixed_tax_percent (float): The fixed tax percentage.
         """
+        old_value = self.__fixed_tax_percent
         self.__fixed_tax_percent = fixed_tax_percent
+        if ResidentialProperty.observers:
+            notify_changed(self, 'FixedTaxPercent', old_value, fixed_tax_percent)
 
     @abstractmethod
     def AgentCommissionValue(self):
@@ -726,3 +1088,64 @@ class SaleHouse(Sale, House):
             float: The agent commission value.
         """
         return self.SalePrice * self.AgentCommissionPercent
+
+
+# Accelerator modules build on the classes above and may pull in NumPy, mmap,
+# asyncio or process pools. `import residentialproperty` loads none of them;
+# each is imported the first time one of its names (or the module itself) is
+# read from this module, e.g. residentialproperty.PropertyStore. Without
+# NumPy they fall back to plain Python.
+ACCELERATORS = {
+    'propertystore': ('PropertyStore',),
+    'propertyindex': ('PropertyIndex',),
+    'batchcompute': ('compute_commissions', 'compute_taxes'),
+    'bulkload': ('bulk_load',),
+    'slotted': ('SlottedSaleApartment', 'SlottedSaleHouse', 'SlottedRentalApartment',
+                'SlottedRentalHouse'),
+    'snapshot': ('save_snapshot', 'open_snapshot'),
+    'serialization': ('to_bytes', 'from_bytes'),
+    'portfolio': ('PortfolioEvaluator',),
+    'stream': ('stream',),  # the function; import stream for the module
+    'aggregates': ('MaterializedAggregates',),
+    'journal': ('MutationJournal', 'replay'),
+    'service': ('PropertyService',),
+    'metrics': ('DerivedMetrics',),
+    'geoindex': ('GeoIndex',),
+    'addressindex': ('AddressIndex',),
+    'comparables': ('ComparablesIndex', 'PriceEstimator', 'find_comparables'),
+    'instrumentation': ('Instrumentation',),
+    'sqlitestore': ('SQLiteRepository',),
+    'scenarios': ('ScenarioEngine', 'scenario_grid'),
+    'versionedbook': ('VersionedBook',),
+    'dedup': ('DedupEngine',),
+    'validation': ('validate_batch', 'ValidationError'),
+}
+
+_LAZY_NAMES = {name: module for module, names in ACCELERATORS.items() for name in names}
+
+
+def __getattr__(name):
+    """
+    Imports an accelerator module on first access to one of its names.
+
+    Args:
+        name (str): The attribute looked up.
+
+    Returns:
+        The attribute of the accelerator module, or the module itself.
+
+    Raises:
+        AttributeError: If no accelerator provides the name.
+    """
+    module_name = _LAZY_NAMES.get(name)
+    if module_name is None and name not in ACCELERATORS:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    import importlib
+    module = importlib.import_module(module_name or name)
+    value = module if module_name is None else getattr(module, name)
+    globals()[name] = value  # later reads skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_NAMES) | set(ACCELERATORS))
@@ -0,0 +1,469 @@
+"""
+What-if repricing: commission, tax, price and rent scenarios evaluated
+against an unchanged book.
+
+A Scenario overrides some of the inputs of AgentCommissionValue() and
+TaxValue() for every listing: the commission percent, the tax percent, and
+multipliers on SalePrice and YearlyRent. An override left as None keeps each
+listing's own percent. scenario_grid() builds every combination of a few
+values per override.
+
+    engine = ScenarioEngine()
+    grid = scenario_grid(commission_percent=(0.015, 0.02, 0.025),
+                         tax_percent=(0.04, 0.05))
+    cube = engine.evaluate(grid)
+    cube.value(grid[0], SaleHouse, 'commission')
+    cube.totals('tax')                             # one total per scenario
+
+The engine copies the columns it needs from the objects (or a PropertyStore
+or snapshot) once, so evaluating never reads or writes a live object; call
+refresh() to pick up later changes. Every metric of a class is a sum that is
+linear in the overrides: the commission of the sales at percent p and price
+multiplier m is m * p * sum(SalePrice), and with their own percents it is
+m * sum(SalePrice * AgentCommissionPercent). The engine therefore reduces
+each class to a few sums in one pass over the columns, and a scenario costs
+a handful of multiplications per class however large the book is. The grid
+is broadcast against those sums with NumPy when it is installed.
+evaluate(mode='direct') recomputes every listing under every scenario instead
+and serves as the correctness baseline. Unset values (e.g. the YearlyRent of
+a rental that was never let) are left out of the sums, as in portfolio.py.
+"""
+
+from collections import namedtuple
+from itertools import product
+import math
+
+from residentialproperty import ResidentialProperty
+from propertystore import PropertyStore, StringTable, KINDS, RENTAL_CODES, SALE_CODES
+from portfolio import object_shard, store_shard
+
+try:
+    import numpy as np
+except ImportError:  # Fall back to plain Python loops over the sums
+    np = None
+
+
+METRICS = ('count', 'sale_value', 'yearly_rent', 'commission', 'tax')
+
+Scenario = namedtuple('Scenario', 'commission_percent tax_percent price_multiplier '
+                                  'rent_multiplier', defaults=(None, None, 1.0, 1.0))
+Scenario.__doc__ = """
+One set of overrides. commission_percent and tax_percent replace every
+listing's AgentCommissionPercent and FixedTaxPercent, or keep them if None;
+price_multiplier and rent_multiplier scale SalePrice and YearlyRent.
+"""
+
+# Per-class sums the metrics are computed from.
+_SUMS = ('count', 'price', 'price_commission', 'price_tax', 'rent', 'rent_commission')
+
+# Listings per scenario block in direct mode, to bound the memory of the
+# scenario x listing arrays.
+_DIRECT_BLOCK = 1 << 22
+
+
+def scenario_grid(commission_percent=(None,), tax_percent=(None,),
+                  price_multiplier=(1.0,), rent_multiplier=(1.0,)):
+    """
+    Builds every combination of the given override values.
+
+    Args:
+        commission_percent (iterable, optional): Commission percents, as
+            fractions; None keeps the listings' own. Defaults to (None,).
+        tax_percent (iterable, optional): Tax percents; None keeps the
+            listings' own. Defaults to (None,).
+        price_multiplier (iterable, optional): SalePrice multipliers.
+            Defaults to (1.0,).
+        rent_multiplier (iterable, optional): YearlyRent multipliers.
+            Defaults to (1.0,).
+
+    Returns:
+        list: The scenarios, the last override varying fastest.
+    """
+    return [Scenario(*values) for values in product(commission_percent, tax_percent,
+                                                    price_multiplier, rent_multiplier)]
+
+
+class ScenarioCube:
+    """
+    The metrics of every class under every scenario.
+    """
+
+    def __init__(self, scenarios, classes, values):
+        """
+        Initializes a ScenarioCube.
+
+        Args:
+            scenarios (list): The scenarios.
+            classes (tuple): The property classes.
+            values: Nested lists or a NumPy array indexed by scenario, class
+                and metric (in METRICS order).
+        """
+        self.scenarios = tuple(scenarios)
+        self.classes = tuple(classes)
+        self.metrics = METRICS
+        self.values = values
+        self.__positions = {scenario: position for position, scenario
+                            in reversed(list(enumerate(self.scenarios)))}
+
+    def __len__(self):
+        return len(self.scenarios)
+
+    def _scenario_position(self, scenario):
+        if isinstance(scenario, int):
+            return scenario
+        try:
+            return self.__positions[scenario]
+        except KeyError:
+            raise KeyError('{!r} was not evaluated'.format(scenario)) from None
+
+    def value(self, scenario, cls, metric):
+        """
+        Gets one metric of one class under one scenario.
+
+        Args:
+            scenario (Scenario or int): The scenario, or its position.
+            cls (type): The property class.
+            metric (str): One of METRICS.
+
+        Returns:
+            float: The value; 0 for a class without listings.
+        """
+        if cls not in self.classes:
+            return 0.0
+        return float(self.values[self._scenario_position(scenario)][
+            self.classes.index(cls)][METRICS.index(metric)])
+
+    def totals(self, metric):
+        """
+        Sums one metric over the classes, for every scenario.
+
+        Args:
+            metric (str): One of METRICS.
+
+        Returns:
+            list: One total per scenario, in scenario order.
+        """
+        column = METRICS.index(metric)
+        if np is not None and isinstance(self.values, np.ndarray):
+            return self.values[:, :, column].sum(axis=1).tolist()
+        return [math.fsum(row[column] for row in block) for block in self.values]
+
+    def rows(self):
+        """
+        Flattens the cube.
+
+        Yields:
+            tuple: (scenario, class, {metric: value}), scenario by scenario.
+        """
+        for scenario, block in zip(self.scenarios, self.values):
+            for cls, row in zip(self.classes, block):
+                yield scenario, cls, dict(zip(METRICS, (float(value) for value in row)))
+
+
+class ScenarioEngine:
+    """
+    Evaluates scenario grids against a copy of the book's columns.
+    """
+
+    def __init__(self, source=None):
+        """
+        Initializes a ScenarioEngine and copies the columns of the book.
+
+        Args:
+            source (iterable or PropertyStore, optional): The properties, or a
+                store or snapshot. Defaults to ResidentialProperty.total_properties.
+        """
+        self.source = source
+        self.refresh()
+
+    def refresh(self):
+        """
+        Copies the columns of the book again and recomputes the sums of each
+        class, picking up listings and changes made since.
+        """
+        source = self.source
+        if source is None:
+            source = ResidentialProperty.total_properties
+        if isinstance(source, PropertyStore):
+            shard = store_shard(source, range(len(source))) if len(source) else None
+        else:
+            properties = list(source)
+            shard = object_shard(properties, StringTable()) if properties else None
+        self.columns = shard.columns if shard is not None else None
+        self.__sums = self._reduce()
+
+    def __len__(self):
+        return len(self.columns['kind']) if self.columns is not None else 0
+
+    def _reduce(self):
+        """
+        Sums the columns per class in one pass.
+
+        Returns:
+            dict: Kind code -> list of the _SUMS.
+        """
+        sums = {}
+        if self.columns is None:
+            return sums
+        columns = self.columns
+        for code, price, rent, percent, tax_percent in zip(
+                columns['kind'], columns['sale_price'], columns['yearly_rent'],
+                columns['commission_percent'], columns['fixed_tax_percent']):
+            totals = sums.get(code)
+            if totals is None:
+                totals = sums[code] = [0, 0.0, 0.0, 0.0, 0.0, 0.0]
+            totals[0] += 1
+            # x == x is False for NaN, i.e. for unset values.
+            if price == price:
+                totals[1] += price
+                totals[2] += price * percent
+                if tax_percent == tax_percent:
+                    totals[3] += price * tax_percent
+            if rent == rent:
+                totals[4] += rent
+                totals[5] += rent * percent
+        return sums
+
+    def classes(self):
+        """
+        Lists the classes in the book.
+
+        Returns:
+            tuple: The property classes, in propertystore.KINDS order.
+        """
+        return tuple(KINDS[code] for code in sorted(self.__sums))
+
+    def evaluate(self, scenarios, mode='sums'):
+        """
+        Evaluates every scenario.
+
+        Args:
+            scenarios (iterable): Scenario tuples, e.g. from scenario_grid().
+            mode (str, optional): 'sums' to evaluate the per-class sums, or
+                'direct' to recompute every listing. Defaults to 'sums'.
+
+        Returns:
+            ScenarioCube: The metrics per scenario and class.
+
+        Raises:
+            ValueError: If the mode is unknown.
+        """
+        scenarios = [Scenario(*scenario) for scenario in scenarios]
+        codes = sorted(self.__sums)
+        if mode == 'sums':
+            values = self._evaluate_sums(scenarios, codes)
+        elif mode == 'direct':
+            values = self._evaluate_direct(scenarios, codes)
+        else:
+            raise ValueError("mode must be 'sums' or 'direct', not {!r}".format(mode))
+        return ScenarioCube(scenarios, tuple(KINDS[code] for code in codes), values)
+
+    def _evaluate_sums(self, scenarios, codes):
+        """
+        Evaluates the scenarios from the per-class sums.
+
+        Args:
+            scenarios (list): The scenarios.
+            codes (list): The kind codes of the classes, in cube order.
+
+        Returns:
+            The cube values.
+        """
+        if np is not None:
+            return self._broadcast_sums(scenarios, codes)
+        values = []
+        for commission_percent, tax_percent, price_multiplier, rent_multiplier in scenarios:
+            block = []
+            for code in codes:
+                count, price, price_commission, price_tax, rent, rent_commission = \
+                    self.__sums[code]
+                commission = tax = 0.0
+                if code in SALE_CODES:
+                    commission = price_multiplier * (
+                        price_commission if commission_percent is None
+                        else commission_percent * price)
+                    tax = price_multiplier * (price_tax if tax_percent is None
+                                              else tax_percent * price)
+                elif code in RENTAL_CODES:
+                    commission = rent_multiplier * (
+                        rent_commission if commission_percent is None
+                        else commission_percent * rent)
+                block.append([count, price_multiplier * price, rent_multiplier * rent,
+                              commission, tax])
+            values.append(block)
+        return values
+
+    def _broadcast_sums(self, scenarios, codes):
+        """
+        Evaluates the scenarios from the per-class sums with NumPy, one
+        scenario per row broadcast against one class per column.
+
+        Args:
+            scenarios (list): The scenarios.
+            codes (list): The kind codes of the classes, in cube order.
+
+        Returns:
+            numpy.ndarray: The cube values.
+        """
+        sums = np.array([self.__sums[code] for code in codes], dtype=float).reshape(-1, 6)
+        count, price, price_commission, price_tax, rent, rent_commission = sums.T
+        is_sale = np.isin(codes, list(SALE_CODES))
+        is_rental = np.isin(codes, list(RENTAL_CODES))
+
+        def overrides(position):
+            given = np.array([np.nan if scenario[position] is None else scenario[position]
+                              for scenario in scenarios], dtype=float)[:, None]
+            return given, np.isnan(given)
+        commission_percent, own_commission = overrides(0)
+        tax_percent, own_tax = overrides(1)
+        price_multiplier = np.array([scenario[2] for scenario in scenarios], dtype=float)[:, None]
+        rent_multiplier = np.array([scenario[3] for scenario in scenarios], dtype=float)[:, None]
+
+        sale_commission = price_multiplier * np.where(own_commission, price_commission,
+                                                      commission_percent * price)
+        rental_commission = rent_multiplier * np.where(own_commission, rent_commission,
+                                                       commission_percent * rent)
+        commission = np.where(is_sale, sale_commission, np.where(is_rental,
+                                                                 rental_commission, 0.0))
+        tax = np.where(is_sale, price_multiplier * np.where(own_tax, price_tax,
+                                                            tax_percent * price), 0.0)
+        return np.stack([np.broadcast_to(count, commission.shape), price_multiplier * price,
+                         rent_multiplier * rent, commission, tax], axis=2)
+
+    def listing_values(self, scenario, metric):
+        """
+        Computes one metric of every listing under one scenario.
+
+        Args:
+            scenario (Scenario): The scenario.
+            metric (str): 'sale_value', 'yearly_rent', 'commission' or 'tax'.
+
+        Returns:
+            tuple: (references, values) in column order. Listings the metric
+            does not apply to, or with unset inputs, get NaN.
+
+        Raises:
+            ValueError: If the metric is unknown.
+        """
+        if metric not in METRICS[1:]:
+            raise ValueError('unknown metric {!r}'.format(metric))
+        if self.columns is None:
+            return [], []
+        scenario = Scenario(*scenario)
+        columns = self.columns
+        position = METRICS.index(metric) - 1
+        if np is not None:
+            values = self._numpy_listing_values([scenario])[position][0]
+        else:
+            values = [row[position] for row in map(
+                self._listing_metrics(scenario), columns['kind'], columns['sale_price'],
+                columns['yearly_rent'], columns['commission_percent'],
+                columns['fixed_tax_percent'])]
+        return list(columns['reference']), values
+
+    @staticmethod
+    def _listing_metrics(scenario):
+        """
+        Makes the function computing the metrics of one listing.
+
+        Args:
+            scenario (Scenario): The scenario.
+
+        Returns:
+            callable: (kind, price, rent, percent, tax percent) -> (sale value,
+            yearly rent, commission, tax), NaN where they do not apply.
+        """
+        commission_percent, tax_percent, price_multiplier, rent_multiplier = scenario
+        nan = math.nan
+
+        def metrics(code, price, rent, percent, own_tax):
+            if commission_percent is not None:
+                percent = commission_percent
+            price *= price_multiplier
+            rent *= rent_multiplier
+            if code in SALE_CODES:
+                return (price, rent, price * percent,
+                        price * (own_tax if tax_percent is None else tax_percent))
+            if code in RENTAL_CODES:
+                return price, rent, rent * percent, nan
+            return price, rent, nan, nan
+        return metrics
+
+    def _numpy_listing_values(self, scenarios):
+        """
+        Computes the listing metrics of a few scenarios with NumPy.
+
+        Args:
+            scenarios (list): The scenarios.
+
+        Returns:
+            tuple: (sale value, yearly rent, commission, tax) arrays of shape
+            (scenarios, listings), NaN where they do not apply.
+        """
+        columns = self.columns
+        kind = np.frombuffer(columns['kind'], dtype=np.uint8)
+        price = np.frombuffer(columns['sale_price'], dtype=float)[None, :]
+        rent = np.frombuffer(columns['yearly_rent'], dtype=float)[None, :]
+        percent = np.frombuffer(columns['commission_percent'], dtype=float)[None, :]
+        own_tax = np.frombuffer(columns['fixed_tax_percent'], dtype=float)[None, :]
+        is_sale = np.isin(kind, list(SALE_CODES))
+        is_rental = np.isin(kind, list(RENTAL_CODES))
+
+        def per_scenario(position, default):
+            return np.array([default if scenario[position] is None else scenario[position]
+                             for scenario in scenarios], dtype=float)[:, None]
+        price = per_scenario(2, 1.0) * price
+        rent = per_scenario(3, 1.0) * rent
+        commission_percent = np.array([np.nan if scenario[0] is None else scenario[0]
+                                       for scenario in scenarios], dtype=float)[:, None]
+        percent = np.where(np.isnan(commission_percent), percent, commission_percent)
+        tax_percent = np.array([np.nan if scenario[1] is None else scenario[1]
+                                for scenario in scenarios], dtype=float)[:, None]
+        tax_percent = np.where(np.isnan(tax_percent), own_tax, tax_percent)
+        commission = np.where(is_sale, price * percent,
+                              np.where(is_rental, rent * percent, np.nan))
+        tax = np.where(is_sale, price * tax_percent, np.nan)
+        return price, rent, commission, tax
+
+    def _evaluate_direct(self, scenarios, codes):
+        """
+        Evaluates the scenarios by recomputing every listing.
+
+        Args:
+            scenarios (list): The scenarios.
+            codes (list): The kind codes of the classes, in cube order.
+
+        Returns:
+            The cube values.
+        """
+        values = [[[0, 0.0, 0.0, 0.0, 0.0] for _ in codes] for _ in scenarios]
+        if self.columns is None:
+            return values
+        positions = {code: position for position, code in enumerate(codes)}
+        columns = self.columns
+        if np is not None:
+            kind = np.frombuffer(columns['kind'], dtype=np.uint8)
+            block = max(1, _DIRECT_BLOCK // len(kind))
+            counts = np.array([np.count_nonzero(kind == code) for code in codes])
+            cube = np.zeros((len(scenarios), len(codes), len(METRICS)))
+            cube[:, :, 0] = counts
+            for start in range(0, len(scenarios), block):
+                metrics = self._numpy_listing_values(scenarios[start:start + block])
+                for position, code in enumerate(codes):
+                    members = kind == code
+                    for column, listing_values in enumerate(metrics, 1):
+                        cube[start:start + block, position, column] = np.nansum(
+                            listing_values[:, members], axis=1)
+            return cube
+        for scenario, block in zip(scenarios, values):
+            metrics = self._listing_metrics(scenario)
+            for code, price, rent, percent, tax_percent in zip(
+                    columns['kind'], columns['sale_price'], columns['yearly_rent'],
+                    columns['commission_percent'], columns['fixed_tax_percent']):
+                row = block[positions[code]]
+                row[0] += 1
+                for column, value in enumerate(metrics(code, price, rent, percent,
+                                                       tax_percent), 1):
+                    if value == value:
+                        row[column] += value
+        return values
@@ -0,0 +1,537 @@
+"""
+Compact, schema-versioned serialization of property objects.
+
+The schema of a class is its field list from propertystore.KIND_ATTRIBUTES,
+followed by the optional Location (added in schema version 2; version 1
+data is still read).
+A property is described by its state: the schema version, the kind code of
+its class and a tuple of field values in schema order. Field names are never
+written, and every field is always present: Rental fields that were never set
+are written as None. Restoring leaves a None out of the instance when the
+class itself defaults the attribute to None, as for the Rental fields and
+Location, so a restored object has the same attributes as the original.
+
+ResidentialProperty.__getstate__() returns that state and __reduce__() ships
+it, so pickling a property (for example to send it to a worker process) no
+longer pickles the instance __dict__ with its mangled attribute names.
+Subclasses without a schema, and instances holding attributes outside their
+schema, are pickled with the stock protocol instead, so nothing is lost.
+
+to_bytes() packs many properties into one columnar buffer: the properties are
+grouped by class and each field is stored as one typed block (a float64
+array, an array of the narrowest int type that holds the values, a byte per
+bool, or the UTF-8 text of every string plus their lengths). Only a field mixing value types, e.g. floats and None, falls back to
+a pickled list. from_bytes() rebuilds the objects a class at a time.
+
+Restored properties are plain objects: they are not added to any registry and
+observers are not notified, exactly as with stock pickle.
+"""
+
+from array import array
+import copyreg
+from itertools import accumulate
+from operator import attrgetter, methodcaller
+import pickle
+import struct
+import sys
+
+from propertystore import KINDS, KIND_CODES, KIND_ATTRIBUTES, PropertyView
+from slotted import SLOTTED_CLASSES
+from bulkload import attribute_builder
+
+SCHEMA_VERSION = 2
+
+# Fields appended to the schema after version 1, in order.
+ADDED_IN_2 = (('_ResidentialProperty__location', 'Location'),)
+
+# Kind code bit marking the slotted variant of a class.
+SLOTTED = 0x80
+
+BATCH_MAGIC = b'RPBATCH\0'
+# magic, schema version, property count, group count
+_BATCH_HEAD = struct.Struct('<8sBQH')
+# kind code, row count
+_GROUP_HEAD = struct.Struct('<BQ')
+# block type, block size
+_BLOCK_HEAD = struct.Struct('<BQ')
+
+# Block types of a to_bytes() column. Int columns are stored in the
+# narrowest of the signed array typecodes 'b', 'h', 'i' and 'q' that fits.
+_NONE, _BOOL, _INT, _FLOAT, _STR, _PICKLE = b'N?qdsp'
+_BLOCK_TYPES = {type(None): _NONE, bool: _BOOL, int: _INT, float: _FLOAT, str: _STR}
+_INT_TYPECODES = tuple((typecode, 2 ** (8 * array(typecode).itemsize - 1))
+                       for typecode in 'bhiq')
+
+_SWAP = sys.byteorder == 'big'  # blocks are little-endian
+
+# Kind code -> (class, attribute names), and class -> (kind code, state
+# getter, one getter per field).
+KIND_SCHEMAS = {}
+_ENCODERS = {}
+# Kind code -> the attribute names of its schema, as a set.
+_ATTRIBUTE_SETS = {}
+
+
+def _register_schemas():
+    """
+    Assigns kind codes to the regular and slotted classes.
+    """
+    for cls in KINDS:
+        attributes = tuple(attribute for attribute, _ in KIND_ATTRIBUTES[cls] + ADDED_IN_2)
+        code = KIND_CODES[cls]
+        KIND_SCHEMAS[code] = (cls, attributes)
+        _ATTRIBUTE_SETS[code] = frozenset(attributes)
+        slotted = SLOTTED_CLASSES.get(cls)
+        if slotted is not None:
+            KIND_SCHEMAS[code | SLOTTED] = (slotted, attributes)
+            _ATTRIBUTE_SETS[code | SLOTTED] = frozenset(attributes)
+
+
+_register_schemas()
+
+
+def state_encoder(cls):
+    """
+    Returns how to read the state of instances of a class.
+
+    Args:
+        cls (type): The class of the property.
+
+    Returns:
+        tuple: (kind code, getter returning the field values in schema order,
+        one getter per field).
+
+    Raises:
+        TypeError: If the class has no schema.
+    """
+    entry = _ENCODERS.get(cls)
+    if entry is not None:
+        return entry
+    kind = cls._kind if issubclass(cls, PropertyView) else getattr(cls, 'variant_of', cls)
+    if kind not in KIND_CODES or (kind is not cls and not issubclass(cls, PropertyView)
+                                  and SLOTTED_CLASSES.get(kind) is not cls):
+        # Subclasses of a slotted class inherit variant_of, but have no schema.
+        raise TypeError('cannot serialize {} objects'.format(cls.__name__))
+    code = KIND_CODES[kind]
+    if cls is kind:
+        # Regular instances: read the attributes straight from the object.
+        getter = attrgetter(*KIND_SCHEMAS[code][1])
+        fields = [attrgetter(attribute) for attribute in KIND_SCHEMAS[code][1]]
+    else:
+        # Views and slotted instances: go through the public properties, which
+        # know how to read store rows and unset slots.
+        names = [name for _, name in KIND_ATTRIBUTES[kind][1:] + ADDED_IN_2]
+        rest = attrgetter(*names)
+
+        def getter(prop):
+            return (prop.getreference_number(),) + rest(prop)
+        fields = [methodcaller('getreference_number')] + [attrgetter(name) for name in names]
+        if getattr(cls, 'variant_of', None) is kind:
+            code |= SLOTTED
+    entry = _ENCODERS[cls] = (code, getter, fields)
+    return entry
+
+
+def kind_schema(version, code):
+    """
+    Looks up the class and attribute names of a kind code.
+
+    Args:
+        version (int): The schema version the data was written with.
+        code (int): The kind code.
+
+    Returns:
+        tuple: (class, attribute names).
+
+    Raises:
+        ValueError: If the version or the kind code is unknown.
+    """
+    if version not in (1, SCHEMA_VERSION):
+        raise ValueError('unsupported property schema version {}'.format(version))
+    try:
+        cls, attributes = KIND_SCHEMAS[code]
+    except KeyError:
+        raise ValueError('unknown property kind code {}'.format(code)) from None
+    if version == 1:
+        attributes = attributes[:-len(ADDED_IN_2)]
+    return cls, attributes
+
+
+def property_state(prop):
+    """
+    Returns the serializable state of a property.
+
+    Args:
+        prop (ResidentialProperty): The property, a slotted variant or a
+            PropertyStore view (which is restored as a regular object).
+
+    Returns:
+        tuple: (schema version, kind code, field values).
+    """
+    code, getter, _ = state_encoder(type(prop))
+    return SCHEMA_VERSION, code, getter(prop)
+
+
+_DEFAULTED = {}  # class -> attributes the class itself sets to None
+
+
+def _defaulted(cls):
+    """
+    Finds the attributes whose class-level default is None, e.g. the Rental
+    fields, which instances only store once a setter is called.
+
+    Args:
+        cls (type): The class of the property.
+
+    Returns:
+        frozenset: The attribute names; empty for slotted classes.
+    """
+    defaulted = _DEFAULTED.get(cls)
+    if defaulted is None:
+        found = set()
+        for klass in reversed(cls.__mro__):
+            for name, value in vars(klass).items():
+                if value is None and name.startswith('_') and not name.startswith('__'):
+                    found.add(name)
+                else:
+                    found.discard(name)
+        defaulted = _DEFAULTED[cls] = frozenset(found)
+    return defaulted
+
+
+def _fill(prop, attributes, values):
+    """
+    Stores field values on a property. A None is not stored for attributes
+    the class defaults to None; an existing value is removed instead.
+
+    Args:
+        prop: The property.
+        attributes (tuple): The attribute names.
+        values (sequence): The values, in attribute order.
+    """
+    try:
+        state = prop.__dict__
+    except AttributeError:  # slotted instances have no __dict__
+        for attribute, value in zip(attributes, values):
+            setattr(prop, attribute, value)
+        return
+    defaulted = _defaulted(type(prop))
+    for attribute, value in zip(attributes, values):
+        if value is None and attribute in defaulted:
+            state.pop(attribute, None)
+        else:
+            state[attribute] = value
+
+
+def reduce_property(prop):
+    """
+    Returns how to pickle a property, as done by
+    ResidentialProperty.__reduce__(): its compact state, or the stock
+    protocol 2 reduction when its class has no schema or the instance holds
+    attributes outside the schema.
+
+    Args:
+        prop (ResidentialProperty): The property.
+
+    Returns:
+        tuple: The callable, its arguments and, for the stock reduction, the
+        instance state.
+    """
+    cls = type(prop)
+    try:
+        code, getter, _ = state_encoder(cls)
+    except TypeError:
+        return _stock_reduction(prop)
+    if KIND_SCHEMAS[code][0] is cls:  # not a view, whose __dict__ holds its row
+        attributes = getattr(prop, '__dict__', None)
+        if attributes and not attributes.keys() <= _ATTRIBUTE_SETS[code]:
+            return _stock_reduction(prop)
+    return restore_property, (SCHEMA_VERSION, code, getter(prop))
+
+
+def _stock_reduction(prop):
+    """
+    Reduces a property the way object.__reduce_ex__(2) would without the
+    compact __getstate__().
+
+    Args:
+        prop: The property.
+
+    Returns:
+        tuple: (copyreg.__newobj__, (class,), state), where the state is the
+        instance __dict__, or (__dict__ or None, slot values) if the class
+        has slots.
+    """
+    cls = type(prop)
+    slots = {}
+    for klass in cls.__mro__:
+        names = vars(klass).get('__slots__', ())
+        for name in (names,) if isinstance(names, str) else names:
+            if name in ('__dict__', '__weakref__'):
+                continue
+            if name.startswith('__') and not name.endswith('__'):
+                name = '_{}{}'.format(klass.__name__.lstrip('_'), name)
+            try:
+                slots[name] = getattr(prop, name)
+            except AttributeError:  # an unset slot
+                pass
+    state = getattr(prop, '__dict__', None)
+    if slots:
+        state = (state or None, slots)
+    return copyreg.__newobj__, (cls,), state
+
+
+def restore_property(version, code, values):
+    """
+    Creates a property from its state. This is the unpickling entry point used
+    by ResidentialProperty.__reduce__().
+
+    Args:
+        version (int): The schema version.
+        code (int): The kind code.
+        values (tuple): The field values.
+
+    Returns:
+        ResidentialProperty: The property.
+    """
+    cls, attributes = kind_schema(version, code)
+    prop = object.__new__(cls)
+    _fill(prop, attributes, values)
+    return prop
+
+
+def restore_state(prop, state):
+    """
+    Overwrites the fields of an existing property, as done by
+    ResidentialProperty.__setstate__().
+
+    Args:
+        prop (ResidentialProperty): The property to update.
+        state (tuple): A state of the same class from property_state().
+
+    Raises:
+        TypeError: If the state is for another class.
+    """
+    cls, attributes = kind_schema(*state[:2])
+    if cls is not type(prop):
+        raise TypeError('state is for {}, not {}'.format(cls.__name__, type(prop).__name__))
+    _fill(prop, attributes, state[2])
+
+
+def _array_block(typecode, values):
+    """
+    Packs numbers into a little-endian array block.
+
+    Args:
+        typecode (str): An array typecode.
+        values (iterable): The numbers.
+
+    Returns:
+        bytes: The block.
+    """
+    packed = array(typecode, values)
+    if _SWAP:
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _unpack_array(typecode, block):
+    """
+    Unpacks a little-endian array block.
+
+    Args:
+        typecode (str): An array typecode.
+        block (memoryview): The block.
+
+    Returns:
+        list: The numbers.
+    """
+    values = array(typecode)
+    values.frombytes(block)
+    if _SWAP:
+        values.byteswap()
+    return values.tolist()
+
+
+def _int_block(values):
+    """
+    Packs ints into an array block of the narrowest typecode that fits.
+
+    Args:
+        values (sequence): The ints.
+
+    Returns:
+        tuple: (typecode as a byte, block), or None if a value needs more
+        than 64 bits.
+    """
+    low, high = min(values, default=0), max(values, default=0)
+    for typecode, limit in _INT_TYPECODES:
+        if -limit <= low and high < limit:
+            return ord(typecode), _array_block(typecode, values)
+    return None
+
+
+def _encode_column(values):
+    """
+    Packs one field of a group of properties.
+
+    Args:
+        values (list): The field value of every property.
+
+    Returns:
+        tuple: (block type, block).
+    """
+    types = set(map(type, values))
+    block_type = _BLOCK_TYPES.get(types.pop()) if len(types) == 1 else None
+    if block_type == _NONE:
+        return _NONE, b''
+    if block_type == _BOOL:
+        return _BOOL, bytes(values)
+    if block_type == _FLOAT:
+        return _FLOAT, _array_block('d', values)
+    if block_type == _INT:
+        block = _int_block(values)
+        if block is not None:
+            return block
+    elif block_type == _STR:
+        typecode, lengths = _int_block(list(map(len, values)))
+        return _STR, bytes((typecode,)) + lengths + ''.join(values).encode('utf-8', 'surrogatepass')
+    return _PICKLE, pickle.dumps(values, pickle.HIGHEST_PROTOCOL)
+
+
+def _decode_column(block_type, block, rows):
+    """
+    Unpacks one field of a group of properties.
+
+    Args:
+        block_type (int): The block type.
+        block (memoryview): The block.
+        rows (int): The number of properties in the group.
+
+    Returns:
+        sequence: The field value of every property.
+
+    Raises:
+        ValueError: If the block type is unknown.
+    """
+    if block_type == _NONE:
+        return (None,) * rows
+    if block_type == _BOOL:
+        return list(map(bool, block))
+    if block_type == _FLOAT:
+        return _unpack_array('d', block)
+    if block_type in b'bhiq':
+        return _unpack_array(chr(block_type), block)
+    if block_type == _STR:
+        typecode = chr(block[0])
+        size = 1 + array(typecode).itemsize * rows
+        ends = list(accumulate(_unpack_array(typecode, block[1:size])))
+        text = str(block[size:], 'utf-8', 'surrogatepass')
+        return [text[start:end] for start, end in zip([0] + ends, ends)]
+    if block_type == _PICKLE:
+        return pickle.loads(block)
+    raise ValueError('corrupt property batch')
+
+
+def to_bytes(properties):
+    """
+    Packs many properties into one buffer.
+
+    Args:
+        properties (iterable): The properties, slotted variants or
+            PropertyStore views.
+
+    Returns:
+        bytes: The buffer.
+
+    Raises:
+        TypeError: If a property cannot be serialized.
+    """
+    encoders = {}  # class -> its encoder
+    groups = {}  # kind code -> (encoder of its first class, properties)
+    mixed = set()  # kind codes shared by several classes, e.g. objects and views
+    codes = bytearray()
+    for prop in properties:
+        cls = type(prop)
+        encoder = encoders.get(cls)
+        if encoder is None:
+            encoder = encoders[cls] = state_encoder(cls)
+            if encoder[0] in groups:
+                mixed.add(encoder[0])
+        group = groups.get(encoder[0])
+        if group is None:
+            group = groups[encoder[0]] = (encoder, [])
+        codes.append(encoder[0])
+        group[1].append(prop)
+    parts = [_BATCH_HEAD.pack(BATCH_MAGIC, SCHEMA_VERSION, len(codes), len(groups)),
+             bytes(codes)]
+    for (code, _, fields), group in groups.values():
+        parts.append(_GROUP_HEAD.pack(code, len(group)))
+        if code in mixed:
+            # Every class reads its own fields; the values line up by schema.
+            columns = zip(*[encoders[type(prop)][1](prop) for prop in group])
+        else:
+            columns = (list(map(field, group)) for field in fields)
+        for column in columns:
+            block_type, block = _encode_column(list(column))
+            parts.append(_BLOCK_HEAD.pack(block_type, len(block)))
+            parts.append(block)
+    return b''.join(parts)
+
+
+def from_bytes(data):
+    """
+    Unpacks every property of a buffer made by to_bytes().
+
+    Args:
+        data (bytes, bytearray or memoryview): The buffer.
+
+    Returns:
+        list: The properties, in the order they were packed.
+
+    Raises:
+        ValueError: If the buffer is not a property batch of this schema
+            version, or the groups do not hold the properties it lists.
+    """
+    buffer = memoryview(data)
+    magic, version, count, group_count = _BATCH_HEAD.unpack_from(buffer, 0)
+    if magic != BATCH_MAGIC:
+        raise ValueError('not a property batch')
+    offset = _BATCH_HEAD.size
+    codes = buffer[offset:offset + count]
+    offset += count
+    built = {}
+    for _ in range(group_count):
+        code, rows = _GROUP_HEAD.unpack_from(buffer, offset)
+        offset += _GROUP_HEAD.size
+        cls, attributes = kind_schema(version, code)
+        columns = []
+        for _ in attributes:
+            block_type, size = _BLOCK_HEAD.unpack_from(buffer, offset)
+            offset += _BLOCK_HEAD.size
+            columns.append(_decode_column(block_type, buffer[offset:offset + size], rows))
+            offset += size
+        if code in built:
+            raise ValueError('corrupt property batch: two groups of kind code {}'.format(code))
+        defaulted = _defaulted(cls)
+        kept = [(attribute, column) for attribute, column in zip(attributes, columns)
+                if attribute not in defaulted]
+        properties = attribute_builder(cls, tuple(attribute for attribute, _ in kept))(
+            object.__new__, cls, *(column for _, column in kept))
+        for attribute, column in zip(attributes, columns):
+            # Values the class defaults to None are only stored when set.
+            if attribute in defaulted and column.count(None) != rows:
+                for prop, value in zip(properties, column):
+                    if value is not None:
+                        prop.__dict__[attribute] = value
+        built[code] = properties
+    decoded = sum(map(len, built.values()))
+    listed = bytes(codes)
+    if decoded != count or any(listed.count(code) != len(properties)
+                               for code, properties in built.items()):
+        raise ValueError('corrupt property batch: {} properties listed, {} decoded'.format(
+            count, decoded))
+    if len(built) == 1:
+        return next(iter(built.values()))
+    iterators = {code: iter(properties) for code, properties in built.items()}
+    return [next(iterators[code]) for code in codes]
@@ -0,0 +1,434 @@
+"""
+An asyncio facade over the property book that batches concurrent requests.
+
+    service = PropertyService()
+    prop = await service.get(reference)
+    commission = await service.quote_commission(reference)
+    matches = await service.search(('Number_of_Bedrooms', '>=', 3), of_type=SaleHouse)
+
+Requests are not served one at a time. Each kind of request has a batcher
+that queues the requests arriving while the event loop is busy. The queue is
+flushed as one micro-batch once the loop comes round to it (or after
+max_delay seconds, or as soon as max_batch requests are waiting). A batch of
+lookups reads a PropertyIndex once per distinct reference, a batch of quotes
+goes through batchcompute.compute_commissions() in one pass, and identical
+searches in a batch run once.
+
+Batches run on the event loop thread: they are short CPU-bound steps, and
+handing them to a thread would only add switching under the GIL.
+
+load_test() drives a service with many concurrent requests from a
+StubClient and reports latency percentiles and throughput.
+"""
+
+import asyncio
+from collections import namedtuple
+from itertools import islice
+import math
+import random
+import time
+
+from residentialproperty import ResidentialProperty
+from propertyindex import PropertyIndex
+from batchcompute import compute_commissions
+
+LoadTestResult = namedtuple('LoadTestResult',
+                            'requests seconds throughput p50 p99 batches mean_batch')
+
+
+class _Batcher:
+    """
+    Queues requests of one kind and serves them in micro-batches.
+    """
+
+    def __init__(self, handler, max_batch, max_delay):
+        """
+        Initializes a _Batcher.
+
+        Args:
+            handler (callable): Maps a list of request keys to a list of
+                results in the same order. An exception instance in the
+                results fails that request only.
+            max_batch (int): The most requests per batch.
+            max_delay (float): Seconds a request may wait for more requests
+                to join its batch; 0 flushes on the next loop iteration.
+        """
+        self.__handler = handler
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.__pending = []
+        self.__scheduled = None
+        self.batches = 0
+        self.requests = 0
+
+    def submit(self, key):
+        """
+        Queues a request.
+
+        Args:
+            key: The request key passed to the handler.
+
+        Returns:
+            asyncio.Future: Resolved with the result when the batch has run.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.__pending.append((key, future))
+        if len(self.__pending) >= self.max_batch:
+            self.flush()
+        elif self.__scheduled is None:
+            if self.max_delay:
+                self.__scheduled = loop.call_later(self.max_delay, self.flush)
+            else:
+                self.__scheduled = loop.call_soon(self.flush)
+        return future
+
+    def flush(self):
+        """
+        Runs the queued requests as one batch.
+        """
+        if self.__scheduled is not None:
+            self.__scheduled.cancel()
+            self.__scheduled = None
+        pending, self.__pending = self.__pending, []
+        if not pending:
+            return
+        self.batches += 1
+        self.requests += len(pending)
+        try:
+            results = self.__handler([key for key, _ in pending])
+        except Exception as error:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, future), result in zip(pending, results):
+            if future.done():  # cancelled by the caller
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+class PropertyService:
+    """
+    Serves lookups, commission quotes and searches to asyncio callers,
+    coalescing concurrent requests into batches.
+    """
+
+    def __init__(self, index=None, max_batch=1024, max_delay=0.0):
+        """
+        Initializes a PropertyService.
+
+        Args:
+            index (PropertyIndex, optional): The index requests are served
+                from. Defaults to a new index over
+                ResidentialProperty.total_properties, closed by close().
+            max_batch (int, optional): The most requests per batch.
+                Defaults to 1024.
+            max_delay (float, optional): Seconds a request may wait for others
+                to join its batch. Defaults to 0, which batches whatever
+                arrives before the event loop's next iteration.
+        """
+        if max_batch < 1:
+            raise ValueError('max_batch must be at least 1')
+        self.__owns_index = index is None
+        self.index = PropertyIndex() if index is None else index
+        self.__lookups = _Batcher(self._get_batch, max_batch, max_delay)
+        self.__quotes = _Batcher(self._quote_batch, max_batch, max_delay)
+        self.__searches = _Batcher(self._search_batch, max_batch, max_delay)
+
+    def close(self):
+        """
+        Closes the index if the service created it.
+        """
+        if self.__owns_index:
+            self.index.close()
+
+    async def get(self, reference):
+        """
+        Looks up a property.
+
+        Args:
+            reference (int): The reference number.
+
+        Returns:
+            ResidentialProperty: The property.
+
+        Raises:
+            KeyError: If no property has the reference number.
+        """
+        return await self.__lookups.submit(reference)
+
+    async def quote_commission(self, reference):
+        """
+        Quotes the agent commission of a property, as AgentCommissionValue()
+        would compute it.
+
+        Args:
+            reference (int): The reference number.
+
+        Returns:
+            float: The commission, NaN if the rent or price is unset.
+
+        Raises:
+            KeyError: If no property has the reference number.
+        """
+        return await self.__quotes.submit(reference)
+
+    async def search(self, *predicates, of_type=None):
+        """
+        Finds the properties matching every predicate.
+
+        Args:
+            *predicates (tuple): (field, op, value) conditions, as accepted by
+                Query.where().
+            of_type (type or tuple, optional): Only return instances of these
+                classes.
+
+        Returns:
+            list: The matching properties, in reference number order.
+        """
+        if of_type is not None and not isinstance(of_type, tuple):
+            of_type = (of_type,)
+        return await self.__searches.submit((predicates, of_type))
+
+    def stats(self):
+        """
+        Reports how requests were batched.
+
+        Returns:
+            dict: Request kind -> (requests served, batches run).
+        """
+        return {name: (batcher.requests, batcher.batches) for name, batcher in
+                (('get', self.__lookups), ('quote_commission', self.__quotes),
+                 ('search', self.__searches))}
+
+    def _resolve(self, references):
+        """
+        Looks up the distinct references of a batch.
+
+        Args:
+            references (list): The reference numbers.
+
+        Returns:
+            dict: Reference -> property, or a KeyError for unknown references.
+        """
+        get = self.index.get
+        found = {}
+        for reference in references:
+            if reference not in found:
+                try:
+                    found[reference] = get(reference)
+                except KeyError as error:
+                    found[reference] = error
+        return found
+
+    def _get_batch(self, references):
+        """
+        Serves a batch of lookups.
+
+        Args:
+            references (list): The reference numbers.
+
+        Returns:
+            list: The properties, or KeyError instances.
+        """
+        found = self._resolve(references)
+        return [found[reference] for reference in references]
+
+    def _quote_batch(self, references):
+        """
+        Serves a batch of commission quotes with one compute_commissions() call.
+
+        Args:
+            references (list): The reference numbers.
+
+        Returns:
+            list: The commissions, or KeyError instances.
+        """
+        found = self._resolve(references)
+        known = [prop for prop in found.values() if not isinstance(prop, KeyError)]
+        quotes = dict(zip(*compute_commissions(known)))
+        return [quotes.get(reference, found[reference]) for reference in references]
+
+    def _search_batch(self, requests):
+        """
+        Serves a batch of searches, running identical searches once.
+
+        Args:
+            requests (list): (predicates, of_type) pairs.
+
+        Returns:
+            list: The matching properties of every search, or the exception
+            raised by an invalid search.
+        """
+        results = {}
+        answers = []
+        for request in requests:
+            key = request
+            try:
+                hash(request)
+            except TypeError:  # e.g. a set for 'in'; run it on its own
+                key = None
+            if key is not None and key in results:
+                answers.append(results[key])
+                continue
+            try:
+                answer = self._search(*request)
+            except (ValueError, TypeError) as error:
+                answer = error
+            if key is not None:
+                results[key] = answer
+            answers.append(answer)
+        return answers
+
+    def _search(self, predicates, of_type):
+        """
+        Runs one search against the index.
+
+        Args:
+            predicates (tuple): (field, op, value) conditions.
+            of_type (tuple): Classes to restrict the search to, or None.
+
+        Returns:
+            list: The matching properties.
+        """
+        query = self.index.query()
+        for field, op, value in predicates:
+            query.where(field, op, value)
+        if of_type is not None:
+            query.of_type(*of_type)
+        return query.all()
+
+
+class StubClient:
+    """
+    A local client for load tests. It calls a PropertyService in-process, the
+    way a network client would issue requests, and records the latency of
+    every call.
+    """
+
+    def __init__(self, service):
+        """
+        Initializes a StubClient.
+
+        Args:
+            service (PropertyService): The service called.
+        """
+        self.service = service
+        self.latencies = []
+
+    def call(self, method, *args, **kwargs):
+        """
+        Sends one request and records its latency. The request counts as sent
+        when call() is made, not when the event loop first runs it, so time
+        spent queued behind other requests is part of the latency.
+
+        Args:
+            method (str): The service method, e.g. 'get'.
+            *args: The positional arguments of the method.
+            **kwargs: The keyword arguments of the method.
+
+        Returns:
+            coroutine: Awaits the result, or the exception the request failed
+            with.
+        """
+        return self._send(time.perf_counter(), getattr(self.service, method), args, kwargs)
+
+    async def _send(self, start, method, args, kwargs):
+        """
+        Awaits a request sent by call().
+
+        Args:
+            start (float): The time the request was sent.
+            method (callable): The service method.
+            args (tuple): Its positional arguments.
+            kwargs (dict): Its keyword arguments.
+
+        Returns:
+            The result, or the exception the request failed with.
+        """
+        try:
+            result = await method(*args, **kwargs)
+        except Exception as error:
+            result = error
+        self.latencies.append(time.perf_counter() - start)
+        return result
+
+
+def _percentile(ordered, fraction):
+    """
+    Reads a percentile from sorted samples (nearest rank).
+
+    Args:
+        ordered (list): The sorted samples.
+        fraction (float): The percentile, e.g. 0.99.
+
+    Returns:
+        float: The sample, or NaN if there are none.
+    """
+    if not ordered:
+        return math.nan
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+def load_test(service, requests=10000, concurrency=10000, references=None,
+              mix=(('get', 0.5), ('quote_commission', 0.4), ('search', 0.1)), seed=0):
+    """
+    Sends requests to a service from a StubClient and measures latency and
+    throughput. The first concurrency requests are sent at once, and every
+    answer lets the next request go, so concurrency requests are in flight
+    until the last wave.
+
+    Args:
+        service (PropertyService): The service.
+        requests (int, optional): The number of requests. Defaults to 10000.
+        concurrency (int, optional): The number of requests in flight.
+            Defaults to 10000.
+        references (list, optional): The reference numbers requested.
+            Defaults to the registered reference numbers.
+        mix (tuple, optional): (method, weight) pairs picking the request
+            kinds. Searches ask for listings with a given bedroom count.
+        seed (int, optional): Seeds the request generator. Defaults to 0.
+
+    Returns:
+        LoadTestResult: The request count, elapsed seconds, requests per
+        second, median and 99th percentile latency in seconds, and the
+        number of batches run with their mean size.
+    """
+    if references is None:
+        references = ResidentialProperty.total_properties.references()
+    generator = random.Random(seed)
+    methods = [method for method, _ in mix]
+    weights = [weight for _, weight in mix]
+    calls = []
+    for method in generator.choices(methods, weights, k=requests):
+        if method == 'search':
+            calls.append((method, ('Number_of_Bedrooms', '==', generator.randint(1, 5))))
+        else:
+            calls.append((method, generator.choice(references)))
+    client = StubClient(service)
+    before = sum(batches for _, batches in service.stats().values())
+
+    async def run():
+        waiting = iter(calls)
+
+        async def connection(first):
+            # Each connection sends its next request once the last one is answered.
+            await first
+            for method, argument in waiting:
+                await client.call(method, argument)
+        # The first wave of requests is sent at once.
+        await asyncio.gather(*(connection(client.call(method, argument))
+                               for method, argument in islice(waiting, concurrency)))
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    seconds = time.perf_counter() - start
+    latencies = sorted(client.latencies)
+    batches = sum(batches for _, batches in service.stats().values()) - before
+    return LoadTestResult(requests, seconds, requests / seconds, _percentile(latencies, 0.5),
+                          _percentile(latencies, 0.99), batches,
+                          requests / batches if batches else 0.0)
@@ -0,0 +1,359 @@
+"""
+A compact, __slots__-based variant of the property class hierarchy.
+
+Instances of the classes below have no per-instance __dict__. Every field
+lives in a slot named after the attribute the regular class would store
+(e.g. ``_ResidentialProperty__address``), so the getters, setters and methods
+are shared with the regular classes unchanged and print_attributes() prints
+the same names and values.
+
+The Rental and Sale mixins cannot own slots, because two bases with their own
+slot layouts cannot be combined. Their slots are declared by the concrete
+classes instead (SlottedRentalApartment, SlottedSaleHouse, ...).
+
+Each slotted class is registered as a virtual subclass of the class it
+mirrors, and the mixins with Rental and Sale, so both
+``isinstance(SlottedSaleHouse(...), SaleHouse)`` and
+``isinstance(SlottedSaleHouse(...), Sale)`` are True. Their instances join
+the same registries and observers.
+
+Every slot is reserved whether it is set or not: Location, the four Rental
+fields and ``__weakref__`` (needed by the weak registry) cost 8 bytes each
+on every instance. On CPython 3.11 a regular instance keeps its attributes
+in a shared-key dict that is about as compact, as long as it only holds the
+constructor's attributes. Measured with benchmarks/bench_slotted.py:
+
+    SaleApartment                       232 bytes, slotted 192
+    RentalHouse, no rent set            208 bytes, slotted 208
+    RentalHouse, rent and deposit set   920 bytes, slotted 208
+
+Setting a Rental field or Location on a regular instance later turns its
+dict into a full one, which is where the slotted rentals save memory; a
+rental whose Rental fields are never set saves nothing. Attribute access is
+not faster than on the regular classes (the bench prints both), and
+instances cannot take attributes that have no slot.
+"""
+
+from residentialproperty import (ResidentialProperty, House, Apartment, Rental, Sale,
+                                 RentalApartment, RentalHouse, SaleApartment, SaleHouse,
+                                 notify_changed, as_location)
+
+# Class attributes of the regular classes that belong to the class, not to
+# its instances, and must not be copied onto the slotted classes.
+_NOT_BORROWED = {
+    '__dict__', '__weakref__', '__module__', '__qualname__', '__doc__', '__init__',
+    '__slots__', '__abstractmethods__', '_abc_impl', 'total_properties',
+    'reference_allocator', 'observers', '_registry_cache', 'use_registry',
+    'registries_for', 'add_observer', 'remove_observer', 'print_attributes',
+}
+
+
+def _borrow(original):
+    """
+    Class decorator copying the properties and methods of a regular class onto
+    its slotted variant, keeping anything the variant defines itself.
+
+    Args:
+        original (type): The regular class.
+
+    Returns:
+        function: The decorator.
+    """
+    def decorate(cls):
+        for name, member in vars(original).items():
+            if name in _NOT_BORROWED or name in vars(cls):
+                continue
+            if callable(member) or isinstance(member, (property, staticmethod, classmethod)):
+                setattr(cls, name, member)
+        return cls
+    return decorate
+
+
+def _print_slots(self):
+    """
+    Prints all the attributes of the property, in the same form as the
+    regular classes.
+    """
+    print("Attributes:")
+    names = [name for klass in reversed(type(self).__mro__)
+             for name in vars(klass).get('__slots__', ()) if name != '__weakref__']
+    # Location is only ever set after construction, so a regular instance
+    # lists it last.
+    names.sort(key=lambda name: name == '_ResidentialProperty__location')
+    for name in names:
+        try:
+            value = getattr(self, name)
+        except AttributeError:  # Rental fields that were never set
+            continue
+        print(name, ":", value)
+
+
+def _optional_property(owner, field, slot, convert=None):
+    """
+    Builds a property for an optional field whose getter returns None while
+    the slot is unset, like the class-level defaults of the regular classes
+    (the Rental fields and Location).
+
+    Args:
+        owner (type): The regular class defining the field, for its docstring.
+        field (str): The property name, e.g. 'YearlyRent'.
+        slot (str): The slot holding the value.
+        convert (callable, optional): Checks and converts a new value, as the
+            regular setter does.
+
+    Returns:
+        property: The property.
+    """
+    def getter(self):
+        return getattr(self, slot, None)
+
+    def setter(self, value):
+        if convert is not None:
+            value = convert(value)
+        old_value = getattr(self, slot, None)
+        setattr(self, slot, value)
+        if ResidentialProperty.observers:
+            notify_changed(self, field, old_value, value)
+
+    getter.__doc__ = getattr(owner, field).__doc__
+    return property(getter, setter)
+
+
+@_borrow(ResidentialProperty)
+class SlottedResidentialProperty(metaclass=type(ResidentialProperty)):
+    """
+    A slotted variant of ResidentialProperty.
+    """
+
+    __slots__ = ('_ResidentialProperty__reference_number', '_ResidentialProperty__address',
+                 '_ResidentialProperty__built_up_area', '_ResidentialProperty__num_of_bedrooms',
+                 '_ResidentialProperty__num_of_bathrooms',
+                 '_ResidentialProperty__num_of_parking_slots',
+                 '_ResidentialProperty__pool_avail', '_ResidentialProperty__gym_avail',
+                 '_ResidentialProperty__agent_commission_percent',
+                 '_ResidentialProperty__location', '__weakref__')
+    variant_of = ResidentialProperty
+
+    Location = _optional_property(ResidentialProperty, 'Location',
+                                  '_ResidentialProperty__location', as_location)
+
+    def __init__(self, address, built_up_area, num_of_bedrooms, num_of_bathrooms,
+                 num_of_parking_slots=1, pool_avail=False, gym_avail=False):
+        """
+        Initializes a new SlottedResidentialProperty object.
+
+        Args:
+            address (str): The address of the property.
+            built_up_area (float): The built-up area of the property in square units.
+            num_of_bedrooms (int): The number of bedrooms in the property.
+            num_of_bathrooms (int): The number of bathrooms in the property.
+            num_of_parking_slots (int, optional): The number of parking slots available. Defaults to 1.
+            pool_avail (bool, optional): Indicates if a pool is available. Defaults to False.
+            gym_avail (bool, optional): Indicates if a gym is available. Defaults to False.
+        """
+        self._ResidentialProperty__reference_number = \
+            ResidentialProperty.reference_allocator.allocate()
+        self._ResidentialProperty__address = address
+        self._ResidentialProperty__built_up_area = built_up_area
+        self._ResidentialProperty__num_of_bedrooms = num_of_bedrooms
+        self._ResidentialProperty__num_of_bathrooms = num_of_bathrooms
+        self._ResidentialProperty__num_of_parking_slots = num_of_parking_slots
+        self._ResidentialProperty__pool_avail = pool_avail
+        self._ResidentialProperty__gym_avail = gym_avail
+        self._ResidentialProperty__agent_commission_percent = 0.02
+        for registry in ResidentialProperty.registries_for(type(self)):
+            registry.add(self)
+
+    print_attributes = _print_slots
+
+
+@_borrow(House)
+class SlottedHouse(SlottedResidentialProperty):
+    """
+    A slotted variant of House.
+    """
+
+    __slots__ = ('_House__num_of_floors', '_House__plot_size', '_House__house_type')
+    variant_of = House
+
+    def __init__(self, address, built_up_area, num_of_bedrooms,
+                 num_of_bathrooms, num_of_floors, plot_size, house_type,
+                 num_of_parking_slots=1, pool_avail=False, gym_avail=False):
+        """
+        Initializes a new SlottedHouse object. Takes the same arguments as House.
+        """
+        super().__init__(address, built_up_area, num_of_bedrooms,
+                         num_of_bathrooms, num_of_parking_slots,
+                         pool_avail, gym_avail)
+        self._House__num_of_floors = num_of_floors
+        self._House__plot_size = plot_size
+        self._House__house_type = house_type
+
+
+@_borrow(Apartment)
+class SlottedApartment(SlottedResidentialProperty):
+    """
+    A slotted variant of Apartment.
+    """
+
+    __slots__ = ('_Apartment__floor_num', '_Apartment__num_of_balconies')
+    variant_of = Apartment
+
+    def __init__(self, address, built_up_area, num_of_bedrooms,
+                 num_of_bathrooms, floor_num, num_of_balconies,
+                 num_of_parking_slots=1, pool_avail=False, gym_avail=False):
+        """
+        Initializes a new SlottedApartment object. Takes the same arguments as
+        Apartment.
+        """
+        super().__init__(address, built_up_area, num_of_bedrooms,
+                         num_of_bathrooms, num_of_parking_slots,
+                         pool_avail, gym_avail)
+        self._Apartment__floor_num = floor_num
+        self._Apartment__num_of_balconies = num_of_balconies
+
+
+_RENTAL_SLOTS = ('_Rental__deposit_amount', '_Rental__yearly_rent',
+                 '_Rental__furnished', '_Rental__maid_room')
+_SALE_SLOTS = ('_Sale__sale_price', '_Sale__annual_service_charge',
+               '_Sale__fixed_tax_percent')
+
+
+@_borrow(Rental)
+class SlottedRental:
+    """
+    A slotted variant of the Rental mixin. Its slots are declared by the
+    classes it is combined with.
+    """
+
+    __slots__ = ()
+
+    DepositAmount = _optional_property(Rental, 'DepositAmount', '_Rental__deposit_amount')
+    YearlyRent = _optional_property(Rental, 'YearlyRent', '_Rental__yearly_rent')
+    Furnished = _optional_property(Rental, 'Furnished', '_Rental__furnished')
+    MaidRoom = _optional_property(Rental, 'MaidRoom', '_Rental__maid_room')
+
+
+@_borrow(Sale)
+class SlottedSale:
+    """
+    A slotted variant of the Sale mixin. Its slots are declared by the
+    classes it is combined with.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, sale_price, annual_service_charge):
+        """
+        Initializes the sale fields.
+
+        Args:
+            sale_price (float): The sale price of the property.
+            annual_service_charge (float): The annual service charge of the property.
+        """
+        self._Sale__sale_price = sale_price
+        self._Sale__annual_service_charge = annual_service_charge
+        self._Sale__fixed_tax_percent = 0.04
+
+
+@_borrow(RentalApartment)
+class SlottedRentalApartment(SlottedRental, SlottedApartment):
+    """
+    A slotted variant of RentalApartment.
+    """
+
+    __slots__ = _RENTAL_SLOTS
+    variant_of = RentalApartment
+
+    def __init__(self, address, built_up_area, num_of_bedrooms,
+                 num_of_bathrooms, floor_num, num_of_balconies,
+                 num_of_parking_slots=1, pool_avail=False, gym_avail=False):
+        """
+        Initializes a SlottedRentalApartment. Takes the same arguments as
+        RentalApartment.
+        """
+        SlottedApartment.__init__(self, address, built_up_area, num_of_bedrooms,
+                                  num_of_bathrooms, floor_num, num_of_balconies,
+                                  num_of_parking_slots, pool_avail, gym_avail)
+
+
+@_borrow(RentalHouse)
+class SlottedRentalHouse(SlottedRental, SlottedHouse):
+    """
+    A slotted variant of RentalHouse.
+    """
+
+    __slots__ = _RENTAL_SLOTS
+    variant_of = RentalHouse
+
+    def __init__(self, address, built_up_area, num_of_bedrooms,
+                 num_of_bathrooms, num_of_floors, plot_size, house_type,
+                 num_of_parking_slots=1, pool_avail=False, gym_avail=False):
+        """
+        Initializes a SlottedRentalHouse. Takes the same arguments as
+        RentalHouse.
+        """
+        SlottedHouse.__init__(self, address, built_up_area, num_of_bedrooms,
+                              num_of_bathrooms, num_of_floors, plot_size, house_type,
+                              num_of_parking_slots, pool_avail, gym_avail)
+
+
+@_borrow(SaleApartment)
+class SlottedSaleApartment(SlottedSale, SlottedApartment):
+    """
+    A slotted variant of SaleApartment.
+    """
+
+    __slots__ = _SALE_SLOTS
+    variant_of = SaleApartment
+
+    def __init__(self, address, built_up_area, num_of_bedrooms,
+                 num_of_bathrooms, floor_num, num_of_balconies,
+                 sale_price, annual_service_charge, num_of_parking_slots=1,
+                 pool_avail=False, gym_avail=False):
+        """
+        Initializes a SlottedSaleApartment. Takes the same arguments as
+        SaleApartment.
+        """
+        SlottedApartment.__init__(self, address, built_up_area, num_of_bedrooms,
+                                  num_of_bathrooms, floor_num, num_of_balconies,
+                                  num_of_parking_slots, pool_avail, gym_avail)
+        SlottedSale.__init__(self, sale_price, annual_service_charge)
+
+
+@_borrow(SaleHouse)
+class SlottedSaleHouse(SlottedSale, SlottedHouse):
+    """
+    A slotted variant of SaleHouse.
+    """
+
+    __slots__ = _SALE_SLOTS
+    variant_of = SaleHouse
+
+    def __init__(self, address, built_up_area, num_of_bedrooms,
+                 num_of_bathrooms, num_of_floors, plot_size, house_type,
+                 sale_price, annual_service_charge, num_of_parking_slots=1,
+                 pool_avail=False, gym_avail=False):
+        """
+        Initializes a SlottedSaleHouse. Takes the same arguments as SaleHouse.
+        """
+        SlottedHouse.__init__(self, address, built_up_area, num_of_bedrooms,
+                              num_of_bathrooms, num_of_floors, plot_size, house_type,
+                              num_of_parking_slots, pool_avail, gym_avail)
+        SlottedSale.__init__(self, sale_price, annual_service_charge)
+
+
+SLOTTED_CLASSES = {
+    ResidentialProperty: SlottedResidentialProperty,
+    House: SlottedHouse,
+    Apartment: SlottedApartment,
+    RentalApartment: SlottedRentalApartment,
+    RentalHouse: SlottedRentalHouse,
+    SaleApartment: SlottedSaleApartment,
+    SaleHouse: SlottedSaleHouse,
+}
+
+for _original, _slotted in SLOTTED_CLASSES.items():
+    _original.register(_slotted)
+Rental.register(SlottedRental)
+Sale.register(SlottedSale)
@@ -0,0 +1,289 @@
+"""
+Memory-mapped snapshots of the property book.
+
+save_snapshot() writes every property to a fixed-layout binary file: a header,
+one contiguous block per PropertyStore column, and a string heap holding the
+addresses and house types. open_snapshot() memory-maps that file and exposes
+it as a read-only Snapshot: opening costs the same whatever the size of the
+book, pages are only read from disk when touched, and every process mapping
+the same file shares one copy in the page cache.
+
+A Snapshot behaves like a read-only PropertyStore, so snapshot.get(reference)
+returns a view with the same getters as SaleApartment, RentalHouse and the
+other classes, and the batch functions in batchcompute accept it directly.
+"""
+
+import mmap
+import os
+import struct
+import sys
+
+from propertystore import PropertyStore, COLUMNS, MISSING_INT
+
+MAGIC = b'RPSNAP01'
+VERSION = 2  # version 1 marked missing integers with -1
+
+# magic, version, flags, row count, column count, string count,
+# heap offsets position, heap data position, heap data size
+_HEADER = struct.Struct('<8sIIQIIQQQ')
+# column name, typecode, data position
+_COLUMN_ENTRY = struct.Struct('<32sc7xQ')
+
+_FLAG_BIG_ENDIAN = 1
+_FLAG_ORDERED = 2
+
+_ALIGNMENT = 8
+
+
+def _aligned(position):
+    """
+    Rounds a file position up to the column alignment.
+
+    Args:
+        position (int): The position.
+
+    Returns:
+        int: The aligned position.
+    """
+    return (position + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def save_snapshot(path, source=None):
+    """
+    Writes a snapshot file. The file is written next to its final location
+    and then renamed, so readers never see a half-written snapshot.
+
+    Args:
+        path (str): The snapshot file.
+        source (PropertyStore or iterable, optional): The properties to save.
+            Defaults to ResidentialProperty.total_properties.
+
+    Returns:
+        int: The number of properties written.
+    """
+    store = source if isinstance(source, PropertyStore) else PropertyStore.from_properties(source)
+    rows = len(store)
+    strings = [value.encode('utf-8') for value in store.strings.strings]
+
+    layout = []
+    position = _HEADER.size + _COLUMN_ENTRY.size * len(COLUMNS)
+    for column, typecode in COLUMNS.items():
+        position = _aligned(position)
+        layout.append((column, typecode, position))
+        position += rows * store.column(column).itemsize
+    heap_offsets = _aligned(position)
+    heap_data = heap_offsets + 8 * (len(strings) + 1)
+    heap_size = sum(len(value) for value in strings)
+
+    flags = (_FLAG_BIG_ENDIAN if sys.byteorder == 'big' else 0) | \
+        (_FLAG_ORDERED if store.ordered else 0)
+    temporary = path + '.tmp'
+    try:
+        with open(temporary, 'wb') as handle:
+            handle.write(_HEADER.pack(MAGIC, VERSION, flags, rows, len(COLUMNS), len(strings),
+                                      heap_offsets, heap_data, heap_size))
+            for column, typecode, position in layout:
+                handle.write(_COLUMN_ENTRY.pack(column.encode('ascii'), typecode.encode('ascii'),
+                                                position))
+            for column, typecode, position in layout:
+                handle.write(b'\0' * (position - handle.tell()))
+                store.column(column).tofile(handle)
+            handle.write(b'\0' * (heap_offsets - handle.tell()))
+            offset = 0
+            offsets = [0]
+            for value in strings:
+                offset += len(value)
+                offsets.append(offset)
+            handle.write(struct.pack('<{}q'.format(len(offsets)), *offsets))
+            for value in strings:
+                handle.write(value)
+        os.replace(temporary, path)
+    except BaseException:
+        try:
+            os.remove(temporary)  # do not leave a partial file next to the snapshot
+        except OSError:
+            pass
+        raise
+    return rows
+
+
+class HeapStrings:
+    """
+    The read-only string table of a snapshot. Strings are decoded from the
+    mapped heap on first use and cached.
+    """
+
+    def __init__(self, buffer, offsets_position, data_position, count):
+        """
+        Initializes a HeapStrings table.
+
+        Args:
+            buffer (memoryview): The whole mapped file.
+            offsets_position (int): Where the string offsets start.
+            data_position (int): Where the string bytes start.
+            count (int): The number of strings.
+        """
+        self.__offsets = buffer[offsets_position:offsets_position + 8 * (count + 1)].cast('q')
+        self.__data = buffer[data_position:data_position + self.__offsets[count]]
+        self.__decoded = {}
+        self.__ids = None
+
+    def lookup(self, string_id):
+        """
+        Returns the string stored under an id.
+
+        Args:
+            string_id (int): The string id.
+
+        Returns:
+            str: The string, or None for a negative id (MISSING_INT).
+        """
+        if string_id < 0:
+            return None
+        value = self.__decoded.get(string_id)
+        if value is None:
+            start, stop = self.__offsets[string_id], self.__offsets[string_id + 1]
+            value = self.__decoded[string_id] = str(self.__data[start:stop], 'utf-8')
+        return value
+
+    def find(self, value):
+        """
+        Returns the id of a string. The first call decodes the whole heap.
+
+        Args:
+            value (str): The string to look up.
+
+        Returns:
+            int: The string id, or MISSING_INT if the string is unknown.
+        """
+        if self.__ids is None:
+            self.__ids = {string: string_id for string_id, string in enumerate(self.strings)}
+        return self.__ids.get(value, MISSING_INT)
+
+    def intern(self, value):
+        raise TypeError('snapshots are read-only')
+
+    @property
+    def strings(self):
+        """
+        Gets every string of the heap, in id order.
+
+        Returns:
+            tuple: The strings.
+        """
+        return tuple(self.lookup(string_id) for string_id in range(len(self)))
+
+    def __len__(self):
+        return len(self.__offsets) - 1
+
+    def release(self):
+        """
+        Releases the views on the mapped file.
+        """
+        self.__offsets.release()
+        self.__data.release()
+
+
+class Snapshot(PropertyStore):
+    """
+    A read-only, memory-mapped PropertyStore. Columns are memoryviews straight
+    onto the mapped file; nothing is copied when the snapshot is opened.
+    """
+
+    def __init__(self, path):
+        """
+        Maps a snapshot file.
+
+        Args:
+            path (str): The snapshot file.
+
+        Raises:
+            ValueError: If the file is not a compatible snapshot.
+        """
+        self.path = path
+        with open(path, 'rb') as handle:
+            self.__map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__buffer = memoryview(self.__map)
+        try:
+            self._load_layout()
+        except Exception:
+            self.close()
+            raise
+
+    def _load_layout(self):
+        """
+        Reads the header and column directory and creates the column views.
+        """
+        buffer = self.__buffer
+        (magic, version, flags, rows, column_count, string_count,
+         heap_offsets, heap_data, _) = _HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError('{} is not a property snapshot'.format(self.path))
+        if version not in (1, VERSION):
+            raise ValueError('unsupported snapshot version {}'.format(version))
+        if version == 1:
+            self._missing_int = -1
+        if bool(flags & _FLAG_BIG_ENDIAN) != (sys.byteorder == 'big'):
+            raise ValueError('snapshot was written on a machine with another byte order')
+        columns = {}
+        for number in range(column_count):
+            name, typecode, position = _COLUMN_ENTRY.unpack_from(
+                buffer, _HEADER.size + number * _COLUMN_ENTRY.size)
+            columns[name.rstrip(b'\0').decode('ascii')] = (typecode.decode('ascii'), position)
+        for column, typecode in COLUMNS.items():
+            if columns.get(column, (None,))[0] != typecode:
+                raise ValueError('snapshot column {!r} is missing or has another type'.format(column))
+            position = columns[column][1]
+            size = struct.calcsize(typecode) * rows
+            setattr(self, column, buffer[position:position + size].cast(typecode))
+        self.strings = HeapStrings(buffer, heap_offsets, heap_data, string_count)
+        self._reset_lookup(bool(flags & _FLAG_ORDERED))
+
+    def __reduce__(self):
+        # Worker processes re-map the file instead of receiving a copy.
+        return open_snapshot, (self.path,)
+
+    def add(self, prop):
+        raise TypeError('snapshots are read-only')
+
+    def append(self, kind, **fields):
+        raise TypeError('snapshots are read-only')
+
+    def extend(self, kind, first_reference, fields):
+        raise TypeError('snapshots are read-only')
+
+    def set_value(self, row, column, value):
+        raise TypeError('snapshots are read-only')
+
+    def close(self):
+        """
+        Unmaps the file. Views taken from the snapshot must not be used
+        afterwards.
+        """
+        if getattr(self, 'strings', None) is not None and isinstance(self.strings, HeapStrings):
+            self.strings.release()
+        for column in COLUMNS:
+            values = self.__dict__.pop(column, None)
+            if values is not None:
+                values.release()
+        self.__buffer.release()
+        self.__map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_snapshot(path):
+    """
+    Memory-maps a snapshot written by save_snapshot().
+
+    Args:
+        path (str): The snapshot file.
+
+    Returns:
+        Snapshot: The read-only snapshot.
+    """
+    return Snapshot(path)
@@ -0,0 +1,853 @@
+"""
+An embedded SQLite repository for property objects.
+
+Every class is stored in one table, ``properties``, with one row per listing:
+the reference number is the primary key, ``kind`` holds the kind code of the
+class (propertystore.KIND_CODES) and every field of every class has its own
+column, named as in propertystore.COLUMNS. Fields a class does not have are
+NULL. Pool_Avail and Gym_Avail get a column each, and the optional Location is
+stored as ``latitude`` and ``longitude``. The columns that queries usually
+filter on are indexed.
+
+    with SQLiteRepository('book.db') as repository:
+        repository.save(ResidentialProperty.total_properties)
+        prop = repository.get(1017)                  # nothing read yet
+        prop.SalePrice                               # the row is read here
+        repository.find(('Number_of_Bedrooms', '>=', 3), of_type=SaleHouse)
+
+Writes go through one connection and are sent with executemany() in batches
+of batch_size rows, all inside one transaction per call. The database runs in
+WAL mode, so readers are never blocked by the writer. Reads take a connection
+from a pool of up to ``readers`` connections, which threads share.
+
+get() and find() return lazy objects: instances of a subclass of the stored
+class that hold only the reference number. The first access to any other
+field reads the row, fills in the fields and turns the object into a plain
+instance of the stored class, so later accesses cost nothing extra. Pass
+lazy=False to read the rows with the query instead, or call hydrate() to read
+many lazy objects in a few queries. Slotted variants and PropertyStore views
+are read back as the regular class. Objects read from the repository are not
+added to any registry, like unpickled ones; load() rebuilds the registries
+from the whole table.
+
+With follow=True the repository observes ResidentialProperty and saves new
+properties, setter calls and deregister() in batches, on flush() and on
+close().
+"""
+
+from contextlib import contextmanager
+from itertools import islice
+from operator import itemgetter
+import queue
+import sqlite3
+import threading
+
+from propertystore import KINDS, KIND_CODES, KIND_ATTRIBUTES, FIELD_COLUMNS
+from propertyindex import OPERATORS, TYPE_FIELD
+from residentialproperty import PropertyObserver, ResidentialProperty
+from serialization import KIND_SCHEMAS, SLOTTED, state_encoder
+
+# Column name -> declared type. The numeric fields accept ints and floats
+# alike, so they are declared without a type: a column without affinity
+# gives back exactly the int or float that was stored.
+TABLE_COLUMNS = {
+    'reference': 'INTEGER PRIMARY KEY',
+    'kind': 'INTEGER NOT NULL',
+    'address': 'TEXT',
+    'built_up_area': '',
+    'bedrooms': '',
+    'bathrooms': '',
+    'parking_slots': '',
+    'pool_avail': 'INTEGER',
+    'gym_avail': 'INTEGER',
+    'commission_percent': '',
+    'num_of_floors': '',
+    'plot_size': '',
+    'house_type': 'TEXT',
+    'floor_num': '',
+    'num_of_balconies': '',
+    'sale_price': '',
+    'annual_service_charge': '',
+    'fixed_tax_percent': '',
+    'deposit_amount': '',
+    'yearly_rent': '',
+    'furnished': 'INTEGER',
+    'maid_room': 'INTEGER',
+    'latitude': 'REAL',
+    'longitude': 'REAL',
+}
+
+# Index name -> indexed columns. Bedrooms alone would pick out a fifth of a
+# book at best, so it leads an index with the area instead.
+INDEXES = {
+    'kind': ('kind',),
+    'address': ('address',),
+    'bedrooms_area': ('bedrooms', 'built_up_area'),
+    'built_up_area': ('built_up_area',),
+    'sale_price': ('sale_price',),
+    'yearly_rent': ('yearly_rent',),
+}
+
+# Property name -> column.
+STORED_FIELDS = dict(FIELD_COLUMNS, Pool_Avail='pool_avail', Gym_Avail='gym_avail')
+
+# Fields stored as 0 or 1 and read back as bools.
+BOOL_FIELDS = ('Pool_Avail', 'Gym_Avail', 'Furnished', 'MaidRoom')
+
+_COLUMN_NAMES = tuple(TABLE_COLUMNS)
+_COLUMN_POSITIONS = {column: position for position, column in enumerate(_COLUMN_NAMES)}
+_SELECT = 'SELECT {} FROM properties'.format(', '.join(_COLUMN_NAMES))
+_INSERT = 'INSERT OR REPLACE INTO properties ({}) VALUES ({})'.format(
+    ', '.join(_COLUMN_NAMES), ', '.join('?' * len(_COLUMN_NAMES)))
+_NO_LOCATION = (None, None)
+
+# Most values bound to one statement in an IN (...) list.
+_IN_LIMIT = 500
+
+
+def _layouts():
+    """
+    Works out how the fields of each class map to the table columns.
+
+    Returns:
+        dict: Kind code -> (class, attribute names in schema order, getter
+        building the columns before latitude from the field values followed by
+        the kind code and None, getter reading the fields other than Location
+        from a row, positions of the bool fields).
+    """
+    layouts = {}
+    for cls in KINDS:
+        code = KIND_CODES[cls]
+        _, attributes = KIND_SCHEMAS[code]
+        names = [name for _, name in KIND_ATTRIBUTES[cls]]
+        columns = ['reference'] + [STORED_FIELDS[name] for name in names[1:]]
+        field_positions = {column: position for position, column in enumerate(columns)}
+        kind_position, none_position = len(attributes), len(attributes) + 1
+        picks = []
+        for column in _COLUMN_NAMES[:-2]:
+            if column == 'kind':
+                picks.append(kind_position)
+            else:
+                picks.append(field_positions.get(column, none_position))
+        to_row = itemgetter(*picks)
+        from_row = itemgetter(*(_COLUMN_POSITIONS[column] for column in columns))
+        bools = tuple(position for position, name in enumerate(names) if name in BOOL_FIELDS)
+        layouts[code] = (cls, attributes, to_row, from_row, bools)
+    return layouts
+
+
+_LAYOUTS = _layouts()
+
+# Class -> function turning an instance into a table row.
+_ROW_MAKERS = {}
+
+
+def _row_maker(cls):
+    """
+    Returns the function that turns instances of a class into table rows.
+
+    Args:
+        cls (type): A property class, slotted variant or PropertyStore view.
+
+    Returns:
+        callable: prop -> tuple of column values.
+
+    Raises:
+        TypeError: If the class cannot be stored.
+    """
+    maker = _ROW_MAKERS.get(cls)
+    if maker is not None:
+        return maker
+    if issubclass(cls, _LazyProperty):
+        def maker(prop):
+            prop._repository._hydrate(prop)
+            return _row_maker(type(prop))(prop)
+    else:
+        code, getter, _ = state_encoder(cls)
+        code &= ~SLOTTED
+        to_row = _LAYOUTS[code][2]
+        tail = (code, None)
+
+        def maker(prop):
+            values = getter(prop)
+            return to_row(values + tail) + (values[-1] or _NO_LOCATION)
+    _ROW_MAKERS[cls] = maker
+    return maker
+
+
+def _field_values(row):
+    """
+    Reads the field values of a class from a table row.
+
+    Args:
+        row (tuple): The row, in TABLE_COLUMNS order.
+
+    Returns:
+        tuple: (class, attribute names, field values in schema order).
+    """
+    cls, attributes, _, from_row, bools = _LAYOUTS[row[1]]
+    values = list(from_row(row))
+    for position in bools:
+        value = values[position]
+        if value.__class__ is int:
+            values[position] = bool(value)
+    latitude = row[-2]
+    values.append(None if latitude is None else (latitude, row[-1]))
+    return cls, attributes, values
+
+
+class _Unloaded:
+    """
+    Stands in for a field of a lazy object until its row is read.
+    """
+
+    __slots__ = ('attribute',)
+
+    def __init__(self, attribute):
+        self.attribute = attribute
+
+    def __get__(self, prop, owner=None):
+        if prop is None:
+            return self
+        prop._repository._hydrate(prop)
+        return prop.__dict__[self.attribute]
+
+
+class _LazyProperty:
+    """
+    Mixin of the lazy classes: the methods that read the instance __dict__
+    directly read the row first.
+    """
+
+    _repository = None
+
+    def print_attributes(self):
+        self._repository._hydrate(self)
+        self.print_attributes()
+
+    def __getstate__(self):
+        self._repository._hydrate(self)
+        return self.__getstate__()
+
+    def __reduce__(self):
+        self._repository._hydrate(self)
+        return self.__reduce__()
+
+
+class ConnectionPool:
+    """
+    A pool of SQLite connections shared by reader threads. Connections are
+    opened on demand, up to size of them; a thread asking for one while all
+    are taken waits for the next to be returned.
+    """
+
+    def __init__(self, connect, size):
+        """
+        Initializes an empty pool.
+
+        Args:
+            connect (callable): Opens a new connection.
+            size (int): The most connections to open.
+        """
+        if size < 1:
+            raise ValueError('size must be at least 1')
+        self.size = size
+        self.__connect = connect
+        self.__idle = queue.LifoQueue()
+        self.__opened = []
+        self.__lock = threading.Lock()
+        self.__closed = False
+
+    def __len__(self):
+        return len(self.__opened)
+
+    @contextmanager
+    def connection(self):
+        """
+        Lends a connection for the duration of a with block.
+
+        Yields:
+            sqlite3.Connection: The connection.
+
+        Raises:
+            ValueError: If the pool is closed.
+        """
+        if self.__closed:
+            raise ValueError('the connection pool is closed')
+        try:
+            connection = self.__idle.get_nowait()
+        except queue.Empty:
+            connection = None
+            with self.__lock:
+                if len(self.__opened) < self.size:
+                    connection = self.__connect()
+                    self.__opened.append(connection)
+            if connection is None:
+                connection = self.__idle.get()
+        try:
+            yield connection
+        finally:
+            self.__idle.put(connection)
+
+    def close(self):
+        """
+        Closes every connection. Connections still lent out are closed too.
+        """
+        self.__closed = True
+        with self.__lock:
+            for connection in self.__opened:
+                connection.close()
+            self.__opened.clear()
+
+
+class SQLiteRepository(PropertyObserver):
+    """
+    Stores properties in an SQLite database file.
+    """
+
+    def __init__(self, path, readers=4, batch_size=10000, follow=False, timeout=30.0,
+                 cache_mb=64):
+        """
+        Opens or creates a repository.
+
+        Args:
+            path (str): The database file. It is created with its table and
+                indexes if it does not exist.
+            readers (int, optional): The most pooled reader connections.
+                Defaults to 4.
+            batch_size (int, optional): Rows per executemany() call, and
+                pending changes that trigger a flush when following. Defaults
+                to 10000.
+            follow (bool, optional): Whether to save new properties, setter
+                calls and deregister() as they happen. Defaults to False.
+            timeout (float, optional): Seconds a connection waits for a lock.
+                Defaults to 30.
+            cache_mb (int, optional): Page cache of each connection, in MB.
+                Defaults to 64.
+
+        Raises:
+            ValueError: If path is ':memory:', which cannot be shared by
+                several connections, or batch_size is not positive.
+        """
+        if path == ':memory:' or not path:
+            raise ValueError('SQLiteRepository needs a database file')
+        if batch_size < 1:
+            raise ValueError('batch_size must be at least 1')
+        self.path = path
+        self.batch_size = batch_size
+        self.__timeout = timeout
+        self.__cache_pragma = 'PRAGMA cache_size=-{:d}'.format(cache_mb * 1024)
+        self.__writer = sqlite3.connect(path, timeout=timeout, isolation_level=None,
+                                        check_same_thread=False)
+        self.__writer.execute('PRAGMA journal_mode=WAL')
+        self.__writer.execute('PRAGMA synchronous=NORMAL')
+        self.__writer.execute(self.__cache_pragma)
+        self.__write_lock = threading.Lock()
+        self._create_schema()
+        self.__readers = ConnectionPool(self._connect_reader, readers)
+        self.__lazy_classes = {}  # kind code -> lazy subclass
+        self.__pending = {}  # reference -> property to save
+        self.__deleted = set()  # references to delete
+        self.__loading = False
+        self.__closed = False
+        # Rows in the table when the planner statistics were last gathered,
+        # and rows saved since.
+        self.__analyzed_rows = self.__writer.execute(
+            'SELECT COUNT(*) FROM properties').fetchone()[0]
+        self.__unanalyzed_rows = 0
+        self.follow = follow
+        if follow:
+            ResidentialProperty.add_observer(self)
+
+    def _create_schema(self):
+        """
+        Creates the table and its indexes if they do not exist.
+        """
+        columns = ', '.join('{} {}'.format(column, declared).strip()
+                            for column, declared in TABLE_COLUMNS.items())
+        with self.__write_lock:
+            self.__writer.execute('CREATE TABLE IF NOT EXISTS properties ({})'.format(columns))
+            for name, columns in INDEXES.items():
+                self.__writer.execute('CREATE INDEX IF NOT EXISTS properties_{} '
+                                      'ON properties ({})'.format(name, ', '.join(columns)))
+
+    def _connect_reader(self):
+        """
+        Opens a read-only connection for the pool.
+
+        Returns:
+            sqlite3.Connection: The connection.
+        """
+        connection = sqlite3.connect(self.path, timeout=self.__timeout,
+                                     check_same_thread=False)
+        connection.execute('PRAGMA query_only=ON')
+        connection.execute(self.__cache_pragma)
+        return connection
+
+    def close(self):
+        """
+        Saves pending changes, stops following and closes every connection.
+        Lazy objects that were never read can no longer be read.
+        """
+        if self.__closed:
+            return
+        if self.follow:
+            ResidentialProperty.remove_observer(self)
+            self.flush()
+        self.__closed = True
+        self.__readers.close()
+        with self.__write_lock:
+            self.__writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.count()
+
+    def __contains__(self, reference):
+        with self.__readers.connection() as connection:
+            return connection.execute('SELECT 1 FROM properties WHERE reference = ?',
+                                      (reference,)).fetchone() is not None
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Runs a with block in one write transaction on the writer connection.
+
+        Yields:
+            sqlite3.Connection: The writer connection.
+        """
+        if self.__closed:
+            raise ValueError('the repository is closed')
+        with self.__write_lock:
+            self.__writer.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.__writer
+            except BaseException:
+                self.__writer.execute('ROLLBACK')
+                raise
+            self.__writer.execute('COMMIT')
+
+    def save(self, properties):
+        """
+        Inserts properties, or replaces the stored rows with the same
+        reference numbers, in one transaction.
+
+        Args:
+            properties (iterable): The properties: regular, slotted,
+                PropertyStore views or lazy objects.
+
+        Returns:
+            int: The number of properties saved.
+
+        Raises:
+            TypeError: If a property's class cannot be stored.
+        """
+        saved = 0
+        properties = iter(properties)
+        with self._transaction() as writer:
+            while True:
+                batch = [_row_maker(type(prop))(prop)
+                         for prop in islice(properties, self.batch_size)]
+                if not batch:
+                    break
+                writer.executemany(_INSERT, batch)
+                saved += len(batch)
+        self.__unanalyzed_rows += saved
+        if self.__unanalyzed_rows > max(self.__analyzed_rows, self.batch_size):
+            self.analyze()
+        return saved
+
+    def analyze(self):
+        """
+        Gathers the statistics the query planner uses to choose an index.
+        save() calls it whenever the table has grown by more than its size at
+        the last call, so the cost stays proportional to the rows saved.
+        Without statistics SQLite prefers any index with an equality match,
+        e.g. bedrooms over a narrow area range.
+        """
+        with self._transaction() as writer:
+            writer.execute('ANALYZE properties')
+            self.__analyzed_rows = writer.execute('SELECT COUNT(*) FROM properties').fetchone()[0]
+        self.__unanalyzed_rows = 0
+
+    def add(self, prop):
+        """
+        Saves one property, so a repository can be given to
+        ResidentialProperty.archive().
+
+        Args:
+            prop (ResidentialProperty): The property.
+
+        Returns:
+            int: Its reference number.
+        """
+        self.save((prop,))
+        return prop.getreference_number()
+
+    def delete(self, references):
+        """
+        Deletes stored properties.
+
+        Args:
+            references (iterable): The reference numbers. Unknown ones are
+                ignored.
+
+        Returns:
+            int: The number of rows deleted.
+        """
+        references = iter(references)
+        with self._transaction() as writer:
+            before = writer.total_changes
+            while True:
+                batch = [(reference,) for reference in islice(references, self.batch_size)]
+                if not batch:
+                    break
+                writer.executemany('DELETE FROM properties WHERE reference = ?', batch)
+            return writer.total_changes - before
+
+    def _lazy_class(self, code):
+        """
+        Returns the lazy subclass of a stored class for this repository.
+
+        Args:
+            code (int): The kind code.
+
+        Returns:
+            type: The lazy class.
+        """
+        lazy = self.__lazy_classes.get(code)
+        if lazy is None:
+            cls, attributes = KIND_SCHEMAS[code]
+            namespace = {attribute: _Unloaded(attribute) for attribute in attributes[1:]}
+            namespace.update(_repository=self, __module__=__name__,
+                             __qualname__='Lazy' + cls.__name__)
+            lazy = self.__lazy_classes[code] = type(cls)('Lazy' + cls.__name__,
+                                                          (_LazyProperty, cls), namespace)
+        return lazy
+
+    def _lazy(self, reference, code):
+        """
+        Creates a lazy object.
+
+        Args:
+            reference (int): The reference number.
+            code (int): The kind code.
+
+        Returns:
+            ResidentialProperty: The lazy object.
+        """
+        prop = object.__new__(self._lazy_class(code))
+        prop.__dict__['_ResidentialProperty__reference_number'] = reference
+        return prop
+
+    def _fill(self, prop, row):
+        """
+        Turns a lazy object into a plain one from its row. Fields already set
+        on the object, e.g. through a setter, are kept.
+
+        Args:
+            prop: The lazy object.
+            row (tuple): Its row.
+        """
+        cls, attributes, values = _field_values(row)
+        state = dict(zip(attributes, values))
+        state.update(prop.__dict__)
+        prop.__dict__.clear()
+        prop.__dict__.update(state)
+        prop.__class__ = cls
+
+    def _hydrate(self, prop):
+        """
+        Reads the row of one lazy object.
+
+        Args:
+            prop: The lazy object.
+
+        Raises:
+            KeyError: If the property is no longer stored.
+        """
+        if not isinstance(prop, _LazyProperty):
+            return  # another thread got there first
+        reference = prop.__dict__['_ResidentialProperty__reference_number']
+        with self.__readers.connection() as connection:
+            row = connection.execute(_SELECT + ' WHERE reference = ?', (reference,)).fetchone()
+        if row is None:
+            raise KeyError('reference number {} is no longer stored'.format(reference))
+        self._fill(prop, row)
+
+    def _materialize(self, row):
+        """
+        Creates a plain object from a row.
+
+        Args:
+            row (tuple): The row.
+
+        Returns:
+            ResidentialProperty: The property.
+        """
+        cls, attributes, values = _field_values(row)
+        prop = object.__new__(cls)
+        prop.__dict__.update(zip(attributes, values))
+        return prop
+
+    def hydrate(self, properties):
+        """
+        Reads the rows of many lazy objects, a few hundred per query.
+
+        Args:
+            properties (iterable): Properties from get() or find(). Objects
+                that are not lazy are skipped.
+
+        Raises:
+            KeyError: If a property is no longer stored.
+        """
+        waiting = {}
+        for prop in properties:
+            if isinstance(prop, _LazyProperty):
+                waiting[prop.getreference_number()] = prop
+        references = list(waiting)
+        with self.__readers.connection() as connection:
+            for start in range(0, len(references), _IN_LIMIT):
+                chunk = references[start:start + _IN_LIMIT]
+                query = _SELECT + ' WHERE reference IN ({})'.format(', '.join('?' * len(chunk)))
+                for row in connection.execute(query, chunk):
+                    self._fill(waiting.pop(row[0]), row)
+        if waiting:
+            raise KeyError('reference numbers no longer stored: {}'.format(
+                ', '.join(map(str, sorted(waiting)))))
+
+    def get(self, reference, lazy=True):
+        """
+        Returns a stored property.
+
+        Args:
+            reference (int): The reference number.
+            lazy (bool, optional): Whether to defer reading the fields until
+                one is accessed. Defaults to True.
+
+        Returns:
+            ResidentialProperty: The property, not added to any registry.
+
+        Raises:
+            KeyError: If no property has that reference number.
+        """
+        columns = 'reference, kind' if lazy else ', '.join(_COLUMN_NAMES)
+        with self.__readers.connection() as connection:
+            row = connection.execute('SELECT {} FROM properties WHERE reference = ?'.format(
+                columns), (reference,)).fetchone()
+        if row is None:
+            raise KeyError(reference)
+        return self._lazy(*row) if lazy else self._materialize(row)
+
+    def _where(self, predicates, of_type):
+        """
+        Translates predicates to an SQL condition.
+
+        Args:
+            predicates (tuple): (field, op, value) conditions, with the
+                operators of propertyindex.OPERATORS.
+            of_type (type or tuple): Classes the properties must be instances
+                of, including their subclasses, or None.
+
+        Returns:
+            tuple: (WHERE clause or '', parameters).
+
+        Raises:
+            ValueError: If a field is not stored or an operator is unknown.
+        """
+        clauses, parameters = [], []
+        if of_type is not None:
+            if not isinstance(of_type, tuple):
+                of_type = (of_type,)
+            predicates = ((TYPE_FIELD, 'in', [cls for cls in KINDS if issubclass(cls, of_type)]),
+                          ) + tuple(predicates)
+        for field, op, value in predicates:
+            if op not in OPERATORS:
+                raise ValueError('unknown operator {!r}'.format(op))
+            if field == TYPE_FIELD:
+                if op not in ('==', 'in'):
+                    raise ValueError("the type can only be compared with '==' or 'in'")
+                classes = (value,) if op == '==' else value
+                column, op, value = 'kind', 'in', [
+                    KIND_CODES[getattr(cls, 'variant_of', cls)] for cls in classes]
+            else:
+                column = STORED_FIELDS.get(field)
+                if column is None:
+                    raise ValueError('{!r} is not a stored field'.format(field))
+            if op == 'between':
+                clauses.append('{} BETWEEN ? AND ?'.format(column))
+                parameters.extend(value)
+            elif op == 'in':
+                value = list(value)
+                clauses.append('{} IN ({})'.format(column, ', '.join('?' * len(value))))
+                parameters.extend(value)
+            elif op == '!=':
+                # Like the Python operator, NULL differs from every value.
+                clauses.append('{} IS NOT ?'.format(column))
+                parameters.append(value)
+            else:
+                clauses.append('{} {} ?'.format(column, 'IS' if value is None else op))
+                parameters.append(value)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), parameters
+
+    def references(self, *predicates, of_type=None, limit=None):
+        """
+        Finds the reference numbers of the properties matching every
+        predicate.
+
+        Args:
+            *predicates (tuple): (field, op, value) conditions, as accepted by
+                Query.where().
+            of_type (type or tuple, optional): Only match instances of these
+                classes.
+            limit (int, optional): The most reference numbers to return.
+
+        Returns:
+            list: The reference numbers, ascending.
+        """
+        where, parameters = self._where(predicates, of_type)
+        query = 'SELECT reference FROM properties{} ORDER BY reference'.format(where)
+        if limit is not None:
+            query += ' LIMIT {:d}'.format(limit)
+        with self.__readers.connection() as connection:
+            return [reference for reference, in connection.execute(query, parameters)]
+
+    def find(self, *predicates, of_type=None, limit=None, lazy=True):
+        """
+        Finds the properties matching every predicate.
+
+        Args:
+            *predicates (tuple): (field, op, value) conditions, as accepted by
+                Query.where().
+            of_type (type or tuple, optional): Only return instances of these
+                classes.
+            limit (int, optional): The most properties to return.
+            lazy (bool, optional): Whether to defer reading the fields until
+                one is accessed. Defaults to True.
+
+        Returns:
+            list: The properties, in reference number order.
+        """
+        where, parameters = self._where(predicates, of_type)
+        columns = 'reference, kind' if lazy else ', '.join(_COLUMN_NAMES)
+        query = 'SELECT {} FROM properties{} ORDER BY reference'.format(columns, where)
+        if limit is not None:
+            query += ' LIMIT {:d}'.format(limit)
+        with self.__readers.connection() as connection:
+            rows = connection.execute(query, parameters).fetchall()
+        if lazy:
+            return [self._lazy(reference, code) for reference, code in rows]
+        return [self._materialize(row) for row in rows]
+
+    def count(self, *predicates, of_type=None):
+        """
+        Counts the properties matching every predicate.
+
+        Args:
+            *predicates (tuple): (field, op, value) conditions.
+            of_type (type or tuple, optional): Only count instances of these
+                classes.
+
+        Returns:
+            int: The number of matching properties.
+        """
+        where, parameters = self._where(predicates, of_type)
+        with self.__readers.connection() as connection:
+            return connection.execute('SELECT COUNT(*) FROM properties' + where,
+                                      parameters).fetchone()[0]
+
+    def load(self, register=True):
+        """
+        Reads every stored property as a plain object.
+
+        Args:
+            register (bool, optional): Whether to add the objects to the
+                property registries and notify observers, exactly as if they
+                had been constructed, and make new reference numbers continue
+                after the highest one loaded. Defaults to True.
+
+        Returns:
+            list: The properties, in reference number order.
+        """
+        loaded = []
+        with self.__readers.connection() as connection:
+            cursor = connection.execute(_SELECT + ' ORDER BY reference')
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                loaded.extend(map(self._materialize, rows))
+        if register and loaded:
+            self.__loading = True
+            try:
+                for prop in loaded:
+                    for registry in ResidentialProperty.registries_for(type(prop)):
+                        registry.add(prop)
+                    for observer in ResidentialProperty.observers:
+                        observer.property_added(prop)
+            finally:
+                self.__loading = False
+            highest = loaded[-1].getreference_number()
+            if ResidentialProperty.reference_number < highest:
+                ResidentialProperty.reference_number = highest
+        return loaded
+
+    def flush(self):
+        """
+        Saves the changes collected while following: new and changed
+        properties are written and deregistered ones deleted.
+        """
+        pending, self.__pending = self.__pending, {}
+        deleted, self.__deleted = self.__deleted, set()
+        if deleted:
+            self.delete(deleted)
+        if pending:
+            self.save(pending.values())
+
+    def _changed(self, prop):
+        if self.__loading:
+            return
+        reference = prop.getreference_number()
+        self.__deleted.discard(reference)
+        self.__pending[reference] = prop
+        if len(self.__pending) >= self.batch_size:
+            self.flush()
+
+    def property_added(self, prop):
+        """
+        Queues a new property to be saved.
+
+        Args:
+            prop (ResidentialProperty): The new property.
+        """
+        self._changed(prop)
+
+    def property_changed(self, prop, field, old_value, new_value):
+        """
+        Queues a changed property to be saved again.
+
+        Args:
+            prop (ResidentialProperty): The changed property.
+            field (str): The name of the property attribute.
+            old_value: The value before the change.
+            new_value: The value after the change.
+        """
+        self._changed(prop)
+
+    def property_removed(self, prop):
+        """
+        Queues a deregistered property to be deleted.
+
+        Args:
+            prop (ResidentialProperty): The removed property.
+        """
+        reference = prop.getreference_number()
+        self.__pending.pop(reference, None)
+        self.__deleted.add(reference)
+        if len(self.__deleted) >= self.batch_size:
+            self.flush()
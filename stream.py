@@ -0,0 +1,402 @@
+"""
+Lazy, composable streams of listings.
+
+stream() pulls properties one at a time from the registry, a PropertyStore or
+snapshot, a bulk-load file or any iterable. Every stage is a generator, so
+the stages never build intermediate lists:
+
+    stream().of_type(SaleApartment).where('Number_of_Bedrooms', '>=', 2) \\
+            .map(lambda prop: prop.SalePrice).batch(10000)
+
+Terminal operations (aggregate(), top(), count(), write(), to_csv()) consume
+the stream. Streams are pull-based: a source is only read when the next stage
+asks for an item, so a slow sink slows the source down instead of letting
+items pile up. buffered() lets a source run ahead in a background thread, but
+only up to a bounded number of items.
+"""
+
+from collections import namedtuple
+import csv
+import heapq
+from itertools import islice
+from operator import attrgetter
+import os
+import queue
+import threading
+
+from residentialproperty import ResidentialProperty
+from propertyindex import Predicate
+
+# to_csv() field name for the reference number, which has no property.
+REFERENCE_FIELD = 'reference_number'
+
+Summary = namedtuple('Summary', 'count total minimum maximum mean')
+
+_END = object()
+
+
+def _field_getter(field):
+    """
+    Builds a function reading a field of a property.
+
+    Args:
+        field (str or callable): A property attribute name, REFERENCE_FIELD,
+            or a function of the property.
+
+    Returns:
+        callable: Maps a property to the value, None if it has no such field.
+    """
+    if callable(field):
+        return field
+    if field == REFERENCE_FIELD:
+        return lambda prop: prop.getreference_number()
+    getter = attrgetter(field)
+
+    def get(prop):
+        try:
+            return getter(prop)
+        except AttributeError:
+            return None
+    return get
+
+
+def stream(source=None, kind=None, chunk_size=50000, file_format=None):
+    """
+    Starts a stream.
+
+    Args:
+        source (optional): Where the properties come from. One of:
+            None for ResidentialProperty.total_properties; a PropertyStore or
+            snapshot, streamed as row views; a CSV or Parquet path, loaded
+            chunk by chunk with bulkload; or any iterable of properties.
+            Objects read from a file are not registered and observers are
+            not notified, so only the chunk being read is kept in memory.
+        kind (type or str, optional): The class of every record of a file.
+        chunk_size (int, optional): Records per chunk read from a file.
+            Defaults to 50000.
+        file_format (str, optional): 'csv' or 'parquet'. Defaults to the
+            file extension.
+
+    Returns:
+        Stream: The stream.
+    """
+    if source is None:
+        return Stream(ResidentialProperty.total_properties)
+    if isinstance(source, (str, os.PathLike)):
+        if kind is None:
+            raise TypeError('streaming a file needs the kind of its records')
+        return Stream(_file_source(source, kind, chunk_size, file_format))
+    return Stream(source)
+
+
+def _file_source(path, kind, chunk_size, file_format):
+    """
+    Yields unregistered objects of a bulk-load file, one chunk in memory at
+    a time.
+
+    Args:
+        path (str): The file.
+        kind (type or str): The class of every record.
+        chunk_size (int): Records per chunk.
+        file_format (str): 'csv', 'parquet' or None.
+
+    Yields:
+        ResidentialProperty: The loaded objects.
+    """
+    from bulkload import iter_load  # only needed for file sources
+    for _, loaded, _ in iter_load(path, kind, chunk_size=chunk_size, file_format=file_format,
+                                  register=False):
+        yield from loaded
+
+
+def _buffered(items, size):
+    """
+    Reads items in a background thread into a bounded queue.
+
+    Args:
+        items (iterable): The source.
+        size (int): The most items read ahead.
+
+    Yields:
+        The items of the source.
+    """
+    buffer = queue.Queue(maxsize=size)
+    stopped = threading.Event()
+    failure = []
+
+    def produce():
+        try:
+            for item in items:
+                while not stopped.is_set():
+                    try:
+                        buffer.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stopped.is_set():
+                    return
+        except BaseException as error:  # re-raised in the consuming thread
+            failure.append(error)
+        while not stopped.is_set():
+            try:
+                buffer.put(_END, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    producer = threading.Thread(target=produce, name='stream-buffer', daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _END:
+                break
+            yield item
+        if failure:
+            raise failure[0]
+    finally:
+        stopped.set()
+        producer.join()
+
+
+class Stream:
+    """
+    A lazy sequence of items, usually properties. Every method returns a new
+    stream or consumes this one; a stream can only be consumed once.
+    """
+
+    def __init__(self, items):
+        """
+        Initializes a Stream.
+
+        Args:
+            items (iterable): The items. PropertyStore objects and snapshots
+                are iterated as row views.
+        """
+        self.__items = iter(items)
+
+    def __iter__(self):
+        return self.__items
+
+    def __next__(self):
+        return next(self.__items)
+
+    def of_type(self, *classes):
+        """
+        Keeps instances of the given classes, including their subclasses,
+        store views and slotted variants.
+
+        Args:
+            *classes (type): The property classes, e.g. SaleApartment.
+
+        Returns:
+            Stream: The filtered stream.
+        """
+        return Stream(item for item in self.__items if isinstance(item, classes))
+
+    def where(self, field, op=None, value=None):
+        """
+        Keeps the items matching a condition.
+
+        Args:
+            field (str or callable): A property attribute name compared with op
+                and value, as in PropertyIndex queries, or a function of the
+                item returning True for the items to keep.
+            op (str, optional): One of propertyindex.OPERATORS.
+            value (optional): The value compared against.
+
+        Returns:
+            Stream: The filtered stream.
+        """
+        if callable(field):
+            return Stream(filter(field, self.__items))
+        return Stream(filter(Predicate(field, op, value).matches, self.__items))
+
+    def map(self, function):
+        """
+        Transforms every item.
+
+        Args:
+            function (callable): Maps an item to the new item.
+
+        Returns:
+            Stream: The transformed stream.
+        """
+        return Stream(map(function, self.__items))
+
+    def batch(self, size):
+        """
+        Groups items into lists of up to size items.
+
+        Args:
+            size (int): The batch size.
+
+        Returns:
+            Stream: A stream of lists.
+        """
+        if size < 1:
+            raise ValueError('batch size must be at least 1')
+        items = self.__items
+        return Stream(iter(lambda: list(islice(items, size)), []))
+
+    def limit(self, count):
+        """
+        Keeps the first items only.
+
+        Args:
+            count (int): The number of items kept.
+
+        Returns:
+            Stream: The shortened stream.
+        """
+        return Stream(islice(self.__items, count))
+
+    def buffered(self, size=10000):
+        """
+        Lets the stream read ahead in a background thread, e.g. to overlap
+        file parsing with a slow sink. At most size items are held; when the
+        buffer is full the reader waits for the consumer.
+
+        Args:
+            size (int, optional): The most items read ahead. Defaults to 10000.
+
+        Returns:
+            Stream: The buffered stream.
+        """
+        return Stream(_buffered(self.__items, size))
+
+    def count(self):
+        """
+        Counts the items.
+
+        Returns:
+            int: The number of items.
+        """
+        return sum(1 for _ in self.__items)
+
+    def aggregate(self, field, by=None):
+        """
+        Summarises a numeric field. Items without a value are skipped.
+
+        Args:
+            field (str or callable): The property attribute name, or a function
+                of the item.
+            by (str or callable, optional): Groups the summary by this field.
+
+        Returns:
+            Summary or dict: The (count, total, minimum, maximum, mean)
+            summary, or a summary per group.
+        """
+        value_of = _field_getter(field)
+        key_of = _field_getter(by) if by is not None else None
+        groups = {}
+        for item in self.__items:
+            value = value_of(item)
+            if value is None:
+                continue
+            key = key_of(item) if key_of is not None else None
+            state = groups.get(key)
+            if state is None:
+                groups[key] = [1, value, value, value]
+            else:
+                state[0] += 1
+                state[1] += value
+                if value < state[2]:
+                    state[2] = value
+                if value > state[3]:
+                    state[3] = value
+        summaries = {key: Summary(count, total, low, high, total / count)
+                     for key, (count, total, low, high) in groups.items()}
+        if key_of is not None:
+            return summaries
+        return summaries.get(None, Summary(0, 0, None, None, None))
+
+    def top(self, k, key='SalePrice', smallest=False):
+        """
+        Returns the k items with the largest values of a field, holding no more
+        than k items at a time. Items without a value are skipped.
+
+        Args:
+            k (int): The number of items.
+            key (str or callable, optional): The field ranked by. Defaults to
+                'SalePrice'.
+            smallest (bool, optional): Return the smallest values instead.
+                Defaults to False.
+
+        Returns:
+            list: The items, best first.
+        """
+        value_of = _field_getter(key)
+        ranked = ((value, item) for item in self.__items
+                  for value in (value_of(item),) if value is not None)
+        select = heapq.nsmallest if smallest else heapq.nlargest
+        return [item for _, item in select(k, ranked, key=lambda pair: pair[0])]
+
+    def for_each(self, function):
+        """
+        Calls a function on every item.
+
+        Args:
+            function (callable): The function.
+
+        Returns:
+            int: The number of items.
+        """
+        count = 0
+        for item in self.__items:
+            function(item)
+            count += 1
+        return count
+
+    def write(self, sink):
+        """
+        Writes every item to a sink. The next item is only read once the sink
+        has returned, so a slow sink never makes items pile up.
+
+        Args:
+            sink: An object with a write(item) method, or a callable. Combine
+                with batch() to write lists of items.
+
+        Returns:
+            int: The number of items written.
+        """
+        return self.for_each(getattr(sink, 'write', sink))
+
+    def to_csv(self, path, fields):
+        """
+        Writes the items as CSV rows.
+
+        Args:
+            path (str or file): The file path, or an open text file.
+            fields (list): Property attribute names, or REFERENCE_FIELD, one per
+                column. Missing fields are written as empty cells.
+
+        Returns:
+            int: The number of rows written.
+        """
+        getters = [_field_getter(field) for field in fields]
+        if isinstance(path, (str, os.PathLike)):
+            with open(path, 'w', newline='') as handle:
+                return self._write_csv(handle, fields, getters)
+        return self._write_csv(path, fields, getters)
+
+    def _write_csv(self, handle, fields, getters):
+        """
+        Writes the header and one row per item to an open file.
+
+        Args:
+            handle (file): The open text file.
+            fields (list): The column names.
+            getters (list): One field getter per column.
+
+        Returns:
+            int: The number of rows written.
+        """
+        writer = csv.writer(handle)
+        writer.writerow(fields)
+        count = 0
+        for item in self.__items:
+            writer.writerow(['' if value is None else value
+                             for value in (getter(item) for getter in getters)])
+            count += 1
+        return count
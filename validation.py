@@ -0,0 +1,552 @@
+"""
+Declarative field schemas for the property classes, compiled into
+validators.
+
+The constructors and setters store whatever they are given: a negative
+Built_Up_Area, '3' bedrooms, or an AgentCommissionPercent of 0 that the
+setter silently ignores. SCHEMAS declares, per class of the hierarchy, the
+type and range of every field. compile_schema() turns the fields of a
+concrete class into Python source, once, and executes it; the resulting
+functions test each value with inline comparisons against constants, so no
+schema is read or looked up per call.
+
+    obj = create(SaleHouse, '1 Lane', 1500, 3, 2, 2, 3000, 'Villa', 650000, 900)
+    errors = validate_batch(SaleHouse, records)     # every FieldError at once
+    listings = build(SaleHouse, records)            # validated, then built
+    listings = build(SaleHouse, records, trusted=True)
+
+create() checks the constructor arguments and raises a ValidationError
+listing every bad value before anything is allocated. validate_batch() checks
+mappings of property name -> value, e.g. parsed feed rows, and reports the
+missing, unknown and bad fields of every record in one list. build() creates
+properties from such records without running the constructor chain (see
+bulkload.py); trusted=True skips the checks for data validated before, e.g.
+read back from the book's own store.
+
+enable() makes the regular constructors and setters validate too, until
+disable(), by wrapping them the way instrumentation.py does, and rejects
+public attributes that are not fields of the class. Disabled, the classes
+run exactly their own code. Validation and an Instrumentation cannot wrap
+the same constructors at once; whichever is enabled second raises.
+"""
+
+from collections import namedtuple
+from contextlib import contextmanager
+import functools
+import inspect
+import numbers
+
+from residentialproperty import (ResidentialProperty, House, Apartment, Rental, Sale,
+                                 RentalApartment, RentalHouse, SaleApartment, SaleHouse,
+                                 as_location)
+from bulkload import build_objects, gc_paused, resolve_kind, reserve_references
+from patching import patch, restore
+
+REQUIRED = object()  # the default of fields that records must have
+
+Field = namedtuple('Field', 'name argument kind above at_least below nullable default',
+                   defaults=(None, None, None, False, REQUIRED))
+Field.__doc__ = """
+A field of a schema: the property name, the constructor argument that sets it
+(None for setter-only fields), its kind ('integer', 'number', 'boolean',
+'text' or 'location'), the exclusive lower bound, the inclusive lower bound,
+the exclusive upper bound, whether None is allowed, and the value a record
+without the field gets (REQUIRED if it must be given).
+"""
+
+# A rejected value: the record number (None outside batches), the property
+# name, the value and the reason.
+FieldError = namedtuple('FieldError', 'row field value message')
+
+# Fields declared by each class of the hierarchy; concrete classes combine
+# those of their bases.
+SCHEMAS = {
+    ResidentialProperty: (
+        Field('Address', 'address', 'text'),
+        Field('Built_Up_Area', 'built_up_area', 'number', above=0),
+        Field('Number_of_Bedrooms', 'num_of_bedrooms', 'integer', at_least=0),
+        Field('Number_of_Bathrooms', 'num_of_bathrooms', 'integer', at_least=0),
+        Field('Number_of_Parking_Slots', 'num_of_parking_slots', 'integer', at_least=0,
+              default=1),
+        Field('Pool_Avail', 'pool_avail', 'boolean', default=False),
+        Field('Gym_Avail', 'gym_avail', 'boolean', default=False),
+        # The setter ignores 0, so it is rejected rather than lost.
+        Field('AgentCommissionPercent', None, 'number', above=0, below=1, default=0.02),
+        Field('Location', None, 'location', nullable=True, default=None),
+    ),
+    House: (
+        Field('Number_of_Floors', 'num_of_floors', 'integer', at_least=1),
+        Field('Plot_Size', 'plot_size', 'number', above=0),
+        Field('House_Type', 'house_type', 'text'),
+    ),
+    Apartment: (
+        Field('FloorNumber', 'floor_num', 'integer'),  # basements are below 0
+        Field('NumberOfBalconies', 'num_of_balconies', 'integer', at_least=0),
+    ),
+    Sale: (
+        Field('SalePrice', 'sale_price', 'number', above=0),
+        Field('AnnualServiceCharge', 'annual_service_charge', 'number', at_least=0),
+        Field('FixedTaxPercent', None, 'number', at_least=0, below=1, default=0.04),
+    ),
+    Rental: (
+        Field('DepositAmount', None, 'number', at_least=0, nullable=True, default=None),
+        Field('YearlyRent', None, 'number', above=0, nullable=True, default=None),
+        Field('Furnished', None, 'boolean', nullable=True, default=None),
+        Field('MaidRoom', None, 'boolean', nullable=True, default=None),
+    ),
+}
+
+CompiledSchema = namedtuple('CompiledSchema',
+                            'cls fields check_args create wrap_init check_records checks')
+CompiledSchema.__doc__ = """
+The validators of a class: its fields; check_args(*args, **kwargs), which
+checks constructor arguments; create(*args, **kwargs), which checks them and
+constructs; wrap_init(init), which returns a checking version of a
+constructor; check_records(records, first_row=0) for mappings; and checks,
+property name -> check(value) returning an error message or None.
+"""
+
+_COMPILED = {}  # class -> CompiledSchema
+
+_MISSING = object()
+
+
+class ValidationError(ValueError):
+    """
+    Raised when values do not match the schema; errors lists every one of
+    them.
+    """
+
+    def __init__(self, errors):
+        """
+        Initializes a ValidationError.
+
+        Args:
+            errors (iterable): The FieldError tuples.
+        """
+        self.errors = list(errors)
+        shown = '; '.join('{}{}={!r} {}'.format(
+            '' if error.row is None else 'row {}: '.format(error.row),
+            error.field, error.value, error.message) for error in self.errors[:5])
+        more = len(self.errors) - 5
+        super().__init__(shown + ('; and {} more'.format(more) if more > 0 else ''))
+
+
+def _is_integer(value):
+    return isinstance(value, numbers.Integral) and not isinstance(value, bool)
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+
+def _bad_location(value):
+    try:
+        as_location(value)
+    except ValueError:
+        return True
+    return False
+
+
+def _report(errors, row, field, value, message):
+    if errors is None:
+        errors = []
+    errors.append(FieldError(row, field, value, message))
+    return errors
+
+
+def _unknown(record, row, names, cls, append):
+    for name in record:
+        if name not in names:
+            append(FieldError(row, name, record[name],
+                              'is not a field of {}'.format(cls.__name__)))
+
+
+def schema(cls):
+    """
+    Collects the fields of a class from SCHEMAS.
+
+    Args:
+        cls (type): A property class, or a slotted variant of one.
+
+    Returns:
+        tuple: The Field tuples, base class fields first.
+    """
+    cls = getattr(cls, 'variant_of', cls)
+    fields = []
+    for klass in reversed(cls.__mro__):
+        fields.extend(SCHEMAS.get(klass, ()))
+    return tuple(fields)
+
+
+def _tests(field, value):
+    """
+    Writes the tests of a field as Python expressions.
+
+    Args:
+        field (Field): The field.
+        value (str): The name of the variable holding the value.
+
+    Returns:
+        list: (expression, message) pairs, in order; a value fails at the
+        first expression that is true. A message of None accepts the value.
+    """
+    tests = [('{} is None'.format(value), None)] if field.nullable else []
+    if field.kind == 'integer':
+        tests.append(('{0}.__class__ is not int and not _is_integer({0})'.format(value),
+                      'must be an integer'))
+    elif field.kind == 'number':
+        tests.append(('{0}.__class__ is not float and {0}.__class__ is not int '
+                      'and not _is_number({0})'.format(value), 'must be a number'))
+    elif field.kind == 'boolean':
+        tests.append(('{0} is not True and {0} is not False'.format(value),
+                      'must be True or False'))
+    elif field.kind == 'text':
+        tests.append(('{0}.__class__ is not str and not isinstance({0}, str)'.format(value),
+                      'must be a string'))
+        tests.append(('not {}.strip()'.format(value), 'must not be empty'))
+    elif field.kind == 'location':
+        tests.append(('_bad_location({})'.format(value),
+                      'must be a (latitude, longitude) pair in range'))
+    else:
+        raise ValueError('Unknown field kind {!r} of {}'.format(field.kind, field.name))
+    # Written as 'not (value > bound)' so that NaN fails too.
+    if field.above is not None:
+        tests.append(('not {} > {!r}'.format(value, field.above),
+                      'must be greater than {}'.format(field.above)))
+    if field.at_least is not None:
+        tests.append(('not {} >= {!r}'.format(value, field.at_least),
+                      'must be at least {}'.format(field.at_least)))
+    if field.below is not None:
+        tests.append(('not {} < {!r}'.format(value, field.below),
+                      'must be less than {}'.format(field.below)))
+    return tests
+
+
+def _branches(tests, indent, report, first='if'):
+    """
+    Writes the tests of a field as an if/elif chain.
+
+    Args:
+        tests (list): (expression, message) pairs from _tests().
+        indent (str): The indentation of the chain.
+        report (str): The statement run on failure, with a {message}
+            placeholder.
+        first (str, optional): The keyword of the first branch. Defaults to
+            'if'.
+
+    Returns:
+        list: The source lines.
+    """
+    lines = []
+    for position, (test, message) in enumerate(tests):
+        lines.append('{}{} {}:'.format(indent, first if position == 0 else 'elif', test))
+        lines.append(indent + '    ' + ('pass' if message is None
+                                        else report.format(message=repr(message))))
+    return lines
+
+
+def _compile(source, name, namespace):
+    namespace.update(_is_integer=_is_integer, _is_number=_is_number,
+                     _bad_location=_bad_location, _report=_report, _unknown=_unknown,
+                     FieldError=FieldError, _MISSING=_MISSING)
+    exec(source, namespace)
+    return namespace[name]
+
+
+def _compile_check(field):
+    """
+    Generates the check of a single field.
+
+    Args:
+        field (Field): The field.
+
+    Returns:
+        function: check(value) -> error message, or None if the value is valid.
+    """
+    lines = ['def check(value):']
+    lines.extend(_branches(_tests(field, 'value'), '    ', 'return {message}'))
+    lines.append('    return None')
+    return _compile('\n'.join(lines), 'check', {})
+
+
+def _compile_arguments(cls, fields):
+    """
+    Generates the functions that check the arguments of a constructor. They
+    have its signature, read here once, and test every argument inline.
+
+    Args:
+        cls (type): The class.
+        fields (tuple): Its fields.
+
+    Returns:
+        tuple: (check_args, create, wrap_init), see CompiledSchema.
+    """
+    by_argument = {field.argument: field for field in fields if field.argument}
+    parameters = list(inspect.signature(cls.__init__).parameters.values())[1:]
+    namespace, arguments = {'_cls': cls, 'ValidationError': ValidationError}, []
+    for position, parameter in enumerate(parameters):
+        if parameter.kind in (parameter.VAR_POSITIONAL, parameter.VAR_KEYWORD):
+            raise TypeError('Cannot compile the arguments of {}.__init__'.format(cls.__name__))
+        if parameter.default is parameter.empty:
+            arguments.append(parameter.name)
+        else:
+            namespace['_default{}'.format(position)] = parameter.default
+            arguments.append('{}=_default{}'.format(parameter.name, position))
+    signature = ', '.join(arguments)
+    passed = ', '.join(parameter.name for parameter in parameters)
+    body = ['    errors = None']
+    for parameter in parameters:
+        field = by_argument.get(parameter.name)
+        if field is None:
+            continue
+        report = 'errors = _report(errors, None, {!r}, {}, {{message}})'.format(
+            field.name, parameter.name)
+        body.extend(_branches(_tests(field, parameter.name), '    ', report))
+    raise_errors = ['    if errors:', '        raise ValidationError(errors)']
+    lines = ['def check_args({}):'.format(signature)] + body + ['    return errors', '',
+             'def create({}):'.format(signature)] + body + raise_errors + [
+             '    return _cls({})'.format(passed), '',
+             'def wrap_init(init):',
+             '    def __init__(self, {}):'.format(signature)]
+    lines.extend('    ' + line for line in body + raise_errors)
+    lines.extend(['        init(self, {})'.format(passed), '    return __init__'])
+    _compile('\n'.join(lines), 'check_args', namespace)
+    return namespace['check_args'], namespace['create'], namespace['wrap_init']
+
+
+def _compile_check_records(cls, fields):
+    """
+    Generates the loop that checks a batch of records.
+
+    Args:
+        cls (type): The class.
+        fields (tuple): Its fields.
+
+    Returns:
+        function: check_records(records, first_row=0) -> list of FieldError.
+    """
+    lines = ['def check_records(records, first_row=0):',
+             '    errors = []',
+             '    append = errors.append',
+             '    for row, record in enumerate(records, first_row):',
+             '        if not _NAMES.issuperset(record):',
+             '            _unknown(record, row, _NAMES, _CLASS, append)',
+             '        get = record.get']
+    for field in fields:
+        report = 'append(FieldError(row, {!r}, value, {{message}}))'.format(field.name)
+        lines.append('        value = get({!r}, _MISSING)'.format(field.name))
+        lines.append('        if value is _MISSING:')
+        if field.default is REQUIRED:
+            lines.append("            append(FieldError(row, {!r}, None, 'is required'))".format(
+                field.name))
+        else:
+            lines.append('            pass')
+        lines.extend(_branches(_tests(field, 'value'), '        ', report, first='elif'))
+    lines.append('    return errors')
+    namespace = {'_NAMES': frozenset(field.name for field in fields), '_CLASS': cls}
+    return _compile('\n'.join(lines), 'check_records', namespace)
+
+
+def compile_schema(cls):
+    """
+    Returns the compiled validators of a class, generating them on first use.
+
+    Args:
+        cls (type): A concrete property class, or a slotted variant of one.
+
+    Returns:
+        CompiledSchema: The validators.
+    """
+    compiled = _COMPILED.get(cls)
+    if compiled is None:
+        fields = schema(cls)
+        compiled = _COMPILED[cls] = CompiledSchema(
+            cls, fields, *_compile_arguments(cls, fields), _compile_check_records(cls, fields),
+            {field.name: _compile_check(field) for field in fields})
+    return compiled
+
+
+def create(cls, *args, **kwargs):
+    """
+    Constructs a property after checking every constructor argument.
+
+    Args:
+        cls (type): The class, e.g. SaleHouse.
+        *args: The constructor arguments.
+        **kwargs: The constructor keyword arguments.
+
+    Returns:
+        ResidentialProperty: The new property.
+
+    Raises:
+        ValidationError: With every bad argument; nothing is created.
+    """
+    compiled = _COMPILED.get(cls) or compile_schema(cls)
+    return compiled.create(*args, **kwargs)
+
+
+def validate_batch(cls, records, first_row=0):
+    """
+    Checks a batch of records and reports every problem at once.
+
+    Args:
+        cls (type): The class the records describe, e.g. SaleHouse.
+        records (iterable): Mappings of property name -> value.
+        first_row (int, optional): The row number of the first record.
+            Defaults to 0.
+
+    Returns:
+        list: A FieldError per missing, unknown or bad value, by row.
+    """
+    return compile_schema(cls).check_records(records, first_row)
+
+
+def build(cls, records, trusted=False):
+    """
+    Creates and registers properties from records without running the
+    constructor chain, as bulk_load() does.
+
+    Args:
+        cls (type or str): One of RentalApartment, RentalHouse, SaleApartment
+            and SaleHouse, or its name.
+        records (iterable): Mappings of property name -> value. Fields they
+            leave out get the schema default.
+        trusted (bool, optional): Skip the checks, for records that were
+            validated before. Defaults to False.
+
+    Returns:
+        list: The new properties, in record order.
+
+    Raises:
+        ValidationError: If trusted is False and any record is invalid; no
+            property is created.
+    """
+    cls = resolve_kind(cls)
+    records = records if isinstance(records, list) else list(records)
+    compiled = compile_schema(cls)
+    if not trusted:
+        errors = compiled.check_records(records)
+        if errors:
+            raise ValidationError(errors)
+    fields = {}
+    for field in compiled.fields:
+        name, default = field.name, field.default
+        if default is REQUIRED:
+            fields[name] = [record[name] for record in records]
+        else:
+            fields[name] = [record.get(name, default) for record in records]
+    with gc_paused():
+        properties = build_objects(cls, reserve_references(len(records)), fields)
+        for prop, location in zip(properties, fields['Location']):
+            if location is not None:
+                prop._ResidentialProperty__location = as_location(location)
+        for registry in ResidentialProperty.registries_for(cls):
+            registry.extend(properties)
+        for observer in ResidentialProperty.observers:
+            for prop in properties:
+                observer.property_added(prop)
+    return properties
+
+
+_patches = []  # patching.patch() records while enabled
+
+
+def enabled():
+    """
+    Tells whether the constructors and setters validate.
+
+    Returns:
+        bool: True between enable() and disable().
+    """
+    return bool(_patches)
+
+
+def enable(classes=None):
+    """
+    Makes the constructors of some classes, and the setters of their fields,
+    raise a ValidationError for values the schema rejects. Setting a public
+    attribute that is not a field of the class, e.g. FloorNumber on a
+    house, raises one as well.
+
+    Args:
+        classes (iterable, optional): The concrete classes. Defaults to
+            RentalApartment, RentalHouse, SaleApartment and SaleHouse.
+            Slotted classes can be added.
+
+    Raises:
+        RuntimeError: If a constructor is already wrapped, e.g. by an enabled
+            Instrumentation.
+    """
+    if _patches:
+        return
+    if classes is None:
+        classes = (RentalApartment, RentalHouse, SaleApartment, SaleHouse)
+    patched = set()
+    try:
+        for cls in classes:
+            compiled = compile_schema(cls)
+            _patch(cls, '__init__', _validated_constructor(cls.__init__, compiled.wrap_init))
+            _patch(cls, '__setattr__', _known_fields_only(cls, compiled.fields))
+            for klass in cls.__mro__:
+                for name, check in compiled.checks.items():
+                    member = vars(klass).get(name)
+                    if isinstance(member, property) and (klass, name) not in patched:
+                        patched.add((klass, name))
+                        _patch(klass, name, _validated_property(member, name, check))
+    except Exception:
+        disable()
+        raise
+
+
+def disable():
+    """
+    Restores the original constructors and setters, newest first.
+    """
+    restore(_patches)
+
+
+@contextmanager
+def validating(classes=None):
+    """
+    Enables validation for the duration of a with block.
+
+    Args:
+        classes (iterable, optional): As for enable().
+    """
+    enable(classes)
+    try:
+        yield
+    finally:
+        disable()
+
+
+def _patch(cls, name, replacement):
+    patch('validation', _patches, cls, name, replacement)
+
+
+def _validated_constructor(function, wrap_init):
+    return functools.wraps(function)(wrap_init(function))
+
+
+def _validated_property(original, name, check):
+    fset = original.fset
+
+    def setter(prop, value):
+        message = check(value)
+        if message is not None:
+            raise ValidationError([FieldError(None, name, value, message)])
+        fset(prop, value)
+    return property(original.fget, setter, original.fdel, original.__doc__)
+
+
+def _known_fields_only(cls, fields):
+    names = frozenset(field.name for field in fields)
+    original = cls.__setattr__
+    message = 'is not a field of {}'.format(cls.__name__)
+
+    def __setattr__(prop, name, value, names=names, original=original):
+        if name[:1] == '_' or name in names:  # the constructors set private names
+            return original(prop, name, value)
+        raise ValidationError([FieldError(None, name, value, message)])
+    return __setattr__
@@ -0,0 +1,404 @@
+"""
+A copy-on-write, versioned copy of the book with point-in-time snapshots.
+
+VersionedBook observes ResidentialProperty and keeps the state of every
+registered property (its schema-ordered field values, see serialization.py)
+in a persistent map keyed by reference number. snapshot() returns a
+BookSnapshot in O(1): it keeps the current root of the map, and nothing that
+root can reach is ever modified again. Reports read a consistent book from
+the snapshot while setters keep changing the live objects.
+
+    book = VersionedBook()
+    snapshot = book.snapshot()
+    prop.SalePrice = 1.0                    # the snapshot still has the old price
+    snapshot.get(prop.getreference_number()).SalePrice
+    sum(listing.SalePrice for listing in snapshot if isinstance(listing, Sale))
+
+The map is a 32-way radix trie over the reference number bits, like the
+persistent vectors of Clojure. A change copies the nodes on the path from
+the root to its entry, at most log32(highest reference) of them, and every
+other node is shared with the earlier versions. Nodes that were created
+since the last snapshot belong to the current version and are changed in
+place instead, so a burst of changes between two snapshots copies each
+touched node once. The memory held by old versions is therefore proportional
+to the changes made since they were taken, and it is freed as soon as the
+last BookSnapshot referencing it is dropped.
+
+Changes are applied under a lock, which only snapshot() shares; reading a
+snapshot takes no lock and never waits for the writers. Setter calls that
+belong together can be made inside `with book.batch():`, so that a snapshot
+has either all of them or none. Properties read from
+a snapshot are frozen: they have every getter and method of their class, and
+setting an attribute raises AttributeError.
+"""
+
+from contextlib import contextmanager
+import threading
+
+from residentialproperty import ResidentialProperty, PropertyObserver
+from serialization import SCHEMA_VERSION, SLOTTED, KIND_SCHEMAS, state_encoder, restore_property
+
+_BITS = 5
+_WIDTH = 1 << _BITS
+_MASK = _WIDTH - 1
+
+# A trie node is a list: the version that owns it, then _WIDTH children (or,
+# in the leaves, _WIDTH entries). An entry is (kind code, field values).
+_EMPTY = [None] * _WIDTH
+
+# Kind code -> frozen subclass.
+_FROZEN_CLASSES = {}
+
+
+class _FrozenProperty:
+    """
+    Mixin of the frozen classes.
+    """
+
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError('properties read from a snapshot are read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError('properties read from a snapshot are read-only')
+
+    def __reduce__(self):
+        # Unpickles as a plain, writable object of the stored class.
+        return restore_property, (SCHEMA_VERSION, self._kind_code,
+                                  tuple(vars(self)[attribute]
+                                        for attribute in KIND_SCHEMAS[self._kind_code][1]))
+
+
+def _frozen_class(code):
+    """
+    Returns the frozen subclass of a stored class.
+
+    Args:
+        code (int): The kind code.
+
+    Returns:
+        type: The frozen class.
+    """
+    frozen = _FROZEN_CLASSES.get(code)
+    if frozen is None:
+        cls, _ = KIND_SCHEMAS[code]
+        frozen = _FROZEN_CLASSES[code] = type(cls)(
+            'Frozen' + cls.__name__, (_FrozenProperty, cls),
+            {'_kind_code': code, '__module__': __name__})
+    return frozen
+
+
+def _freeze(entry):
+    """
+    Creates the frozen object of a trie entry.
+
+    Args:
+        entry (tuple): (kind code, field values).
+
+    Returns:
+        ResidentialProperty: The frozen object.
+    """
+    code, values = entry
+    prop = object.__new__(_frozen_class(code))
+    prop.__dict__.update(zip(KIND_SCHEMAS[code][1], values))
+    return prop
+
+
+def _lookup(root, shift, reference):
+    """
+    Finds the entry of a reference number in a trie.
+
+    Args:
+        root (list): The root node.
+        shift (int): The bit shift of the root level.
+        reference (int): The reference number.
+
+    Returns:
+        tuple: The entry, or None.
+    """
+    if reference < 0 or reference >> shift >= _WIDTH:
+        return None
+    node = root
+    while shift:
+        node = node[1 + ((reference >> shift) & _MASK)]
+        if node is None:
+            return None
+        shift -= _BITS
+    return node[1 + (reference & _MASK)]
+
+
+def _walk(node, shift, base):
+    """
+    Yields the entries below a trie node in reference number order.
+
+    Args:
+        node (list): The node.
+        shift (int): Its bit shift.
+        base (int): The lowest reference number it covers.
+
+    Yields:
+        tuple: (reference number, entry).
+    """
+    if not shift:
+        for slot, entry in enumerate(node[1:]):
+            if entry is not None:
+                yield base + slot, entry
+        return
+    for slot, child in enumerate(node[1:]):
+        if child is not None:
+            yield from _walk(child, shift - _BITS, base + (slot << shift))
+
+
+class BookSnapshot:
+    """
+    An immutable view of the book as it was when snapshot() was called.
+    """
+
+    def __init__(self, root, shift, size, version):
+        """
+        Initializes a BookSnapshot. Use VersionedBook.snapshot() instead.
+
+        Args:
+            root (list): The root node, never modified again.
+            shift (int): The bit shift of the root level.
+            size (int): The number of properties.
+            version (int): The number of changes applied before the snapshot.
+        """
+        self.__root = root
+        self.__shift = shift
+        self.__size = size
+        self.version = version
+
+    def __len__(self):
+        return self.__size
+
+    def __contains__(self, reference):
+        return _lookup(self.__root, self.__shift, reference) is not None
+
+    def __iter__(self):
+        """
+        Iterates the properties in reference number order.
+
+        Yields:
+            ResidentialProperty: Frozen properties.
+        """
+        for _, entry in _walk(self.__root, self.__shift, 0):
+            yield _freeze(entry)
+
+    def references(self):
+        """
+        Lists the reference numbers in the snapshot.
+
+        Returns:
+            list: The reference numbers, ascending.
+        """
+        return [reference for reference, _ in _walk(self.__root, self.__shift, 0)]
+
+    def state(self, reference):
+        """
+        Returns the stored state of a property, without creating an object.
+
+        Args:
+            reference (int): The reference number.
+
+        Returns:
+            tuple: (schema version, kind code, field values), as returned by
+            serialization.property_state() for a regular object.
+
+        Raises:
+            KeyError: If the property was not in the book.
+        """
+        entry = _lookup(self.__root, self.__shift, reference)
+        if entry is None:
+            raise KeyError(reference)
+        return (SCHEMA_VERSION,) + entry
+
+    def get(self, reference):
+        """
+        Returns a property as it was when the snapshot was taken.
+
+        Args:
+            reference (int): The reference number.
+
+        Returns:
+            ResidentialProperty: A frozen property.
+
+        Raises:
+            KeyError: If the property was not in the book.
+        """
+        entry = _lookup(self.__root, self.__shift, reference)
+        if entry is None:
+            raise KeyError(reference)
+        return _freeze(entry)
+
+
+class VersionedBook(PropertyObserver):
+    """
+    Keeps every version of the registered properties that a snapshot still
+    refers to.
+    """
+
+    def __init__(self, properties=None):
+        """
+        Initializes a VersionedBook and starts observing property changes.
+
+        Args:
+            properties (iterable, optional): The properties to start from.
+                Defaults to ResidentialProperty.total_properties.
+        """
+        self.__lock = threading.RLock()
+        self.__owner = object()  # the version that may change nodes in place
+        self.__root = [self.__owner] + _EMPTY
+        self.__shift = 0
+        self.__size = 0
+        self.__changes = 0
+        if properties is None:
+            properties = ResidentialProperty.total_properties
+        with self.__lock:
+            for prop in properties:
+                self._put(prop)
+        ResidentialProperty.add_observer(self)
+
+    def close(self):
+        """
+        Stops observing property changes. Existing snapshots stay readable.
+        """
+        ResidentialProperty.remove_observer(self)
+
+    def __len__(self):
+        return self.__size
+
+    @property
+    def version(self):
+        """
+        Gets the number of changes applied so far.
+
+        Returns:
+            int: The version number.
+        """
+        return self.__changes
+
+    def snapshot(self):
+        """
+        Takes a point-in-time snapshot in O(1).
+
+        Returns:
+            BookSnapshot: The snapshot.
+        """
+        with self.__lock:
+            # Nodes reachable from this root now belong to the snapshot; later
+            # changes copy them instead of changing them in place.
+            self.__owner = object()
+            return BookSnapshot(self.__root, self.__shift, self.__size, self.__changes)
+
+    @contextmanager
+    def batch(self):
+        """
+        Groups changes: snapshots taken by other threads wait until the with
+        block ends, so they see every change made inside it or none.
+        Readers of existing snapshots are not affected.
+
+        Yields:
+            VersionedBook: This book.
+        """
+        with self.__lock:
+            yield self
+
+    def _editable(self, node):
+        """
+        Returns a node that may be changed in place: the node itself if the
+        current version owns it, otherwise a copy that it owns.
+
+        Args:
+            node (list): The node, or None for a missing one.
+
+        Returns:
+            list: The editable node.
+        """
+        if node is None:
+            return [self.__owner] + _EMPTY
+        if node[0] is self.__owner:
+            return node
+        copy = node[:]
+        copy[0] = self.__owner
+        return copy
+
+    def _set(self, reference, entry):
+        """
+        Stores or clears the entry of a reference number. Callers hold the
+        lock.
+
+        Args:
+            reference (int): The reference number.
+            entry (tuple): (kind code, field values), or None to remove it.
+
+        Returns:
+            tuple: The previous entry, or None.
+        """
+        if reference < 0:
+            raise ValueError('reference numbers must not be negative')
+        while reference >> self.__shift >= _WIDTH:
+            if entry is None:
+                return None
+            self.__root = [self.__owner, self.__root] + _EMPTY[1:]
+            self.__shift += _BITS
+        node = self.__root = self._editable(self.__root)
+        shift = self.__shift
+        while shift:
+            slot = 1 + ((reference >> shift) & _MASK)
+            child = node[slot]
+            if child is None and entry is None:
+                return None
+            node[slot] = node = self._editable(child)
+            shift -= _BITS
+        slot = 1 + (reference & _MASK)
+        previous = node[slot]
+        node[slot] = entry
+        self.__size += (entry is not None) - (previous is not None)
+        self.__changes += 1
+        return previous
+
+    def _put(self, prop):
+        """
+        Stores the current state of a property. Callers hold the lock.
+
+        Args:
+            prop (ResidentialProperty): The property.
+        """
+        code, getter, _ = state_encoder(type(prop))
+        values = getter(prop)
+        self._set(values[0], (code & ~SLOTTED, values))
+
+    def property_added(self, prop):
+        """
+        Adds a new property to the current version.
+
+        Args:
+            prop (ResidentialProperty): The new property.
+        """
+        with self.__lock:
+            self._put(prop)
+
+    def property_changed(self, prop, field, old_value, new_value):
+        """
+        Replaces the state of a changed property in the current version.
+
+        Args:
+            prop (ResidentialProperty): The changed property.
+            field (str): The name of the property attribute.
+            old_value: The value before the change.
+            new_value: The value after the change.
+        """
+        with self.__lock:
+            self._put(prop)
+
+    def property_removed(self, prop):
+        """
+        Removes a deregistered property from the current version.
+
+        Args:
+            prop (ResidentialProperty): The removed property.
+        """
+        with self.__lock:
+            self._set(prop.getreference_number(), None)